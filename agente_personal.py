@@ -1,12 +1,186 @@
+import bisect
+import json
+import os
+import re
+import shutil
 import sqlite3
 import threading
-from typing import List, Tuple
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import compresion
+import telemetria
 
 DB_NAME = 'agente_personal.db'
 
+# Índices sobre las claves foráneas y los listados calientes: nombre -> (tabla, columnas).
+# Sin ellos cada DELETE en cascada (proyectos -> tareas/conversaciones -> mensajes)
+# recorre las tablas hijas completas mientras se tiene el lock de escritura.
+INDICES = {
+    # (proyecto_id) lleva el rowid al final: también sirve para paginar las tareas por id
+    'idx_tareas_proyecto': ('tareas', 'proyecto_id'),
+    # Tablero: filtrar por estado y paginar por id dentro del estado
+    'idx_tareas_proyecto_estado': ('tareas', 'proyecto_id, estado'),
+    'idx_conversaciones_proyecto': ('conversaciones', 'proyecto_id'),
+    # Cubre la FK y además el ORDER BY de listar_mensajes (evita ordenar en memoria)
+    'idx_mensajes_conversacion_fecha': ('mensajes', 'conversacion_id, datetime(fecha), id'),
+    # Lo que cambió desde la última versión vista (ver revisar_cambios)
+    'idx_cambios_version': ('cambios', 'version'),
+}
+
+# Consultas calientes que deben resolverse con índice (SEARCH), nunca con SCAN.
+# Las tres últimas son las búsquedas que hace SQLite en las tablas hijas al borrar en cascada.
+CONSULTAS_CRITICAS = {
+    'listar_mensajes': ('SELECT remitente, contenido FROM mensajes WHERE conversacion_id = ? '
+                        'ORDER BY datetime(fecha) ASC, id ASC', (1,)),
+    'listar_tareas': ('SELECT id, descripcion, estado FROM tareas WHERE proyecto_id = ?', (1,)),
+    'pagina_tareas': ('SELECT id, descripcion, estado FROM tareas WHERE proyecto_id = ? AND id > ? '
+                      'ORDER BY id LIMIT ?', (1, 0, 50)),
+    'pagina_tareas_estado': ('SELECT id, descripcion, estado FROM tareas WHERE proyecto_id = ? AND estado = ? '
+                             'AND id > ? ORDER BY id LIMIT ?', (1, 'pendiente', 0, 50)),
+    'conteo_tareas': ('SELECT estado, cantidad FROM tareas_conteo WHERE proyecto_id = ?', (1,)),
+    'cambios_desde': ('SELECT tabla, clave, padre, version FROM cambios WHERE version > ? ORDER BY version', (0,)),
+    'listar_chats': ('SELECT nombre, id FROM conversaciones WHERE proyecto_id=? AND eliminado = 0 '
+                     'ORDER BY id ASC', (1,)),
+    'proyecto_por_nombre': ('SELECT id FROM proyectos WHERE nombre = ?', ('x',)),
+    'cascada_tareas': ('SELECT 1 FROM tareas WHERE proyecto_id = ?', (1,)),
+    'cascada_conversaciones': ('SELECT 1 FROM conversaciones WHERE proyecto_id = ?', (1,)),
+    'cascada_mensajes': ('SELECT 1 FROM mensajes WHERE conversacion_id = ?', (1,)),
+}
+
+# Columnas agregadas después de la versión inicial del esquema: tabla -> [(columna, definición)]
+COLUMNAS_AGREGADAS = {
+    'proyectos': [('eliminado', 'INTEGER NOT NULL DEFAULT 0')],
+    'conversaciones': [('eliminado', 'INTEGER NOT NULL DEFAULT 0'), ('archivo', 'TEXT')],
+}
+
+# Estados de tarea que muestra el tablero, en orden de columnas (la base acepta cualquier texto)
+ESTADOS_TAREA = ('pendiente', 'en curso', 'hecha')
+
+# Triggers que mantienen tareas_conteo al día con cada INSERT/DELETE/UPDATE de tareas
+# (incluidos los borrados en cascada y los que hace el purgador en lotes)
+_TRIGGERS_CONTEO_TAREAS = {
+    'trg_tareas_conteo_alta': '''
+        CREATE TRIGGER trg_tareas_conteo_alta AFTER INSERT ON tareas BEGIN
+            INSERT INTO tareas_conteo (proyecto_id, estado, cantidad)
+            VALUES (NEW.proyecto_id, COALESCE(NEW.estado, 'pendiente'), 1)
+            ON CONFLICT (proyecto_id, estado) DO UPDATE SET cantidad = cantidad + 1;
+        END''',
+    'trg_tareas_conteo_baja': '''
+        CREATE TRIGGER trg_tareas_conteo_baja AFTER DELETE ON tareas BEGIN
+            UPDATE tareas_conteo SET cantidad = cantidad - 1
+            WHERE proyecto_id = OLD.proyecto_id AND estado = COALESCE(OLD.estado, 'pendiente');
+            DELETE FROM tareas_conteo
+            WHERE proyecto_id = OLD.proyecto_id AND estado = COALESCE(OLD.estado, 'pendiente') AND cantidad <= 0;
+        END''',
+    'trg_tareas_conteo_cambio': '''
+        CREATE TRIGGER trg_tareas_conteo_cambio AFTER UPDATE OF estado, proyecto_id ON tareas
+        WHEN OLD.proyecto_id IS NOT NEW.proyecto_id OR OLD.estado IS NOT NEW.estado BEGIN
+            UPDATE tareas_conteo SET cantidad = cantidad - 1
+            WHERE proyecto_id = OLD.proyecto_id AND estado = COALESCE(OLD.estado, 'pendiente');
+            DELETE FROM tareas_conteo
+            WHERE proyecto_id = OLD.proyecto_id AND estado = COALESCE(OLD.estado, 'pendiente') AND cantidad <= 0;
+            INSERT INTO tareas_conteo (proyecto_id, estado, cantidad)
+            VALUES (NEW.proyecto_id, COALESCE(NEW.estado, 'pendiente'), 1)
+            ON CONFLICT (proyecto_id, estado) DO UPDATE SET cantidad = cantidad + 1;
+        END''',
+}
+
+# Registro de cambios para otras instancias (ver revisar_cambios): por cada tabla observada,
+# los eventos que anotan y la expresión de la clave y del padre de la fila afectada.
+# Es coalescido: una fila por (tabla, clave) con la versión del último cambio, así mil
+# mensajes nuevos en un chat son una sola fila y la tabla no crece con el historial.
+# Los mensajes se anotan por conversación y las tareas por proyecto (lo que refresca la UI);
+# los borrados del purgador no se anotan (el chat o proyecto ya avisó al marcarse eliminado).
+_OBSERVADAS = {
+    'proyectos': {'INSERT': ('NEW.id', 'NULL', None),
+                  'UPDATE': ('NEW.id', 'NULL', None),
+                  'DELETE': ('OLD.id', 'NULL', None)},
+    'conversaciones': {'INSERT': ('NEW.id', 'NEW.proyecto_id', None),
+                       'UPDATE': ('NEW.id', 'NEW.proyecto_id', None),
+                       'DELETE': ('OLD.id', 'OLD.proyecto_id', None)},
+    'mensajes': {'INSERT': ('NEW.conversacion_id', 'NULL', None),
+                 'DELETE': ('OLD.conversacion_id', 'NULL',
+                            'NOT EXISTS (SELECT 1 FROM conversaciones WHERE id = OLD.conversacion_id '
+                            'AND eliminado = 1)')},
+    'tareas': {'INSERT': ('NEW.proyecto_id', 'NULL', None),
+               'UPDATE': ('NEW.proyecto_id', 'NULL', None),
+               'DELETE': ('OLD.proyecto_id', 'NULL',
+                          'NOT EXISTS (SELECT 1 FROM proyectos WHERE id = OLD.proyecto_id AND eliminado = 1)')},
+}
+
+
+def _sql_trigger_cambios(tabla: str, evento: str) -> Tuple[str, str]:
+    clave, padre, condicion = _OBSERVADAS[tabla][evento]
+    nombre = f'trg_cambios_{tabla}_{evento.lower()}'
+    cuando = f' WHEN {condicion}' if condicion else ''
+    return nombre, f'''
+        CREATE TRIGGER IF NOT EXISTS {nombre} AFTER {evento} ON {tabla}{cuando} BEGIN
+            INSERT INTO cambios (tabla, clave, padre, version)
+            VALUES ('{tabla}', {clave}, {padre}, (SELECT COALESCE(MAX(version), 0) + 1 FROM cambios))
+            ON CONFLICT (tabla, clave) DO UPDATE SET padre = excluded.padre, version = excluded.version;
+        END'''
+
+
+# Búsqueda de texto (ver buscar_mensajes): índice FTS5 con tokenizador trigram sobre el texto
+# ya descomprimido, en cada base con mensajes (la principal y las de archivo). Es contentless
+# (content=''): guarda el índice y no una segunda copia del texto, así la compresión sigue
+# ahorrando espacio; a cambio, sacar una fila exige volver a pasar el texto que se indexó.
+# Los triggers no descomprimen (así cualquier conexión, aunque no tenga la función SQL
+# descomprimir, puede escribir mensajes): anotan en busqueda_cola el id de cada alta y el
+# contenido anterior de cada baja o cambio, y la app pasa la cola al índice (ver
+# _aplicar_cola_busqueda). busqueda_pendiente guarda el rango de ids (desde, hasta] que aún no
+# se indexó (lo que ya había al crear el índice; ver indexar_busqueda_pendiente). La búsqueda
+# recorre descomprimiendo lo que esté en la cola o pendiente, así que nunca da resultados viejos.
+_FUERA_DE_PENDIENTE = 'NOT EXISTS (SELECT 1 FROM busqueda_pendiente WHERE {fila}.id > desde AND {fila}.id <= hasta)'
+_SQL_BUSQUEDA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {esquema}.mensajes_busqueda USING fts5(texto, content='', tokenize='trigram')",
+    'CREATE TABLE IF NOT EXISTS {esquema}.busqueda_pendiente (desde INTEGER NOT NULL, hasta INTEGER NOT NULL)',
+    # contenido NULL: alta; si no, el contenido que estaba indexado y hay que sacar
+    'CREATE TABLE IF NOT EXISTS {esquema}.busqueda_cola (orden INTEGER PRIMARY KEY, id INTEGER NOT NULL, contenido)',
+    'CREATE INDEX IF NOT EXISTS {esquema}.idx_busqueda_cola_id ON busqueda_cola (id)',
+    f'''CREATE TRIGGER IF NOT EXISTS {{esquema}}.trg_busqueda_mensajes_insert AFTER INSERT ON mensajes
+        WHEN {_FUERA_DE_PENDIENTE.format(fila='NEW')} BEGIN
+            INSERT INTO busqueda_cola (id) VALUES (NEW.id);
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {{esquema}}.trg_busqueda_mensajes_delete AFTER DELETE ON mensajes
+        WHEN {_FUERA_DE_PENDIENTE.format(fila='OLD')} BEGIN
+            INSERT INTO busqueda_cola (id, contenido) VALUES (OLD.id, OLD.contenido);
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {{esquema}}.trg_busqueda_mensajes_update AFTER UPDATE OF contenido ON mensajes
+        WHEN {_FUERA_DE_PENDIENTE.format(fila='OLD')} BEGIN
+            INSERT INTO busqueda_cola (id, contenido) VALUES (OLD.id, OLD.contenido);
+        END''',
+)
+
+
+class Cambio(NamedTuple):
+    tabla: str              # 'proyectos', 'conversaciones', 'mensajes', 'tareas' o '*' (recargar todo)
+    clave: int              # id del proyecto/conversación (mensajes: su conversación; tareas: su proyecto)
+    padre: Optional[int]    # conversaciones: proyecto al que pertenecen
+    version: int
+
+
+# Máximo de parámetros por sentencia en las actualizaciones masivas (SQLite admite 999 en versiones viejas)
+_IDS_POR_SENTENCIA = 500
+
+# Prefijo con el que se renombra un proyecto eliminado para liberar su nombre (UNIQUE)
+_PREFIJO_ELIMINADO = '~eliminado~'
+
+# Nombre de cada respaldo (un directorio por foto): AAAAMMDD-HHMMSS[-n]
+_PATRON_RESPALDO = re.compile(r'^\d{8}-\d{6}(-\d+)?$')
+
+# Bases de archivo adjuntas a la vez (SQLite admite 10 por defecto); se sueltan por LRU
+_MAX_ARCHIVOS_ADJUNTOS = 4
+
 class AgentePersonal:
-    def __init__(self, db_path: str = DB_NAME, perform_migration: bool = True):
+    def __init__(self, db_path: str = DB_NAME, perform_migration: bool = True, purga_automatica: bool = True,
+                 umbral_compresion: int = compresion.UMBRAL_BYTES, dir_archivo: Optional[str] = None,
+                 dir_respaldos: Optional[str] = None):
         # Permite usar la conexión desde varios hilos y activa las claves foráneas
+        self.db_path = db_path
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         # Reducir tiempos de espera en locks para no bloquear la UI al iniciar
         try:
@@ -18,7 +192,50 @@ class AgentePersonal:
         # como FOREIGN KEY constraint failed debido a escrituras concurrentes).
         self.lock = threading.Lock()
         self.conn.execute('PRAGMA foreign_keys = ON')
+        # Purga en segundo plano de proyectos/conversaciones eliminados (ver eliminar_proyecto)
+        self.purga_automatica = purga_automatica
+        self._purgador: Optional[threading.Thread] = None
+        self._purga_pendiente = threading.Event()
+        self._purga_lock = threading.Lock()
+        self._cerrando = threading.Event()
+        # Directorio en memoria de proyectos y conversaciones (ver _cargar_directorio)
+        self._cache_lock = threading.RLock()
+        self.invalidar_cache()
+        # Compresión de cuerpos grandes (ver compresion.py); 0 desactiva
+        self.umbral_compresion = umbral_compresion
+        self._diccionarios: Dict[int, bytes] = {}
+        self._diccionario_activo = 0
+        # Funciones SQL para poder filtrar/buscar sobre el texto aunque esté comprimido
+        self.conn.create_function('descomprimir', 1, self._descomprimir_sql, deterministic=True)
+        self.conn.create_function('largo_original', 1, compresion.largo_original, deterministic=True)
+        self.conn.create_function('contiene', 2, self._contiene_sql, deterministic=True)
+        # Conversaciones inactivas movidas a bases aparte (ver archivar_inactivas)
+        if dir_archivo is None and db_path not in ('', ':memory:'):
+            dir_archivo = os.path.splitext(os.path.abspath(db_path))[0] + '_archivo'
+        self.dir_archivo = dir_archivo
+        self._adjuntos: 'OrderedDict[str, str]' = OrderedDict()  # archivo -> alias del ATTACH
+        self._n_adjuntos = 0
+        # Respaldos en caliente (ver respaldar)
+        if dir_respaldos is None and db_path not in ('', ':memory:'):
+            dir_respaldos = os.path.splitext(os.path.abspath(db_path))[0] + '_respaldos'
+        self.dir_respaldos = dir_respaldos
+        self._respaldo: Optional[Future] = None
+        self._respaldo_lock = threading.Lock()
+        self._indexador: Optional[threading.Thread] = None
         self._crear_tablas()
+        self._asegurar_columnas()
+        self._asegurar_indices()
+        self._asegurar_conteo_tareas()
+        self._asegurar_registro_cambios()
+        with self.lock:
+            self._asegurar_busqueda('main')
+        # Vigilancia de escrituras de otros procesos (ver revisar_cambios)
+        self._vigilante: Optional[threading.Thread] = None
+        with self.lock:
+            self._data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            self._version_vista = self._version_cambios()
+        self._cargar_diccionarios()
+        self._cargar_archivadas()
         # Migración automática: opcional para evitar bloquear la UI en el hilo principal.
         if perform_migration:
             # Si la BD fue creada sin ON DELETE CASCADE, reconstruimos las tablas dependientes
@@ -27,12 +244,17 @@ class AgentePersonal:
 
     def _crear_tablas(self):
         cursor = self.conn.cursor()
+        # En una base nueva, auto_vacuum incremental permite devolver al disco el espacio
+        # liberado por la purga sin un VACUUM completo (sólo tiene efecto antes de crear tablas).
+        if not cursor.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
         # Proyectos
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS proyectos (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 nombre TEXT UNIQUE NOT NULL,
-                contexto TEXT
+                contexto TEXT,
+                eliminado INTEGER NOT NULL DEFAULT 0
             )
         ''')
         # Tareas
@@ -45,6 +267,27 @@ class AgentePersonal:
                 FOREIGN KEY(proyecto_id) REFERENCES proyectos(id) ON DELETE CASCADE
             )
         ''')
+        # Cantidad de tareas por proyecto y estado (la mantienen los triggers de _asegurar_conteo_tareas):
+        # el tablero muestra los totales sin contar decenas de miles de filas
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tareas_conteo (
+                proyecto_id INTEGER NOT NULL,
+                estado TEXT NOT NULL,
+                cantidad INTEGER NOT NULL,
+                PRIMARY KEY (proyecto_id, estado)
+            ) WITHOUT ROWID
+        ''')
+        # Último cambio de cada proyecto/conversación/chat/tablero (lo escriben los triggers de
+        # _asegurar_registro_cambios; lo leen las otras instancias en revisar_cambios)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cambios (
+                tabla TEXT NOT NULL,
+                clave INTEGER NOT NULL,
+                padre INTEGER,
+                version INTEGER NOT NULL,
+                PRIMARY KEY (tabla, clave)
+            ) WITHOUT ROWID
+        ''')
         # Conversaciones (pueden ser libres o asociadas a un proyecto)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS conversaciones (
@@ -52,6 +295,8 @@ class AgentePersonal:
                 nombre TEXT,
                 proyecto_id INTEGER,
                 fecha_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                eliminado INTEGER NOT NULL DEFAULT 0,
+                archivo TEXT,
                 FOREIGN KEY(proyecto_id) REFERENCES proyectos(id) ON DELETE CASCADE
             )
         ''')
@@ -67,6 +312,35 @@ class AgentePersonal:
                 FOREIGN KEY(conversacion_id) REFERENCES conversaciones(id) ON DELETE CASCADE
             )
         ''')
+        # Resumen acumulado de la parte vieja de cada conversación (ver resumenes.py):
+        # cubre los mensajes con id <= hasta_mensaje_id; el resto se manda tal cual al modelo
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS resumenes (
+                conversacion_id INTEGER PRIMARY KEY,
+                resumen TEXT NOT NULL,
+                hasta_mensaje_id INTEGER NOT NULL,
+                actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(conversacion_id) REFERENCES conversaciones(id) ON DELETE CASCADE
+            )
+        ''')
+        # Diccionarios zstd compartidos para comprimir mensajes (se conservan todos para poder leer)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS diccionarios_compresion (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                datos BLOB NOT NULL,
+                creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.conn.commit()
+
+    def _asegurar_columnas(self):
+        """Agrega a bases existentes las columnas de COLUMNAS_AGREGADAS que falten."""
+        cur = self.conn.cursor()
+        for tabla, columnas in COLUMNAS_AGREGADAS.items():
+            existentes = {row[1] for row in cur.execute(f'PRAGMA table_info({tabla})').fetchall()}
+            for columna, definicion in columnas:
+                if columna not in existentes:
+                    cur.execute(f'ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}')
         self.conn.commit()
 
     # --- MIGRACIÓN DE ESQUEMA: habilitar ON DELETE CASCADE si falta ---
@@ -111,6 +385,12 @@ class AgentePersonal:
             try:
                 cur.execute('BEGIN IMMEDIATE')
 
+                # Los triggers del registro de cambios nombran otras tablas y SQLite no deja
+                # renombrar mientras apunten a una que no existe; se recrean al terminar
+                for tabla, eventos in _OBSERVADAS.items():
+                    for evento in eventos:
+                        cur.execute(f'DROP TRIGGER IF EXISTS trg_cambios_{tabla}_{evento.lower()}')
+
                 # --- tareas ---
                 if not self._tiene_cascada('tareas'):
                     cur.execute('''
@@ -139,13 +419,15 @@ class AgentePersonal:
                             nombre TEXT,
                             proyecto_id INTEGER,
                             fecha_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            eliminado INTEGER NOT NULL DEFAULT 0,
+                            archivo TEXT,
                             FOREIGN KEY(proyecto_id) REFERENCES proyectos(id) ON DELETE CASCADE
                         )
                     ''')
                     cur.execute(
                         """
-                        INSERT INTO conversaciones_new (id, nombre, proyecto_id, fecha_inicio)
-                        SELECT id, nombre, proyecto_id, fecha_inicio FROM conversaciones
+                        INSERT INTO conversaciones_new (id, nombre, proyecto_id, fecha_inicio, eliminado, archivo)
+                        SELECT id, nombre, proyecto_id, fecha_inicio, eliminado, archivo FROM conversaciones
                         """
                     )
                     cur.execute('DROP TABLE conversaciones')
@@ -184,44 +466,571 @@ class AgentePersonal:
                 # Reactivar enforcement y asegurar ON
                 cur.execute('PRAGMA foreign_keys = ON')
                 self.conn.commit()
+        # Las tablas reconstruidas perdieron sus índices y sus triggers
+        self._asegurar_indices()
+        self._asegurar_conteo_tareas()
+        self._asegurar_registro_cambios()
+        with self.lock:
+            self._asegurar_busqueda('main')
 
-    def crear_proyecto(self, nombre: str, contexto: str = None):
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO proyectos (nombre, contexto) VALUES (?, ?)', (nombre, contexto))
-        self.conn.commit()
+    # --- ÍNDICES ---
+    def _asegurar_indices(self):
+        """Crea los índices de INDICES que falten (idempotente)."""
+        with self.lock:
+            cur = self.conn.cursor()
+            for nombre, (tabla, columnas) in INDICES.items():
+                cur.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({columnas})')
+            self.conn.commit()
+
+    def _asegurar_conteo_tareas(self):
+        """Crea los triggers de tareas_conteo; si faltaba alguno, recalcula los totales desde tareas."""
+        with self.lock:
+            cur = self.conn.cursor()
+            existentes = {r[0] for r in cur.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'tareas'").fetchall()}
+            if all(nombre in existentes for nombre in _TRIGGERS_CONTEO_TAREAS):
+                return
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                for nombre, sql in _TRIGGERS_CONTEO_TAREAS.items():
+                    cur.execute(f'DROP TRIGGER IF EXISTS {nombre}')
+                    cur.execute(sql)
+                cur.execute('DELETE FROM tareas_conteo')
+                cur.execute("INSERT INTO tareas_conteo (proyecto_id, estado, cantidad) "
+                            "SELECT proyecto_id, COALESCE(estado, 'pendiente'), COUNT(*) FROM tareas "
+                            "GROUP BY 1, 2")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def _asegurar_registro_cambios(self):
+        """Crea los triggers que anotan en `cambios` (idempotente)."""
+        with self.lock:
+            cur = self.conn.cursor()
+            for tabla, eventos in _OBSERVADAS.items():
+                for evento in eventos:
+                    cur.execute(_sql_trigger_cambios(tabla, evento)[1])
+            self.conn.commit()
+
+    def verificar_indices(self) -> List[str]:
+        """Devuelve los nombres de los índices requeridos que no existen."""
+        with self.lock:
+            existentes = {r[0] for r in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()}
+        return [nombre for nombre in INDICES if nombre not in existentes]
+
+    def plan_consulta(self, sql: str, params: tuple = ()) -> List[str]:
+        """Devuelve el detalle de EXPLAIN QUERY PLAN para la consulta."""
+        with self.lock:
+            return [row[3] for row in self.conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+    def consultas_con_scan(self) -> Dict[str, List[str]]:
+        """Consultas de CONSULTAS_CRITICAS cuyo plan recorre una tabla completa."""
+        malas = {}
+        for nombre, (sql, params) in CONSULTAS_CRITICAS.items():
+            plan = self.plan_consulta(sql, params)
+            if any(paso.startswith('SCAN') for paso in plan):
+                malas[nombre] = plan
+        return malas
+
+    # --- DIRECTORIO EN MEMORIA ---
+    # Caché write-through de proyectos y conversaciones visibles: la navegación de la UI
+    # (seleccionar proyecto, listar chats) no toca SQLite en el caso común. Las APIs de
+    # mutación de esta clase la mantienen al día; cambios hechos por fuera (otro proceso,
+    # SQL directo) requieren invalidar_cache().
+    def invalidar_cache(self):
+        with self._cache_lock:
+            self._proyectos: Optional[Dict[int, Tuple[str, Optional[str]]]] = None  # id -> (nombre, contexto)
+            self._proyectos_por_nombre: Dict[str, int] = {}
+            self._proyectos_orden: List[str] = []
+            self._chats: Dict[Optional[int], List[Tuple[int, str]]] = {}  # proyecto_id -> [(id, nombre)]
+            self._chat_proyecto: Dict[int, Optional[int]] = {}
+            self._conteo_mensajes: Dict[int, int] = {}
+
+    def _cargar_directorio(self):
+        with self._cache_lock:
+            if self._proyectos is not None:
+                return
+            with self.lock:
+                rows = self.conn.execute(
+                    'SELECT id, nombre, contexto FROM proyectos WHERE eliminado = 0').fetchall()
+            self._proyectos = {pid: (nombre, ctx) for pid, nombre, ctx in rows}
+            self._proyectos_por_nombre = {nombre: pid for pid, nombre, _ctx in rows}
+            self._proyectos_orden = sorted(self._proyectos_por_nombre)
+
+    def listar_proyectos(self) -> List[str]:
+        """Nombres de los proyectos visibles, en orden alfabético."""
+        with self._cache_lock:
+            self._cargar_directorio()
+            return list(self._proyectos_orden)
+
+    def id_proyecto(self, nombre: str) -> Optional[int]:
+        with self._cache_lock:
+            self._cargar_directorio()
+            return self._proyectos_por_nombre.get(nombre)
+
+    def _id_proyecto_o_error(self, nombre: str) -> int:
+        proyecto_id = self.id_proyecto(nombre)
+        if proyecto_id is None:
+            raise ValueError(f"Proyecto '{nombre}' no existe.")
+        return proyecto_id
+
+    def listar_conversaciones(self, proyecto_id: Optional[int]) -> List[Tuple[int, str]]:
+        """(id, nombre) de las conversaciones visibles del proyecto (None = libres), por id."""
+        with self._cache_lock:
+            chats = self._chats.get(proyecto_id)
+            if chats is None:
+                with self.lock:
+                    if proyecto_id is None:
+                        rows = self.conn.execute('SELECT id, nombre FROM conversaciones WHERE proyecto_id IS NULL '
+                                                 'AND eliminado = 0 ORDER BY id ASC').fetchall()
+                    else:
+                        rows = self.conn.execute('SELECT id, nombre FROM conversaciones WHERE proyecto_id = ? '
+                                                 'AND eliminado = 0 ORDER BY id ASC', (proyecto_id,)).fetchall()
+                chats = self._chats[proyecto_id] = [(cid, nombre) for cid, nombre in rows]
+                for cid, _nombre in chats:
+                    self._chat_proyecto[cid] = proyecto_id
+            return list(chats)
+
+    def contar_mensajes(self, conversacion_id: int) -> int:
+        with self._cache_lock:
+            n = self._conteo_mensajes.get(conversacion_id)
+            if n is None:
+                with self.lock:
+                    tabla = self._tabla_mensajes(conversacion_id)
+                    n = self.conn.execute(f'SELECT COUNT(*) FROM {tabla} WHERE conversacion_id = ?',
+                                          (conversacion_id,)).fetchone()[0]
+                self._conteo_mensajes[conversacion_id] = n
+            return n
+
+    def _cache_quitar_proyecto(self, proyecto_id: int):
+        with self._cache_lock:
+            if self._proyectos is not None and proyecto_id in self._proyectos:
+                nombre = self._proyectos.pop(proyecto_id)[0]
+                self._proyectos_por_nombre.pop(nombre, None)
+                self._proyectos_orden.remove(nombre)
+            for cid, _nombre in self._chats.pop(proyecto_id, []):
+                self._chat_proyecto.pop(cid, None)
+                self._conteo_mensajes.pop(cid, None)
+
+    def _cache_agregar_proyecto(self, proyecto_id: int, nombre: str, contexto: Optional[str]):
+        with self._cache_lock:
+            if self._proyectos is None:
+                return  # se cargará completo en el próximo acceso
+            self._proyectos[proyecto_id] = (nombre, contexto)
+            self._proyectos_por_nombre[nombre] = proyecto_id
+            bisect.insort(self._proyectos_orden, nombre)
+
+    # --- Proyectos y tareas ---
+    def crear_proyecto(self, nombre: str, contexto: str = None) -> int:
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT INTO proyectos (nombre, contexto) VALUES (?, ?)', (nombre, contexto))
+            self.conn.commit()
+            proyecto_id = cursor.lastrowid
+        self._cache_agregar_proyecto(proyecto_id, nombre, contexto)
+        return proyecto_id
+
+    def renombrar_proyecto(self, proyecto_id: int, nuevo_nombre: str) -> None:
+        """Renombra el proyecto (sqlite3.IntegrityError si el nombre ya existe)."""
+        with self.lock:
+            self.conn.execute('UPDATE proyectos SET nombre = ? WHERE id = ?', (nuevo_nombre, proyecto_id))
+            self.conn.commit()
+        with self._cache_lock:
+            if self._proyectos is not None and proyecto_id in self._proyectos:
+                viejo, contexto = self._proyectos.pop(proyecto_id)
+                self._proyectos_por_nombre.pop(viejo, None)
+                self._proyectos_orden.remove(viejo)
+                self._cache_agregar_proyecto(proyecto_id, nuevo_nombre, contexto)
 
     def agregar_tarea(self, proyecto: str, tarea: str):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id FROM proyectos WHERE nombre = ?', (proyecto,))
-        row = cursor.fetchone()
-        if not row:
-            raise ValueError(f"Proyecto '{proyecto}' no existe.")
-        proyecto_id = row[0]
-        cursor.execute('INSERT INTO tareas (proyecto_id, descripcion) VALUES (?, ?)', (proyecto_id, tarea))
-        self.conn.commit()
+        proyecto_id = self._id_proyecto_o_error(proyecto)
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('INSERT INTO tareas (proyecto_id, descripcion) VALUES (?, ?)', (proyecto_id, tarea))
+            self.conn.commit()
 
-    def listar_tareas(self, proyecto: str) -> List[Tuple[int, str, str]]:
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id FROM proyectos WHERE nombre = ?', (proyecto,))
-        row = cursor.fetchone()
-        if not row:
-            raise ValueError(f"Proyecto '{proyecto}' no existe.")
-        proyecto_id = row[0]
-        cursor.execute('SELECT id, descripcion, estado FROM tareas WHERE proyecto_id = ?', (proyecto_id,))
-        return cursor.fetchall()
+    def listar_tareas(self, proyecto: str, estado: Optional[str] = None, despues_de: int = 0,
+                      limite: Optional[int] = None) -> List[Tuple[int, str, str]]:
+        """Tareas del proyecto ordenadas por id, opcionalmente sólo las de un `estado`.
+
+        Con `limite` devuelve una página: la siguiente se pide con `despues_de` = último id
+        recibido (paginado por clave, cada página cuesta lo mismo aunque haya decenas de miles).
+        """
+        proyecto_id = self._id_proyecto_o_error(proyecto)
+        sql = 'SELECT id, descripcion, estado FROM tareas WHERE proyecto_id = ?'
+        params: tuple = (proyecto_id,)
+        if estado is not None:
+            sql += ' AND estado = ?'
+            params += (estado,)
+        if despues_de:
+            sql += ' AND id > ?'
+            params += (despues_de,)
+        sql += ' ORDER BY id'
+        if limite is not None:
+            sql += ' LIMIT ?'
+            params += (limite,)
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def contar_tareas(self, proyecto: str) -> Dict[str, int]:
+        """Cantidad de tareas del proyecto por estado (de tareas_conteo, sin recorrer las tareas)."""
+        proyecto_id = self._id_proyecto_o_error(proyecto)
+        with self.lock:
+            rows = self.conn.execute('SELECT estado, cantidad FROM tareas_conteo WHERE proyecto_id = ?',
+                                     (proyecto_id,)).fetchall()
+        return dict(rows)
 
     def actualizar_estado_tarea(self, tarea_id: int, nuevo_estado: str):
-        cursor = self.conn.cursor()
-        cursor.execute('UPDATE tareas SET estado = ? WHERE id = ?', (nuevo_estado, tarea_id))
-        self.conn.commit()
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('UPDATE tareas SET estado = ? WHERE id = ?', (nuevo_estado, tarea_id))
+            self.conn.commit()
+
+    def actualizar_estado_tareas(self, tarea_ids, nuevo_estado: str) -> int:
+        """Cambia el estado de varias tareas en una sola transacción. Devuelve cuántas cambiaron."""
+        ids = list(tarea_ids)
+        cambiadas = 0
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                for i in range(0, len(ids), _IDS_POR_SENTENCIA):
+                    tramo = ids[i:i + _IDS_POR_SENTENCIA]
+                    cur.execute(f'UPDATE tareas SET estado = ? WHERE id IN ({",".join("?" * len(tramo))}) '
+                                'AND estado IS NOT ?', (nuevo_estado, *tramo, nuevo_estado))
+                    cambiadas += cur.rowcount
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return cambiadas
+
+    def transicionar_tareas(self, proyecto: str, estado_actual: str, nuevo_estado: str) -> int:
+        """Pasa todas las tareas del proyecto en `estado_actual` a `nuevo_estado` (una transacción, por índice)."""
+        proyecto_id = self._id_proyecto_o_error(proyecto)
+        if estado_actual == nuevo_estado:
+            return 0
+        with self.lock:
+            cur = self.conn.execute('UPDATE tareas SET estado = ? WHERE proyecto_id = ? AND estado = ?',
+                                    (nuevo_estado, proyecto_id, estado_actual))
+            self.conn.commit()
+            return cur.rowcount
 
     def cargar_contexto(self, proyecto: str) -> str:
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT contexto FROM proyectos WHERE nombre = ?', (proyecto,))
-        row = cursor.fetchone()
-        if row:
-            return row[0]
-        return None
+        with self._cache_lock:
+            self._cargar_directorio()
+            proyecto_id = self._proyectos_por_nombre.get(proyecto)
+            if proyecto_id is None:
+                return None
+            return self._proyectos[proyecto_id][1]
+
+    # --- Conversaciones y mensajes ---
+    def crear_conversacion(self, nombre: str, proyecto_id: Optional[int] = None) -> int:
+        """Crea una conversación (libre si proyecto_id es None) y devuelve su id."""
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute('INSERT INTO conversaciones (nombre, proyecto_id) VALUES (?, ?)', (nombre, proyecto_id))
+            self.conn.commit()
+            cid = cur.lastrowid
+        with self._cache_lock:
+            chats = self._chats.get(proyecto_id)
+            if chats is not None:
+                chats.append((cid, nombre))
+                self._chat_proyecto[cid] = proyecto_id
+            self._conteo_mensajes[cid] = 0
+        return cid
+
+    def renombrar_chat(self, conversacion_id: int, nuevo_nombre: str) -> None:
+        with self.lock:
+            self.conn.execute('UPDATE conversaciones SET nombre = ? WHERE id = ?', (nuevo_nombre, conversacion_id))
+            self.conn.commit()
+        with self._cache_lock:
+            if conversacion_id not in self._chat_proyecto:
+                return
+            chats = self._chats.get(self._chat_proyecto[conversacion_id], [])
+            for i, (cid, _nombre) in enumerate(chats):
+                if cid == conversacion_id:
+                    chats[i] = (cid, nuevo_nombre)
+
+    def agregar_mensaje(self, conversacion_id: int, remitente: str, contenido: str, tipo: str = 'texto') -> int:
+        """Inserta un mensaje en la conversación y devuelve su id."""
+        t0 = time.perf_counter()
+        contenido = self._codificar(contenido)
+        t_espera = time.perf_counter()
+        with self.lock:
+            t_espera = time.perf_counter() - t_espera
+            if conversacion_id in self._archivadas:
+                # Una conversación archivada que vuelve a usarse pasa de nuevo a la base principal
+                self._desarchivar(conversacion_id)
+            cur = self.conn.cursor()
+            cur.execute('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) VALUES (?, ?, ?, ?)',
+                        (conversacion_id, remitente, tipo, contenido))
+            self.conn.commit()
+            mid = cur.lastrowid
+        with self._cache_lock:
+            if conversacion_id in self._conteo_mensajes:
+                self._conteo_mensajes[conversacion_id] += 1
+        telemetria.observar('db_espera_lock', t_espera)
+        telemetria.observar('db_agregar_mensaje', time.perf_counter() - t0)
+        return mid
+
+    def vaciar_conversacion(self, conversacion_id: int) -> None:
+        """Borra el historial de la conversación sin eliminarla."""
+        with self.lock:
+            tabla = self._tabla_mensajes(conversacion_id)
+            self.conn.execute(f'DELETE FROM {tabla} WHERE conversacion_id = ?', (conversacion_id,))
+            self.conn.execute('DELETE FROM resumenes WHERE conversacion_id = ?', (conversacion_id,))
+            self.conn.execute('UPDATE conversaciones SET archivo = NULL WHERE id = ?', (conversacion_id,))
+            self.conn.commit()
+            self._archivadas.pop(conversacion_id, None)
+        with self._cache_lock:
+            self._conteo_mensajes[conversacion_id] = 0
+
+    # --- ELIMINACIÓN DIFERIDA ---
+    # Borrar en cascada un proyecto grande puede tardar segundos con el lock tomado.
+    # En su lugar se marca la fila (lápida), desaparece de los listados al instante y
+    # un hilo purgador borra los hijos en lotes acotados, soltando el lock entre lotes.
+    def eliminar_proyecto(self, proyecto_id: int) -> None:
+        """Marca el proyecto y sus conversaciones como eliminados y agenda la purga."""
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                # Renombrar libera el nombre (UNIQUE) para poder crear otro proyecto igual
+                cur.execute('UPDATE proyectos SET eliminado = 1, nombre = ? || id || ? || nombre '
+                            'WHERE id = ? AND eliminado = 0', (_PREFIJO_ELIMINADO, '~', proyecto_id))
+                cur.execute('UPDATE conversaciones SET eliminado = 1 WHERE proyecto_id = ?', (proyecto_id,))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        self._cache_quitar_proyecto(proyecto_id)
+        self._agendar_purga()
+
+    def eliminar_chat(self, conversacion_id: int) -> None:
+        """Marca la conversación como eliminada y agenda la purga de sus mensajes."""
+        with self.lock:
+            self.conn.execute('UPDATE conversaciones SET eliminado = 1 WHERE id = ?', (conversacion_id,))
+            self.conn.commit()
+        with self._cache_lock:
+            self._conteo_mensajes.pop(conversacion_id, None)
+            if conversacion_id in self._chat_proyecto:
+                chats = self._chats.get(self._chat_proyecto.pop(conversacion_id), [])
+                chats[:] = [c for c in chats if c[0] != conversacion_id]
+            else:
+                # No sabemos en qué listado estaba: que se recargue
+                self._chats.clear()
+        self._agendar_purga()
+
+    def purga_pendiente(self) -> bool:
+        """True si quedan proyectos o conversaciones marcados sin purgar."""
+        with self.lock:
+            cur = self.conn.cursor()
+            return bool(cur.execute('SELECT 1 FROM conversaciones WHERE eliminado = 1 LIMIT 1').fetchone()
+                        or cur.execute('SELECT 1 FROM proyectos WHERE eliminado = 1 LIMIT 1').fetchone())
+
+    def _borrar_en_lotes(self, sql_ids: str, tabla: str, params: tuple, lote: int, pausa: float,
+                         archivo: Optional[str] = None) -> int:
+        """Borra filas de `tabla` cuyos ids devuelve `sql_ids` (con LIMIT ?), un lote por transacción.
+
+        Con `archivo`, borra en esa base de archivo (`{esquema}` en sql_ids es su alias).
+        """
+        total = 0
+        while not self._cerrando.is_set():
+            with self.lock:
+                esquema = self._adjuntar(archivo) if archivo else 'main'
+                cur = self.conn.cursor()
+                cur.execute(f'DELETE FROM {esquema}.{tabla} WHERE id IN ({sql_ids.format(esquema=esquema)})',
+                            params + (lote,))
+                borradas = cur.rowcount
+                self.conn.commit()
+            total += borradas
+            if borradas < lote:
+                break
+            # Ceder el lock (y el lock de escritura de SQLite) a lectores y escritores
+            time.sleep(pausa)
+        return total
+
+    def purgar_eliminados(self, lote: int = 2000, pausa: float = 0.005, vacuum_paginas: int = 1000) -> int:
+        """Borra físicamente lo marcado como eliminado. Devuelve la cantidad de filas borradas."""
+        total = 0
+        with self.lock:
+            convs = self.conn.execute(
+                'SELECT id, archivo FROM conversaciones WHERE eliminado = 1 ORDER BY id').fetchall()
+        archivos = sorted({archivo for _cid, archivo in convs if archivo})
+        for cid, archivo in convs:
+            if archivo:
+                total += self._borrar_en_lotes('SELECT id FROM {esquema}.mensajes WHERE conversacion_id = ? LIMIT ?',
+                                               'mensajes', (cid,), lote, pausa, archivo=archivo)
+            total += self._borrar_en_lotes('SELECT id FROM mensajes WHERE conversacion_id = ? LIMIT ?',
+                                           'mensajes', (cid,), lote, pausa)
+            if self._cerrando.is_set():
+                return total
+            with self.lock:
+                # Si llegó algún mensaje tardío, la cascada lo cubre (son pocos)
+                cur = self.conn.execute('DELETE FROM conversaciones WHERE id = ? AND eliminado = 1', (cid,))
+                total += cur.rowcount
+                self.conn.commit()
+                self._archivadas.pop(cid, None)
+        with self.lock:
+            proys = [r[0] for r in self.conn.execute(
+                'SELECT id FROM proyectos WHERE eliminado = 1 ORDER BY id').fetchall()]
+        for pid in proys:
+            total += self._borrar_en_lotes('SELECT id FROM tareas WHERE proyecto_id = ? LIMIT ?',
+                                           'tareas', (pid,), lote, pausa)
+            if self._cerrando.is_set():
+                return total
+            with self.lock:
+                cur = self.conn.execute('DELETE FROM proyectos WHERE id = ? AND eliminado = 1', (pid,))
+                total += cur.rowcount
+                self.conn.commit()
+        if total:
+            # Sacar del índice de búsqueda lo borrado (sin esperar a la próxima búsqueda)
+            for archivo in [None] + archivos:
+                self._vaciar_cola_busqueda(archivo, 1000, pausa)
+            if vacuum_paginas:
+                self._vacuum_incremental(vacuum_paginas, pausa)
+        return total
+
+    def _vacuum_incremental(self, paginas: int, pausa: float):
+        """Devuelve páginas libres al sistema de a poco (sólo si auto_vacuum=INCREMENTAL)."""
+        with self.lock:
+            if self.conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return
+        while not self._cerrando.is_set():
+            with self.lock:
+                libres = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if not libres:
+                    return
+                # execute() da un solo paso de la sentencia (libera una página); executescript la corre entera
+                self.conn.executescript(f'PRAGMA incremental_vacuum({min(paginas, libres)})')
+            time.sleep(pausa)
+
+    def _agendar_purga(self):
+        if not self.purga_automatica:
+            return
+        with self._purga_lock:
+            self._purga_pendiente.set()
+            if self._purgador is None:
+                self._purgador = threading.Thread(target=self._loop_purgador, name='purgador', daemon=True)
+                self._purgador.start()
+
+    def iniciar_purgador(self):
+        """Arranca el purgador si quedaron eliminaciones pendientes de una sesión anterior."""
+        if self.purga_pendiente():
+            self._agendar_purga()
+
+    def _loop_purgador(self):
+        while not self._cerrando.is_set():
+            with self._purga_lock:
+                if not self._purga_pendiente.is_set():
+                    # Sin trabajo: el hilo termina y se recrea en la próxima eliminación
+                    self._purgador = None
+                    return
+                self._purga_pendiente.clear()
+            try:
+                self.purgar_eliminados()
+            except Exception:
+                # Base cerrada u ocupada por otro proceso: reintentar más tarde
+                if not self._cerrando.wait(1.0):
+                    self._purga_pendiente.set()
+
+    def esperar_purga(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que el purgador termine (útil en tests y scripts)."""
+        hilo = self._purgador
+        if hilo is not None:
+            hilo.join(timeout)
+            return not hilo.is_alive()
+        return True
+
+    # --- CAMBIOS DE OTRAS INSTANCIAS ---
+    # Otra UI, la CLI o un script pueden escribir la misma base. PRAGMA data_version sólo
+    # cambia cuando commitea OTRA conexión y consultarlo no lee tablas: mientras nadie más
+    # escriba, vigilar cuesta un PRAGMA por intervalo. Cuando cambia, se leen de `cambios`
+    # sólo las filas con versión mayor a la última vista y se invalida sólo esa parte de la
+    # caché. Las filas pueden incluir cambios propios: quien las aplique debe ser idempotente.
+    def _version_cambios(self) -> int:
+        return self.conn.execute('SELECT COALESCE(MAX(version), 0) FROM cambios').fetchone()[0]
+
+    def revisar_cambios(self) -> List[Cambio]:
+        """Lo que cambió desde la última revisión si otra conexión escribió; [] si no.
+
+        Si la base fue reemplazada (p. ej. restaurada de un respaldo) devuelve un único
+        Cambio('*', ...): hay que recargar todo.
+        """
+        with self.lock:
+            data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return []
+            self._data_version = data_version
+            ultima = self._version_cambios()
+            if ultima < self._version_vista:
+                cambios = [Cambio('*', 0, None, ultima)]
+            else:
+                cambios = [Cambio(*row) for row in self.conn.execute(
+                    'SELECT tabla, clave, padre, version FROM cambios WHERE version > ? ORDER BY version',
+                    (self._version_vista,)).fetchall()]
+            self._version_vista = ultima
+        self._aplicar_cambios_externos(cambios)
+        return cambios
+
+    def _aplicar_cambios_externos(self, cambios: List[Cambio]):
+        """Invalida sólo lo afectado del directorio en memoria."""
+        tablas = {c.tabla for c in cambios}
+        if '*' in tablas or 'proyectos' in tablas:
+            self.invalidar_cache()
+        else:
+            with self._cache_lock:
+                for c in cambios:
+                    if c.tabla == 'conversaciones':
+                        self._chats.pop(c.padre, None)
+                        proyecto_previo = self._chat_proyecto.pop(c.clave, c.padre)
+                        self._chats.pop(proyecto_previo, None)
+                        self._conteo_mensajes.pop(c.clave, None)
+                    elif c.tabla == 'mensajes':
+                        self._conteo_mensajes.pop(c.clave, None)
+        if tablas & {'*', 'conversaciones'}:
+            # Otra instancia pudo archivar o desarchivar conversaciones
+            self._cargar_archivadas()
+
+    def vigilar_cambios(self, al_cambiar: Callable[[List[Cambio]], None], intervalo: float = 0.5):
+        """Revisa cada `intervalo` segundos en un hilo y llama a al_cambiar(cambios) desde ese hilo."""
+        if self._vigilante is not None:
+            return
+
+        def loop():
+            while not self._cerrando.wait(intervalo):
+                try:
+                    cambios = self.revisar_cambios()
+                except sqlite3.Error:
+                    # Base ocupada por otro proceso o cerrándose: se reintenta al próximo intervalo
+                    continue
+                if cambios:
+                    try:
+                        al_cambiar(cambios)
+                    except Exception:
+                        pass
+        self._vigilante = threading.Thread(target=loop, name='vigilante-cambios', daemon=True)
+        self._vigilante.start()
+
+    def cerrar(self):
+        """Detiene el purgador, el vigilante, el indexador y el respaldo en curso y cierra la conexión."""
+        self._cerrando.set()
+        self._purga_pendiente.set()
+        for hilo in (self._purgador, self._vigilante, self._indexador):
+            if hilo is not None and hilo is not threading.current_thread():
+                hilo.join(timeout=5.0)
+        respaldo = self._respaldo
+        if respaldo is not None:
+            try:
+                respaldo.exception(timeout=5.0)
+            except Exception:
+                pass
+        self.conn.close()
 
     def listar_mensajes(self, conversacion_id: int) -> List[Tuple[str, str]]:
         """Devuelve (remitente, contenido) de una conversación ordenados por fecha e id.
@@ -229,15 +1038,773 @@ class AgentePersonal:
         Se ejecuta bajo lock para evitar condiciones de carrera con otros hilos que
         escriban/lean simultáneamente en la misma conexión SQLite.
         """
+        t0 = time.perf_counter()
         with self.lock:
+            t_espera = time.perf_counter() - t0
+            # Si la conversación está archivada se lee de su base de archivo (adjunta a demanda)
+            tabla = self._tabla_mensajes(conversacion_id)
             cur = self.conn.cursor()
             cur.execute(
-                'SELECT remitente, contenido FROM mensajes WHERE conversacion_id = ? '
+                f'SELECT remitente, contenido FROM {tabla} WHERE conversacion_id = ? '
                 'ORDER BY datetime(fecha) ASC, id ASC',
                 (conversacion_id,)
             )
-            return cur.fetchall()
+            rows = cur.fetchall()
+        mensajes = [(remitente, self._descomprimir(contenido)) for remitente, contenido in rows]
+        telemetria.observar('db_espera_lock', t_espera)
+        telemetria.observar('db_listar_mensajes', time.perf_counter() - t0)
+        return mensajes
+
+    def listar_mensajes_desde(self, conversacion_id: int, despues_de_id: int = 0) -> List[Tuple[int, str, str]]:
+        """(id, remitente, contenido) de los mensajes con id > despues_de_id, en el orden de listar_mensajes."""
+        with self.lock:
+            tabla = self._tabla_mensajes(conversacion_id)
+            rows = self.conn.execute(
+                f'SELECT id, remitente, contenido FROM {tabla} WHERE conversacion_id = ? AND id > ? '
+                'ORDER BY datetime(fecha) ASC, id ASC',
+                (conversacion_id, despues_de_id)
+            ).fetchall()
+        return [(mid, remitente, self._descomprimir(contenido)) for mid, remitente, contenido in rows]
+
+    # --- RESÚMENES ---
+    def obtener_resumen(self, conversacion_id: int) -> Tuple[Optional[str], int]:
+        """(resumen, hasta_mensaje_id) de la conversación; (None, 0) si todavía no tiene."""
+        with self.lock:
+            row = self.conn.execute('SELECT resumen, hasta_mensaje_id FROM resumenes WHERE conversacion_id = ?',
+                                    (conversacion_id,)).fetchone()
+        return (row[0], row[1]) if row else (None, 0)
+
+    def guardar_resumen(self, conversacion_id: int, resumen: str, hasta_mensaje_id: int) -> bool:
+        """Guarda el resumen si avanza la marca de agua. False si ya había uno igual o más nuevo."""
+        with self.lock:
+            cur = self.conn.execute(
+                'INSERT INTO resumenes (conversacion_id, resumen, hasta_mensaje_id) VALUES (?, ?, ?) '
+                'ON CONFLICT(conversacion_id) DO UPDATE SET resumen = excluded.resumen, '
+                'hasta_mensaje_id = excluded.hasta_mensaje_id, actualizado = CURRENT_TIMESTAMP '
+                'WHERE excluded.hasta_mensaje_id > resumenes.hasta_mensaje_id',
+                (conversacion_id, resumen, hasta_mensaje_id))
+            self.conn.commit()
+            return cur.rowcount > 0
+
+    def buscar_mensajes(self, texto: str, conversacion_id: Optional[int] = None,
+                        limite: int = 50, incluir_archivo: bool = True) -> List[Tuple[int, int, str, str]]:
+        """Busca `texto` (sin distinguir mayúsculas, también acentuadas) en los mensajes visibles.
+
+        Devuelve (id, conversacion_id, remitente, contenido), los más nuevos primero.
+        Con 3 caracteres o más usa el índice de búsqueda (ver _SQL_BUSQUEDA) y sólo se
+        descomprimen los mensajes que se devuelven y los que el índice todavía no tiene al
+        día; los textos más cortos recorren todo descomprimiendo con la función SQL contiene().
+        Con `incluir_archivo` busca también en las bases de archivo.
+        """
+        filtro = ' AND m.conversacion_id = ?' if conversacion_id is not None else ''
+        extra: tuple = (conversacion_id,) if conversacion_id is not None else ()
+        columnas = 'SELECT m.id, m.conversacion_id, m.remitente, m.contenido '
+        visibles = 'JOIN main.conversaciones c ON c.id = m.conversacion_id WHERE c.eliminado = 0'
+        orden = ' ORDER BY m.id DESC LIMIT ?'
+        frase = '"' + texto.replace('"', '""') + '"'
+
+        def buscar_en(esquema: str) -> List[tuple]:
+            self._aplicar_cola_busqueda(esquema)
+            if len(texto) < 3:  # el trigram no indexa menos de tres caracteres
+                consultas = [(f'{columnas}FROM {esquema}.mensajes m {visibles} AND contiene(m.contenido, ?)',
+                              (texto.lower(),))]
+            else:
+                en_cola = f'SELECT id FROM {esquema}.busqueda_cola'
+                sin_indexar = f'm.id IN ({en_cola})'
+                params: tuple = ()
+                pendiente = self.conn.execute(f'SELECT desde, hasta FROM {esquema}.busqueda_pendiente').fetchone()
+                if pendiente:
+                    sin_indexar += ' OR (m.id > ? AND m.id <= ?)'
+                    params = tuple(pendiente)
+                consultas = [
+                    (f'{columnas}FROM {esquema}.mensajes_busqueda b JOIN {esquema}.mensajes m ON m.id = b.rowid '
+                     f'{visibles} AND b.mensajes_busqueda MATCH ? AND m.id NOT IN ({en_cola})', (frase,)),
+                    (f'{columnas}FROM {esquema}.mensajes m {visibles} AND ({sin_indexar}) '
+                     'AND contiene(m.contenido, ?)', params + (texto.lower(),)),
+                ]
+            rows = []
+            for sql, params in consultas:
+                rows += self.conn.execute(sql + filtro + orden, params + extra + (limite,)).fetchall()
+            return rows
+
+        if not texto:
+            return []
+        with self.lock:
+            rows = buscar_en('main')
+            if incluir_archivo:
+                if conversacion_id is not None:
+                    archivos = {self._archivadas.get(conversacion_id)} - {None}
+                else:
+                    archivos = set(self._archivadas.values())
+                for archivo in sorted(archivos):
+                    rows += buscar_en(self._adjuntar(archivo))
+        rows.sort(key=lambda r: r[0], reverse=True)
+        return [(mid, cid, rem, self._descomprimir(cont)) for mid, cid, rem, cont in rows[:limite]]
+
+    def _asegurar_busqueda(self, esquema: str):
+        """Crea el índice de búsqueda y sus triggers en `esquema` (idempotente). Requiere self.lock.
+
+        Si la base ya tenía mensajes, quedan anotados en busqueda_pendiente para
+        indexar_busqueda_pendiente; mientras tanto la búsqueda los recorre descomprimiendo.
+        """
+        existia = self.conn.execute(
+            f"SELECT 1 FROM {esquema}.sqlite_master WHERE name = 'mensajes_busqueda'").fetchone()
+        for sql in _SQL_BUSQUEDA:
+            self.conn.execute(sql.format(esquema=esquema))
+        if not existia:
+            hasta = self.conn.execute(f'SELECT MAX(id) FROM {esquema}.mensajes').fetchone()[0]
+            if hasta is not None:
+                self.conn.execute(f'INSERT INTO {esquema}.busqueda_pendiente (desde, hasta) VALUES (0, ?)',
+                                  (hasta,))
+        self.conn.commit()
+
+    def _aplicar_cola_busqueda(self, esquema: str, lote: int = 1000) -> int:
+        """Pasa al índice de búsqueda hasta `lote` anotaciones de busqueda_cola. Requiere self.lock.
+
+        Devuelve la cantidad de mensajes revisados (0 si la cola está vacía o si otra
+        conexión está escribiendo: la cola queda para la próxima y la búsqueda igual la
+        tiene en cuenta).
+        """
+        if not self.conn.execute(f'SELECT 1 FROM {esquema}.busqueda_cola LIMIT 1').fetchone():
+            return 0
+        cur = self.conn.cursor()
+        try:
+            cur.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            return 0
+        try:
+            filas = cur.execute(f'SELECT orden, id, contenido FROM {esquema}.busqueda_cola ORDER BY orden LIMIT ?',
+                                (lote,)).fetchall()
+            # Lo indexado es el contenido de la primera baja de cada id (una primera alta: nada);
+            # al terminar el índice queda como la fila actual, así que sobran todas sus anotaciones
+            indexado: Dict[int, object] = {}
+            for _orden, mid, contenido in filas:
+                indexado.setdefault(mid, contenido)
+            ids = list(indexado)
+            actual: Dict[int, object] = {}
+            for i in range(0, len(ids), _IDS_POR_SENTENCIA):
+                parte = ids[i:i + _IDS_POR_SENTENCIA]
+                actual.update(cur.execute(f'SELECT id, contenido FROM {esquema}.mensajes '
+                                          f'WHERE id IN ({",".join("?" * len(parte))})', parte).fetchall())
+            for mid, viejo in indexado.items():
+                antes = self._descomprimir_sql(viejo)
+                ahora = self._descomprimir_sql(actual.get(mid))
+                if antes == ahora:
+                    continue  # p. ej. un mensaje que sólo se comprimió
+                if antes is not None:
+                    cur.execute(f"INSERT INTO {esquema}.mensajes_busqueda (mensajes_busqueda, rowid, texto) "
+                                "VALUES ('delete', ?, ?)", (mid, antes))
+                if ahora is not None:
+                    cur.execute(f'INSERT INTO {esquema}.mensajes_busqueda (rowid, texto) VALUES (?, ?)',
+                                (mid, ahora))
+            for i in range(0, len(ids), _IDS_POR_SENTENCIA):
+                parte = ids[i:i + _IDS_POR_SENTENCIA]
+                cur.execute(f'DELETE FROM {esquema}.busqueda_cola WHERE id IN ({",".join("?" * len(parte))})', parte)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return len(ids)
+
+    def _vaciar_cola_busqueda(self, archivo: Optional[str], lote: int, pausa: float) -> int:
+        """Aplica toda busqueda_cola de la base principal (None) o de un archivo, de a lotes."""
+        revisados = 0
+        while not self._cerrando.is_set():
+            with self.lock:
+                n = self._aplicar_cola_busqueda(self._adjuntar(archivo) if archivo else 'main', lote)
+            if not n:
+                break
+            revisados += n
+            time.sleep(pausa)
+        return revisados
+
+    def indexar_busqueda_pendiente(self, lote: int = 500, pausa: float = 0.005) -> int:
+        """Pone al día el índice de búsqueda de la base principal y las de archivo.
+
+        Aplica busqueda_cola e indexa los mensajes anteriores al índice por rangos de id,
+        un lote por transacción (suelta el lock entre lotes). Se puede cortar y retomar:
+        el avance queda en busqueda_pendiente. Devuelve la cantidad de mensajes revisados.
+        """
+        indexados = 0
+        with self.lock:
+            archivos = sorted(set(self._archivadas.values()))
+        for archivo in [None] + archivos:
+            # Primero lo anotado por los triggers (altas, bajas y cambios recientes)
+            indexados += self._vaciar_cola_busqueda(archivo, lote, pausa)
+            while not self._cerrando.is_set():
+                with self.lock:
+                    esquema = self._adjuntar(archivo) if archivo else 'main'
+                    cur = self.conn.cursor()
+                    cur.execute('BEGIN IMMEDIATE')
+                    try:
+                        pendiente = cur.execute(f'SELECT desde, hasta FROM {esquema}.busqueda_pendiente').fetchone()
+                        if pendiente is None:
+                            self.conn.rollback()
+                            break
+                        desde, hasta = pendiente
+                        ids = cur.execute(f'SELECT id FROM {esquema}.mensajes WHERE id > ? AND id <= ? '
+                                          'ORDER BY id LIMIT ?', (desde, hasta, lote)).fetchall()
+                        if ids:
+                            cur.execute(f'INSERT INTO {esquema}.mensajes_busqueda (rowid, texto) '
+                                        f'SELECT id, descomprimir(contenido) FROM {esquema}.mensajes '
+                                        'WHERE id > ? AND id <= ?', (desde, ids[-1][0]))
+                            indexados += len(ids)
+                        if len(ids) < lote:
+                            cur.execute(f'DELETE FROM {esquema}.busqueda_pendiente')
+                        else:
+                            cur.execute(f'UPDATE {esquema}.busqueda_pendiente SET desde = ?', (ids[-1][0],))
+                        self.conn.commit()
+                    except Exception:
+                        self.conn.rollback()
+                        raise
+                time.sleep(pausa)
+        return indexados
+
+    def iniciar_indexador(self):
+        """Lanza indexar_busqueda_pendiente en segundo plano (se detiene al cerrar)."""
+        if self._indexador is None or not self._indexador.is_alive():
+            self._indexador = threading.Thread(target=self.indexar_busqueda_pendiente,
+                                               name='indexador-busqueda', daemon=True)
+            self._indexador.start()
+
+    # --- ARCHIVO ---
+    # Las conversaciones sin actividad se mueven a bases SQLite aparte (una por año o por
+    # proyecto, dentro de dir_archivo) que se adjuntan con ATTACH sólo cuando se leen. Así
+    # la base principal queda chica y sus B-trees y caché sólo tienen el historial vivo.
+    # conversaciones.archivo guarda el nombre del archivo (NULL = base principal).
+    def _cargar_archivadas(self):
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT id, archivo FROM conversaciones WHERE archivo IS NOT NULL').fetchall()
+        self._archivadas: Dict[int, str] = dict(rows)
+
+    def _adjuntar(self, archivo: str) -> str:
+        """Adjunta la base de archivo (si no lo está) y devuelve su alias. Requiere self.lock."""
+        alias = self._adjuntos.get(archivo)
+        if alias is not None:
+            self._adjuntos.move_to_end(archivo)
+            return alias
+        if not self.dir_archivo:
+            raise ValueError('Esta base no tiene directorio de archivo (¿base en memoria?).')
+        if self.conn.in_transaction:
+            self.conn.commit()  # ATTACH/DETACH no se permiten dentro de una transacción
+        while len(self._adjuntos) >= _MAX_ARCHIVOS_ADJUNTOS:
+            _viejo, alias_viejo = self._adjuntos.popitem(last=False)
+            self.conn.execute(f'DETACH DATABASE {alias_viejo}')
+        self._n_adjuntos += 1
+        alias = f'arch{self._n_adjuntos}'
+        os.makedirs(self.dir_archivo, exist_ok=True)
+        self.conn.execute(f'ATTACH DATABASE ? AS {alias}', (os.path.join(self.dir_archivo, archivo),))
+        # Mismo esquema que mensajes, sin la FK (conversaciones vive en la base principal)
+        self.conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {alias}.mensajes (
+                id INTEGER PRIMARY KEY,
+                conversacion_id INTEGER NOT NULL,
+                remitente TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                contenido TEXT NOT NULL,
+                fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        tabla, columnas = INDICES['idx_mensajes_conversacion_fecha']
+        self.conn.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_mensajes_conversacion_fecha '
+                          f'ON {tabla} ({columnas})')
+        self._asegurar_busqueda(alias)
+        self._adjuntos[archivo] = alias
+        return alias
+
+    def _tabla_mensajes(self, conversacion_id: int) -> str:
+        """Tabla (con esquema) donde están los mensajes de la conversación. Requiere self.lock."""
+        archivo = self._archivadas.get(conversacion_id)
+        return f'{self._adjuntar(archivo)}.mensajes' if archivo else 'main.mensajes'
+
+    def _mover_mensajes(self, conversacion_id: int, origen: str, destino: str, archivo: Optional[str]):
+        """Mueve los mensajes entre bases en una sola transacción. Requiere self.lock."""
+        cur = self.conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            cur.execute(f'INSERT INTO {destino}.mensajes (id, conversacion_id, remitente, tipo, contenido, fecha) '
+                        f'SELECT id, conversacion_id, remitente, tipo, contenido, fecha FROM {origen}.mensajes '
+                        'WHERE conversacion_id = ?', (conversacion_id,))
+            movidos = cur.rowcount
+            cur.execute(f'DELETE FROM {origen}.mensajes WHERE conversacion_id = ?', (conversacion_id,))
+            cur.execute('UPDATE conversaciones SET archivo = ? WHERE id = ?', (archivo, conversacion_id))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        if archivo:
+            self._archivadas[conversacion_id] = archivo
+        else:
+            self._archivadas.pop(conversacion_id, None)
+        return movidos
+
+    def _desarchivar(self, conversacion_id: int) -> int:
+        origen = self._adjuntar(self._archivadas[conversacion_id])
+        return self._mover_mensajes(conversacion_id, origen, 'main', None)
+
+    def desarchivar_conversacion(self, conversacion_id: int) -> int:
+        """Devuelve la conversación a la base principal. Devuelve la cantidad de mensajes movidos."""
+        with self.lock:
+            if conversacion_id not in self._archivadas:
+                return 0
+            return self._desarchivar(conversacion_id)
+
+    def archivar_inactivas(self, dias: int = 180, por: str = 'anio', pausa: float = 0.005,
+                           vacuum_paginas: int = 1000) -> Dict[str, int]:
+        """Mueve al archivo las conversaciones cuyo último mensaje tiene más de `dias` días.
+
+        `por` elige el archivo destino: 'anio' (anio_AAAA.db, por la fecha del último
+        mensaje) o 'proyecto' (proyecto_<id>.db, libres.db para las conversaciones
+        sueltas). Cada conversación se mueve en su propia transacción, soltando el lock
+        entre una y otra. Devuelve la cantidad de conversaciones y mensajes movidos.
+        """
+        if por not in ('anio', 'proyecto'):
+            raise ValueError("por debe ser 'anio' o 'proyecto'")
+        if not self.dir_archivo:
+            raise ValueError('Esta base no tiene directorio de archivo (¿base en memoria?).')
+        with self.lock:
+            candidatas = self.conn.execute(
+                'SELECT c.id, c.proyecto_id, MAX(datetime(m.fecha)) AS ultimo FROM conversaciones c '
+                'JOIN mensajes m ON m.conversacion_id = c.id '
+                'WHERE c.eliminado = 0 AND c.archivo IS NULL GROUP BY c.id '
+                "HAVING ultimo < datetime('now', ?) ORDER BY c.id",
+                (f'-{int(dias)} days',)).fetchall()
+        informe = {'conversaciones': 0, 'mensajes': 0}
+        for cid, proyecto_id, ultimo in candidatas:
+            if self._cerrando.is_set():
+                break
+            if por == 'anio':
+                archivo = f'anio_{ultimo[:4]}.db'
+            else:
+                archivo = f'proyecto_{proyecto_id}.db' if proyecto_id is not None else 'libres.db'
+            with self.lock:
+                # Re-chequear: pudo eliminarse o recibir mensajes desde la selección
+                vigente = self.conn.execute(
+                    'SELECT 1 FROM conversaciones c WHERE c.id = ? AND c.eliminado = 0 AND c.archivo IS NULL '
+                    "AND (SELECT MAX(datetime(fecha)) FROM mensajes WHERE conversacion_id = c.id) < datetime('now', ?)",
+                    (cid, f'-{int(dias)} days')).fetchone()
+                if not vigente:
+                    continue
+                destino = self._adjuntar(archivo)
+                informe['mensajes'] += self._mover_mensajes(cid, 'main', destino, archivo)
+                informe['conversaciones'] += 1
+            time.sleep(pausa)
+        if informe['conversaciones'] and vacuum_paginas:
+            self._vacuum_incremental(vacuum_paginas, pausa)
+        return informe
+
+    def conversacion_archivada(self, conversacion_id: int) -> Optional[str]:
+        """Nombre del archivo donde está la conversación, o None si está en la base principal."""
+        with self.lock:
+            return self._archivadas.get(conversacion_id)
+
+    # --- RESPALDOS ---
+    # Fotos consistentes de la base sin cerrar la app. El método 'backup' usa la API de
+    # respaldo de SQLite sobre la MISMA conexión, de a `paginas` por paso: entre pasos se
+    # suelta self.lock, así la UI sigue leyendo y escribiendo, y lo que se escriba mientras
+    # tanto SQLite lo vuelca también en la copia (con otra conexión el respaldo se
+    # reiniciaría con cada escritura). Cada foto es un directorio dentro de dir_respaldos
+    # con la base principal y, opcionalmente, las bases de archivo.
+    def respaldar(self, metodo: str = 'backup', paginas: int = 256, pausa: float = 0.005,
+                  conservar: int = 7, incluir_archivo: bool = True, verificar: bool = True) -> str:
+        """Toma una foto de la base y devuelve la ruta de su directorio.
+
+        metodo='vacuum' usa VACUUM INTO: la copia sale compacta pero se hace en un solo
+        paso con el lock tomado (bloquea a los demás hilos mientras dura). Se conservan
+        las `conservar` fotos más recientes.
+        """
+        if metodo not in ('backup', 'vacuum'):
+            raise ValueError("metodo debe ser 'backup' o 'vacuum'")
+        if not self.dir_respaldos:
+            raise ValueError('Esta base no tiene directorio de respaldos (¿base en memoria?).')
+        os.makedirs(self.dir_respaldos, exist_ok=True)
+        nombre = base = time.strftime('%Y%m%d-%H%M%S')
+        n = 1
+        while os.path.exists(os.path.join(self.dir_respaldos, nombre)):
+            n += 1
+            nombre = f'{base}-{n}'
+        final = os.path.join(self.dir_respaldos, nombre)
+        parcial = final + '.parcial'
+        os.makedirs(parcial)
+        try:
+            destino = os.path.join(parcial, os.path.basename(self.db_path))
+            if metodo == 'vacuum':
+                with self.lock:
+                    if self.conn.in_transaction:
+                        self.conn.commit()
+                    self.conn.execute('VACUUM INTO ?', (destino,))
+            else:
+                self._copiar_en_pasos(destino, paginas, pausa)
+            if verificar:
+                self._verificar_copia(destino)
+            if incluir_archivo and self.dir_archivo and os.path.isdir(self.dir_archivo):
+                dir_copia = os.path.join(parcial, os.path.basename(self.dir_archivo))
+                os.makedirs(dir_copia)
+                for archivo in sorted(os.listdir(self.dir_archivo)):
+                    if archivo.endswith('.db'):
+                        self._copiar_en_pasos(os.path.join(dir_copia, archivo), paginas, pausa,
+                                              origen=os.path.join(self.dir_archivo, archivo))
+            os.rename(parcial, final)
+        except BaseException:
+            shutil.rmtree(parcial, ignore_errors=True)
+            raise
+        self._rotar_respaldos(conservar)
+        return final
+
+    def _copiar_en_pasos(self, destino: str, paginas: int, pausa: float, origen: Optional[str] = None):
+        """Copia con la API de backup de a `paginas` páginas, pausando entre pasos.
+
+        Sin `origen` copia la base principal por self.conn (soltando self.lock entre pasos);
+        con `origen` (bases de archivo, que casi no cambian) usa una conexión aparte.
+        """
+        dest = sqlite3.connect(destino)
+        # La copia es un archivo nuevo que se verifica y renombra al final: sin journal ni
+        # fsync de SQLite. Se baja a disco de a tramos entre pasos para no acumular cientos
+        # de MB sucios que después frenan los commits de la base principal.
+        dest.execute('PRAGMA journal_mode = OFF')
+        dest.execute('PRAGMA synchronous = OFF')
+        fd = os.open(destino, os.O_RDWR)
+        pasos = 0
+
+        def entre_pasos():
+            nonlocal pasos
+            pasos += 1
+            if pasos % 16 == 0:
+                os.fsync(fd)
+            self._pausa_respaldo(pausa)
+
+        try:
+            if origen is not None:
+                src = sqlite3.connect(origen)
+                try:
+                    src.backup(dest, pages=paginas, progress=lambda *_: entre_pasos())
+                finally:
+                    src.close()
+            else:
+                def progreso(_estado, _restantes, _total):
+                    self.lock.release()
+                    try:
+                        entre_pasos()
+                    finally:
+                        self.lock.acquire()
+
+                with self.lock:
+                    if self.conn.in_transaction:
+                        self.conn.commit()
+                    self.conn.backup(dest, pages=paginas, progress=progreso)
+        finally:
+            dest.close()
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _pausa_respaldo(self, pausa: float):
+        if self._cerrando.wait(pausa):
+            raise InterruptedError('Respaldo cancelado: la base se está cerrando.')
+
+    @staticmethod
+    def _verificar_copia(ruta: str):
+        conn = sqlite3.connect(ruta)
+        try:
+            resultado = conn.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            conn.close()
+        if resultado != 'ok':
+            raise sqlite3.DatabaseError(f'El respaldo {ruta} no pasó quick_check: {resultado}')
+
+    def listar_respaldos(self) -> List[str]:
+        """Rutas de las fotos completas, de la más reciente a la más vieja."""
+        if not self.dir_respaldos or not os.path.isdir(self.dir_respaldos):
+            return []
+        nombres = [n for n in os.listdir(self.dir_respaldos) if _PATRON_RESPALDO.match(n)]
+        nombres.sort(key=lambda n: (n[:15], int(n[16:] or 1)), reverse=True)
+        return [os.path.join(self.dir_respaldos, n) for n in nombres]
+
+    def _rotar_respaldos(self, conservar: int):
+        for ruta in self.listar_respaldos()[max(conservar, 1):]:
+            shutil.rmtree(ruta, ignore_errors=True)
+        # Restos de respaldos interrumpidos (cierre de la app, corte de luz)
+        for n in os.listdir(self.dir_respaldos):
+            if n.endswith('.parcial') and (self._respaldo is None or self._respaldo.done()):
+                shutil.rmtree(os.path.join(self.dir_respaldos, n), ignore_errors=True)
+
+    def respaldar_en_segundo_plano(self, **opciones) -> Future:
+        """Ejecuta respaldar(**opciones) en un hilo aparte; devuelve un Future con la ruta.
+
+        Si ya hay un respaldo en curso devuelve ese mismo Future.
+        """
+        with self._respaldo_lock:
+            if self._respaldo is not None and not self._respaldo.done():
+                return self._respaldo
+            fut: Future = Future()
+            self._respaldo = fut
+
+        def trabajar():
+            if not fut.set_running_or_notify_cancel():
+                return
+            try:
+                fut.set_result(self.respaldar(**opciones))
+            except BaseException as e:
+                fut.set_exception(e)
+
+        threading.Thread(target=trabajar, name='respaldo', daemon=True).start()
+        return fut
+
+    def respaldar_si_vencido(self, horas: float = 24.0, **opciones) -> Optional[Future]:
+        """Lanza un respaldo en segundo plano si el último tiene más de `horas` horas."""
+        respaldos = self.listar_respaldos()
+        if respaldos and time.time() - os.path.getmtime(respaldos[0]) < horas * 3600:
+            return None
+        return self.respaldar_en_segundo_plano(**opciones)
+
+    # --- EXPORTACIÓN / IMPORTACIÓN ---
+    # Formato: JSON Lines, un registro por línea, comprimido según la extensión del archivo
+    # (.jsonl.zst con zstandard, .jsonl.gz con la librería estándar, .jsonl plano). La primera
+    # línea es una cabecera con los totales; después vienen el proyecto, sus tareas, sus
+    # conversaciones y los mensajes agrupados por conversación. Todo se lee y escribe en
+    # lotes, así que la memoria no depende del tamaño del proyecto.
+    def exportar_proyecto(self, proyecto_id: int, ruta: str, lote: int = 2000) -> Dict[str, int]:
+        """Exporta el proyecto (tareas, conversaciones y mensajes, incluidos los archivados).
+
+        Los mensajes se escriben descomprimidos para que el archivo no dependa de los
+        diccionarios de esta base. Devuelve los totales escritos.
+        """
+        with self.lock:
+            fila = self.conn.execute('SELECT nombre, contexto FROM proyectos WHERE id = ? AND eliminado = 0',
+                                     (proyecto_id,)).fetchone()
+            if fila is None:
+                raise ValueError(f'Proyecto {proyecto_id} no existe.')
+            convs = self.conn.execute('SELECT id, nombre, fecha_inicio FROM conversaciones '
+                                      'WHERE proyecto_id = ? AND eliminado = 0 ORDER BY id',
+                                      (proyecto_id,)).fetchall()
+            n_tareas = self.conn.execute('SELECT COUNT(*) FROM tareas WHERE proyecto_id = ?',
+                                         (proyecto_id,)).fetchone()[0]
+            n_mensajes = 0
+            for cid, _nombre, _fecha in convs:
+                n_mensajes += self.conn.execute(
+                    f'SELECT COUNT(*) FROM {self._tabla_mensajes(cid)} WHERE conversacion_id = ?',
+                    (cid,)).fetchone()[0]
+        totales = {'proyectos': 1, 'tareas': n_tareas, 'conversaciones': len(convs), 'mensajes': n_mensajes}
+        with compresion.abrir_flujo(ruta, 'wt') as f:
+            def escribir(registro):
+                f.write(json.dumps(registro, ensure_ascii=False))
+                f.write('\n')
+
+            escribir({'formato': 'agente_personal', 'version': 1, **totales})
+            escribir({'t': 'proyecto', 'nombre': fila[0], 'contexto': fila[1]})
+            ultimo = 0
+            while True:
+                with self.lock:
+                    rows = self.conn.execute('SELECT id, descripcion, estado FROM tareas WHERE proyecto_id = ? '
+                                             'AND id > ? ORDER BY id LIMIT ?', (proyecto_id, ultimo, lote)).fetchall()
+                for ultimo, descripcion, estado in rows:
+                    escribir({'t': 'tarea', 'descripcion': descripcion, 'estado': estado})
+                if len(rows) < lote:
+                    break
+            for cid, nombre, fecha_inicio in convs:
+                escribir({'t': 'conversacion', 'id': cid, 'nombre': nombre, 'fecha_inicio': fecha_inicio})
+            for cid, _nombre, _fecha in convs:
+                ultimo = 0
+                while True:
+                    with self.lock:
+                        rows = self.conn.execute(
+                            f'SELECT id, remitente, tipo, contenido, fecha FROM {self._tabla_mensajes(cid)} '
+                            'WHERE conversacion_id = ? AND id > ? ORDER BY id LIMIT ?',
+                            (cid, ultimo, lote)).fetchall()
+                    for ultimo, remitente, tipo, contenido, fecha in rows:
+                        escribir({'t': 'mensaje', 'c': cid, 'remitente': remitente, 'tipo': tipo,
+                                  'contenido': self._descomprimir(contenido), 'fecha': fecha})
+                    if len(rows) < lote:
+                        break
+        return totales
+
+    def importar_proyecto(self, ruta: str, nombre: Optional[str] = None, lote: int = 2000) -> int:
+        """Importa un proyecto exportado con exportar_proyecto y devuelve su nuevo id.
+
+        `nombre` reemplaza al nombre original (ValueError si ya existe). Inserta en lotes
+        de `lote` filas por transacción. Los índices quedan en su lugar durante la carga:
+        la base es compartida y sin ellos el resto de la app haría SCAN mientras dure la
+        importación. Si algo falla, el proyecto a medio importar se elimina.
+        """
+        with compresion.abrir_flujo(ruta, 'rt') as f:
+            cabecera = json.loads(f.readline() or '{}')
+            if cabecera.get('formato') != 'agente_personal' or cabecera.get('version') != 1:
+                raise ValueError(f'{ruta} no es una exportación de proyecto válida.')
+            registro = json.loads(f.readline())
+            if registro.get('t') != 'proyecto':
+                raise ValueError(f'{ruta}: falta el registro del proyecto.')
+            nombre = nombre or registro['nombre']
+            if self.id_proyecto(nombre) is not None:
+                raise ValueError(f"Proyecto '{nombre}' ya existe.")
+            proyecto_id = self.crear_proyecto(nombre, registro.get('contexto'))
+            try:
+                self._importar_registros(f, proyecto_id, lote)
+            except BaseException:
+                self.eliminar_proyecto(proyecto_id)
+                raise
+        return proyecto_id
+
+    def _importar_registros(self, f, proyecto_id: int, lote: int):
+        ids_conversacion: Dict[int, int] = {}  # id en el archivo -> id nuevo
+        pendientes: Dict[str, list] = {'tarea': [], 'mensaje': []}
+        sql = {
+            'tarea': 'INSERT INTO tareas (proyecto_id, descripcion, estado) VALUES (?, ?, ?)',
+            'mensaje': 'INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido, fecha) '
+                       'VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))',
+        }
+
+        def volcar(tipo):
+            if pendientes[tipo]:
+                with self.lock:
+                    self.conn.executemany(sql[tipo], pendientes[tipo])
+                    self.conn.commit()
+                pendientes[tipo].clear()
+
+        for linea in f:
+            if not linea.strip():
+                continue
+            r = json.loads(linea)
+            t = r.get('t')
+            if t == 'tarea':
+                pendientes['tarea'].append((proyecto_id, r['descripcion'], r.get('estado') or 'pendiente'))
+            elif t == 'conversacion':
+                with self.lock:
+                    cur = self.conn.execute('INSERT INTO conversaciones (nombre, proyecto_id, fecha_inicio) '
+                                            'VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))',
+                                            (r.get('nombre'), proyecto_id, r.get('fecha_inicio')))
+                    self.conn.commit()
+                ids_conversacion[r['id']] = cur.lastrowid
+            elif t == 'mensaje':
+                try:
+                    cid = ids_conversacion[r['c']]
+                except KeyError:
+                    raise ValueError(f"Mensaje de una conversación desconocida ({r['c']}).") from None
+                pendientes['mensaje'].append((cid, r['remitente'], r.get('tipo') or 'texto',
+                                              self._codificar(r['contenido']), r.get('fecha')))
+            else:
+                raise ValueError(f'Registro desconocido en la importación: {t!r}')
+            for tipo, filas in pendientes.items():
+                if len(filas) >= lote:
+                    volcar(tipo)
+        for tipo in pendientes:
+            volcar(tipo)
+        with self._cache_lock:
+            self._chats.pop(proyecto_id, None)
+
+    # --- COMPRESIÓN ---
+    def _descomprimir(self, valor):
+        if self._falta_diccionario(valor):
+            with self.lock:
+                self._leer_diccionarios()
+        return compresion.descomprimir(valor, self._diccionarios)
+
+    def _descomprimir_sql(self, valor):
+        # La función SQL corre dentro de una consulta que ya tiene self.lock
+        if self._falta_diccionario(valor):
+            self._leer_diccionarios()
+        return compresion.descomprimir(valor, self._diccionarios)
+
+    def _contiene_sql(self, valor, texto: str) -> bool:
+        # Búsqueda sin índice: `texto` ya viene en minúsculas
+        return texto in (self._descomprimir_sql(valor) or '').lower()
+
+    def _falta_diccionario(self, valor) -> bool:
+        # Otra instancia pudo entrenar un diccionario después de que esta lo cargara
+        dict_id = compresion.diccionario_usado(valor)
+        return bool(dict_id) and dict_id not in self._diccionarios
+
+    def _codificar(self, contenido: str):
+        if not self.umbral_compresion or not isinstance(contenido, str):
+            return contenido
+        dict_id = self._diccionario_activo
+        return compresion.comprimir(contenido, self.umbral_compresion, dict_id=dict_id,
+                                    diccionario=self._diccionarios.get(dict_id))
+
+    def _cargar_diccionarios(self):
+        with self.lock:
+            self._leer_diccionarios()
+
+    def _leer_diccionarios(self):
+        """Carga diccionarios_compresion y activa el último. El llamador tiene self.lock."""
+        rows = self.conn.execute('SELECT id, datos FROM diccionarios_compresion ORDER BY id').fetchall()
+        self._diccionarios = {did: bytes(datos) for did, datos in rows}
+        # Sin zstd no se puede comprimir con diccionario (sí leer lo que ya esté en zlib)
+        self._diccionario_activo = rows[-1][0] if rows and compresion.zstandard is not None else 0
+
+    def entrenar_diccionario_compresion(self, muestras: int = 5000, tamaño: int = 64 * 1024) -> int:
+        """Entrena un diccionario zstd con mensajes recientes, lo guarda y lo deja activo."""
+        with self.lock:
+            rows = self.conn.execute('SELECT contenido FROM mensajes ORDER BY id DESC LIMIT ?', (muestras,)).fetchall()
+        datos = compresion.entrenar_diccionario((self._descomprimir(r[0]) for r in rows), tamaño)
+        with self.lock:
+            cur = self.conn.execute('INSERT INTO diccionarios_compresion (datos) VALUES (?)', (datos,))
+            self.conn.commit()
+            dict_id = cur.lastrowid
+        self._diccionarios[dict_id] = datos
+        self._diccionario_activo = dict_id
+        return dict_id
+
+    def comprimir_mensajes_existentes(self, lote: int = 500, pausa: float = 0.005) -> Dict[str, int]:
+        """Migra a formato comprimido los mensajes grandes guardados como texto plano.
+
+        Recorre la base principal y las de archivo por rangos de id, un lote por
+        transacción (suelta el lock entre lotes). Devuelve filas revisadas/comprimidas
+        y bytes antes/después.
+        """
+        informe = {'revisadas': 0, 'comprimidas': 0, 'bytes_antes': 0, 'bytes_despues': 0}
+        if not self.umbral_compresion:
+            return informe
+        with self.lock:
+            archivos = sorted(set(self._archivadas.values()))
+        for archivo in [None] + archivos:
+            ultimo = 0
+            while not self._cerrando.is_set():
+                with self.lock:
+                    # El alias se resuelve en cada lote: entre lotes la base pudo soltarse (LRU)
+                    tabla = f'{self._adjuntar(archivo)}.mensajes' if archivo else 'main.mensajes'
+                    rows = self.conn.execute(
+                        f"SELECT id, contenido FROM {tabla} WHERE id > ? AND typeof(contenido) = 'text' "
+                        'AND length(CAST(contenido AS BLOB)) > ? ORDER BY id LIMIT ?',
+                        (ultimo, self.umbral_compresion, lote)).fetchall()
+                if not rows:
+                    break
+                cambios = []
+                for mid, contenido in rows:
+                    nuevo = self._codificar(contenido)
+                    informe['revisadas'] += 1
+                    if isinstance(nuevo, bytes):
+                        cambios.append((nuevo, mid))
+                        informe['comprimidas'] += 1
+                        informe['bytes_antes'] += len(contenido.encode('utf-8'))
+                        informe['bytes_despues'] += len(nuevo)
+                if cambios:
+                    with self.lock:
+                        tabla = f'{self._adjuntar(archivo)}.mensajes' if archivo else 'main.mensajes'
+                        self.conn.executemany(f'UPDATE {tabla} SET contenido = ? WHERE id = ?', cambios)
+                        self.conn.commit()
+                ultimo = rows[-1][0]
+                time.sleep(pausa)
+        return informe
+
+    def reporte_compresion(self) -> Dict[str, int]:
+        """Totales de la tabla mensajes: bytes guardados vs. bytes del texto original."""
+        with self.lock:
+            total, comprimidos, guardados, originales = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(typeof(contenido) = 'blob'), 0), "
+                'COALESCE(SUM(length(CAST(contenido AS BLOB))), 0), '
+                'COALESCE(SUM(largo_original(contenido)), 0) FROM mensajes').fetchone()
+        return {
+            'mensajes': total,
+            'comprimidos': comprimidos,
+            'bytes_guardados': guardados,
+            'bytes_originales': originales,
+            'bytes_ahorrados': originales - guardados,
+        }
 
 if __name__ == '__main__':
-    agente = AgentePersonal()
-    print('Agente Personal listo para trabajar. Usá los métodos crear_proyecto, agregar_tarea y listar_tareas.')
+    # Interfaz de línea de comandos (ver cli.py): python agente_personal.py --help
+    import sys
+    from cli import main
+    sys.exit(main())
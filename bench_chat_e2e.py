@@ -0,0 +1,267 @@
+"""Benchmark de latencia punta a punta del chat con un modelo falso determinista.
+
+Recorre el mismo camino que un envío real en modo stream:
+
+  ChatUI.enviar_mensaje -> _armar_historial -> obtener_respuesta_llama_stream
+  -> DespachadorUI -> _actualizar_burbuja_agente (hilo de Tk) -> AgentePersonal.agregar_mensaje
+
+y reporta time-to-first-token, latencia por token en la UI (desde que el modelo
+emite el token hasta que Tk lo pinta), latencia total y el backlog de la cola de
+eventos de Tk (`after info`). No necesita el archivo GGUF.
+
+Necesita un display. En CI sin pantalla:
+
+  xvfb-run -a python bench_chat_e2e.py --envios 20 --tps 40 --salida e2e.json
+  # o bien dejar que el script levante Xvfb por su cuenta:
+  python bench_chat_e2e.py --xvfb
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+from telemetria import percentiles
+
+_PALABRAS = ('hola Facu acá va una respuesta de prueba con varias palabras para simular '
+             'tokens que llegan de a uno desde el modelo local mientras la UI pinta').split()
+
+
+class ModeloFalso:
+    """Modelo de streaming determinista con ritmo de tokens configurable."""
+
+    def __init__(self, tokens_por_segundo: float = 30.0, n_tokens: int = 120,
+                 latencia_primer_token: float = 0.2, semilla: int = 1234):
+        self.tokens_por_segundo = tokens_por_segundo
+        self.n_tokens = n_tokens
+        self.latencia_primer_token = latencia_primer_token
+        self.semilla = semilla
+        # Instante (perf_counter) en que se emitió cada token de la respuesta en curso
+        self.emisiones: List[float] = []
+
+    def tokens(self) -> List[str]:
+        rng = random.Random(self.semilla)
+        return [rng.choice(_PALABRAS) + ' ' for _ in range(self.n_tokens)]
+
+    def stream(self, historial, callback: Callable[[str], None], delay: float = 0.0, **_kwargs) -> str:
+        self.emisiones = []
+        pausa = 1.0 / self.tokens_por_segundo if self.tokens_por_segundo > 0 else 0.0
+        time.sleep(self.latencia_primer_token)
+        acumulado = ''
+        for i, tok in enumerate(self.tokens()):
+            if i:
+                time.sleep(pausa)
+            acumulado += tok
+            self.emisiones.append(time.perf_counter())
+            callback(acumulado)
+        return acumulado
+
+    def completo(self, historial, **_kwargs) -> str:
+        time.sleep(self.latencia_primer_token + self.n_tokens / max(self.tokens_por_segundo, 1e-9))
+        return ''.join(self.tokens())
+
+
+def _asegurar_display(usar_xvfb: bool) -> Optional[subprocess.Popen]:
+    if os.environ.get('DISPLAY') or sys.platform.startswith('win') or sys.platform == 'darwin':
+        return None
+    if not usar_xvfb:
+        raise SystemExit('No hay DISPLAY. Ejecutá con xvfb-run o pasá --xvfb.')
+    if not shutil.which('Xvfb'):
+        raise SystemExit('No se encontró Xvfb en el PATH.')
+    display = ':%d' % (90 + os.getpid() % 100)
+    proc = subprocess.Popen(['Xvfb', display, '-screen', '0', '1280x1024x24', '-nolisten', 'tcp'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ['DISPLAY'] = display
+    time.sleep(0.5)
+    return proc
+
+
+class Medicion:
+    """Instrumentación de una instancia de ChatUI (sin modificar la clase)."""
+
+    def __init__(self, ui, modelo: ModeloFalso):
+        self.ui = ui
+        self.modelo = modelo
+        self.t_envio = 0.0
+        self.t_primer_token_ui: Optional[float] = None
+        self.t_ultima_burbuja = 0.0
+        self.t_db: Optional[float] = None
+        self.t_historial = 0.0
+        self.t_handler = 0.0
+        self.latencias_token: List[float] = []
+        self.backlog: List[int] = []
+        self._pintados = 0
+        self._envolver()
+
+    def _envolver(self):
+        ui = self.ui
+        original_actualizar = ui._actualizar_burbuja_agente
+        original_armar = ui._armar_historial
+        original_agregar = ui.agente.agregar_mensaje
+
+        def actualizar(texto, *args):
+            ahora = time.perf_counter()
+            original_actualizar(texto, *args)
+            # El despachador coalesce: una pintada puede traer varios tokens nuevos (cada
+            # token del modelo falso termina en espacio). Cada uno cuenta desde su emisión.
+            hasta = min(texto.count(' '), len(self.modelo.emisiones))
+            for i in range(self._pintados, hasta):
+                self.latencias_token.append(ahora - self.modelo.emisiones[i])
+            if hasta > self._pintados:
+                if self.t_primer_token_ui is None:
+                    self.t_primer_token_ui = time.perf_counter()
+                self._pintados = hasta
+            self.t_ultima_burbuja = time.perf_counter()
+
+        def armar(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return original_armar(*args, **kwargs)
+            finally:
+                self.t_historial = time.perf_counter() - t0
+
+        def agregar(conversacion_id, remitente, contenido, *args, **kwargs):
+            res = original_agregar(conversacion_id, remitente, contenido, *args, **kwargs)
+            if remitente == 'Agente':
+                self.t_db = time.perf_counter()
+            return res
+
+        ui._actualizar_burbuja_agente = actualizar
+        ui._armar_historial = armar
+        ui.agente.agregar_mensaje = agregar
+
+    def reiniciar(self):
+        self.t_primer_token_ui = None
+        self.t_db = None
+        self.t_ultima_burbuja = 0.0
+        self._pintados = 0
+        self.latencias_token = []
+
+    def muestrear_backlog(self):
+        try:
+            self.backlog.append(len(self.ui.root.tk.splitlist(self.ui.root.tk.call('after', 'info'))))
+        except Exception:
+            pass
+
+
+def correr(envios: int, modelo: ModeloFalso, historial_previo: int = 0, timeout: float = 120.0) -> dict:
+    import tkinter as tk
+    import chat_ui_moderno
+    from agente_personal import AgentePersonal
+
+    chat_ui_moderno.obtener_respuesta_llama_stream = modelo.stream
+    chat_ui_moderno.obtener_respuesta_llama = modelo.completo
+
+    tmp = tempfile.mkdtemp(prefix='bench_e2e_')
+    root = tk.Tk()
+    try:
+        ui = chat_ui_moderno.ChatUI(root)
+        ui._init_style()
+        ui.agente = AgentePersonal(db_path=os.path.join(tmp, 'bench.db'))
+        ui.stream_enabled = True
+        ui.proyecto_id = ui.agente.crear_proyecto('Bench')
+        ui.conversacion_id = ui.agente.crear_conversacion('Bench chat', ui.proyecto_id)
+        for i in range(historial_previo):
+            ui.agente.agregar_mensaje(ui.conversacion_id, 'Usuario' if i % 2 == 0 else 'Agente',
+                                      ' '.join(_PALABRAS[: 5 + i % 20]))
+        root.update()
+
+        med = Medicion(ui, modelo)
+        corridas = []
+        for n in range(envios):
+            med.reiniciar()
+            ui.entry_mensaje.config(state='normal')
+            ui.entry_mensaje.delete(0, tk.END)
+            ui.entry_mensaje.insert(0, f'Pregunta de prueba número {n}')
+            med.t_envio = time.perf_counter()
+            ui.enviar_mensaje()
+            med.t_handler = time.perf_counter() - med.t_envio
+            limite = med.t_envio + timeout
+            # Bombear el loop de Tk hasta que la respuesta esté pintada y guardada
+            while time.perf_counter() < limite:
+                root.update()
+                med.muestrear_backlog()
+                if med.t_db is not None and med._pintados >= modelo.n_tokens:
+                    break
+                time.sleep(0.001)
+            ui.animando = False
+            root.update()
+            corridas.append({
+                'ttft': (med.t_primer_token_ui - med.t_envio) if med.t_primer_token_ui else None,
+                'total_ui': med.t_ultima_burbuja - med.t_envio,
+                'total_db': (med.t_db - med.t_envio) if med.t_db else None,
+                'historial': med.t_historial,
+                'handler': med.t_handler,
+                'latencias_token': list(med.latencias_token),
+            })
+    finally:
+        try:
+            root.destroy()
+        except Exception:
+            pass
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def valores(clave):
+        return [c[clave] for c in corridas if c[clave] is not None]
+
+    backlog = med.backlog or [0]
+    return {
+        'envios': envios,
+        'ttft': percentiles(valores('ttft')),
+        'latencia_token_ui': percentiles([x for c in corridas for x in c['latencias_token']]),
+        'total_hasta_burbuja': percentiles(valores('total_ui')),
+        'total_hasta_db': percentiles(valores('total_db')),
+        'armar_historial': percentiles(valores('historial')),
+        'handler_enviar': percentiles(valores('handler')),
+        'backlog_tk': {'max': max(backlog), 'media': round(statistics.fmean(backlog), 2)},
+        'incompletos': sum(1 for c in corridas if c['total_db'] is None),
+    }
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--envios', type=int, default=10)
+    p.add_argument('--tps', type=float, default=30.0, help='tokens por segundo del modelo falso')
+    p.add_argument('--tokens', type=int, default=120, help='tokens por respuesta')
+    p.add_argument('--primer-token', type=float, default=0.2, help='latencia del primer token (s)')
+    p.add_argument('--historial-previo', type=int, default=0, help='mensajes precargados en la conversación')
+    p.add_argument('--semilla', type=int, default=1234)
+    p.add_argument('--xvfb', action='store_true', help='levantar Xvfb si no hay DISPLAY')
+    p.add_argument('--salida', default='bench_chat_e2e.json')
+    args = p.parse_args(argv)
+
+    xvfb = _asegurar_display(args.xvfb)
+    try:
+        modelo = ModeloFalso(args.tps, args.tokens, args.primer_token, args.semilla)
+        res = correr(args.envios, modelo, args.historial_previo)
+    finally:
+        if xvfb:
+            xvfb.terminate()
+    informe = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'config': vars(args),
+        'resultados': res,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    for clave in ('ttft', 'latencia_token_ui', 'total_hasta_burbuja', 'total_hasta_db', 'armar_historial', 'handler_enviar'):
+        m = res[clave]
+        if m.get('n'):
+            print(f'{clave:<22} p50={m["p50_ms"]:>9.2f} ms  p95={m["p95_ms"]:>9.2f} ms  max={m["max_ms"]:>9.2f} ms')
+    print(f'backlog_tk             max={res["backlog_tk"]["max"]}  media={res["backlog_tk"]["media"]}')
+    print(f'Resultados en {args.salida}')
+    return 1 if res['incompletos'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
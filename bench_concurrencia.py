@@ -0,0 +1,425 @@
+"""Prueba de estrés de concurrencia sobre AgentePersonal (hilos y procesos).
+
+Corre una mezcla configurable de operaciones contra la misma base:
+
+  lectura    listar_mensajes / listar_conversaciones / listar_tareas
+  escritura  agregar_mensaje (a veces sobre chats que otro hilo está borrando) y agregar_tarea
+  cascada    crear un proyecto con chat y mensajes y eliminar uno anterior (purga en cascada)
+  migracion  abrir otra instancia sobre la base: esquema, índices, triggers y migración
+
+con N hilos por proceso y P procesos. Cada instancia reemplaza `agente.lock` por un
+CandadoInstrumentado que mide la espera y la retención por sitio de llamada. El informe
+trae rendimiento (ops/s), latencias p50/p95/p99/max por operación, errores
+`database is locked`, fallas de clave foránea (escrituras rechazadas por la carrera con un
+borrado) y huérfanos reales (PRAGMA foreign_key_check al final, debe ser 0).
+
+  python bench_concurrencia.py --hilos 1,2,4,8 --duracion 5
+  python bench_concurrencia.py --hilos 4 --procesos 1,2,4 --mezcla lectura=50,escritura=45,cascada=5
+  python bench_concurrencia.py --esquema-viejo --mezcla escritura=80,migracion=20   # migración en caliente
+
+Cada combinación de hilos × procesos se mide sobre una copia nueva de la misma base
+sintética (ver bench_persistencia.generar_db), así las corridas son comparables.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+import bench_persistencia
+from agente_personal import AgentePersonal
+from telemetria import percentiles
+
+OPERACIONES = ('lectura', 'escritura', 'cascada', 'migracion')
+MEZCLA_POR_DEFECTO = {'lectura': 70, 'escritura': 25, 'cascada': 4, 'migracion': 1}
+MENSAJES_BASE = 10_000
+MENSAJES_POR_CASCADA = 20
+# Chats creados por 'cascada' que siguen siendo blanco de escrituras después de borrarlos
+_VOLATILES = 32
+# Cuántas muestras por sitio se guardan como máximo en el informe JSON
+_MAX_SITIOS = 30
+
+
+def _sitio(frame) -> str:
+    codigo = frame.f_code
+    return f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})'
+
+
+class CandadoInstrumentado:
+    """Reemplazo de threading.Lock que mide espera y retención por sitio de llamada.
+
+    El sitio es la función (y línea) que hace `with agente.lock:` o `acquire()`. Las
+    muestras se anotan con el candado tomado, así que no necesitan otro lock; leerlas
+    sólo es seguro con los hilos detenidos.
+    """
+
+    def __init__(self, candado=None):
+        self._candado = candado if candado is not None else threading.Lock()
+        self.espera: Dict[str, List[float]] = defaultdict(list)
+        self.retencion: Dict[str, List[float]] = defaultdict(list)
+        self._sitio: Optional[str] = None
+        self._desde = 0.0
+
+    def _tomar(self, sitio: str, blocking: bool = True, timeout: float = -1) -> bool:
+        t0 = time.perf_counter()
+        if not self._candado.acquire(blocking, timeout):
+            return False
+        self._desde = time.perf_counter()
+        self._sitio = sitio
+        self.espera[sitio].append(self._desde - t0)
+        return True
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self._tomar(_sitio(sys._getframe(1)), blocking, timeout)
+
+    def release(self):
+        self.retencion[self._sitio].append(time.perf_counter() - self._desde)
+        self._candado.release()
+
+    def locked(self) -> bool:
+        return self._candado.locked()
+
+    def __enter__(self):
+        self._tomar(_sitio(sys._getframe(1)))
+        return True
+
+    def __exit__(self, *_exc):
+        self.release()
+
+    def muestras(self) -> Dict[str, Dict[str, List[float]]]:
+        return {s: {'espera': list(self.espera[s]), 'retencion': list(self.retencion.get(s, []))}
+                for s in list(self.espera)}
+
+
+def instrumentar(agente: AgentePersonal) -> CandadoInstrumentado:
+    """Reemplaza `agente.lock` por un CandadoInstrumentado (antes de usar la instancia)."""
+    candado = CandadoInstrumentado(agente.lock)
+    agente.lock = candado
+    return candado
+
+
+def parsear_mezcla(texto: str) -> Dict[str, float]:
+    """'lectura=70,escritura=30' -> pesos por operación (las no nombradas quedan en 0)."""
+    mezcla = {op: 0.0 for op in OPERACIONES}
+    for parte in texto.split(','):
+        if not parte.strip():
+            continue
+        op, _, peso = parte.partition('=')
+        op = op.strip()
+        if op not in mezcla:
+            raise ValueError(f'operación desconocida: {op!r} (válidas: {", ".join(OPERACIONES)})')
+        mezcla[op] = float(peso)
+    if sum(mezcla.values()) <= 0:
+        raise ValueError('la mezcla no tiene ninguna operación con peso')
+    return mezcla
+
+
+class _Contexto:
+    """Estado compartido por los hilos de un proceso."""
+
+    def __init__(self, ruta: str, config: dict, etiqueta: str):
+        self.ruta = ruta
+        self.config = config
+        self.etiqueta = etiqueta
+        self.agente = AgentePersonal(db_path=ruta, perform_migration=not config['esquema_viejo'])
+        self.candado = instrumentar(self.agente)
+        dims = bench_persistencia._dimensiones(config['mensajes_base'])
+        self.conversaciones = dims['conversaciones']
+        self.proyectos = [f'Proyecto {p:06d}' for p in range(1, dims['proyectos'] + 1)]
+        self.volatiles: deque = deque(maxlen=_VOLATILES)  # ids de chats de 'cascada'
+        self.por_borrar: deque = deque()                  # ids de proyectos de 'cascada'
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.errores: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._n = 0
+
+    def siguiente(self) -> int:
+        with self._lock:
+            self._n += 1
+            return self._n
+
+
+def _op_lectura(ctx: _Contexto, rng: random.Random):
+    ag = ctx.agente
+    r = rng.random()
+    if r < 0.6:
+        ag.listar_mensajes(rng.randint(1, ctx.conversaciones))
+    elif r < 0.8:
+        ag.listar_conversaciones(ag.id_proyecto(rng.choice(ctx.proyectos)))
+    else:
+        ag.listar_tareas(rng.choice(ctx.proyectos))
+
+
+def _op_escritura(ctx: _Contexto, rng: random.Random):
+    ag = ctx.agente
+    if rng.random() < 0.1:
+        ag.agregar_tarea(rng.choice(ctx.proyectos), 'tarea de estrés')
+        return
+    volatiles = list(ctx.volatiles)
+    if volatiles and rng.random() < 0.2:
+        # Carrera buscada: el chat puede estar marcado o ya purgado por otro hilo/proceso
+        cid = rng.choice(volatiles)
+    else:
+        cid = rng.randint(1, ctx.conversaciones)
+    ag.agregar_mensaje(cid, 'Usuario', 'mensaje de estrés ' * rng.randint(1, 20))
+
+
+def _op_cascada(ctx: _Contexto, rng: random.Random):
+    ag = ctx.agente
+    pid = ag.crear_proyecto(f'estrés {ctx.etiqueta}-{ctx.siguiente()}')
+    cid = ag.crear_conversacion('estrés', pid)
+    for i in range(MENSAJES_POR_CASCADA):
+        ag.agregar_mensaje(cid, 'Usuario' if i % 2 else 'Agente', f'mensaje {i}')
+    ctx.volatiles.append(cid)
+    ctx.por_borrar.append(pid)
+    # Se borra uno anterior, así las escrituras a sus chats compiten con la purga
+    if len(ctx.por_borrar) > 2:
+        try:
+            viejo = ctx.por_borrar.popleft()
+        except IndexError:
+            return
+        ag.eliminar_proyecto(viejo)
+
+
+def _op_migracion(ctx: _Contexto, rng: random.Random):
+    AgentePersonal(db_path=ctx.ruta, purga_automatica=False).cerrar()
+
+
+_FUNCIONES = {
+    'lectura': _op_lectura,
+    'escritura': _op_escritura,
+    'cascada': _op_cascada,
+    'migracion': _op_migracion,
+}
+
+
+def _clasificar(ctx: _Contexto, exc: Exception):
+    mensaje = str(exc)
+    if isinstance(exc, sqlite3.OperationalError) and ('locked' in mensaje or 'busy' in mensaje):
+        ctx.errores['database_locked'] += 1
+    elif isinstance(exc, sqlite3.IntegrityError) and 'FOREIGN KEY' in mensaje:
+        ctx.errores['fk_rechazadas'] += 1
+    else:
+        ctx.errores[f'{type(exc).__name__}: {mensaje[:80]}'] += 1
+    # Una sentencia fallida deja abierta la transacción implícita de la conexión compartida:
+    # otros procesos verían la base bloqueada hasta el próximo commit de cualquier hilo
+    with ctx.agente.lock:
+        if ctx.agente.conn.in_transaction:
+            ctx.errores['transacciones_colgadas'] += 1
+            ctx.agente.conn.rollback()
+
+
+def _hilo(ctx: _Contexto, indice: int, inicio: threading.Event):
+    config = ctx.config
+    rng = random.Random(f'{config["semilla"]}-{ctx.etiqueta}-{indice}')
+    ops = [op for op in OPERACIONES if config['mezcla'][op] > 0]
+    pesos = [config['mezcla'][op] for op in ops]
+    limite = config['operaciones'] or float('inf')
+    inicio.wait()
+    fin = time.perf_counter() + config['duracion']
+    hechas = 0
+    while hechas < limite and time.perf_counter() < fin:
+        op = rng.choices(ops, pesos)[0]
+        t0 = time.perf_counter()
+        try:
+            _FUNCIONES[op](ctx, rng)
+        except Exception as exc:
+            _clasificar(ctx, exc)
+        ctx.latencias[op].append(time.perf_counter() - t0)
+        hechas += 1
+
+
+def _correr_proceso(ruta: str, config: dict, etiqueta: str) -> dict:
+    """Corre `config['hilos']` hilos en este proceso y devuelve las muestras crudas."""
+    ctx = _Contexto(ruta, config, etiqueta)
+    inicio = threading.Event()
+    hilos = [threading.Thread(target=_hilo, args=(ctx, i, inicio), name=f'estres-{etiqueta}-{i}', daemon=True)
+             for i in range(config['hilos'])]
+    for h in hilos:
+        h.start()
+    t0 = time.perf_counter()
+    inicio.set()
+    for h in hilos:
+        h.join()
+    transcurrido = time.perf_counter() - t0
+    # La purga en segundo plano también compite por el lock: se espera y se mide
+    ctx.agente.esperar_purga(timeout=60)
+    ctx.agente.cerrar()
+    return {
+        'transcurrido': transcurrido,
+        'latencias': dict(ctx.latencias),
+        'errores': dict(ctx.errores),
+        'candado': ctx.candado.muestras(),
+    }
+
+
+def _resumen_candado(sitios: Dict[str, Dict[str, List[float]]]) -> List[dict]:
+    filas = []
+    for sitio, m in sitios.items():
+        filas.append({
+            'sitio': sitio,
+            'n': len(m['espera']),
+            'espera_total_ms': round(sum(m['espera']) * 1000, 3),
+            'espera': percentiles(m['espera']),
+            'retencion_total_ms': round(sum(m['retencion']) * 1000, 3),
+            'retencion': percentiles(m['retencion']),
+        })
+    filas.sort(key=lambda f: f['espera_total_ms'], reverse=True)
+    return filas[:_MAX_SITIOS]
+
+
+def _huerfanos(ruta: str) -> int:
+    conn = sqlite3.connect(ruta)
+    try:
+        return len(conn.execute('PRAGMA foreign_key_check').fetchall())
+    finally:
+        conn.close()
+
+
+def correr(ruta: str, hilos: int = 4, procesos: int = 1, duracion: float = 5.0,
+           operaciones: Optional[int] = None, mezcla: Optional[Dict[str, float]] = None,
+           semilla: int = bench_persistencia.SEMILLA, esquema_viejo: bool = False,
+           mensajes_base: int = MENSAJES_BASE) -> dict:
+    """Corre una combinación hilos × procesos sobre la base `ruta` (que se modifica).
+
+    Termina a los `duracion` segundos o cuando cada hilo hizo `operaciones`, lo primero.
+    """
+    config = {
+        'hilos': hilos,
+        'duracion': duracion,
+        'operaciones': operaciones,
+        'mezcla': dict(mezcla or MEZCLA_POR_DEFECTO),
+        'semilla': semilla,
+        'esquema_viejo': esquema_viejo,
+        'mensajes_base': mensajes_base,
+    }
+    t0 = time.perf_counter()
+    if procesos <= 1:
+        partes = [_correr_proceso(ruta, config, 'p0')]
+    else:
+        # spawn: un fork con la conexión SQLite y los hilos del padre no es seguro
+        with multiprocessing.get_context('spawn').Pool(procesos) as pool:
+            partes = pool.starmap(_correr_proceso, [(ruta, config, f'p{i}') for i in range(procesos)])
+    total = time.perf_counter() - t0
+
+    latencias: Dict[str, List[float]] = defaultdict(list)
+    errores: Dict[str, int] = defaultdict(int)
+    sitios: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: {'espera': [], 'retencion': []})
+    for parte in partes:
+        for op, muestras in parte['latencias'].items():
+            latencias[op].extend(muestras)
+        for clave, n in parte['errores'].items():
+            errores[clave] += n
+        for sitio, m in parte['candado'].items():
+            sitios[sitio]['espera'].extend(m['espera'])
+            sitios[sitio]['retencion'].extend(m['retencion'])
+    transcurrido = max(p['transcurrido'] for p in partes)
+    n_ops = sum(len(m) for m in latencias.values())
+    return {
+        'hilos': hilos,
+        'procesos': procesos,
+        'operaciones': n_ops,
+        'transcurrido_s': round(transcurrido, 3),
+        'total_s': round(total, 3),
+        'ops_por_segundo': round(n_ops / transcurrido, 1) if transcurrido else 0.0,
+        'latencias': {op: percentiles(latencias[op]) for op in OPERACIONES if latencias.get(op)},
+        'database_locked': errores.pop('database_locked', 0),
+        'fk_rechazadas': errores.pop('fk_rechazadas', 0),
+        'transacciones_colgadas': errores.pop('transacciones_colgadas', 0),
+        'otros_errores': dict(errores),
+        'huerfanos': _huerfanos(ruta),
+        'candado': _resumen_candado(sitios),
+    }
+
+
+def barrer(combinaciones, directorio: str, mensajes_base: int = MENSAJES_BASE,
+           semilla: int = bench_persistencia.SEMILLA, esquema_viejo: bool = False, **opciones) -> List[dict]:
+    """Mide cada (hilos, procesos) sobre una copia nueva de la misma base sintética.
+
+    Agrega `aceleracion` (ops/s respecto de la primera combinación) y `eficiencia`
+    (aceleración dividida por el aumento de trabajadores): 1.0 es escalado perfecto.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    plantilla = os.path.join(directorio, f'estres_{mensajes_base}_{semilla}_{int(esquema_viejo)}.db')
+    if not os.path.exists(plantilla):
+        bench_persistencia.generar_db(plantilla, mensajes_base, semilla, cascada=not esquema_viejo)
+    ruta = os.path.join(directorio, f'estres_{mensajes_base}_{semilla}.trabajo.db')
+    resultados = []
+    for hilos, procesos in combinaciones:
+        shutil.copyfile(plantilla, ruta)
+        try:
+            res = correr(ruta, hilos, procesos, semilla=semilla, esquema_viejo=esquema_viejo,
+                         mensajes_base=mensajes_base, **opciones)
+        finally:
+            for sufijo in ('', '-journal', '-wal', '-shm'):
+                if os.path.exists(ruta + sufijo):
+                    os.remove(ruta + sufijo)
+        base = resultados[0] if resultados else res
+        trabajadores = (hilos * procesos) / (base['hilos'] * base['procesos'])
+        res['aceleracion'] = round(res['ops_por_segundo'] / base['ops_por_segundo'], 3) if base['ops_por_segundo'] else 0.0
+        res['eficiencia'] = round(res['aceleracion'] / trabajadores, 3)
+        resultados.append(res)
+    return resultados
+
+
+def _enteros(texto: str) -> List[int]:
+    return [int(x) for x in texto.split(',') if x.strip()]
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--hilos', default='1,2,4,8', help='hilos por proceso, separados por coma')
+    p.add_argument('--procesos', default='1', help='procesos, separados por coma')
+    p.add_argument('--duracion', type=float, default=5.0, help='segundos por combinación')
+    p.add_argument('--operaciones', type=int, help='tope de operaciones por hilo')
+    p.add_argument('--mezcla', default=','.join(f'{k}={v}' for k, v in MEZCLA_POR_DEFECTO.items()))
+    p.add_argument('--mensajes', type=float, default=MENSAJES_BASE, help='tamaño de la base sintética')
+    p.add_argument('--semilla', type=int, default=bench_persistencia.SEMILLA)
+    p.add_argument('--esquema-viejo', action='store_true',
+                   help='partir de una base sin ON DELETE CASCADE: la migra la primera operación "migracion"')
+    p.add_argument('--dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_dbs'))
+    p.add_argument('--sitios', type=int, default=8, help='sitios del lock a mostrar por combinación')
+    p.add_argument('--salida', default='bench_concurrencia.json')
+    args = p.parse_args(argv)
+
+    combinaciones = [(h, pr) for pr in _enteros(args.procesos) for h in _enteros(args.hilos)]
+    resultados = barrer(combinaciones, args.dir, int(args.mensajes), args.semilla, args.esquema_viejo,
+                        duracion=args.duracion, operaciones=args.operaciones, mezcla=parsear_mezcla(args.mezcla))
+    informe = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': vars(args),
+        'resultados': resultados,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+
+    print(f'{"hilos":>5} {"proc":>4} {"ops/s":>9} {"acel":>6} {"efic":>5} {"locked":>7} {"fk":>5} {"huérf":>5}  p99 por operación')
+    for r in resultados:
+        p99 = '  '.join(f'{op}={m["p99_ms"]:.1f}ms' for op, m in r['latencias'].items())
+        print(f'{r["hilos"]:>5} {r["procesos"]:>4} {r["ops_por_segundo"]:>9.1f} {r["aceleracion"]:>6.2f} '
+              f'{r["eficiencia"]:>5.2f} {r["database_locked"]:>7} {r["fk_rechazadas"]:>5} {r["huerfanos"]:>5}  {p99}')
+        for s in r['candado'][:args.sitios]:
+            print(f'        {s["sitio"]:<48} n={s["n"]:<7} espera={s["espera_total_ms"]:>9.1f} ms '
+                  f'(p99 {s["espera"].get("p99_ms", 0):.2f})  retención={s["retencion_total_ms"]:>9.1f} ms')
+        if r['transacciones_colgadas'] or r['otros_errores']:
+            print(f'        transacciones colgadas={r["transacciones_colgadas"]}  otros={r["otros_errores"]}')
+    print(f'Resultados en {args.salida}')
+    # Un huérfano es una violación real de integridad, no una carrera bien rechazada
+    return 1 if any(r['huerfanos'] for r in resultados) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Benchmark de los motores de inferencia local: elige el más rápido de esta máquina.
+
+Carga cada motor disponible (ver motores_llm), lo calienta con una generación corta y
+genera la misma serie de respuestas con cada uno. Mide el tiempo de carga, el primer
+token y los caracteres/s de decodificación (sin la espera ni la evaluación del prompt),
+que es lo que se siente al leer una respuesta larga. Gana la mayor mediana de caracteres/s:
+cada motor corre su propio archivo de modelo con su tokenizador, así que los tokens/s
+(que también se informan) no se pueden comparar entre motores.
+
+  python bench_motores_llm.py                          # mide todos los disponibles
+  python bench_motores_llm.py --guardar                # y deja la elección en motor_llm.json
+  python bench_motores_llm.py --motores llama_cpp,ctranslate2 --tokens 128 --salida motores.json
+
+La app usa la elección guardada mientras no se defina AGENTE_LLM (ver llama_local_helper).
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+import llama_local_helper as llh
+import motores_llm
+from telemetria import percentiles
+
+PROMPTS = [
+    'Explicame en pocas líneas qué es una base de datos relacional.',
+    'Escribí una lista de cinco tareas para organizar una mudanza.',
+    'Resumí las ventajas de usar control de versiones en un proyecto chico.',
+    'Dame una receta simple para una cena con arroz y verduras.',
+    'Contame cómo funciona un índice en SQLite y cuándo conviene crearlo.',
+    'Proponé tres nombres para un proyecto de asistente personal.',
+]
+
+
+def _generar(motor: motores_llm.MotorLLM, prompt: str, max_tokens: int):
+    """(uso, caracteres/s de decodificación): desde el primer delta hasta el final."""
+    uso = llh.UsoGeneracion()
+    deltas = list(llh.generar_con_motor(motor, [{'role': 'user', 'content': prompt}], max_tokens, None, uso))
+    dt = uso.t_total - (uso.t_primer_token or uso.t_total)
+    cps = sum(len(d) for d in deltas[1:]) / dt if len(deltas) > 1 and dt > 0 else 0.0
+    return uso, cps
+
+
+def medir_motor(motor: motores_llm.MotorLLM, prompts: List[str], max_tokens: int = 64,
+                calentamiento: int = 1) -> Dict[str, object]:
+    """Carga el motor, lo calienta y mide una generación por prompt. Lo cierra al terminar.
+
+    Los caracteres/s valen para comparar motores; los tokens dependen del tokenizador de cada modelo.
+    """
+    t0 = time.perf_counter()
+    motor.cargar()
+    carga = time.perf_counter() - t0
+    try:
+        for _ in range(calentamiento):
+            _generar(motor, prompts[0], 8)
+        medidas = [_generar(motor, prompt, max_tokens) for prompt in prompts]
+    finally:
+        motor.cerrar()
+    usos = [uso for uso, _cps in medidas]
+    decode = [u.decode_tokens_por_segundo for u in usos if u.decode_tokens_por_segundo]
+    cps = [c for _uso, c in medidas if c]
+    return {
+        'modelo': motor.modelo(),
+        'carga_s': round(carga, 3),
+        'ttft': percentiles([u.t_primer_token - u.t_espera for u in usos if u.t_primer_token is not None]),
+        'total': percentiles([u.t_total for u in usos]),
+        'decode_cps_p50': round(statistics.median(cps), 2) if cps else 0.0,
+        'decode_tps_p50': round(statistics.median(decode), 2) if decode else 0.0,
+        'tps_p50': round(statistics.median(u.tokens_por_segundo for u in usos), 2),
+        'tokens': sum(u.completion_tokens for u in usos),
+        'prompt_tokens': sum(u.prompt_tokens for u in usos),
+    }
+
+
+def elegir(resultados: Dict[str, Dict[str, object]]) -> Optional[str]:
+    """El de mayor mediana de caracteres/s de decodificación; a igualdad, el de menor primer token."""
+    validos = {n: r for n, r in resultados.items() if 'error' not in r and r.get('decode_cps_p50')}
+    if not validos:
+        return None
+    return max(validos, key=lambda n: (validos[n]['decode_cps_p50'], -validos[n]['ttft'].get('p50_ms', 0)))
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--motores', help='motores a medir, separados por coma (default: todos los disponibles)')
+    p.add_argument('--tokens', type=int, default=64, help='tokens por respuesta')
+    p.add_argument('--repeticiones', type=int, default=len(PROMPTS), help='respuestas por motor')
+    p.add_argument('--guardar', action='store_true', help='guardar el ganador para esta máquina')
+    p.add_argument('--preferencia', help='archivo de la elección (default: motor_llm.json junto a la app)')
+    p.add_argument('--salida', default='bench_motores_llm.json')
+    args = p.parse_args(argv)
+
+    nombres = [n.strip() for n in args.motores.split(',') if n.strip()] if args.motores \
+        else motores_llm.motores_disponibles()
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(max(1, args.repeticiones))]
+    resultados: Dict[str, Dict[str, object]] = {}
+    for nombre in nombres:
+        cls = motores_llm.MOTORES.get(nombre)
+        motor = cls() if cls is not None else None
+        if motor is None or not motor.disponible():
+            resultados[nombre] = {'error': 'no disponible (falta la librería o el modelo)'}
+            continue
+        print(f'== {nombre}', flush=True)
+        try:
+            resultados[nombre] = medir_motor(motor, prompts, args.tokens)
+        except Exception as e:
+            resultados[nombre] = {'error': f'{type(e).__name__}: {e}'}
+    ganador = elegir(resultados)
+
+    informe = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'maquina': motores_llm.huella_maquina(),
+        'config': vars(args),
+        'resultados': resultados,
+        'ganador': ganador,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    for nombre, r in resultados.items():
+        if 'error' in r:
+            print(f'{nombre:<12} {r["error"]}')
+        else:
+            print(f'{nombre:<12} decode={r["decode_cps_p50"]:>8.1f} car/s ({r["decode_tps_p50"]:.1f} tok/s)  '
+                  f'ttft p50={r["ttft"].get("p50_ms", 0):>8.1f} ms  carga={r["carga_s"]:.1f} s')
+    if ganador is None:
+        print('Ningún motor pudo generar')
+        return 1
+    print(f'Más rápido en esta máquina: {ganador}')
+    if args.guardar:
+        medidos = [n for n, r in resultados.items() if 'error' not in r]
+        motores_llm.guardar_preferencia(ganador, resultados, args.preferencia, medidos)
+        print(f'Elección guardada en {args.preferencia or motores_llm.ARCHIVO_PREFERENCIA}')
+    print(f'Resultados en {args.salida}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Benchmark reproducible de la capa de persistencia (AgentePersonal).
+
+Genera bases sintéticas deterministas (semilla fija) de 10^3 a 10^7 mensajes repartidos
+en muchos proyectos y conversaciones, y mide:
+
+  listar_mensajes, listar_tareas, agregar_mensaje (insert + commit),
+  eliminar_chat, eliminar_proyecto (marcado), la purga en lotes de lo eliminado y la
+  migración de esquema.
+
+Los resultados se escriben en JSON para comparar entre versiones:
+
+  python bench_persistencia.py --escalas 1e3,1e4,1e5 --salida base.json
+  python bench_persistencia.py --escalas 1e3,1e4,1e5 --comparar base.json   # exit 1 si hay regresión
+
+Las bases generadas se guardan en --dir y se reutilizan mientras no cambie la semilla.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+from agente_personal import AgentePersonal
+
+SEMILLA = 1234
+MENSAJES_POR_CONVERSACION = 200
+CONVERSACIONES_POR_PROYECTO = 10
+TAREAS_POR_PROYECTO = 50
+
+# Esquema previo a ON DELETE CASCADE, para medir la migración
+_ESQUEMA_SIN_CASCADA = [
+    'CREATE TABLE proyectos (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT UNIQUE NOT NULL, contexto TEXT)',
+    "CREATE TABLE tareas (id INTEGER PRIMARY KEY AUTOINCREMENT, proyecto_id INTEGER NOT NULL, "
+    "descripcion TEXT NOT NULL, estado TEXT DEFAULT 'pendiente', FOREIGN KEY(proyecto_id) REFERENCES proyectos(id))",
+    'CREATE TABLE conversaciones (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT, proyecto_id INTEGER, '
+    'fecha_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(proyecto_id) REFERENCES proyectos(id))',
+    'CREATE TABLE mensajes (id INTEGER PRIMARY KEY AUTOINCREMENT, conversacion_id INTEGER NOT NULL, '
+    'remitente TEXT NOT NULL, tipo TEXT NOT NULL, contenido TEXT NOT NULL, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP, '
+    'FOREIGN KEY(conversacion_id) REFERENCES conversaciones(id))',
+]
+
+_PALABRAS = ('proyecto tarea modelo respuesta archivo resumen contexto usuario agente datos '
+             'consulta prueba error cambio versión lista base chat mensaje voz texto').split()
+
+
+def _dimensiones(n_mensajes: int) -> Dict[str, int]:
+    conversaciones = max(8, n_mensajes // MENSAJES_POR_CONVERSACION)
+    proyectos = max(4, conversaciones // CONVERSACIONES_POR_PROYECTO)
+    return {
+        'mensajes': n_mensajes,
+        'conversaciones': conversaciones,
+        'proyectos': proyectos,
+        'tareas': proyectos * TAREAS_POR_PROYECTO,
+    }
+
+
+def _texto(rng: random.Random, palabras: int) -> str:
+    return ' '.join(rng.choice(_PALABRAS) for _ in range(palabras))
+
+
+def _filas_mensajes(rng: random.Random, dims: Dict[str, int]) -> Iterator[tuple]:
+    n_conv = dims['conversaciones']
+    base = 1_600_000_000  # fechas crecientes y deterministas
+    for i in range(dims['mensajes']):
+        conv = (i % n_conv) + 1
+        remitente = 'Usuario' if (i // n_conv) % 2 == 0 else 'Agente'
+        palabras = rng.randint(5, 40) if remitente == 'Usuario' else rng.randint(20, 200)
+        fecha = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(base + i))
+        yield (conv, remitente, 'texto', _texto(rng, palabras), fecha)
+
+
+def generar_db(ruta: str, n_mensajes: int, semilla: int = SEMILLA, cascada: bool = True,
+               lote: int = 50_000) -> Dict[str, int]:
+    """Crea una base sintética determinista en `ruta` (la sobrescribe)."""
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    dims = _dimensiones(n_mensajes)
+    if cascada:
+        # Esquema actual: lo crea AgentePersonal
+        AgentePersonal(db_path=ruta).conn.close()
+    conn = sqlite3.connect(ruta)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    if not cascada:
+        for ddl in _ESQUEMA_SIN_CASCADA:
+            conn.execute(ddl)
+    rng = random.Random(semilla)
+    with conn:
+        conn.executemany('INSERT INTO proyectos (id, nombre, contexto) VALUES (?, ?, ?)',
+                         ((p, f'Proyecto {p:06d}', _texto(rng, 12)) for p in range(1, dims['proyectos'] + 1)))
+        conn.executemany('INSERT INTO tareas (proyecto_id, descripcion, estado) VALUES (?, ?, ?)',
+                         (((t % dims['proyectos']) + 1, _texto(rng, 6), rng.choice(('pendiente', 'completada')))
+                          for t in range(dims['tareas'])))
+        conn.executemany('INSERT INTO conversaciones (id, nombre, proyecto_id) VALUES (?, ?, ?)',
+                         ((c, f'Chat {c}', ((c - 1) % dims['proyectos']) + 1)
+                          for c in range(1, dims['conversaciones'] + 1)))
+    filas = _filas_mensajes(rng, dims)
+    while True:
+        bloque = [f for _, f in zip(range(lote), filas)]
+        if not bloque:
+            break
+        with conn:
+            conn.executemany('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido, fecha) '
+                             'VALUES (?, ?, ?, ?, ?)', bloque)
+    conn.close()
+    return dims
+
+
+def _resumen(muestras: List[float]) -> Dict[str, float]:
+    orden = sorted(muestras)
+    p95 = orden[min(len(orden) - 1, int(round(0.95 * (len(orden) - 1))))]
+    return {
+        'n': len(orden),
+        'min_ms': round(orden[0] * 1000, 4),
+        'p50_ms': round(statistics.median(orden) * 1000, 4),
+        'p95_ms': round(p95 * 1000, 4),
+        'media_ms': round(statistics.fmean(orden) * 1000, 4),
+    }
+
+
+def _medir(func, argumentos) -> List[float]:
+    muestras = []
+    for args in argumentos:
+        t0 = time.perf_counter()
+        func(*args)
+        muestras.append(time.perf_counter() - t0)
+    return muestras
+
+
+def medir_escala(n_mensajes: int, directorio: str, repeticiones: int = 20, semilla: int = SEMILLA,
+                 regenerar: bool = False, migracion_max: int = 1_000_000) -> Dict[str, Dict[str, float]]:
+    os.makedirs(directorio, exist_ok=True)
+    plantilla = os.path.join(directorio, f'bench_{n_mensajes}_{semilla}.db')
+    if regenerar or not os.path.exists(plantilla):
+        generar_db(plantilla, n_mensajes, semilla)
+    dims = _dimensiones(n_mensajes)
+    # Se trabaja sobre una copia: los borrados no deben ensuciar la plantilla
+    ruta = os.path.join(directorio, f'bench_{n_mensajes}_{semilla}.trabajo.db')
+    shutil.copyfile(plantilla, ruta)
+    rng = random.Random(semilla + 1)
+    resultados: Dict[str, Dict[str, float]] = {}
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False)
+    try:
+        n_conv, n_proy = dims['conversaciones'], dims['proyectos']
+        convs = [(rng.randint(1, n_conv),) for _ in range(repeticiones)]
+        resultados['listar_mensajes'] = _resumen(_medir(ag.listar_mensajes, convs))
+        proys = [(f'Proyecto {rng.randint(1, n_proy):06d}',) for _ in range(repeticiones)]
+        resultados['listar_tareas'] = _resumen(_medir(ag.listar_tareas, proys))
+        inserts = [(rng.randint(1, n_conv), 'Usuario', _texto(rng, 20)) for _ in range(repeticiones)]
+        resultados['agregar_mensaje'] = _resumen(_medir(ag.agregar_mensaje, inserts))
+        # Borrados sobre objetos distintos en cada repetición
+        n_borrar = min(repeticiones, max(1, n_proy // 2))
+        proyectos_borrar = rng.sample(range(1, n_proy + 1), n_borrar)
+        borrados = set(proyectos_borrar)
+        candidatas = [c for c in range(1, n_conv + 1) if ((c - 1) % n_proy) + 1 not in borrados]
+        chats = [(c,) for c in rng.sample(candidatas, min(repeticiones, len(candidatas)))]
+        if chats:
+            resultados['eliminar_chat'] = _resumen(_medir(ag.eliminar_chat, chats))
+        resultados['eliminar_proyecto'] = _resumen(_medir(ag.eliminar_proyecto, [(p,) for p in proyectos_borrar]))
+        # Borrado físico de todo lo marcado arriba (lo hace el purgador en segundo plano)
+        resultados['purga'] = _resumen(_medir(ag.purgar_eliminados, [()]))
+    finally:
+        ag.cerrar()
+        os.remove(ruta)
+
+    if n_mensajes <= migracion_max:
+        ruta_mig = os.path.join(directorio, f'bench_{n_mensajes}_{semilla}.migracion.db')
+        generar_db(ruta_mig, n_mensajes, semilla, cascada=False)
+        t0 = time.perf_counter()
+        AgentePersonal(db_path=ruta_mig, perform_migration=True).conn.close()
+        resultados['migracion'] = _resumen([time.perf_counter() - t0])
+        os.remove(ruta_mig)
+    return resultados
+
+
+def _version() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(__file__) or '.',
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def comparar(actual: dict, base: dict, tolerancia: float) -> List[str]:
+    """Devuelve las operaciones cuyo p50 empeoró más que `tolerancia` (0.2 = 20 %)."""
+    regresiones = []
+    for escala, ops in actual['resultados'].items():
+        ops_base = base.get('resultados', {}).get(escala, {})
+        for op, met in ops.items():
+            ref = ops_base.get(op)
+            if not ref or not ref.get('p50_ms'):
+                continue
+            ratio = met['p50_ms'] / ref['p50_ms']
+            if ratio > 1 + tolerancia:
+                regresiones.append(f'{escala} {op}: {ref["p50_ms"]:.3f} ms -> {met["p50_ms"]:.3f} ms (x{ratio:.2f})')
+    return regresiones
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--escalas', default='1e3,1e4,1e5',
+                   help='cantidades de mensajes separadas por coma (ej. 1e3,1e4,1e5,1e6,1e7)')
+    p.add_argument('--repeticiones', type=int, default=20)
+    p.add_argument('--semilla', type=int, default=SEMILLA)
+    p.add_argument('--dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_dbs'))
+    p.add_argument('--regenerar', action='store_true', help='rehacer las bases aunque ya existan')
+    p.add_argument('--migracion-max', type=float, default=1e6,
+                   help='no medir la migración por encima de esta escala')
+    p.add_argument('--salida', default='bench_persistencia.json')
+    p.add_argument('--comparar', help='JSON de una corrida anterior para detectar regresiones')
+    p.add_argument('--tolerancia', type=float, default=0.25)
+    args = p.parse_args(argv)
+
+    escalas = [int(float(e)) for e in args.escalas.split(',') if e.strip()]
+    informe = {
+        'version': _version(),
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'semilla': args.semilla,
+        'repeticiones': args.repeticiones,
+        'resultados': {},
+    }
+    for n in escalas:
+        print(f'== {n} mensajes ({_dimensiones(n)})', flush=True)
+        res = medir_escala(n, args.dir, args.repeticiones, args.semilla, args.regenerar, int(args.migracion_max))
+        informe['resultados'][str(n)] = res
+        for op, met in res.items():
+            print(f'  {op:<18} p50={met["p50_ms"]:>10.3f} ms  p95={met["p95_ms"]:>10.3f} ms')
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f'Resultados en {args.salida}')
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        regresiones = comparar(informe, base, args.tolerancia)
+        for r in regresiones:
+            print('REGRESIÓN', r)
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""Captura de voz en streaming con buffer circular y detección de actividad de voz.
+
+El callback de `sounddevice` sólo copia cada bloque a un buffer circular preasignado
+(sin crear arrays nuevos por bloque). Un hilo de análisis recorre el audio nuevo en
+tramas de ~30 ms, detecta los tramos con voz por energía y, cuando un tramo termina
+(silencio o duración máxima), lo manda a un hilo de transcripción. Así el texto se
+va armando mientras el usuario habla y al detener sólo queda por transcribir el
+último tramo.
+
+Requisitos: numpy (ya necesario para sounddevice).
+"""
+
+import queue
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+class BufferCircular:
+    """Buffer circular preasignado de muestras int16 mono.
+
+    Las posiciones son absolutas (cantidad total de muestras escritas), así un lector
+    puede pedir `leer(desde, hasta)` sin preocuparse por la vuelta del buffer.
+    """
+
+    def __init__(self, capacidad: int):
+        if capacidad <= 0:
+            raise ValueError('La capacidad del buffer debe ser positiva.')
+        self._datos = np.zeros(capacidad, dtype=np.int16)
+        self._capacidad = capacidad
+        self._escritas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacidad(self) -> int:
+        return self._capacidad
+
+    @property
+    def escritas(self) -> int:
+        """Posición absoluta de la próxima muestra a escribir."""
+        return self._escritas
+
+    def escribir(self, bloque) -> None:
+        bloque = np.asarray(bloque).reshape(-1)
+        n = len(bloque)
+        if n == 0:
+            return
+        with self._lock:
+            if n >= self._capacidad:
+                # Sólo sobreviven las últimas `capacidad` muestras
+                bloque = bloque[-self._capacidad:]
+                self._escritas += n - self._capacidad
+                n = self._capacidad
+            inicio = self._escritas % self._capacidad
+            primera = min(n, self._capacidad - inicio)
+            self._datos[inicio:inicio + primera] = bloque[:primera]
+            if primera < n:
+                self._datos[:n - primera] = bloque[primera:]
+            self._escritas += n
+
+    def leer(self, desde: int, hasta: int) -> np.ndarray:
+        """Devuelve una copia de las muestras [desde, hasta).
+
+        Si `desde` ya fue sobrescrito se recorta a la muestra más vieja disponible.
+        """
+        with self._lock:
+            hasta = min(hasta, self._escritas)
+            desde = max(desde, self._escritas - self._capacidad, 0)
+            n = hasta - desde
+            if n <= 0:
+                return np.zeros(0, dtype=np.int16)
+            inicio = desde % self._capacidad
+            primera = min(n, self._capacidad - inicio)
+            out = np.empty(n, dtype=np.int16)
+            out[:primera] = self._datos[inicio:inicio + primera]
+            if primera < n:
+                out[primera:] = self._datos[:n - primera]
+            return out
+
+
+class SegmentadorVAD:
+    """Detector de actividad de voz por energía (RMS) con piso de ruido adaptativo.
+
+    Se alimenta con tramas de tamaño fijo y devuelve los tramos de voz cerrados como
+    pares (inicio, fin) en posiciones absolutas de muestra.
+    """
+
+    def __init__(self, fs: int = 16000, trama_ms: int = 30, umbral_min: float = 300.0,
+                 factor_ruido: float = 3.0, inicio_ms: int = 90, silencio_fin_ms: int = 600,
+                 preroll_ms: int = 200, max_segmento_s: float = 12.0):
+        self.fs = fs
+        self.trama = int(fs * trama_ms / 1000)
+        self.umbral_min = umbral_min
+        self.factor_ruido = factor_ruido
+        self._tramas_inicio = max(1, inicio_ms // trama_ms)
+        self._tramas_fin = max(1, silencio_fin_ms // trama_ms)
+        self._preroll = int(fs * preroll_ms / 1000)
+        self._max_muestras = int(fs * max_segmento_s)
+        self._ruido = umbral_min / factor_ruido
+        self._en_voz = False
+        self._inicio = 0
+        self._consecutivas_voz = 0
+        self._consecutivas_silencio = 0
+        self._ultima_voz = 0
+
+    @property
+    def en_voz(self) -> bool:
+        return self._en_voz
+
+    @property
+    def inicio_actual(self) -> int:
+        return self._inicio
+
+    def procesar(self, trama: np.ndarray, posicion: int) -> Optional[Tuple[int, int]]:
+        """Procesa una trama que empieza en `posicion`. Devuelve un segmento cerrado o None."""
+        rms = float(np.sqrt(np.mean(trama.astype(np.float32) ** 2))) if len(trama) else 0.0
+        umbral = max(self.umbral_min, self._ruido * self.factor_ruido)
+        es_voz = rms >= umbral
+        fin_trama = posicion + len(trama)
+
+        if not self._en_voz:
+            if es_voz:
+                self._consecutivas_voz += 1
+                if self._consecutivas_voz >= self._tramas_inicio:
+                    self._en_voz = True
+                    self._consecutivas_silencio = 0
+                    primera = fin_trama - self._consecutivas_voz * self.trama
+                    self._inicio = max(0, primera - self._preroll)
+                    self._ultima_voz = fin_trama
+            else:
+                self._consecutivas_voz = 0
+                # El piso de ruido sólo se adapta con silencio
+                self._ruido = 0.95 * self._ruido + 0.05 * rms
+            return None
+
+        if es_voz:
+            self._consecutivas_silencio = 0
+            self._ultima_voz = fin_trama
+        else:
+            self._consecutivas_silencio += 1
+        if self._consecutivas_silencio >= self._tramas_fin:
+            return self._cerrar(self._ultima_voz + self._preroll, seguir_en_voz=False)
+        if fin_trama - self._inicio >= self._max_muestras:
+            # Corte forzado para no acumular tramos largos sin transcribir
+            return self._cerrar(fin_trama, seguir_en_voz=True)
+        return None
+
+    def cerrar_pendiente(self, posicion: int) -> Optional[Tuple[int, int]]:
+        """Cierra el tramo abierto (al detener la grabación)."""
+        if not self._en_voz:
+            return None
+        return self._cerrar(posicion, seguir_en_voz=False)
+
+    def _cerrar(self, fin: int, seguir_en_voz: bool) -> Tuple[int, int]:
+        segmento = (self._inicio, fin)
+        self._en_voz = seguir_en_voz
+        self._inicio = fin
+        self._consecutivas_voz = 0
+        self._consecutivas_silencio = 0
+        return segmento
+
+
+class CapturaVozIncremental:
+    """Pipeline de dictado: buffer circular -> VAD -> transcripción incremental.
+
+    `transcribir(pcm: bytes, fs: int) -> str` recibe PCM int16 mono de un tramo.
+    `on_parcial(texto)` se invoca (desde el hilo de transcripción) con el texto
+    acumulado cada vez que se transcribe un tramo.
+    """
+
+    def __init__(self, transcribir: Callable[[bytes, int], str], fs: int = 16000,
+                 on_parcial: Optional[Callable[[str], None]] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None,
+                 vad: Optional[SegmentadorVAD] = None, intervalo_s: float = 0.05):
+        self.fs = fs
+        self._transcribir = transcribir
+        self._on_parcial = on_parcial
+        self._on_error = on_error
+        self.vad = vad or SegmentadorVAD(fs=fs)
+        # El buffer sólo necesita cubrir el tramo más largo más un margen
+        capacidad = self.vad._max_muestras + self.vad._preroll + fs * 5
+        self.buffer = BufferCircular(capacidad)
+        self._intervalo = intervalo_s
+        self._analizado = 0
+        self._textos: List[str] = []
+        self._cola: 'queue.Queue[Optional[np.ndarray]]' = queue.Queue()
+        self._stop = threading.Event()
+        self._hilo_analisis: Optional[threading.Thread] = None
+        self._hilo_transcripcion: Optional[threading.Thread] = None
+
+    # --- Entrada de audio ---
+    def callback(self, indata, frames, time_, status):
+        """Callback para `sounddevice.InputStream` (no asigna memoria por bloque)."""
+        try:
+            self.buffer.escribir(indata[:, 0] if getattr(indata, 'ndim', 1) > 1 else indata)
+        except Exception:
+            pass
+
+    # --- Ciclo de vida ---
+    def iniciar(self):
+        self._stop.clear()
+        self._hilo_analisis = threading.Thread(target=self._loop_analisis, daemon=True)
+        self._hilo_transcripcion = threading.Thread(target=self._loop_transcripcion, daemon=True)
+        self._hilo_analisis.start()
+        self._hilo_transcripcion.start()
+
+    def detener(self, timeout: float = 30.0) -> str:
+        """Cierra el último tramo, espera las transcripciones pendientes y devuelve el texto."""
+        self._stop.set()
+        if self._hilo_analisis:
+            self._hilo_analisis.join(timeout=2.0)
+        self._analizar_pendiente()
+        fin = self.buffer.escritas
+        seg = self.vad.cerrar_pendiente(fin)
+        if seg:
+            self._encolar(seg)
+        self._cola.put(None)
+        if self._hilo_transcripcion:
+            self._hilo_transcripcion.join(timeout=timeout)
+        return self.texto()
+
+    def texto(self) -> str:
+        return ' '.join(t for t in self._textos if t).strip()
+
+    # --- Hilos internos ---
+    def _loop_analisis(self):
+        while not self._stop.wait(self._intervalo):
+            self._analizar_pendiente()
+
+    def _analizar_pendiente(self):
+        trama = self.vad.trama
+        disponibles = self.buffer.escritas
+        # Si el análisis quedó atrás de lo que guarda el buffer, saltar a lo disponible
+        self._analizado = max(self._analizado, disponibles - self.buffer.capacidad)
+        while disponibles - self._analizado >= trama:
+            datos = self.buffer.leer(self._analizado, self._analizado + trama)
+            seg = self.vad.procesar(datos, self._analizado)
+            self._analizado += trama
+            if seg:
+                self._encolar(seg)
+
+    def _encolar(self, segmento: Tuple[int, int]):
+        inicio, fin = segmento
+        audio = self.buffer.leer(inicio, fin)
+        if len(audio):
+            self._cola.put(audio)
+
+    def _loop_transcripcion(self):
+        while True:
+            audio = self._cola.get()
+            if audio is None:
+                return
+            try:
+                texto = (self._transcribir(audio.tobytes(), self.fs) or '').strip()
+            except Exception as e:
+                texto = ''
+                if self._on_error:
+                    try:
+                        self._on_error(e)
+                    except Exception:
+                        pass
+            if texto:
+                self._textos.append(texto)
+                if self._on_parcial:
+                    try:
+                        self._on_parcial(self.texto())
+                    except Exception:
+                        pass
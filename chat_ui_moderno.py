@@ -22,6 +22,8 @@ DARK_ACCENT = '#2c313c'
 TEXT_COLOR = '#e6e6e6'
 USER_BUBBLE = '#2556b8'
 AGENT_BUBBLE = '#3a8b3a'
+AGENT_CODE_BG = '#2a662a'
+AGENT_SECONDARY = '#cfe3cf'
 FONT = ('Segoe UI', 11)
 
 import tkinter as tk
@@ -31,9 +33,14 @@ try:
     import ttkbootstrap as tb  # type: ignore
 except Exception:
     tb = None  # fallback to plain ttk
-import queue, threading, sqlite3, traceback
-
-from agente_personal import AgentePersonal
+import threading, sqlite3, time, traceback
+
+import telemetria
+from agente_personal import ESTADOS_TAREA, AgentePersonal
+from despachador_ui import DespachadorUI
+from layout_chat import MetricasFuente, MotorLayout
+from markdown_incremental import BurbujaMarkdown, configurar_tags, crear_fuentes
+from resumenes import Resumidor
 from llama_local_helper import obtener_respuesta_llama_stream, obtener_respuesta_llama
 
 # --- Clase principal de la UI ---
@@ -61,6 +68,7 @@ class ChatUI:
             try:
                 contenido = ""
                 msg_error = None
+                prompt_base = "Resume el siguiente contenido de archivo para el usuario:"
                 if ext == ".txt":
                     try:
                         with open(ruta, "r", encoding="utf-8") as f:
@@ -74,45 +82,52 @@ class ChatUI:
                         contenido = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
                     except Exception as e:
                         msg_error = f"No se pudo leer el archivo Word: {e}"
-                elif ext == ".xlsx":
-                    try:
-                        import pandas as pd
-                        df = pd.read_excel(ruta)
-                        contenido = df.to_string(index=False)
-                    except Exception as e:
-                        msg_error = f"No se pudo leer el archivo Excel: {e}"
-                elif ext == ".csv":
+                elif ext in (".xlsx", ".csv"):
+                    # Tablas: perfil por bloques (tipos, nulos, rangos, categorías, ejemplos) en
+                    # lugar del DataFrame como texto, que el corte de abajo reducía a las primeras filas
                     try:
-                        import pandas as pd
-                        df = pd.read_csv(ruta, encoding="utf-8", engine="python", error_bad_lines=False)
-                        contenido = df.to_string(index=False)
+                        import perfil_tabular
+                        contenido = perfil_tabular.perfilar(ruta).texto()
+                        prompt_base = ("Describe para el usuario qué contiene esta tabla a partir de su perfil "
+                                       "(calculado sobre todas las filas):")
                     except Exception as e:
-                        msg_error = f"No se pudo leer el archivo CSV: {e}"
+                        tipo = "Excel" if ext == ".xlsx" else "CSV"
+                        msg_error = f"No se pudo leer el archivo {tipo}: {e}"
                 elif ext == ".pdf":
+                    # Las páginas sin capa de texto (escaneadas) pasan por OCR local, en paralelo
                     try:
-                        import pdfplumber
-                        with pdfplumber.open(ruta) as pdf:
-                            paginas = [page.extract_text() for page in pdf.pages if page.extract_text()]
-                            contenido = "\n".join(paginas)
+                        import ocr_pdf
+
+                        def avisar_progreso(hechas, total):
+                            self.despachador.publicar_unico(
+                                'ocr', self._show_toast_tip, f"Leyendo PDF (OCR): página {hechas} de {total}…", 4000)
+                        leido_pdf = ocr_pdf.extraer_texto(ruta, progreso=avisar_progreso)
+                        contenido = leido_pdf.texto
                         if not contenido.strip():
-                            msg_error = "El PDF no tiene texto extraíble. Puede estar escaneado o vacío."
+                            motivo = ocr_pdf.motivo_no_disponible()
+                            if leido_pdf.sin_leer and motivo:
+                                msg_error = f"El PDF no tiene texto extraíble y no se puede hacer OCR: {motivo}."
+                            else:
+                                msg_error = "El PDF no tiene texto extraíble. Puede estar escaneado o vacío."
+                        elif leido_pdf.ocr:
+                            self.despachador.publicar_unico('ocr', self._show_toast_tip, f"PDF leído: {leido_pdf.resumen()}")
                     except Exception as e:
                         msg_error = f"No se pudo leer el archivo PDF: {e}"
                 else:
-                    self.root.after(0, lambda: self._show_toast_error("Tipo de archivo no soportado."))
+                    self.despachador.publicar(self._show_toast_error, "Tipo de archivo no soportado.")
                     return
                 if msg_error:
-                    self.root.after(0, lambda: self._show_toast_error(msg_error))
+                    self.despachador.publicar(self._show_toast_error, msg_error)
                     return
                 if not contenido.strip():
-                    self.root.after(0, lambda: self._show_toast_error("El archivo está vacío o no se pudo extraer texto."))
+                    self.despachador.publicar(self._show_toast_error, "El archivo está vacío o no se pudo extraer texto.")
                     return
                 contenido_corto = contenido[:5000]
-                prompt = f"Resume el siguiente contenido de archivo para el usuario:\n{contenido_corto}"
-                self.root.after(0, lambda: self._insertar_burbuja("Usuario", f"Archivo leído correctamente: {os.path.basename(ruta)}"))
-                self.root.after(0, lambda: self._guardar_mensaje("Usuario", f"Archivo leído correctamente: {os.path.basename(ruta)}"))
-                self.root.after(0, self._cargar_historial)
-                self.root.after(0, lambda: self._insertar_burbuja("Usuario", "Procesando resumen del archivo..."))
+                prompt = f"{prompt_base}\n{contenido_corto}"
+                leido = f"Archivo leído correctamente: {os.path.basename(ruta)}"
+                self.despachador.publicar(self._guardar_mensaje, "Usuario", leido)
+                self.despachador.publicar_unico('historial', self._cargar_historial)
+                self.despachador.publicar(self._insertar_burbuja, "Usuario", "Procesando resumen del archivo...")
 
                 resumen_result = {'done': False, 'resumen': None}
                 def modelo_thread():
@@ -125,7 +140,7 @@ class ChatUI:
                         tb = traceback.format_exc()
                         resumen_result['resumen'] = f"Error al generar resumen: {e}\nTraceback:\n{tb}"
                         # Mostrar error en la UI si ocurre un crash en el hilo
-                        self.root.after(0, lambda: self._show_toast_error(f"Error al generar resumen: {e}\nTraceback:\n{tb}"))
+                        self.despachador.publicar(self._show_toast_error, f"Error al generar resumen: {e}\nTraceback:\n{tb}")
                     finally:
                         resumen_result['done'] = True
 
@@ -142,13 +157,12 @@ class ChatUI:
                     resumen = f"[Timeout] El modelo no respondió a tiempo. Respuesta alternativa:\n{resumen}"
                 if not resumen or not resumen.strip():
                     resumen = "No se pudo generar el resumen del archivo. (El modelo no respondió)"
-                self.root.after(0, lambda: self._insertar_burbuja("Usuario", f"Este archivo contiene:\n{resumen}"))
-                self.root.after(0, lambda: self._guardar_mensaje("Usuario", f"Este archivo contiene:\n{resumen}"))
-                self.root.after(0, self._cargar_historial)
+                self.despachador.publicar(self._guardar_mensaje, "Usuario", f"Este archivo contiene:\n{resumen}")
+                self.despachador.publicar_unico('historial', self._cargar_historial)
             except Exception as e:
                 import traceback
                 tb = traceback.format_exc()
-                self.root.after(0, lambda: self._show_toast_error(f"Error al leer archivo: {e}\nTraceback:\n{tb}"))
+                self.despachador.publicar(self._show_toast_error, f"Error al leer archivo: {e}\nTraceback:\n{tb}")
 
         threading.Thread(target=procesar_archivo, daemon=True).start()
 
@@ -166,9 +180,10 @@ class ChatUI:
     # --- Helper para recarga de listboxes ---
     @captura_errores_metodo
     def _reload_listbox(self, listbox, items, seleccionar=None):
-        listbox.delete(0, tk.END)
-        for item in items:
-            listbox.insert(tk.END, item)
+        # Reconstruir sólo si cambió el contenido (evita redibujar en cada navegación)
+        if list(listbox.get(0, tk.END)) != list(items):
+            listbox.delete(0, tk.END)
+            listbox.insert(tk.END, *items)
         if seleccionar and seleccionar in items:
             idx = items.index(seleccionar)
             listbox.selection_clear(0, tk.END)
@@ -250,20 +265,26 @@ class ChatUI:
         self.proyecto_id = None
         self.conversacion_id = None
 
-        self.respuesta_queue = queue.Queue()
+        # Único camino de los hilos de trabajo hacia Tk (ver despachador_ui.py)
+        self.despachador = DespachadorUI(root)
+        self.despachador.iniciar()
         self.animando = False
-        self._recibiendo_stream = False
         # Config: activar/desactivar stream. Por defecto, no-stream para máxima estabilidad.
         self.stream_enabled = False
         # Cancelación de respuestas en curso por conversación
         self._cancelaciones = {}
+        # Respuestas en curso: conversacion_id -> último texto parcial (varias a la vez)
+        self._generando = {}
+        # Resumen incremental de los chats largos (ver resumenes.py); se crea al primer uso
+        self._resumidor = None
         # Mapa de chats visibles: índice -> conversacion_id
         self._chat_map = []
         # Grabación de voz (toggle)
         self._grabando = False
+        self._cargando_voz = False
         self._grab_stop = None  # type: ignore[assignment]
         self._grab_thread = None  # type: ignore[assignment]
-        self._grab_frames = None  # type: ignore
+        self._grab_captura = None  # type: ignore
         self._grab_fs = 16000
 
         # --- INICIALIZACIÓN DE WIDGETS ---
@@ -326,10 +347,23 @@ class ChatUI:
             lambda e: self.canvas.configure(scrollregion=self.canvas.bbox('all'))
         )
         self._scroll_window = self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor='nw')
-        self.canvas.bind(
-            '<Configure>',
-            lambda e: self.canvas.itemconfigure(self._scroll_window, width=e.width)
-        )
+        # Ancho de las burbujas sin consultar la geometría y reflow diferido al redimensionar
+        # Fuentes de las respuestas en Markdown; sus métricas también dimensionan las burbujas
+        self._fuentes_md = crear_fuentes(self.root, FONT[0], FONT[1])
+        self._metricas_md = {clase: MetricasFuente(self._fuentes_md[clase])
+                             for clase in ('normal', 'codigo', 'h1', 'h2', 'h3')}
+        self._burbuja_agente = None  # última burbuja del agente en el chat visible
+        # Para sumar sólo lo que escriben otras instancias (ver _aplicar_cambios_externos)
+        self._ultimo_mensaje_id = 0        # mayor id de mensaje mostrado en el chat visible
+        self._mensajes_propios = set()     # ids guardados por esta ventana (ya están en pantalla)
+        self._cambios_diferidos = set()    # chats con mensajes externos pendientes mientras generan
+        self.layout = MotorLayout(self._metricas_md['normal'],
+                                  self.root.after, self.root.after_cancel, vista=self.canvas.yview)
+
+        def on_canvas_configure(e):
+            self.canvas.itemconfigure(self._scroll_window, width=e.width)
+            self.layout.on_configure(e)
+        self.canvas.bind('<Configure>', on_canvas_configure)
         self.canvas.configure(yscrollcommand=self.scrollbar.set)
         self.canvas.pack(side='left', fill='both', expand=True)
         self.scrollbar.pack(side='right', fill='y')
@@ -370,8 +404,10 @@ class ChatUI:
         self.menu_proyecto = tk.Menu(self.root, tearoff=0)
         self.menu_proyecto.add_command(label='Renombrar Proyecto', command=self.renombrar_proyecto)
         self.menu_proyecto.add_command(label='Eliminar Proyecto', command=self.eliminar_proyecto)
+        self.menu_proyecto.add_command(label='Tablero de Tareas', command=self._mostrar_tablero)
         self.menu_proyecto.add_separator()
         self.menu_proyecto.add_command(label='Nuevo Proyecto', command=self.crear_proyecto)
+        self.menu_proyecto.add_command(label='Estadísticas (F12)', command=self._mostrar_estadisticas)
 
         self.menu_chat = tk.Menu(self.root, tearoff=0)
         self.menu_chat.add_command(label='Renombrar Conversación', command=self.renombrar_chat)
@@ -385,6 +421,7 @@ class ChatUI:
             label='Seleccioná un proyecto para Renombrar/Eliminar', state='disabled')
         self.menu_proyecto_vacio.add_separator()
         self.menu_proyecto_vacio.add_command(label='Nuevo Proyecto', command=self.crear_proyecto)
+        self.menu_proyecto_vacio.add_command(label='Estadísticas (F12)', command=self._mostrar_estadisticas)
 
         self.menu_chat_vacio_proy = tk.Menu(self.root, tearoff=0)
         self.menu_chat_vacio_proy.add_command(label='Nuevo Chat', command=self.crear_chat)
@@ -553,16 +590,18 @@ class ChatUI:
             elif getattr(event, 'num', None) == 5:
                 self.canvas.yview_scroll(1, "units")
 
+    def _rueda_en_burbuja(self, event):
+        # El binding de clase de tk.Text desplazaría la burbuja en vez del chat
+        self._on_mousewheel(event)
+        return 'break'
+
     # ---------------- Proyectos ----------------
     def crear_proyecto(self):
         nombre = simpledialog.askstring('Nuevo Proyecto', 'Nombre del proyecto:')
         if not nombre:
             return
         try:
-            with self.agente.lock:
-                cur = self.agente.conn.cursor()
-                cur.execute("INSERT INTO proyectos (nombre) VALUES (?)", (nombre,))
-                self.agente.conn.commit()
+            self.agente.crear_proyecto(nombre)
             self._cargar_proyectos(seleccionar_nombre=nombre)
         except sqlite3.IntegrityError:
                 self._show_toast_error(f'Ya existe un proyecto llamado "{nombre}".')
@@ -574,10 +613,7 @@ class ChatUI:
         if not nuevo:
             return
         try:
-            with self.agente.lock:
-                cur = self.agente.conn.cursor()
-                cur.execute("UPDATE proyectos SET nombre=? WHERE id=?", (nuevo, self.proyecto_id))
-                self.agente.conn.commit()
+            self.agente.renombrar_proyecto(self.proyecto_id, nuevo)
             self._cargar_proyectos(seleccionar_nombre=nuevo)
         except sqlite3.IntegrityError:
             self._show_toast_error(f'Ya existe un proyecto llamado "{nuevo}".')
@@ -587,30 +623,22 @@ class ChatUI:
         if not sel:
             return
         nombre = self.listbox_proyectos.get(sel[0])
-        with self.agente.lock:
-            cur = self.agente.conn.cursor()
-            cur.execute('SELECT id FROM proyectos WHERE nombre=?', (nombre,))
-            row = cur.fetchone()
-        if not row:
+        proyecto_id = self.agente.id_proyecto(nombre)
+        if proyecto_id is None:
             self._show_toast_error('Proyecto no encontrado en la base de datos.')
             self._cargar_proyectos()
             return
-        proyecto_id = row[0]
         if not self._safe(messagebox.askyesno, 'Confirmar', f'¿Eliminar el proyecto "{nombre}" y todas sus conversaciones y mensajes?'):
             return
         try:
-            with self.agente.lock:
-                cur2 = self.agente.conn.cursor()
-                convs = cur2.execute('SELECT id FROM conversaciones WHERE proyecto_id=?', (proyecto_id,)).fetchall()
-                for (cid,) in convs:
-                    ev = self._cancelaciones.get(cid)
-                    if ev:
-                        ev.set()
-                        self._cancelaciones.pop(cid, None)
-                self._cancelaciones = {k: v for k, v in self._cancelaciones.items() if k not in [c[0] for c in convs]}
-                cur2.execute('BEGIN IMMEDIATE')
-                cur2.execute('DELETE FROM proyectos WHERE id=?', (proyecto_id,))
-                self.agente.conn.commit()
+            convs = [cid for cid, _nombre in self.agente.listar_conversaciones(proyecto_id)]
+            for cid in convs:
+                ev = self._cancelaciones.get(cid)
+                if ev:
+                    ev.set()
+                    self._cancelaciones.pop(cid, None)
+            self._cancelaciones = {k: v for k, v in self._cancelaciones.items() if k not in convs}
+            self.agente.eliminar_proyecto(proyecto_id)
         except Exception as e:
             self._show_toast_error(f'No se pudo eliminar el proyecto: {e}')
             return
@@ -629,13 +657,7 @@ class ChatUI:
 
             idx = sel[0]
             nombre = self.listbox_proyectos.get(idx)
-            proyecto_id = None
-            with self.agente.lock:
-                cur = self.agente.conn.cursor()
-                cur.execute('SELECT id FROM proyectos WHERE nombre = ?', (nombre,))
-                row = cur.fetchone()
-                if row:
-                    proyecto_id = row[0]
+            proyecto_id = self.agente.id_proyecto(nombre)
 
             if proyecto_id is None:
                 self._set_status('Proyecto no encontrado en la base de datos.', 4000)
@@ -660,10 +682,7 @@ class ChatUI:
 
     def _cargar_proyectos(self, seleccionar_nombre: str | None = None):
         try:
-            with self.agente.lock:
-                cur = self.agente.conn.cursor()
-                cur.execute('SELECT nombre FROM proyectos ORDER BY nombre ASC')
-                proyectos = [r[0] for r in cur.fetchall()]
+            proyectos = self.agente.listar_proyectos()
         except Exception as e:
             self._set_status(f'Error al cargar proyectos: {e}', 5000)
             proyectos = []
@@ -682,11 +701,7 @@ class ChatUI:
         if self.proyecto_id is None:
             return
         nombre = simpledialog.askstring('Nuevo Chat', 'Nombre de la conversación:') or 'Conversación'
-        with self.agente.lock:
-            cur = self.agente.conn.cursor()
-            cur.execute('INSERT INTO conversaciones (nombre, proyecto_id) VALUES (?, ?)',
-                        (nombre, self.proyecto_id))
-            self.agente.conn.commit()
+        self.agente.crear_conversacion(nombre, self.proyecto_id)
         self._cargar_chats(self.proyecto_id, seleccionar_nombre=nombre)
 
     def renombrar_chat(self):
@@ -695,11 +710,7 @@ class ChatUI:
         nuevo = simpledialog.askstring('Renombrar Conversación', 'Nuevo nombre:')
         if not nuevo:
             return
-        with self.agente.lock:
-            cur = self.agente.conn.cursor()
-            cur.execute('UPDATE conversaciones SET nombre=? WHERE id=?',
-                        (nuevo, self.conversacion_id))
-            self.agente.conn.commit()
+        self.agente.renombrar_chat(self.conversacion_id, nuevo)
         self._cargar_chats(self.proyecto_id, seleccionar_nombre=nuevo)
 
     def eliminar_chat(self):
@@ -713,16 +724,12 @@ class ChatUI:
         if not self._safe(messagebox.askyesno, 'Confirmar', f'¿Eliminar la conversación "{nombre}" y su historial?'):
             return
         try:
-            with self.agente.lock:
-                cur2 = self.agente.conn.cursor()
-                ev = self._cancelaciones.get(conv_id)
-                if ev:
-                    ev.set()
-                    self._cancelaciones.pop(conv_id, None)
-                self._cancelaciones = {k: v for k, v in self._cancelaciones.items() if k != conv_id}
-                cur2.execute('BEGIN IMMEDIATE')
-                cur2.execute('DELETE FROM conversaciones WHERE id=?', (conv_id,))
-                self.agente.conn.commit()
+            ev = self._cancelaciones.get(conv_id)
+            if ev:
+                ev.set()
+                self._cancelaciones.pop(conv_id, None)
+            self._cancelaciones = {k: v for k, v in self._cancelaciones.items() if k != conv_id}
+            self.agente.eliminar_chat(conv_id)
         except Exception as e:
             self._show_toast_error(f'No se pudo eliminar la conversación: {e}')
             return
@@ -741,22 +748,20 @@ class ChatUI:
             return
         self.conversacion_id = self._chat_map[idx]
         self._cargar_historial()
+        self._actualizar_controles()
         self.btn_renombrar_chat.pack(pady=(0, 4), fill='x')
         self.btn_eliminar_chat.pack(pady=(0, 4), fill='x')
         self.btn_borrar_hist.pack(pady=(0, 6), fill='x')
 
     def _cargar_chats(self, proyecto_id: int, seleccionar_nombre: str | None = None):
         try:
-            with self.agente.lock:
-                cur = self.agente.conn.cursor()
-                cur.execute('SELECT nombre, id FROM conversaciones WHERE proyecto_id=? ORDER BY id ASC', (proyecto_id,))
-                rows = cur.fetchall()
+            rows = self.agente.listar_conversaciones(proyecto_id)
         except Exception as e:
             self._set_status(f'Error al cargar conversaciones: {e}', 5000)
             rows = []
         nombres = []
         self._chat_map = []
-        for nombre, cid in rows:
+        for cid, nombre in rows:
             n = nombre or f"Chat #{cid}"
             nombres.append(n)
             self._chat_map.append(cid)
@@ -789,107 +794,137 @@ class ChatUI:
                 w.destroy()
             except Exception:
                 pass
-        self.scrollable_frame.update_idletasks()
-        self.canvas.update_idletasks()
+        self.layout.limpiar()
+        self._burbuja_agente = None
         if self.conversacion_id is None:
             self.canvas.yview_moveto(0.0)
             return
         # Inserta solo los mensajes del chat seleccionado
-        for remitente, contenido in self.agente.listar_mensajes(self.conversacion_id):
+        filas = self.agente.listar_mensajes_desde(self.conversacion_id)
+        for _mid, remitente, contenido in filas:
             self._insertar_burbuja(remitente, contenido)
-        self.scrollable_frame.update_idletasks()
-        self.canvas.update_idletasks()
+        self._ultimo_mensaje_id = max((f[0] for f in filas), default=0)
+        # Si la respuesta de este chat sigue generándose (quizás mientras mirábamos otro), mostrar lo que va
+        if self.conversacion_id in self._generando:
+            self._insertar_burbuja('Agente', self._generando[self.conversacion_id])
+        # Sin update_idletasks: Tk acomoda todas las burbujas en una sola pasada al quedar ocioso
         self.root.after(50, lambda: self.canvas.yview_moveto(1.0))
 
     def _insertar_burbuja(self, remitente, contenido):
         frame = tk.Frame(self.scrollable_frame, bg=DARK_BG)
-        # Calcular el ancho disponible dinámicamente
-        frame.update_idletasks()
-        available_width = self.scrollable_frame.winfo_width() or 300
-        wrap = max(200, available_width - 100)  # margen para burbuja
+        # Ancho de corte según el último <Configure> del canvas (ver layout_chat.py)
+        wrap = self.layout.corte()
         if remitente == 'Usuario':
             bubble = tk.Message(frame, text=contenido, bg=USER_BUBBLE, fg='white',
                                font=FONT, width=wrap, padx=12, pady=8)
             bubble.pack(anchor='e', padx=10, pady=4, fill='x')
             frame.pack(fill='x', anchor='e', padx=(60, 10))
+            self.layout.registrar(bubble, contenido)
         else:
-            bubble = tk.Message(frame, text=contenido, bg=AGENT_BUBBLE, fg=TEXT_COLOR,
-                               font=FONT, width=wrap, padx=12, pady=8)
-            bubble.pack(anchor='w', padx=10, pady=4, fill='x')
+            # Respuesta del modelo: Markdown en un tk.Text que se pinta de forma incremental
+            texto = tk.Text(frame, bg=AGENT_BUBBLE, fg=TEXT_COLOR, font=self._fuentes_md['normal'],
+                            wrap='word', padx=12, pady=8, width=1, height=1, relief='flat', bd=0,
+                            highlightthickness=0, cursor='arrow', selectbackground=AGENT_CODE_BG)
+            configurar_tags(texto, self._fuentes_md, AGENT_CODE_BG, AGENT_SECONDARY)
+            # La rueda desplaza el chat, no el contenido de la burbuja
+            for evento in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+                texto.bind(evento, self._rueda_en_burbuja)
+            bubble = BurbujaMarkdown(texto, self._metricas_md, corte=wrap)
+            bubble.mostrar(contenido)
+            # Sin fill: el ancho lo fija BurbujaMarkdown (en caracteres) y coincide con su estimación de alto
+            texto.pack(anchor='w', padx=10, pady=4)
             frame.pack(fill='x', anchor='w', padx=(10, 60))
+            self._burbuja_agente = bubble
+            self.layout.registrar(bubble, contenido)
+
 
+    def _actualizar_burbuja_agente(self, nuevo_texto, conversacion_id=None):
+        """Actualiza el texto de la última burbuja del agente en el chat actual. Si no existe, la crea. Evita duplicados.
 
-    def _actualizar_burbuja_agente(self, nuevo_texto):
-        """Actualiza el texto de la última burbuja del agente en el chat actual. Si no existe, la crea. Evita duplicados."""
+        Con `conversacion_id`, sólo pinta si ese chat es el visible (las respuestas de otros
+        chats siguen en segundo plano y se ven al volver a ellos).
+        """
         if self.conversacion_id is None:
             return
-        # Buscar la última burbuja del agente
-        frames = [frame for frame in reversed(self.scrollable_frame.winfo_children())]
-        for frame in frames:
-            for widget in frame.winfo_children():
-                if isinstance(widget, tk.Message) and widget.cget('bg') == AGENT_BUBBLE:
-                    widget.config(text=nuevo_texto)
-                    return
+        if conversacion_id is not None and conversacion_id != self.conversacion_id:
+            return
+        # La última burbuja del agente: sólo se re-parsea la línea sin terminar
+        burbuja = self._burbuja_agente
+        if burbuja is not None and burbuja.winfo_exists():
+            burbuja.mostrar(nuevo_texto)
+            self.layout.actualizar_natural(burbuja, burbuja.ancho_natural())
+            return
         # Si no existe, la crea
         self._insertar_burbuja('Agente', nuevo_texto)
 
     def _guardar_mensaje(self, remitente, contenido):
-        with self.agente.lock:
-            # Si no hay conversación seleccionada, crear una acorde al contexto actual
-            if self.conversacion_id is None:
-                cur = self.agente.conn.cursor()
-                if self.proyecto_id is not None:
-                    cur.execute('INSERT INTO conversaciones (nombre, proyecto_id) VALUES (?, ?)',
-                                ("Conversación", self.proyecto_id))
-                else:
-                    cur.execute('INSERT INTO conversaciones (nombre, proyecto_id) VALUES (?, ?)',
-                                ("Conversación Libre", None))
-                self.agente.conn.commit()
-                self.conversacion_id = cur.lastrowid
-            cur = self.agente.conn.cursor()
-            cur.execute('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) '
-                        'VALUES (?, ?, ?, ?)', (self.conversacion_id, remitente, 'texto', contenido))
-            self.agente.conn.commit()
+        # Si no hay conversación seleccionada, crear una acorde al contexto actual
+        if self.conversacion_id is None:
+            nombre = "Conversación" if self.proyecto_id is not None else "Conversación Libre"
+            self.conversacion_id = self.agente.crear_conversacion(nombre, self.proyecto_id)
+        with telemetria.medir('ui_guardar_mensaje'):
+            self._mensajes_propios.add(self.agente.agregar_mensaje(self.conversacion_id, remitente, contenido))
 
     def enviar_mensaje(self, event=None):
         texto = self.entry_mensaje.get().strip()
         if not texto:
             return
-        # Deshabilitar input y botón de enviar
-        self.entry_mensaje.config(state='disabled')
-        self.btn_enviar.config(state='disabled')
-        # Habilitar Stop
-        self.btn_stop.config(state='normal')
+        if self.conversacion_id in self._generando:
+            # Otro chat puede generar en paralelo; el mismo, de a una respuesta
+            self._show_toast_tip('Esta conversación todavía está respondiendo. Podés seguir en otro chat o detenerla.')
+            return
         # Guardar mensaje del usuario (creará conversación si falta)
         self._guardar_mensaje('Usuario', texto)
         self.entry_mensaje.delete(0, tk.END)
-        self._cargar_historial()
-
-        # Burbuja "pensando..."
-        self._insertar_burbuja('Agente', '...')
-        self.animando = True
-        self._animar_puntos()
+        self._lanzar_respuesta(texto)
 
+    def _lanzar_respuesta(self, texto):
+        """Pide la respuesta del chat actual en un hilo propio; otros chats pueden estar generando a la vez."""
         # Snapshot para responder sobre la misma conversación aunque el usuario cambie de selección
         conv_id_snapshot = self.conversacion_id
+        # Burbuja "pensando..." (la agrega _cargar_historial mientras la conversación esté en _generando)
+        self._generando[conv_id_snapshot] = '...'
+        self._cargar_historial()
+        self.animando = True
+        self._animar_puntos()
         # Resetear/crear token de cancelación para esta conversación
         ev = threading.Event()
         self._cancelaciones[conv_id_snapshot] = ev
-        def reactivar_input():
-            self.entry_mensaje.config(state='normal')
-            self.btn_enviar.config(state='normal')
-            self.btn_stop.config(state='disabled')
-        if self.stream_enabled:
-            def hilo_stream():
-                self._respuesta_streaming(texto, conv_id_snapshot, ev)
-                self.root.after(0, reactivar_input)
-            threading.Thread(target=hilo_stream, daemon=True).start()
-        else:
-            def hilo_nostream():
-                self._respuesta_nostream(texto, conv_id_snapshot, ev)
-                self.root.after(0, reactivar_input)
-            threading.Thread(target=hilo_nostream, daemon=True).start()
-    
+        self._actualizar_controles()
+        responder = self._respuesta_streaming if self.stream_enabled else self._respuesta_nostream
+
+        def hilo():
+            try:
+                responder(texto, conv_id_snapshot, ev)
+            finally:
+                self.despachador.publicar(self._fin_respuesta, conv_id_snapshot, ev)
+        threading.Thread(target=hilo, daemon=True).start()
+
+    def _fin_respuesta(self, conversacion_id, cancel_event):
+        self._generando.pop(conversacion_id, None)
+        if self._cancelaciones.get(conversacion_id) is cancel_event and not cancel_event.is_set():
+            # Limpieza del token de cancelación si sigue siendo el mismo
+            self._cancelaciones.pop(conversacion_id, None)
+        if not self._generando:
+            self.animando = False
+        self._actualizar_controles()
+        if conversacion_id in self._cambios_diferidos:
+            self._cambios_diferidos.discard(conversacion_id)
+            if conversacion_id == self.conversacion_id:
+                self._agregar_mensajes_nuevos()
+        if conversacion_id != self.conversacion_id and not cancel_event.is_set():
+            nombre = None
+            if conversacion_id in self._chat_map:
+                nombre = self.listbox_chats.get(self._chat_map.index(conversacion_id))
+            self._show_toast_tip(f'Respuesta lista en «{nombre}».' if nombre else 'Respuesta lista en otra conversación.',
+                                 duration=4000)
+
+    def _actualizar_controles(self):
+        """Enviar/Stop según si el chat visible tiene una respuesta en curso."""
+        generando = self.conversacion_id in self._generando
+        self._safe(self.btn_enviar.config, state='disabled' if generando else 'normal')
+        self._safe(self.btn_stop.config, state='normal' if generando else 'disabled')
+
     def _cancelar_respuesta(self):
         # Cancela la respuesta actual del modelo
         conv_id_snapshot = self.conversacion_id
@@ -898,16 +933,22 @@ class ChatUI:
             ev.set()
         self.btn_stop.config(state='disabled')
 
+    def _obtener_resumidor(self):
+        if self._resumidor is None or self._resumidor.agente is not self.agente:
+            self._resumidor = Resumidor(self.agente)
+        return self._resumidor
+
     def _armar_historial(self, conversacion_id: int, texto_usuario: str):
-        rows = self.agente.listar_mensajes(conversacion_id)
-        historial = [{'role': 'user' if r == 'Usuario' else 'assistant', 'content': c}
-                     for r, c in rows]
+        # Resumen de lo viejo + turnos recientes: el prompt no crece con el largo del chat
+        with telemetria.medir('ui_armar_historial'):
+            historial = self._obtener_resumidor().historial(conversacion_id)
         if not historial or historial[-1]['role'] != 'user':
             historial.append({'role': 'user', 'content': texto_usuario})
         return historial
 
 
     def _respuesta_nostream(self, texto_usuario: str, conversacion_id: int, cancel_event: threading.Event):
+        t0 = time.perf_counter()
         try:
             historial = self._armar_historial(conversacion_id, texto_usuario)
             # Si el modelo soporta callback de cancelación, pásalo aquí
@@ -920,165 +961,418 @@ class ChatUI:
         except Exception as e:
             respuesta_final = f"[Error del modelo] {e}"
         if cancel_event.is_set():
-            self.animando = False
-            self.root.after(0, self._actualizar_burbuja_agente, '[Cancelado]')
+            self.despachador.publicar_unico(('burbuja', conversacion_id), self._actualizar_burbuja_agente,
+                                            '[Cancelado]', conversacion_id)
             return  # conversación eliminada o cancelada
-        self.animando = False
-        self.root.after(0, self._actualizar_burbuja_agente, respuesta_final)
+        self._generando[conversacion_id] = respuesta_final
+        self.despachador.publicar_unico(('burbuja', conversacion_id), self._actualizar_burbuja_agente,
+                                        respuesta_final, conversacion_id)
         try:
-            with self.agente.lock:
-                if cancel_event.is_set():
-                    return
-                cur = self.agente.conn.cursor()
-                cur.execute('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) '
-                            'VALUES (?, "Agente", "texto", ?)', (conversacion_id, respuesta_final))
-                self.agente.conn.commit()
+            if cancel_event.is_set():
+                return
+            self._mensajes_propios.add(self.agente.agregar_mensaje(conversacion_id, 'Agente', respuesta_final))
         except Exception:
             return
-        # Limpieza del token de cancelación si sigue siendo el mismo
-        self._cancelaciones.pop(conversacion_id, None)
-        self.respuesta_queue.put(True)
+        # Ya está guardada: al recargar el chat sale del historial, no del parcial
+        self._generando.pop(conversacion_id, None)
+        self._obtener_resumidor().agendar(conversacion_id)
+        telemetria.observar('chat_respuesta_total', time.perf_counter() - t0)
 
     def _respuesta_streaming(self, texto_usuario: str, conversacion_id: int, cancel_event: threading.Event):
+        t0 = time.perf_counter()
         historial = self._armar_historial(conversacion_id, texto_usuario)
-        self._recibiendo_stream = False
 
         def actualizar_burbuja(parcial: str):
             if cancel_event.is_set():
                 return
-            if not self._recibiendo_stream:
+            if self._generando.get(conversacion_id) == '...':
                 self.animando = False
-                self._recibiendo_stream = True
-            self.root.after(0, self._actualizar_burbuja_agente, parcial)
+            self._generando[conversacion_id] = parcial
+            # Coalescido: si llegan varios tokens entre dos ticks de Tk, se pinta sólo el último texto
+            self.despachador.publicar_unico(('burbuja', conversacion_id), self._actualizar_burbuja_agente,
+                                            parcial, conversacion_id)
 
         try:
-            respuesta_final = obtener_respuesta_llama_stream(historial, actualizar_burbuja)
+            respuesta_final = obtener_respuesta_llama_stream(historial, actualizar_burbuja,
+                                                             cancel_event=cancel_event)
         except Exception as e:
             respuesta_final = f"[Error de modelo] {e}"
         if cancel_event.is_set():
             return  # conversación eliminada o cancelada
-        self.animando = False
-        self.root.after(0, self._actualizar_burbuja_agente, respuesta_final)
+        self._generando[conversacion_id] = respuesta_final
+        self.despachador.publicar_unico(('burbuja', conversacion_id), self._actualizar_burbuja_agente,
+                                        respuesta_final, conversacion_id)
         try:
-            with self.agente.lock:
-                if cancel_event.is_set():
-                    return
-                cur = self.agente.conn.cursor()
-                cur.execute('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) '
-                            'VALUES (?, "Agente", "texto", ?)', (conversacion_id, respuesta_final))
-                self.agente.conn.commit()
+            if cancel_event.is_set():
+                return
+            self._mensajes_propios.add(self.agente.agregar_mensaje(conversacion_id, 'Agente', respuesta_final))
         except Exception:
             return
-        # Limpieza del token de cancelación si sigue siendo el mismo
-        self._cancelaciones.pop(conversacion_id, None)
-        self.respuesta_queue.put(True)
+        # Ya está guardada: al recargar el chat sale del historial, no del parcial
+        self._generando.pop(conversacion_id, None)
+        self._obtener_resumidor().agendar(conversacion_id)
+        telemetria.observar('chat_respuesta_total', time.perf_counter() - t0)
 
     # ---------------- Dictado de voz ----------------
     def dictar_mensaje(self):
-        """Toggle grabación: click para empezar, click para detener y transcribir + enviar."""
-        try:
-            import speech_recognition as sr
-        except ImportError:
-            self._show_toast_error('Necesitás instalar SpeechRecognition para transcribir voz.')
-            self._set_status('Falta SpeechRecognition. Instalá: pip install SpeechRecognition', timeout=6000)
-            return
+        """Toggle grabación: click para empezar, click para detener y enviar.
 
+        La transcripción se hace por tramos mientras se graba (ver captura_voz) con un
+        motor local si hay uno instalado (ver motores_stt), así que al detener sólo
+        falta el último tramo y no se necesita conexión.
+        """
         if self._grabando:
             if self._grab_stop:
                 self._grab_stop.set()
             th = self._grab_thread
-            self._safe(lambda: th and th.join(timeout=2.0))
+            captura = self._grab_captura
+            # Se limpia acá, en el hilo de Tk: una grabación nueva no puede pisarse con esta
+            self._grab_thread = None
+            self._grab_captura = None
+            self._grab_stop = None
             self._grabando = False
-            self._safe(self.btn_microfono.config, text='🎙')
             self._stop_recording_ui()
-            try:
-                import numpy as np
-                frames = self._grab_frames or []
-                if not frames:
-                    self._set_status('No se capturó audio.', timeout=3000)
-                    return
-                data = np.concatenate(frames, axis=0).astype('int16')
-                raw = data.tobytes()
-                audio = sr.AudioData(raw, self._grab_fs, sample_width=2)
-                self._set_status('Procesando…', timeout=3000)
-                r = sr.Recognizer()
+            self._set_status('Procesando…', timeout=3000)
+
+            def finalizar():
                 try:
-                    texto = r.recognize_google(audio, language='es-AR')
-                except sr.UnknownValueError:
-                    texto = ''
-                    self._set_status('No se entendió el audio. Intentá de nuevo.', timeout=4000)
+                    if th:
+                        th.join(timeout=2.0)
+                    texto = captura.detener() if captura else ''
+                    if texto:
+                        self.despachador.publicar(self._insertar_y_enviar, texto)
+                    else:
+                        self.despachador.publicar(self._show_toast_error, 'No se entendió el audio. Intentá de nuevo.')
                 except Exception as e:
-                    self._show_toast_error(f'Transcripción: Error: {e}')
-                    texto = ''
-                if texto:
-                    self.root.after(0, lambda: self._insertar_y_enviar(texto))
-            except Exception as e:
-                self._show_toast_error(f'Dictado de voz: {e}')
-            finally:
-                self._grab_thread = None
-                self._grab_frames = []
-                self._grab_stop = None
+                    self.despachador.publicar(self._show_toast_error, f'Dictado de voz: {e}')
+
+            threading.Thread(target=finalizar, daemon=True).start()
+            return
+        if self._cargando_voz:
+            return
+
+        # La primera vez se carga el modelo (o se espera a la precarga): fuera del hilo de Tk
+        self._cargando_voz = True
+        self._safe(self.btn_microfono.config, text='⏳', state='disabled')
+        self._set_status('Cargando motor de voz…', timeout=0)
+
+        def resolver():
+            try:
+                from motores_stt import obtener_transcriptor
+                transcriptor = obtener_transcriptor()
+            except Exception:
+                transcriptor = None
+            self.despachador.publicar(self._empezar_dictado, transcriptor)
+
+        threading.Thread(target=resolver, daemon=True).start()
+
+    def _empezar_dictado(self, transcriptor):
+        """Abre el micrófono con el transcriptor ya cargado (corre en el hilo de Tk)."""
+        self._cargando_voz = False
+        self._safe(self.btn_microfono.config, text='🎤', state='normal')
+        if transcriptor is None:
+            self._show_toast_error('No hay motor de voz instalado. Instalá faster-whisper o vosk (offline) o SpeechRecognition.')
+            self._set_status('Falta motor de voz. Instalá: pip install faster-whisper', timeout=6000)
             return
 
         try:
             import sounddevice as sd
-            import numpy as np
+            from captura_voz import CapturaVozIncremental
         except Exception as e:
             self._show_toast_error(f'Audio: No se pudo inicializar sounddevice: {e}\nAsegúrate de que sounddevice esté instalado y el micrófono esté disponible.')
             self._set_status('Error de audio: revisa la configuración del micrófono.', timeout=6000)
             return
 
-        self._grab_stop = threading.Event()
-        self._grab_frames = []
+        def transcribir(pcm: bytes, fs: int) -> str:
+            # Corre en el hilo de transcripción de la captura; el modelo vive en el worker
+            return transcriptor.transcribir(pcm, fs)
 
-        def cb(indata, frames, time_, status):
-            try:
-                if status:
-                    pass
-                self._grab_frames.append(indata.copy())
-            except Exception:
-                pass
+        def on_parcial(texto: str):
+            self.despachador.publicar_unico('dictado', self._mostrar_dictado_parcial, texto, captura)
+
+        def on_error(e: Exception):
+            self.despachador.publicar(self._show_toast_error, f'Transcripción: Error: {e}')
+
+        stop = self._grab_stop = threading.Event()
+        self._grab_captura = CapturaVozIncremental(transcribir, fs=self._grab_fs,
+                                                   on_parcial=on_parcial, on_error=on_error)
+        captura = self._grab_captura
 
         def loop():
             try:
-                with sd.InputStream(samplerate=self._grab_fs, channels=1, dtype='int16', callback=cb):
-                    self._start_recording_ui()
-                    self._set_status('Grabando… click de nuevo para detener.', timeout=0)
-                    while self._grab_stop and not self._grab_stop.is_set():
+                captura.iniciar()
+                with sd.InputStream(samplerate=self._grab_fs, channels=1, dtype='int16', callback=captura.callback):
+                    self.despachador.publicar(self._start_recording_ui)
+                    self.despachador.publicar_unico('status', self._set_status,
+                                                    'Grabando… click de nuevo para detener.', timeout=0)
+                    while not stop.is_set():
                         sd.sleep(100)
             except Exception as e:
-                self._show_toast_error(f'Audio: Error de entrada de audio: {e}')
+                self.despachador.publicar(self._show_toast_error, f'Audio: Error de entrada de audio: {e}')
             finally:
-                self._stop_recording_ui()
+                self.despachador.publicar(self._stop_recording_ui)
 
         self._grab_thread = threading.Thread(target=loop, daemon=True)
         self._grab_thread.start()
         self._grabando = True
         self._safe(self.btn_microfono.config, text='⏹')
 
+    def _precargar_motor_voz(self):
+        try:
+            from motores_stt import obtener_transcriptor
+            threading.Thread(target=obtener_transcriptor, daemon=True).start()
+        except Exception:
+            pass
+
+    def _mostrar_estadisticas(self, event=None):
+        """Panel con las métricas de telemetría del proceso (se refresca cada segundo)."""
+        win = getattr(self, '_win_estadisticas', None)
+        if win is not None and win.winfo_exists():
+            win.lift()
+            return
+        win = self._win_estadisticas = tk.Toplevel(self.root)
+        win.title('Estadísticas')
+        win.configure(bg=DARK_BG)
+        texto = tk.Text(win, bg=DARK_PANEL, fg=TEXT_COLOR, font=('Consolas', 10), width=78, height=24,
+                        relief='flat', highlightthickness=0)
+        texto.pack(fill='both', expand=True, padx=8, pady=8)
+        barra = tk.Frame(win, bg=DARK_BG)
+        barra.pack(fill='x', padx=8, pady=(0, 8))
+
+        def exportar():
+            self._safe(telemetria.exportar_prometheus, 'agente_metricas.prom')
+            self._set_status('Métricas exportadas a agente_metricas.prom', timeout=3000)
+
+        self._make_button(barra, 'Exportar Prometheus', command=exportar).pack(side='left')
+        self._make_button(barra, 'Reiniciar', command=telemetria.reiniciar, danger=True).pack(side='left', padx=(8, 0))
+
+        def refrescar():
+            if not win.winfo_exists():
+                return
+            lineas = [f'{"métrica":<26}{"n":>7}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}{"total":>12}']
+            for nombre, d in telemetria.resumen().items():
+                if 'total' in d:
+                    lineas.append(f'{nombre:<26}{"":>37}{d["total"]:>12g}')
+                elif nombre.endswith('_tps'):
+                    # Ritmos (tokens/s), no tiempos
+                    lineas.append(f'{nombre:<26}{d["n"]:>7}{d["p50"]:>10.1f}{d["p95"]:>10.1f}{d["max"]:>10.1f}')
+                else:
+                    lineas.append(f'{nombre:<26}{d["n"]:>7}{d["p50"] * 1000:>10.1f}'
+                                  f'{d["p95"] * 1000:>10.1f}{d["max"] * 1000:>10.1f}')
+            texto.config(state='normal')
+            texto.delete('1.0', tk.END)
+            texto.insert('1.0', '\n'.join(lineas))
+            texto.config(state='disabled')
+            win.after(1000, refrescar)
+
+        refrescar()
+
+    # Filas que trae cada página del tablero; la siguiente se pide al acercarse al final del scroll
+    _TAREAS_POR_PAGINA = 200
+
+    def _mostrar_tablero(self):
+        """Tablero de tareas del proyecto: filtro por estado con totales, carga por páginas y cambios masivos."""
+        if self.proyecto_actual is None:
+            self._show_toast_tip('Seleccioná un proyecto para ver sus tareas.')
+            return
+        proyecto = self.proyecto_actual
+        win = getattr(self, '_win_tablero', None)
+        if win is not None and win.winfo_exists():
+            if win.proyecto == proyecto:
+                win.lift()
+                return
+            win.destroy()
+        win = self._win_tablero = tk.Toplevel(self.root)
+        win.proyecto = proyecto
+        win.proyecto_id = self.proyecto_id
+        win.title(f'Tareas — {proyecto}')
+        win.configure(bg=DARK_BG)
+        # filtro: estado mostrado (None = todas); ultimo_id: clave de la próxima página
+        estado = {'filtro': None, 'ultimo_id': 0, 'completo': False, 'agendada': False}
+
+        barra_filtros = tk.Frame(win, bg=DARK_BG)
+        barra_filtros.pack(fill='x', padx=8, pady=(8, 4))
+        marco = tk.Frame(win, bg=DARK_BG)
+        marco.pack(fill='both', expand=True, padx=8)
+        arbol = ttk.Treeview(marco, columns=('descripcion', 'estado'), show='headings', selectmode='extended')
+        arbol.heading('descripcion', text='Descripción')
+        arbol.heading('estado', text='Estado')
+        arbol.column('descripcion', width=420)
+        arbol.column('estado', width=110, anchor='center')
+        barra_scroll = ttk.Scrollbar(marco, orient='vertical', command=arbol.yview)
+        arbol.pack(side='left', fill='both', expand=True)
+        barra_scroll.pack(side='right', fill='y')
+        acciones = tk.Frame(win, bg=DARK_BG)
+        acciones.pack(fill='x', padx=8, pady=8)
+
+        def cargar_pagina():
+            estado['agendada'] = False
+            if estado['completo']:
+                return
+            filas = self.agente.listar_tareas(proyecto, estado=estado['filtro'], despues_de=estado['ultimo_id'],
+                                              limite=self._TAREAS_POR_PAGINA)
+            for tid, descripcion, est in filas:
+                arbol.insert('', 'end', iid=str(tid), values=(descripcion, est))
+            if filas:
+                estado['ultimo_id'] = filas[-1][0]
+            estado['completo'] = len(filas) < self._TAREAS_POR_PAGINA
+
+        def al_desplazar(primero, ultimo):
+            barra_scroll.set(primero, ultimo)
+            # Cerca del final de lo cargado: traer la próxima página (no se lee todo de una)
+            if float(ultimo) > 0.9 and not estado['completo'] and not estado['agendada']:
+                estado['agendada'] = True
+                win.after_idle(cargar_pagina)
+        arbol.configure(yscrollcommand=al_desplazar)
+
+        def refrescar_filtros():
+            for w in barra_filtros.winfo_children():
+                w.destroy()
+            conteo = self.agente.contar_tareas(proyecto)
+            estados = list(ESTADOS_TAREA) + sorted(set(conteo) - set(ESTADOS_TAREA))
+            opciones = [(None, f'Todas ({sum(conteo.values())})')]
+            opciones += [(e, f'{e} ({conteo.get(e, 0)})') for e in estados]
+            for valor, texto in opciones:
+                btn = self._make_button(barra_filtros, texto, command=lambda v=valor: filtrar(v),
+                                        primary=(valor == estado['filtro']))
+                btn.pack(side='left', padx=(0, 4))
+
+        def filtrar(valor):
+            estado.update(filtro=valor, ultimo_id=0, completo=False)
+            arbol.delete(*arbol.get_children())
+            refrescar_filtros()
+            cargar_pagina()
+
+        def marcar(nuevo):
+            ids = [int(i) for i in arbol.selection()]
+            if not ids:
+                self._show_toast_tip('Seleccioná una o más tareas (Ctrl/Shift + clic).')
+                return
+
+            def trabajar():
+                try:
+                    self.agente.actualizar_estado_tareas(ids, nuevo)
+                except Exception as e:
+                    self.despachador.publicar(self._show_toast_error, f'No se pudieron actualizar las tareas: {e}')
+                    return
+                self.despachador.publicar(lambda: win.winfo_exists() and filtrar(estado['filtro']))
+            # Miles de filas en una transacción: fuera del hilo de Tk
+            threading.Thread(target=trabajar, daemon=True).start()
+
+        def agregar():
+            descripcion = simpledialog.askstring('Nueva tarea', 'Descripción:', parent=win)
+            if descripcion:
+                self.agente.agregar_tarea(proyecto, descripcion)
+                filtrar(estado['filtro'])
+
+        # Para los cambios que llegan de otras instancias (ver _aplicar_cambios_externos)
+        win.refrescar = lambda: filtrar(estado['filtro'])
+        self._make_button(acciones, '+ Tarea', command=agregar, primary=True).pack(side='left')
+        for nuevo in ESTADOS_TAREA:
+            self._make_button(acciones, f'Marcar {nuevo}', command=lambda n=nuevo: marcar(n)).pack(
+                side='left', padx=(8, 0))
+        filtrar(None)
+
+    # ---------------- Otras instancias ----------------
+    def _aplicar_cambios_externos(self, cambios):
+        """Otra instancia escribió en la base: refresca sólo las vistas afectadas, sin recargar todo."""
+        if self.agente is None:
+            return
+        tablas = {c.tabla for c in cambios}
+        if tablas & {'*', 'proyectos'}:
+            self._refrescar_proyectos()
+        if self.proyecto_id is not None and ('*' in tablas or any(
+                c.tabla == 'conversaciones' and c.padre == self.proyecto_id for c in cambios)):
+            self._refrescar_chats()
+        if '*' in tablas:
+            self._cargar_historial()
+        elif any(c.tabla in ('mensajes', 'conversaciones') and c.clave == self.conversacion_id for c in cambios):
+            # Conversación: vaciar un chat archivado borra en la base de archivo, donde no hay triggers
+            self._agregar_mensajes_nuevos()
+        win = getattr(self, '_win_tablero', None)
+        if win is not None and win.winfo_exists() and ('*' in tablas or any(
+                c.tabla == 'tareas' and c.clave == win.proyecto_id for c in cambios)):
+            win.refrescar()
+
+    def _refrescar_proyectos(self):
+        proyectos = self.agente.listar_proyectos()
+        if self.proyecto_actual is not None and self.proyecto_actual not in proyectos:
+            # Renombrado en otra instancia: seguir en el mismo proyecto con su nombre nuevo
+            nuevo = next((n for n in proyectos if self.agente.id_proyecto(n) == self.proyecto_id), None)
+            if nuevo is None:
+                # Eliminado: volver al estado inicial
+                self._cargar_proyectos()
+                return
+            self.proyecto_actual = nuevo
+        self._reload_listbox(self.listbox_proyectos, proyectos, self.proyecto_actual)
+
+    def _refrescar_chats(self):
+        rows = self.agente.listar_conversaciones(self.proyecto_id)
+        ids = [cid for cid, _nombre in rows]
+        if self.conversacion_id is not None and self.conversacion_id not in ids:
+            # El chat visible se eliminó en otra instancia
+            self._cargar_chats(self.proyecto_id)
+            return
+        self._chat_map = ids
+        self._reload_listbox(self.listbox_chats, [nombre or f"Chat #{cid}" for cid, nombre in rows])
+        if self.conversacion_id in ids:
+            self.listbox_chats.selection_set(ids.index(self.conversacion_id))
+
+    def _agregar_mensajes_nuevos(self):
+        """Agrega al final las burbujas de los mensajes que otra instancia escribió en el chat visible."""
+        cid = self.conversacion_id
+        if cid is None:
+            return
+        if cid in self._generando:
+            # La burbuja en streaming tiene que quedar última: se completa en _fin_respuesta
+            self._cambios_diferidos.add(cid)
+            return
+        ultimo = self._ultimo_mensaje_id
+        filas = self.agente.listar_mensajes_desde(cid, max(ultimo - 1, 0))
+        if ultimo and not any(mid == ultimo for mid, _r, _c in filas):
+            # El último mensaje mostrado ya no existe (vaciaron el chat): recargar
+            self._cargar_historial()
+            return
+        nuevas = [f for f in filas if f[0] > ultimo]
+        for mid, remitente, contenido in nuevas:
+            if mid not in self._mensajes_propios:
+                self._insertar_burbuja(remitente, contenido)
+        if nuevas:
+            self._ultimo_mensaje_id = max(f[0] for f in nuevas)
+            self.root.after(50, lambda: self.canvas.yview_moveto(1.0))
+
+    def _respaldo_automatico(self):
+        """Foto diaria de la base en segundo plano (no frena el chat) y vuelve a revisar cada hora."""
+        if self.agente is not None:
+            self._safe(self.agente.respaldar_si_vencido, 24)
+        self.root.after(3600 * 1000, self._respaldo_automatico)
+
+    def _mostrar_dictado_parcial(self, texto: str, captura):
+        """Muestra en el input el texto transcripto hasta el momento (sólo de la grabación en curso)."""
+        if captura is not self._grab_captura:
+            return
+        self.entry_mensaje.delete(0, tk.END)
+        self.entry_mensaje.insert(0, texto)
+
+    def _start_recording_ui(self):
+        self._safe(self.btn_microfono.config, text='⏹')
+
+    def _stop_recording_ui(self):
+        self._safe(self.btn_microfono.config, text='🎤')
+
     # ---------------- Entrada de texto ----------------
     def _insertar_y_enviar(self, texto):
         if not texto:
             return
+        if self.conversacion_id in self._generando:
+            self.entry_mensaje.delete(0, tk.END)
+            self.entry_mensaje.insert(0, texto)
+            self._show_toast_tip('Esta conversación todavía está respondiendo: el dictado quedó en el campo de texto.')
+            return
         self._guardar_mensaje('Usuario', texto)
-        self._cargar_historial()
-        self._insertar_burbuja('Usuario', texto)
         # Corrección: el campo de entrada es entry_mensaje
         self.entry_mensaje.delete(0, tk.END)
-        self.animando = True
-        self._animar_puntos()
-
-        # Snapshot para responder sobre la misma conversación aunque el usuario cambie de selección
-        conv_id_snapshot = self.conversacion_id
-        # Resetear/crear token de cancelación para esta conversación
-        ev = threading.Event()
-        self._cancelaciones[conv_id_snapshot] = ev
-        if self.stream_enabled:
-            threading.Thread(target=self._respuesta_streaming,
-                             args=(texto, conv_id_snapshot, ev), daemon=True).start()
-        else:
-            threading.Thread(target=self._respuesta_nostream,
-                             args=(texto, conv_id_snapshot, ev), daemon=True).start()
+        self._lanzar_respuesta(texto)
 
     def _enfocar_input(self, event=None):
         self.entry_mensaje.focus()
@@ -1103,13 +1397,8 @@ class ChatUI:
     def _cargar_historial_global(self):
         # Cargar historial de la última conversación activa al iniciar
         try:
-            conv_id = None
-            with self.agente.lock:
-                cur = self.agente.conn.cursor()
-                cur.execute('SELECT id, nombre FROM conversaciones WHERE proyecto_id IS NULL ORDER BY id DESC LIMIT 1')
-                row = cur.fetchone()
-                if row:
-                    conv_id = row[0]
+            libres = self.agente.listar_conversaciones(None)
+            conv_id = libres[-1][0] if libres else None
             if conv_id is not None:
                 # Actualizar estado fuera del lock para evitar deadlocks con listar_mensajes()
                 self.conversacion_id = conv_id
@@ -1127,6 +1416,13 @@ class ChatUI:
         # Cancelar cualquier respuesta en curso
         for ev in self._cancelaciones.values():
             ev.set()
+        if self._resumidor is not None:
+            self._safe(self._resumidor.cerrar)
+        if self.agente is not None:
+            # Corta la purga en curso entre lotes; lo que falte se retoma al próximo inicio
+            self._safe(self.agente.cerrar)
+        self._safe(telemetria.detener_volcado)
+        self.despachador.detener()
         self.root.destroy()
 
     def run(self):
@@ -1151,6 +1447,13 @@ class ChatUI:
                 self.agente.conn.execute('PRAGMA foreign_keys = ON')
             except Exception:
                 pass
+            # Terminar de purgar lo eliminado en la sesión anterior, en segundo plano
+            self.agente.iniciar_purgador()
+            # Índice de búsqueda: lo que quedó sin indexar (bases de antes del índice, archivo)
+            self.agente.iniciar_indexador()
+            # Escrituras de otras ventanas, la CLI o scripts sobre la misma base
+            self.agente.vigilar_cambios(lambda cambios: self.despachador.publicar(self._aplicar_cambios_externos,
+                                                                                   cambios))
         finally:
             # Limpiar status breve
             self.root.after(500, lambda: self.status_var.set(''))
@@ -1159,6 +1462,14 @@ class ChatUI:
         self.root.after(0, self._cargar_proyectos)
         # Asegurar que el panel de chat quede vacío al inicio (sin proyecto seleccionado)
         self.root.after(0, self._cargar_historial)
+        # Precargar el motor de voz local en segundo plano para que el primer dictado no espere
+        self.root.after(1500, self._precargar_motor_voz)
+        # Telemetría: volcado periódico a archivo rotativo y formato Prometheus; F12 abre el panel
+        telemetria.iniciar_volcado(archivo='agente_metricas.jsonl', prometheus='agente_metricas.prom',
+                                   intervalo=30.0)
+        self.root.bind('<F12>', self._mostrar_estadisticas)
+        # Respaldo en caliente si el último tiene más de un día
+        self.root.after(60 * 1000, self._respaldo_automatico)
         # Enfocar entrada de texto al iniciar
         self.root.after(1000, self._enfocar_input)
         # Bind global para mousewheel (scroll en canvas)
@@ -1174,10 +1485,7 @@ class ChatUI:
             self._set_status('No hay conversación seleccionada.', 3000)
             return
         try:
-            with self.agente.lock:
-                cur = self.agente.conn.cursor()
-                cur.execute('DELETE FROM mensajes WHERE conversacion_id=?', (self.conversacion_id,))
-                self.agente.conn.commit()
+            self.agente.vaciar_conversacion(self.conversacion_id)
             self._set_status('Historial borrado correctamente.', 3000)
             self._cargar_historial()
         except Exception as e:
@@ -0,0 +1,297 @@
+"""Interfaz de línea de comandos (sin Tk) para AgentePersonal y el modelo local.
+
+Ejemplos:
+  python agente_personal.py proyectos
+  python agente_personal.py proyecto crear Viaje --contexto "Vacaciones 2026"
+  python agente_personal.py tarea agregar Viaje "Sacar pasajes"
+  python agente_personal.py tareas Viaje --estado pendiente
+  python agente_personal.py tarea estado 3 4 7 hecha
+  python agente_personal.py chat --proyecto Viaje "¿Qué me falta organizar?"
+  python agente_personal.py chat --conversacion 12          # modo interactivo (stdin)
+  python agente_personal.py lote pedidos.jsonl --salida respuestas.jsonl --concurrencia 4
+
+Formato del modo lote (una línea JSON por pedido):
+  entrada: {"id": "a1", "prompt": "Resumí esto: ..."}
+           {"id": "a2", "mensajes": [{"role": "user", "content": "..."}, ...]}
+  salida:  {"id": "a1", "respuesta": "...", "uso": {...}}  o  {"id": "a1", "error": "..."}
+Las respuestas salen en el orden de entrada; la memoria se mantiene acotada a la ventana
+de pedidos en vuelo (concurrencia * 4).
+"""
+
+import argparse
+import json
+import sys
+from collections import deque
+from typing import List, Optional
+
+from agente_personal import DB_NAME, AgentePersonal
+from resumenes import Resumidor
+
+
+def _agente(args) -> AgentePersonal:
+    # Sin purgador en segundo plano: un comando corto no debe quedar esperando la purga
+    return AgentePersonal(db_path=args.db, purga_automatica=False)
+
+
+def _id_proyecto(ag: AgentePersonal, nombre: str) -> int:
+    proyecto_id = ag.id_proyecto(nombre)
+    if proyecto_id is None:
+        raise ValueError(f"Proyecto '{nombre}' no existe.")
+    return proyecto_id
+
+
+def _imprimir_tabla(filas, encabezados):
+    anchos = [max(len(str(x)) for x in col) for col in zip(encabezados, *filas)]
+    for fila in [encabezados] + list(filas):
+        print('  '.join(str(x).ljust(a) for x, a in zip(fila, anchos)).rstrip())
+
+
+# --- Proyectos y tareas ---
+def _cmd_proyectos(args, ag: AgentePersonal) -> int:
+    for nombre in ag.listar_proyectos():
+        print(nombre)
+    return 0
+
+
+def _cmd_proyecto(args, ag: AgentePersonal) -> int:
+    if args.accion == 'crear':
+        print(ag.crear_proyecto(args.nombre, args.contexto))
+    elif args.accion == 'renombrar':
+        ag.renombrar_proyecto(_id_proyecto(ag, args.nombre), args.nuevo)
+    elif args.accion == 'eliminar':
+        ag.eliminar_proyecto(_id_proyecto(ag, args.nombre))
+        ag.purgar_eliminados()
+    elif args.accion == 'exportar':
+        print(json.dumps(ag.exportar_proyecto(_id_proyecto(ag, args.nombre), args.ruta)))
+    return 0
+
+
+def _cmd_tareas(args, ag: AgentePersonal) -> int:
+    _imprimir_tabla(ag.listar_tareas(args.proyecto, estado=args.estado), ('id', 'descripción', 'estado'))
+    return 0
+
+
+def _cmd_tarea(args, ag: AgentePersonal) -> int:
+    if args.accion == 'agregar':
+        ag.agregar_tarea(args.proyecto, args.descripcion)
+    else:
+        ag.actualizar_estado_tareas(args.id, args.estado)
+    return 0
+
+
+def _cmd_chats(args, ag: AgentePersonal) -> int:
+    proyecto_id = _id_proyecto(ag, args.proyecto) if args.proyecto else None
+    _imprimir_tabla([(cid, nombre, ag.contar_mensajes(cid)) for cid, nombre in ag.listar_conversaciones(proyecto_id)],
+                    ('id', 'nombre', 'mensajes'))
+    return 0
+
+
+def _cmd_historial(args, ag: AgentePersonal) -> int:
+    for remitente, contenido in ag.listar_mensajes(args.conversacion):
+        print(f'[{remitente}] {contenido}')
+    return 0
+
+
+# --- Chat ---
+def _responder(ag: AgentePersonal, conversacion_id: int, texto: str, max_tokens: int, salida=None,
+               resumidor: Optional[Resumidor] = None) -> str:
+    from llama_local_helper import UsoGeneracion, generar_deltas
+    salida = salida or sys.stdout
+    resumidor = resumidor or Resumidor(ag)
+    ag.agregar_mensaje(conversacion_id, 'Usuario', texto)
+    uso = UsoGeneracion()
+    partes = []
+    try:
+        # Igual que ChatUI._armar_historial: resumen de lo viejo + turnos recientes
+        for delta in generar_deltas(resumidor.historial(conversacion_id), max_tokens=max_tokens, uso=uso):
+            partes.append(delta)
+            salida.write(delta)
+            salida.flush()
+    except KeyboardInterrupt:
+        uso.finish_reason = 'cancelado'
+    salida.write('\n')
+    respuesta = ''.join(partes)
+    if respuesta:
+        ag.agregar_mensaje(conversacion_id, 'Agente', respuesta)
+        resumidor.agendar(conversacion_id)
+    print(f'({uso.completion_tokens} tokens, {uso.t_total:.1f} s, {uso.decode_tokens_por_segundo:.1f} tok/s)',
+          file=sys.stderr)
+    return respuesta
+
+
+def _cmd_chat(args, ag: AgentePersonal) -> int:
+    if args.conversacion is not None:
+        conversacion_id = args.conversacion
+    else:
+        proyecto_id = _id_proyecto(ag, args.proyecto) if args.proyecto else None
+        conversacion_id = ag.crear_conversacion(args.nombre, proyecto_id)
+        print(f'Conversación {conversacion_id}', file=sys.stderr)
+    resumidor = Resumidor(ag)
+    try:
+        if args.mensaje:
+            _responder(ag, conversacion_id, ' '.join(args.mensaje), args.max_tokens, resumidor=resumidor)
+            # Un solo turno: dejar el resumen al día antes de salir
+            resumidor.esperar()
+            return 0
+        # Interactivo: una línea por mensaje, hasta EOF (Ctrl+D) o "/salir"
+        for linea in sys.stdin:
+            texto = linea.strip()
+            if texto in ('/salir', '/exit'):
+                break
+            if texto:
+                _responder(ag, conversacion_id, texto, args.max_tokens, resumidor=resumidor)
+    finally:
+        resumidor.cerrar()
+    return 0
+
+
+# --- Lote ---
+def _pedido(registro: dict) -> List[dict]:
+    if 'mensajes' in registro:
+        return list(registro['mensajes'])
+    return [{'role': 'user', 'content': registro['prompt']}]
+
+
+def _cmd_lote(args, ag: Optional[AgentePersonal]) -> int:
+    from llama_local_helper import PlanificadorModelo
+    planificador = PlanificadorModelo(concurrencia=args.concurrencia, max_en_cola=args.concurrencia * 2)
+    proyecto_id = _id_proyecto(ag, args.proyecto) if ag is not None and args.proyecto else None
+    ventana = deque()
+    errores = 0
+    salida = open(args.salida, 'w', encoding='utf-8') if args.salida != '-' else sys.stdout
+
+    def escribir(pid, registro, fut):
+        nonlocal errores
+        try:
+            texto, uso = fut.result()
+            res = {'id': pid, 'respuesta': texto, 'uso': uso.como_dict()}
+            if proyecto_id is not None:
+                cid = ag.crear_conversacion(str(pid), proyecto_id)
+                for m in _pedido(registro):
+                    ag.agregar_mensaje(cid, 'Usuario' if m.get('role') == 'user' else 'Agente', m.get('content', ''))
+                ag.agregar_mensaje(cid, 'Agente', texto)
+        except Exception as e:
+            errores += 1
+            res = {'id': pid, 'error': str(e)}
+        salida.write(json.dumps(res, ensure_ascii=False) + '\n')
+        salida.flush()
+
+    try:
+        with open(args.entrada, encoding='utf-8') as f:
+            for n, linea in enumerate(f, 1):
+                if not linea.strip():
+                    continue
+                try:
+                    registro = json.loads(linea)
+                except json.JSONDecodeError as e:
+                    # Una línea rota se informa como cualquier pedido inválido, sin cortar el lote
+                    registro = None
+                    error = ValueError(f'JSON inválido en la línea {n}: {e}')
+                else:
+                    error = None if isinstance(registro, dict) else ValueError(f'la línea {n} no es un objeto JSON')
+                if error is not None:
+                    pid, fut = n, _fallido(error)
+                else:
+                    pid = registro.get('id', n)
+                    try:
+                        fut = planificador.enviar(_pedido(registro),
+                                                  max_tokens=registro.get('max_tokens', args.max_tokens))
+                    except KeyError as e:
+                        fut = _fallido(ValueError(f'falta el campo {e}'))
+                ventana.append((pid, registro, fut))
+                if len(ventana) >= args.concurrencia * 4:
+                    escribir(*ventana.popleft())
+        while ventana:
+            escribir(*ventana.popleft())
+    finally:
+        planificador.cerrar(esperar=False)
+        if salida is not sys.stdout:
+            salida.close()
+    return 1 if errores else 0
+
+
+def _fallido(error: Exception):
+    from concurrent.futures import Future
+    fut = Future()
+    fut.set_exception(error)
+    return fut
+
+
+def construir_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog='agente', description='Agente personal sin interfaz gráfica.')
+    p.add_argument('--db', default=DB_NAME, help=f'ruta de la base (default: {DB_NAME})')
+    sub = p.add_subparsers(dest='comando', required=True)
+
+    sub.add_parser('proyectos', help='listar proyectos').set_defaults(func=_cmd_proyectos)
+
+    pp = sub.add_parser('proyecto', help='crear/renombrar/eliminar/exportar un proyecto')
+    acc = pp.add_subparsers(dest='accion', required=True)
+    c = acc.add_parser('crear')
+    c.add_argument('nombre')
+    c.add_argument('--contexto')
+    r = acc.add_parser('renombrar')
+    r.add_argument('nombre')
+    r.add_argument('nuevo')
+    acc.add_parser('eliminar').add_argument('nombre')
+    e = acc.add_parser('exportar')
+    e.add_argument('nombre')
+    e.add_argument('ruta', help='.jsonl, .jsonl.gz o .jsonl.zst')
+    pp.set_defaults(func=_cmd_proyecto)
+
+    pt = sub.add_parser('tareas', help='listar tareas de un proyecto')
+    pt.add_argument('proyecto')
+    pt.add_argument('--estado', help='sólo las tareas en este estado')
+    pt.set_defaults(func=_cmd_tareas)
+
+    pta = sub.add_parser('tarea', help='agregar tarea o cambiar su estado')
+    acc = pta.add_subparsers(dest='accion', required=True)
+    a = acc.add_parser('agregar')
+    a.add_argument('proyecto')
+    a.add_argument('descripcion')
+    es = acc.add_parser('estado')
+    es.add_argument('id', type=int, nargs='+', help='una o más tareas (se cambian en una transacción)')
+    es.add_argument('estado')
+    pta.set_defaults(func=_cmd_tarea)
+
+    pc = sub.add_parser('chats', help='listar conversaciones (libres si no se indica proyecto)')
+    pc.add_argument('proyecto', nargs='?')
+    pc.set_defaults(func=_cmd_chats)
+
+    ph = sub.add_parser('historial', help='mostrar los mensajes de una conversación')
+    ph.add_argument('conversacion', type=int)
+    ph.set_defaults(func=_cmd_historial)
+
+    pch = sub.add_parser('chat', help='conversar con el modelo (stream a stdout)')
+    pch.add_argument('mensaje', nargs='*', help='sin mensaje: modo interactivo leyendo stdin')
+    pch.add_argument('--proyecto')
+    pch.add_argument('--conversacion', type=int, help='continuar una conversación existente')
+    pch.add_argument('--nombre', default='Conversación CLI')
+    pch.add_argument('--max-tokens', type=int, default=512)
+    pch.set_defaults(func=_cmd_chat)
+
+    pl = sub.add_parser('lote', help='procesar pedidos JSONL con el planificador del modelo')
+    pl.add_argument('entrada')
+    pl.add_argument('--salida', default='-', help="archivo JSONL de resultados ('-' = stdout)")
+    pl.add_argument('--concurrencia', type=int, default=1)
+    pl.add_argument('--max-tokens', type=int, default=512)
+    pl.add_argument('--proyecto', help='guardar cada pedido como conversación de este proyecto')
+    pl.set_defaults(func=_cmd_lote)
+    return p
+
+
+def main(argv=None) -> int:
+    args = construir_parser().parse_args(argv)
+    # El lote sin proyecto no toca la base
+    ag = None if args.comando == 'lote' and not args.proyecto else _agente(args)
+    try:
+        return args.func(args, ag)
+    except (ValueError, KeyError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    finally:
+        if ag is not None:
+            ag.cerrar()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Compresión transparente de cuerpos de mensaje grandes.
+
+Los textos por encima de un umbral se guardan como BLOB con una cabecera propia:
+
+  MAGIA (2 bytes) | algoritmo (1 byte: b'z' zlib, b's' zstd) | id de diccionario (uint32)
+  | largo original en bytes (uint32) | datos comprimidos
+
+Los textos cortos siguen guardándose como TEXT, así que una base mezcla ambos
+formatos y `descomprimir()` acepta cualquiera de los dos.
+
+zlib viene con Python. zstd (pip install zstandard) comprime mejor y más rápido y
+además permite un diccionario compartido entrenado con nuestros propios mensajes,
+que ayuda mucho con textos medianos y repetitivos.
+"""
+
+import gzip
+import io
+import struct
+import threading
+import zlib
+from typing import IO, Dict, Iterable, Optional, Union
+
+try:
+    import zstandard  # type: ignore
+except Exception:  # librería opcional
+    zstandard = None  # type: ignore
+
+MAGIA = b'\x00\xc7'
+_CABECERA = struct.Struct('>2scII')
+ZLIB = b'z'
+ZSTD = b's'
+
+UMBRAL_BYTES = 1024
+
+_local = threading.local()
+
+
+def algoritmo_por_defecto() -> bytes:
+    return ZSTD if zstandard is not None else ZLIB
+
+
+def es_comprimido(valor) -> bool:
+    return isinstance(valor, (bytes, bytearray, memoryview)) and bytes(valor[:2]) == MAGIA
+
+
+def _zstd_compresor(dict_id: int, diccionario: Optional[bytes]):
+    cache = getattr(_local, 'compresores', None)
+    if cache is None:
+        cache = _local.compresores = {}
+    comp = cache.get(dict_id)
+    if comp is None:
+        dic = zstandard.ZstdCompressionDict(diccionario) if diccionario else None
+        comp = cache[dict_id] = zstandard.ZstdCompressor(level=3, dict_data=dic)
+    return comp
+
+
+def _zstd_descompresor(dict_id: int, diccionario: Optional[bytes]):
+    cache = getattr(_local, 'descompresores', None)
+    if cache is None:
+        cache = _local.descompresores = {}
+    dec = cache.get(dict_id)
+    if dec is None:
+        dic = zstandard.ZstdCompressionDict(diccionario) if diccionario else None
+        dec = cache[dict_id] = zstandard.ZstdDecompressor(dict_data=dic)
+    return dec
+
+
+def comprimir(texto: str, umbral: int = UMBRAL_BYTES, algoritmo: Optional[bytes] = None,
+              dict_id: int = 0, diccionario: Optional[bytes] = None) -> Union[str, bytes]:
+    """Devuelve el texto tal cual si es corto o no conviene, o el BLOB comprimido."""
+    crudo = texto.encode('utf-8')
+    if len(crudo) <= umbral:
+        return texto
+    algoritmo = algoritmo or algoritmo_por_defecto()
+    if algoritmo == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('zstandard no está instalado')
+        datos = _zstd_compresor(dict_id, diccionario).compress(crudo)
+    else:
+        algoritmo, dict_id = ZLIB, 0
+        datos = zlib.compress(crudo, 6)
+    if len(datos) + _CABECERA.size >= len(crudo):
+        return texto  # incompresible: no vale la pena
+    return _CABECERA.pack(MAGIA, algoritmo, dict_id, len(crudo)) + datos
+
+
+def descomprimir(valor, diccionarios: Optional[Dict[int, bytes]] = None) -> str:
+    """Inverso de comprimir(); deja pasar los textos sin comprimir."""
+    if valor is None or isinstance(valor, str):
+        return valor
+    valor = bytes(valor)
+    if not es_comprimido(valor):
+        return valor.decode('utf-8', errors='replace')
+    _magia, algoritmo, dict_id, largo = _CABECERA.unpack_from(valor)
+    datos = valor[_CABECERA.size:]
+    if algoritmo == ZLIB:
+        return zlib.decompress(datos).decode('utf-8')
+    if algoritmo == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('Hay mensajes comprimidos con zstd: instalá zstandard para leerlos.')
+        diccionario = (diccionarios or {}).get(dict_id) if dict_id else None
+        if dict_id and diccionario is None:
+            raise RuntimeError(f'Falta el diccionario de compresión {dict_id}.')
+        return _zstd_descompresor(dict_id, diccionario).decompress(datos, max_output_size=largo).decode('utf-8')
+    raise ValueError(f'Algoritmo de compresión desconocido: {algoritmo!r}')
+
+
+def diccionario_usado(valor) -> int:
+    """Id del diccionario zstd con que se comprimió `valor` (0 si no usa ninguno)."""
+    if valor is None or isinstance(valor, str):
+        return 0
+    valor = bytes(valor)
+    if not es_comprimido(valor):
+        return 0
+    return _CABECERA.unpack_from(valor)[2]
+
+
+def largo_original(valor) -> int:
+    """Largo en bytes del texto sin comprimir (sirve para reportes en SQL)."""
+    if valor is None:
+        return 0
+    if isinstance(valor, str):
+        return len(valor.encode('utf-8'))
+    valor = bytes(valor)
+    if es_comprimido(valor):
+        return _CABECERA.unpack_from(valor)[3]
+    return len(valor)
+
+
+def entrenar_diccionario(muestras: Iterable[str], tamaño: int = 64 * 1024) -> bytes:
+    """Entrena un diccionario zstd con textos de ejemplo (requiere zstandard)."""
+    if zstandard is None:
+        raise RuntimeError('Entrenar un diccionario requiere zstandard (pip install zstandard).')
+    datos = [m.encode('utf-8') for m in muestras if m]
+    return zstandard.train_dictionary(tamaño, datos).as_bytes()
+
+
+def abrir_flujo(ruta: str, modo: str = 'rt') -> IO:
+    """Abre un archivo de texto comprimiendo según la extensión: .zst (zstd), .gz o plano.
+
+    Lee y escribe en streaming, con memoria constante sin importar el tamaño.
+    """
+    if ruta.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError('Los archivos .zst requieren zstandard (pip install zstandard); usá .gz.')
+        crudo = open(ruta, 'rb' if 'r' in modo else 'wb')
+        if 'r' in modo:
+            flujo = zstandard.ZstdDecompressor().stream_reader(crudo, read_across_frames=True, closefd=True)
+        else:
+            flujo = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(crudo, closefd=True)
+        return io.TextIOWrapper(flujo, encoding='utf-8') if 'b' not in modo else flujo
+    if ruta.endswith('.gz'):
+        return gzip.open(ruta, modo, compresslevel=6, encoding='utf-8' if 'b' not in modo else None)
+    return open(ruta, modo, encoding='utf-8' if 'b' not in modo else None)
+
+
+if __name__ == '__main__':
+    # Herramienta de migración: comprime los mensajes grandes ya guardados e informa el ahorro.
+    #   python compresion.py [ruta.db] [--entrenar]
+    import sys
+    from agente_personal import AgentePersonal, DB_NAME
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    agente = AgentePersonal(db_path=args[0] if args else DB_NAME, purga_automatica=False)
+    try:
+        if '--entrenar' in sys.argv:
+            print('Diccionario entrenado:', agente.entrenar_diccionario_compresion())
+        print('Migración:', agente.comprimir_mensajes_existentes())
+        print('Estado:', agente.reporte_compresion())
+    finally:
+        agente.cerrar()
@@ -0,0 +1,30 @@
+# conftest.py
+# Fixtures compartidas por las pruebas
+
+import pytest
+
+from agente_personal import AgentePersonal
+
+
+@pytest.fixture
+def abrir_agente(tmp_path):
+    """Abre AgentePersonal sobre tmp_path/<nombre> (sin purga automática salvo que se pida).
+
+    Se puede abrir la misma base varias veces (varias instancias); todas se cierran al terminar.
+    """
+    abiertos = []
+
+    def abrir(nombre='agente.db', **opciones):
+        opciones.setdefault('purga_automatica', False)
+        agente = AgentePersonal(db_path=str(tmp_path / nombre), **opciones)
+        abiertos.append(agente)
+        return agente
+    yield abrir
+    for agente in reversed(abiertos):
+        agente.cerrar()
+
+
+@pytest.fixture
+def ag(abrir_agente):
+    """AgentePersonal sobre una base nueva (tmp_path/agente.db)."""
+    return abrir_agente()
@@ -0,0 +1,130 @@
+"""Despachador central de operaciones de UI publicadas desde otros hilos.
+
+Tk no es thread-safe: los hilos de trabajo (modelo, lectura de archivos, dictado) no
+deben tocar widgets ni llamar a root.after. En su lugar publican la operación:
+
+  despachador.publicar(self._show_toast_error, 'No se pudo leer el archivo')
+  despachador.publicar_unico(('burbuja', cid), self._actualizar_burbuja_agente, texto, cid)
+
+La cola se vacía en el hilo de Tk con un temporizador propio, por tandas acotadas
+(`max_por_tick` operaciones o `presupuesto_ms` de trabajo): si queda algo, la próxima
+tanda se agenda enseguida pero después de que Tk procese sus eventos, así el loop
+principal sigue respondiendo aunque los hilos publiquen miles de actualizaciones.
+
+publicar_unico() coalesce por clave: si la misma clave se publica varias veces antes de
+ejecutarse, sólo corre la última (con sus argumentos y en su posición en la cola). Sirve
+para actualizaciones redundantes como el texto de una burbuja en streaming, el estado
+o recargar el historial.
+"""
+
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+import telemetria
+
+# (número de orden, clave o None, función, args, kwargs)
+_Operacion = Tuple[int, Optional[Hashable], Callable[..., Any], tuple, dict]
+
+
+class DespachadorUI:
+    def __init__(self, root, intervalo_ms: int = 16, max_por_tick: int = 200, presupuesto_ms: float = 8.0):
+        self.root = root
+        self.intervalo_ms = intervalo_ms
+        self.max_por_tick = max_por_tick
+        self.presupuesto_ms = presupuesto_ms
+        self._lock = threading.Lock()
+        self._cola: Deque[_Operacion] = deque()
+        self._vigentes: Dict[Hashable, int] = {}  # clave -> número de orden de la última publicación
+        self._orden = 0
+        self._activo = False
+        self._id_after = None
+        self.ejecutadas = 0
+        self.coalescidas = 0
+
+    # --- Desde cualquier hilo ---
+    def publicar(self, func: Callable[..., Any], *args, **kwargs) -> None:
+        """Encola func(*args, **kwargs) para el hilo de Tk, en orden de llegada."""
+        self._encolar(None, func, args, kwargs)
+
+    def publicar_unico(self, clave: Hashable, func: Callable[..., Any], *args, **kwargs) -> None:
+        """Como publicar(), pero reemplaza lo pendiente con la misma clave (gana la última)."""
+        self._encolar(clave, func, args, kwargs)
+
+    def _encolar(self, clave, func, args, kwargs):
+        with self._lock:
+            self._orden += 1
+            if clave is not None:
+                if clave in self._vigentes:
+                    self.coalescidas += 1
+                self._vigentes[clave] = self._orden
+            self._cola.append((self._orden, clave, func, args, kwargs))
+
+    def pendientes(self) -> int:
+        with self._lock:
+            return len(self._cola)
+
+    # --- Desde el hilo de Tk ---
+    def iniciar(self) -> None:
+        """Arranca el temporizador de vaciado (llamar desde el hilo de Tk)."""
+        if not self._activo:
+            self._activo = True
+            self._agendar(self.intervalo_ms)
+
+    def detener(self) -> None:
+        """Deja de vaciar la cola; lo pendiente se descarta (la ventana se está cerrando)."""
+        self._activo = False
+        if self._id_after is not None:
+            try:
+                self.root.after_cancel(self._id_after)
+            except Exception:
+                pass
+            self._id_after = None
+        with self._lock:
+            self._cola.clear()
+            self._vigentes.clear()
+
+    def drenar(self) -> int:
+        """Ejecuta una tanda acotada de operaciones. Devuelve cuántas se ejecutaron."""
+        t0 = time.perf_counter()
+        limite = t0 + self.presupuesto_ms / 1000.0
+        hechas = 0
+        while hechas < self.max_por_tick:
+            with self._lock:
+                if not self._cola:
+                    break
+                orden, clave, func, args, kwargs = self._cola.popleft()
+                if clave is not None:
+                    if self._vigentes.get(clave) != orden:
+                        continue  # hay una publicación más nueva con la misma clave
+                    del self._vigentes[clave]
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                # Una operación rota no debe cortar el resto de la tanda
+                traceback.print_exc()
+            hechas += 1
+            if time.perf_counter() >= limite:
+                break
+        if hechas:
+            self.ejecutadas += hechas
+            telemetria.observar('ui_despacho_tanda', time.perf_counter() - t0)
+        return hechas
+
+    def _agendar(self, demora_ms: int):
+        try:
+            self._id_after = self.root.after(demora_ms, self._tick)
+        except Exception:
+            # La ventana ya no existe
+            self._activo = False
+            self._id_after = None
+
+    def _tick(self):
+        self._id_after = None
+        if not self._activo:
+            return
+        self.drenar()
+        # Si quedó trabajo, seguir apenas Tk atienda sus eventos; si no, al próximo intervalo
+        self._agendar(1 if self.pendientes() else self.intervalo_ms)
@@ -0,0 +1,187 @@
+"""Layout de las burbujas del chat sin pasadas de geometría forzadas.
+
+Antes cada burbuja hacía update_idletasks() + winfo_width() para calcular su ancho de
+corte: cargar un chat de 500 mensajes eran 500 pasadas de layout sincrónicas, y al
+cambiar el tamaño de la ventana las burbujas existentes no se reacomodaban.
+
+Ahora:
+  - El ancho disponible sale del evento <Configure> del canvas (no se consulta a Tk).
+  - MetricasFuente mide el texto con anchos de carácter cacheados (font.measure se
+    llama una vez por carácter distinto), así se sabe sin tocar Tk qué burbujas cambian
+    de líneas con un ancho nuevo.
+  - Al redimensionar, el reflow espera a que el usuario suelte el borde (debounce) y
+    reconfigura sólo las burbujas cuyo texto cruza el ancho viejo o el nuevo, empezando
+    por las visibles y de a tandas para no congelar el loop.
+Tk hace una sola pasada de layout cuando vuelve a estar ocioso.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Mismo criterio que antes: la burbuja deja 100 px de margen y nunca baja de 200 px
+MARGEN_BURBUJA = 100
+ANCHO_MINIMO = 200
+
+# Palabra con los espacios que la siguen (o espacios sueltos al principio)
+_TROZOS = re.compile(r'\S+\s*|\s+')
+
+
+def ancho_de_corte(ancho_disponible: int) -> int:
+    return max(ANCHO_MINIMO, ancho_disponible - MARGEN_BURBUJA)
+
+
+class MetricasFuente:
+    """Medición de texto con cache por carácter sobre un tkinter.font.Font (o similar)."""
+
+    def __init__(self, fuente):
+        self.fuente = fuente
+        self._anchos: Dict[str, int] = {}
+        self._alto: Optional[int] = None
+
+    def ancho(self, texto: str) -> int:
+        """Ancho en píxeles de una línea (suma de anchos de carácter; ignora el kerning)."""
+        anchos = self._anchos
+        total = 0
+        for c in texto:
+            w = anchos.get(c)
+            if w is None:
+                w = anchos[c] = self.fuente.measure(c)
+            total += w
+        return total
+
+    def ancho_natural(self, texto: str) -> int:
+        """Ancho de la línea más larga si no hubiera corte automático."""
+        return max((self.ancho(linea) for linea in texto.split('\n')), default=0)
+
+    def alto_linea(self) -> int:
+        if self._alto is None:
+            self._alto = self.fuente.metrics('linespace')
+        return self._alto
+
+    def lineas(self, texto: str, ancho: int) -> int:
+        """Líneas que ocupa una línea de `texto` con corte por palabra a `ancho` píxeles (como wrap='word')."""
+        ancho = max(1, ancho)
+        lineas, x = 1, 0
+        for trozo in _TROZOS.findall(texto):
+            palabra = trozo.rstrip()
+            w = self.ancho(palabra)
+            if x and x + w > ancho:
+                lineas += 1
+                x = 0
+            if w > ancho:
+                # Palabra más ancha que la línea: Tk la parte por carácter
+                extra = (w - 1) // ancho
+                lineas += extra
+                w -= extra * ancho
+            x += w + self.ancho(trozo[len(palabra):])
+        return lineas
+
+
+class MotorLayout:
+    """Lleva el ancho disponible y reacomoda las burbujas registradas al redimensionar.
+
+    `programar` es root.after y `cancelar` root.after_cancel; `vista` devuelve la fracción
+    visible (canvas.yview()) para empezar el reflow por lo que el usuario está mirando.
+    """
+
+    def __init__(self, metricas: MetricasFuente, programar: Callable, cancelar: Callable,
+                 vista: Optional[Callable[[], Tuple[float, float]]] = None,
+                 ancho_inicial: int = 300, demora_ms: int = 80, por_tanda: int = 50):
+        self.metricas = metricas
+        self._programar = programar
+        self._cancelar = cancelar
+        self._vista = vista
+        self.ancho = ancho_inicial
+        self.demora_ms = demora_ms
+        self.por_tanda = por_tanda
+        # Burbujas en orden de aparición: [widget, ancho natural del texto, corte aplicado]
+        self._burbujas: List[list] = []
+        self._debounce = None
+        self._pendientes: List[list] = []
+        self._tanda = None
+        self.reconfiguradas = 0
+
+    def corte(self) -> int:
+        return ancho_de_corte(self.ancho)
+
+    def registrar(self, widget, texto: str) -> int:
+        """Agrega una burbuja y devuelve el ancho de corte con el que hay que crearla."""
+        corte = self.corte()
+        self._burbujas.append([widget, self.metricas.ancho_natural(texto), corte])
+        return corte
+
+    def actualizar_texto(self, widget, texto: str) -> None:
+        """El texto de la burbuja cambió (streaming): recalcula su ancho natural."""
+        self.actualizar_natural(widget, self.metricas.ancho_natural(texto))
+
+    def actualizar_natural(self, widget, ancho_natural: int) -> None:
+        """Como actualizar_texto() cuando la burbuja ya conoce su ancho natural (sin medir todo el texto)."""
+        for burbuja in reversed(self._burbujas):
+            if burbuja[0] is widget:
+                burbuja[1] = ancho_natural
+                return
+
+    def limpiar(self) -> None:
+        """Olvida todas las burbujas (se recargó el historial)."""
+        self._burbujas.clear()
+        self._pendientes.clear()
+
+    def on_configure(self, event) -> None:
+        """Handler de <Configure> del canvas: agenda un reflow cuando el ancho deja de cambiar."""
+        if event.width == self.ancho:
+            return
+        self.ancho = event.width
+        if self._debounce is not None:
+            self._cancelar(self._debounce)
+        self._debounce = self._programar(self.demora_ms, self.reflow)
+
+    def reflow(self) -> None:
+        self._debounce = None
+        corte = self.corte()
+        afectadas = []
+        for burbuja in self._burbujas:
+            natural, aplicado = burbuja[1], burbuja[2]
+            if aplicado == corte:
+                continue
+            if natural <= min(aplicado, corte):
+                # Entra en una línea con los dos anchos: sólo se anota el corte nuevo
+                burbuja[2] = corte
+                continue
+            afectadas.append(burbuja)
+        self._pendientes = self._ordenar_por_vista(afectadas)
+        if self._tanda is not None:
+            self._cancelar(self._tanda)
+            self._tanda = None
+        self._aplicar_tanda()
+
+    def _ordenar_por_vista(self, afectadas: List[list]) -> List[list]:
+        if not afectadas or self._vista is None:
+            return list(reversed(afectadas))  # sin vista: lo último (abajo) primero
+        try:
+            arriba, abajo = self._vista()
+        except Exception:
+            return list(reversed(afectadas))
+        n = len(self._burbujas)
+        indices = {id(b): i for i, b in enumerate(self._burbujas)}
+        desde, hasta = arriba * n, abajo * n
+
+        def distancia(burbuja):
+            i = indices[id(burbuja)]
+            return 0 if desde <= i <= hasta else min(abs(i - desde), abs(i - hasta))
+        return sorted(afectadas, key=distancia)
+
+    def _aplicar_tanda(self) -> None:
+        self._tanda = None
+        corte = self.corte()
+        tanda, self._pendientes = self._pendientes[:self.por_tanda], self._pendientes[self.por_tanda:]
+        for burbuja in tanda:
+            widget = burbuja[0]
+            try:
+                if widget.winfo_exists():
+                    widget.configure(width=corte)
+                    self.reconfiguradas += 1
+            except Exception:
+                continue
+            burbuja[2] = corte
+        if self._pendientes:
+            self._tanda = self._programar(1, self._aplicar_tanda)
@@ -5,12 +5,27 @@ Requisitos recomendados (CPU):
 
 Archivo esperado: ./llama-2-7b-chat.Q4_K_M.gguf (ver .gitignore)
 Si no está la librería o el archivo, se usa un stub de respaldo para que la UI nunca quede colgada.
+
+Batching continuo (opcional, ver motor_batch): con AGENTE_BATCH=1 las generaciones de
+varias conversaciones se decodifican juntas en lugar de esperar su turno de a una.
+  AGENTE_BATCH_SECUENCIAS  secuencias simultáneas (default: 4)
+
+Otros runtimes (opcional, ver motores_llm): con AGENTE_LLM=onnx o AGENTE_LLM=ctranslate2,
+o con la elección que deja `python bench_motores_llm.py --guardar`, se genera con ONNX
+Runtime GenAI o CTranslate2 en lugar de llama-cpp. Si el motor elegido no está o no
+carga, se sigue con llama-cpp.
 """
 
+import asyncio
 import os
+import queue
 import time
 import threading
-from typing import List, Dict, Callable, Optional
+from concurrent.futures import Future, TimeoutError as _FuturoTimeout
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import motores_llm
+import telemetria
 
 _MODEL_FILENAME = "llama-2-7b-chat.Q4_K_M.gguf"
 _MODEL_PATH = os.path.join(os.path.dirname(__file__), _MODEL_FILENAME)
@@ -22,6 +37,17 @@ except Exception:  # librería no disponible
 
 _llm = None  # type: ignore
 _llm_lock = threading.Lock()
+# El objeto Llama no es reentrante: una generación a la vez (las demás esperan su turno)
+_gen_lock = threading.Lock()
+
+_motor = None  # MotorBatchContinuo, si AGENTE_BATCH=1
+_motor_error: Optional[str] = None
+
+_backend = None  # motores_llm.MotorLLM distinto de llama-cpp, si se eligió uno
+_backend_resuelto = False
+_backend_error: Optional[str] = None
+
+_SYSTEM_PROMPT = {"role": "system", "content": "Responde siempre en español y llama al usuario Facu en tus respuestas."}
 
 
 def _get_llm() -> Optional[object]:
@@ -34,10 +60,54 @@ def _get_llm() -> Optional[object]:
     with _llm_lock:
         if _llm is None:
             # Config básica; ajustar n_ctx/n_threads según tu equipo
-            _llm = Llama(model_path=_MODEL_PATH, n_ctx=4096, n_threads=os.cpu_count() or 4)
+            with telemetria.medir("llm_carga"):
+                _llm = Llama(model_path=_MODEL_PATH, n_ctx=4096, n_threads=os.cpu_count() or 4)
     return _llm
 
 
+def _get_motor() -> Optional[object]:
+    """Motor de batching continuo (carga perezosa); None si está desactivado o no se pudo crear."""
+    global _motor, _motor_error
+    if _motor is not None or _motor_error is not None:
+        return _motor
+    if os.environ.get("AGENTE_BATCH", "0") != "1" or Llama is None or not os.path.exists(_MODEL_PATH):
+        return None
+    with _llm_lock:
+        if _motor is None and _motor_error is None:
+            try:
+                from motor_batch import BackendLlamaCpp, MotorBatchContinuo
+                secuencias = int(os.environ.get("AGENTE_BATCH_SECUENCIAS", "4"))
+                with telemetria.medir("llm_carga"):
+                    backend = BackendLlamaCpp(_MODEL_PATH, max_secuencias=secuencias)
+                _motor = MotorBatchContinuo(backend, max_secuencias=secuencias)
+            except Exception as e:
+                # API de bajo nivel incompatible con la versión instalada: seguir con el camino clásico
+                _motor_error = str(e)
+    return _motor
+
+
+def _get_backend() -> Optional[object]:
+    """Motor alternativo a llama-cpp (carga perezosa); None si no se eligió o no se pudo cargar."""
+    global _backend, _backend_resuelto, _backend_error
+    if _backend_resuelto:
+        return _backend
+    with _llm_lock:
+        if not _backend_resuelto:
+            nombre = motores_llm.motor_preferido()
+            if nombre and nombre != motores_llm.MotorLlamaCpp.nombre:
+                motor = motores_llm.MOTORES[nombre]()
+                if motor.disponible():
+                    try:
+                        with telemetria.medir("llm_carga"):
+                            motor.cargar()
+                        _backend = motor
+                    except Exception as e:
+                        # Modelo incompatible con la versión instalada: seguir con llama-cpp
+                        _backend_error = str(e)
+            _backend_resuelto = True
+    return _backend
+
+
 def _to_chat_messages(historial: List[Dict[str, str]]) -> List[Dict[str, str]]:
     # Filtrar roles conocidos y mantener orden
     msgs = []
@@ -49,67 +119,320 @@ def _to_chat_messages(historial: List[Dict[str, str]]) -> List[Dict[str, str]]:
     return msgs
 
 
-def obtener_respuesta_llama(historial: List[Dict[str, str]]) -> str:
-    """Camino no-stream: usa llama-cpp si está disponible; fallback si no."""
-    llm = _get_llm()
+def _mensajes(historial: List[Dict[str, str]]) -> List[Dict[str, str]]:
     # Inyectar sistema para español y saludo personalizado
-    system_prompt = {"role": "system", "content": "Responde siempre en español y llama al usuario Facu en tus respuestas."}
-    messages = [system_prompt] + _to_chat_messages(historial)
+    msgs = _to_chat_messages(historial)
+    # Los mensajes de sistema del llamador (p. ej. el resumen de la conversación) se suman
+    # al prompt de sistema: la plantilla de Llama 2 admite uno solo, al principio
+    extra = [m["content"] for m in msgs if m["role"] == "system" and m["content"]]
+    if not extra:
+        return [_SYSTEM_PROMPT] + msgs
+    sistema = {"role": "system", "content": "\n\n".join([_SYSTEM_PROMPT["content"]] + extra)}
+    return [sistema] + [m for m in msgs if m["role"] != "system"]
+
+
+def modelo_disponible() -> bool:
+    """True si hay un modelo real (no la respuesta demo) para generar."""
+    return _get_motor() is not None or _get_backend() is not None or _get_llm() is not None
+
+
+def _respuesta_demo(historial: List[Dict[str, str]]) -> str:
+    ultimo_user = next((m["content"] for m in reversed(historial) if m.get("role") == "user"), "")
+    return f"Hola Facu, recibí tu mensaje: '{ultimo_user}'. (Respuesta demo no-stream)"
+
+
+class UsoGeneracion:
+    """Estadísticas de una generación; se completan a medida que avanza el stream."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.t_espera = 0.0  # segundos esperando el turno del modelo (_gen_lock)
+        self.t_primer_token: Optional[float] = None  # segundos desde el inicio (incluye la espera)
+        self.t_total = 0.0
+        self.finish_reason: Optional[str] = None  # 'stop', 'length', 'cancelado' o 'error'
+
+    @property
+    def tokens_por_segundo(self) -> float:
+        return self.completion_tokens / self.t_total if self.t_total > 0 else 0.0
+
+    @property
+    def decode_tokens_por_segundo(self) -> float:
+        """Ritmo de generación sin contar la espera ni la evaluación del prompt."""
+        if self.t_primer_token is None or self.completion_tokens < 2:
+            return 0.0
+        dt = self.t_total - self.t_primer_token
+        return (self.completion_tokens - 1) / dt if dt > 0 else 0.0
+
+    def como_dict(self) -> Dict[str, object]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "t_espera": self.t_espera,
+            "t_primer_token": self.t_primer_token,
+            "t_total": self.t_total,
+            "tokens_por_segundo": round(self.tokens_por_segundo, 2),
+            "decode_tokens_por_segundo": round(self.decode_tokens_por_segundo, 2),
+            "finish_reason": self.finish_reason,
+        }
+
+    def __repr__(self):
+        return f"UsoGeneracion({self.como_dict()})"
+
+    def registrar(self):
+        """Vuelca la generación a la telemetría del proceso."""
+        telemetria.observar("llm_espera_cola", self.t_espera)
+        if self.t_primer_token is not None:
+            # Con llama-cpp el primer token incluye la evaluación del prompt
+            telemetria.observar("llm_ttft", self.t_primer_token - self.t_espera)
+        telemetria.observar("llm_total", self.t_total)
+        if self.decode_tokens_por_segundo:
+            telemetria.observar("llm_decode_tps", self.decode_tokens_por_segundo)
+        telemetria.contar("llm_tokens_prompt", self.prompt_tokens)
+        telemetria.contar("llm_tokens_generados", self.completion_tokens)
+        telemetria.contar(f"llm_fin_{self.finish_reason or 'desconocido'}")
+
+
+def generar_deltas(historial: List[Dict[str, str]], max_tokens: int = 512,
+                   cancel_event: Optional[threading.Event] = None,
+                   uso: Optional[UsoGeneracion] = None) -> Iterator[str]:
+    """Generador de fragmentos nuevos (deltas) de la respuesta, sin acumular el texto.
+
+    Es por demanda: el modelo avanza un token sólo cuando el consumidor pide el
+    siguiente, así que un consumidor lento frena la generación (backpressure) en vez
+    de acumular (con el motor de batching se adelanta a lo sumo `max_pendientes` deltas
+    y deja de entrar en las pasadas hasta que se lea). Se corta con `cancel_event` o
+    cerrando el generador (close() / break). Si se pasa `uso`, al terminar queda con tokens, tiempos y finish_reason.
+    """
+    uso = uso if uso is not None else UsoGeneracion()
+    motor = _get_motor()
+    if motor is not None:
+        try:
+            yield from motor.generar(_mensajes(historial), max_tokens, cancel_event, uso)
+        finally:
+            uso.registrar()
+        return
+    backend = _get_backend()
+    if backend is not None:
+        yield from generar_con_motor(backend, historial, max_tokens, cancel_event, uso)
+        return
+    llm = _get_llm()  # la carga del modelo se mide aparte (llm_carga)
+    t0 = time.perf_counter()
     if llm is None:
+        # Fallback: particionado simple de la respuesta demo para simular streaming
+        base = _respuesta_demo(historial)
+        uso.prompt_tokens = sum(len(m.get("content", "").split()) for m in historial)
+        uso.finish_reason = "cancelado"
+        try:
+            for parte in ["⏳ Pensando… ", "OK, ", "ahora ", "te ", "respondo:\n", base]:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                if uso.t_primer_token is None:
+                    uso.t_primer_token = time.perf_counter() - t0
+                uso.completion_tokens += 1
+                yield parte
+            uso.finish_reason = "stop"
+        finally:
+            uso.t_total = time.perf_counter() - t0
+            uso.registrar()
+        return
+
+    yield from generar_con_motor(motores_llm.MotorLlamaCpp(llm=llm), historial, max_tokens, cancel_event, uso, t0)
+
+
+def generar_con_motor(motor, historial: List[Dict[str, str]], max_tokens: int,
+                       cancel_event: Optional[threading.Event], uso: UsoGeneracion,
+                       t0: Optional[float] = None) -> Iterator[str]:
+    """Genera con un motor de motores_llm de a una generación por vez (_gen_lock).
+
+    El motor cuenta los tokens y el finish_reason; acá se miden la espera del turno, el
+    primer token y el total, y se registra la telemetría.
+    """
+    t0 = time.perf_counter() if t0 is None else t0
+    with _gen_lock:
+        uso.t_espera = time.perf_counter() - t0
+        deltas = motor.generar(_mensajes(historial), max_tokens, cancel_event, uso)
+        try:
+            for delta in deltas:
+                if uso.t_primer_token is None:
+                    uso.t_primer_token = time.perf_counter() - t0
+                yield delta
+        except GeneratorExit:
+            uso.finish_reason = "cancelado"
+            raise
+        except Exception:
+            uso.finish_reason = "error"
+            raise
+        finally:
+            deltas.close()
+            uso.t_total = time.perf_counter() - t0
+            uso.registrar()
+
+
+_FIN = object()
+
+
+async def generar_deltas_async(historial: List[Dict[str, str]], max_tokens: int = 512,
+                               cancel_event: Optional[threading.Event] = None,
+                               uso: Optional[UsoGeneracion] = None,
+                               max_pendientes: int = 16) -> AsyncIterator[str]:
+    """Versión async de generar_deltas para consumidores con asyncio (CLI, servidor).
+
+    La generación corre en un hilo aparte y entrega los deltas por una cola acotada a
+    `max_pendientes`: si el consumidor no lee, el hilo espera (backpressure). Cancelar
+    la tarea o cerrar el generador detiene la generación.
+    """
+    loop = asyncio.get_running_loop()
+    cola: asyncio.Queue = asyncio.Queue(maxsize=max_pendientes)
+    cancel = cancel_event if cancel_event is not None else threading.Event()
+    interno = threading.Event()  # cancelación propia, para no tocar el evento del llamador
+
+    def cancelado() -> bool:
+        return interno.is_set() or cancel.is_set()
+
+    def entregar(item) -> bool:
+        fut = asyncio.run_coroutine_threadsafe(cola.put(item), loop)
+        while True:
+            try:
+                fut.result(timeout=0.1)
+                return True
+            except _FuturoTimeout:
+                if interno.is_set():
+                    fut.cancel()
+                    return False
+
+    def producir():
+        deltas = generar_deltas(historial, max_tokens, cancel, uso)
+        try:
+            for delta in deltas:
+                if cancelado() or not entregar(delta):
+                    break
+            entregar(_FIN)
+        except BaseException as e:
+            entregar(e)
+        finally:
+            deltas.close()
+
+    hilo = threading.Thread(target=producir, name="llama-stream", daemon=True)
+    hilo.start()
+    try:
+        while True:
+            item = await cola.get()
+            if item is _FIN:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        interno.set()
+        # Que el productor termine (y suelte _gen_lock) sin bloquear el loop
+        await loop.run_in_executor(None, hilo.join)
+
+
+def obtener_respuesta_llama(historial: List[Dict[str, str]],
+                            cancel_callback: Optional[Callable[[], bool]] = None) -> str:
+    """Camino no-stream: usa llama-cpp si está disponible; fallback si no."""
+    motor = _get_motor() or _get_backend()
+    llm = _get_llm() if motor is None else None
+    if motor is None and llm is None:
         # Fallback estable
-        ultimo_user = next((m["content"] for m in reversed(historial) if m.get("role") == "user"), "")
-        return f"Hola Facu, recibí tu mensaje: '{ultimo_user}'. (Respuesta demo no-stream)"
+        return _respuesta_demo(historial)
     try:
-        out = llm.create_chat_completion(messages=messages, max_tokens=512)
+        if cancel_callback is not None or motor is not None:
+            # Con cancelación se genera por stream para poder cortar entre tokens; con
+            # batching también, así la respuesta comparte el lote con las demás (y los
+            # otros motores sólo generan por stream)
+            partes = []
+            for delta in generar_deltas(historial):
+                if cancel_callback is not None and cancel_callback():
+                    break
+                partes.append(delta)
+            return "".join(partes).strip()
+        with telemetria.medir("llm_completo"), _gen_lock:
+            out = llm.create_chat_completion(messages=_mensajes(historial), max_tokens=512)
         return out["choices"][0]["message"]["content"].strip()
     except Exception as e:
         return f"[Error LLaMA] {e}"
 
 
-def obtener_respuesta_llama_stream(historial: List[Dict[str, str]], callback: Callable[[str], None], delay: float = 0.0) -> str:
-    """Camino stream: devuelve texto final y publica parciales en callback."""
-    llm = _get_llm()
-    # Inyectar sistema para español y saludo personalizado
-    system_prompt = {"role": "system", "content": "Responde siempre en español y llama al usuario Facu en tus respuestas."}
-    messages = [system_prompt] + _to_chat_messages(historial)
-
-    if llm is None:
-        # Fallback a no-stream con particionado simple para simular streaming
-        base = obtener_respuesta_llama(historial)
-        partes = ["⏳ Pensando… ", "OK, ", "ahora ", "te ", "respondo:\n", base]
-        acumulado = ""
-        for p in partes:
-            acumulado += p
-            try:
-                callback(acumulado)
-            except Exception:
-                pass
-            if delay:
-                time.sleep(delay)
-        return acumulado
+def obtener_respuesta_llama_stream(historial: List[Dict[str, str]], callback: Callable[[str], None],
+                                   delay: float = 0.0, cancel_event: Optional[threading.Event] = None,
+                                   uso: Optional[UsoGeneracion] = None) -> str:
+    """Camino stream: devuelve texto final y publica parciales (texto acumulado) en callback.
 
-    acumulado = ""
+    Se apoya en generar_deltas; para consumir sin el costo de rearmar el texto en cada
+    token, usar generar_deltas / generar_deltas_async directamente.
+    """
+    partes: List[str] = []
     try:
-        for chunk in llm.create_chat_completion(messages=messages, stream=True, max_tokens=512):
-            delta = ""
-            try:
-                delta = chunk["choices"][0]["delta"].get("content", "")
-            except Exception:
-                # Compatibilidad con versiones que usan 'text' durante el stream
-                delta = chunk["choices"][0].get("text", "")
-            if not delta:
-                continue
-            acumulado += delta
+        for delta in generar_deltas(historial, cancel_event=cancel_event, uso=uso):
+            partes.append(delta)
             try:
-                callback(acumulado)
+                callback("".join(partes))
             except Exception:
                 pass
             if delay:
                 time.sleep(delay)
     except Exception as e:
-        acumulado = f"[Error LLaMA stream] {e}"
+        partes = [f"[Error LLaMA stream] {e}"]
         try:
-            callback(acumulado)
+            callback(partes[0])
         except Exception:
             pass
-    return acumulado
+    return "".join(partes)
+
+
+class PlanificadorModelo:
+    """Cola de pedidos al modelo atendida por `concurrencia` hilos de trabajo.
+
+    `generar` es la función de streaming a usar (por defecto generar_deltas, que con un
+    único Llama serializa la generación en _gen_lock; con AGENTE_BATCH=1 o pasando
+    MotorBatchContinuo.generar, los pedidos de los distintos hilos se decodifican
+    juntos). La cola está acotada a `max_en_cola`: enviar() bloquea cuando está llena,
+    así un lote grande no carga todo en memoria.
+    """
+
+    def __init__(self, concurrencia: int = 1, generar: Optional[Callable[..., Iterator[str]]] = None,
+                 max_en_cola: int = 64):
+        self.generar = generar or generar_deltas
+        self._cola: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_en_cola)
+        self._hilos = [threading.Thread(target=self._trabajar, name=f"planificador-{i}", daemon=True)
+                       for i in range(max(1, concurrencia))]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def enviar(self, historial: List[Dict[str, str]], max_tokens: int = 512,
+               on_delta: Optional[Callable[[str], None]] = None,
+               cancel_event: Optional[threading.Event] = None) -> Future:
+        """Encola un pedido. El Future resuelve a (texto, UsoGeneracion)."""
+        fut: Future = Future()
+        self._cola.put((historial, max_tokens, on_delta, cancel_event, fut, time.perf_counter()))
+        return fut
+
+    def cerrar(self, esperar: bool = True):
+        """Termina los hilos después de atender lo ya encolado."""
+        for _ in self._hilos:
+            self._cola.put(None)
+        if esperar:
+            for hilo in self._hilos:
+                hilo.join()
+
+    def _trabajar(self):
+        while True:
+            item = self._cola.get()
+            if item is None:
+                return
+            historial, max_tokens, on_delta, cancel_event, fut, t_encolado = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            telemetria.observar("planificador_espera", time.perf_counter() - t_encolado)
+            uso = UsoGeneracion()
+            try:
+                partes = []
+                for delta in self.generar(historial, max_tokens=max_tokens, cancel_event=cancel_event, uso=uso):
+                    partes.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta)
+                fut.set_result(("".join(partes), uso))
+            except BaseException as e:
+                fut.set_exception(e)
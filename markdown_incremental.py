@@ -0,0 +1,297 @@
+"""Markdown incremental para las burbujas del agente (tk.Text con tags).
+
+Las respuestas del modelo llegan como Markdown crudo y se muestran mientras se generan:
+cada delta vuelve a pintar la burbuja con todo el texto acumulado. Parsear y reinsertar
+todo en cada token haría que el costo por token crezca con el largo de la respuesta.
+
+El parser trabaja por líneas: una línea que ya terminó en '\\n' no cambia más (en este
+subconjunto de Markdown ninguna línea posterior modifica cómo se ve una anterior), así
+que se parsea e inserta una sola vez. Sólo la línea sin terminar (la cola) se vuelve a
+parsear y reemplazar en cada actualización, y el alto de la burbuja se estima con las
+métricas cacheadas de layout_chat en vez de pedirle a Tk una pasada de geometría.
+
+Soporta bloques de código con ``` o ~~~ (se ven mientras se escriben, antes de cerrarse),
+títulos #..######, listas con viñetas y numeradas (anidadas por sangría), citas, reglas
+horizontales y, dentro de la línea, **negrita**, *cursiva*, `código` y [enlaces](url).
+No soporta títulos subrayados (=== / ---) ni tablas: se ven como texto.
+"""
+
+import math
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from layout_chat import MetricasFuente
+
+# (texto, tags de tk.Text)
+Tramo = Tuple[str, Tuple[str, ...]]
+
+# Marca del tk.Text donde empieza la cola (lo único que se reemplaza en cada token)
+MARCA_COLA = 'md_cola'
+
+# Márgenes izquierdos (lmargin1, lmargin2) de los tags de bloque, en píxeles
+SANGRIAS = {
+    'lista1': (6, 20),
+    'lista2': (24, 38),
+    'lista3': (42, 56),
+    'cita': (12, 12),
+    'codigo_bloque': (6, 6),
+}
+
+_CERCA = re.compile(r'^ {0,3}(`{3,}|~{3,})\s*([^`\s]*)')
+_TITULO = re.compile(r'^ {0,3}(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+_REGLA = re.compile(r'^ {0,3}([-*_])(?:\s*\1){2,}\s*$')
+_VINETA = re.compile(r'^(\s*)[-*+]\s+(.*)$')
+_NUMERADA = re.compile(r'^(\s*)(\d{1,9}[.)])\s+(.*)$')
+_CITA = re.compile(r'^ {0,3}>\s?(.*)$')
+_EN_LINEA = re.compile(
+    r'(?P<tics>`+)(?P<codigo>.+?)(?P=tics)'
+    r'|\*\*(?P<negrita>\S(?:.*?\S)?)\*\*'
+    r'|__(?P<negrita2>\S(?:.*?\S)?)__'
+    r'|\*(?P<cursiva>[^\s*](?:[^*]*?[^\s*])?)\*'
+    r'|(?<!\w)_(?P<cursiva2>[^\s_](?:[^_]*?[^\s_])?)_(?!\w)'
+    r'|\[(?P<enlace>[^\]]+)\]\((?P<url>[^)\s]+)\)'
+)
+
+
+class Linea(NamedTuple):
+    tramos: List[Tramo]
+    clase: str    # fuente que manda en el ancho y el alto: 'normal', 'codigo', 'h1', 'h2', 'h3'
+    bloque: str   # tag de bloque ('' si es un párrafo común); define la sangría
+
+
+class Actualizacion(NamedTuple):
+    reiniciar: bool         # el texto no continúa al anterior: hay que borrar y pintar de nuevo
+    nuevas: List[Linea]     # líneas que terminaron desde la última vez (ya no cambian)
+    cola: Optional[Linea]   # línea sin terminar (se reemplaza en cada actualización)
+
+
+def en_linea(texto: str, base: Tuple[str, ...] = ()) -> List[Tramo]:
+    """Formato dentro de una línea. Un marcador sin cerrar se ve tal cual hasta que se cierra."""
+    tramos: List[Tramo] = []
+    pos = 0
+    for m in _EN_LINEA.finditer(texto):
+        if m.start() > pos:
+            tramos.append((texto[pos:m.start()], base))
+        if m.group('codigo') is not None:
+            tramos.append((m.group('codigo'), base + ('codigo',)))
+        elif m.group('negrita') is not None or m.group('negrita2') is not None:
+            tramos.append((m.group('negrita') or m.group('negrita2'), base + ('negrita',)))
+        elif m.group('cursiva') is not None or m.group('cursiva2') is not None:
+            tramos.append((m.group('cursiva') or m.group('cursiva2'), base + ('cursiva',)))
+        else:
+            tramos.append((m.group('enlace'), base + ('enlace',)))
+        pos = m.end()
+    if pos < len(texto):
+        tramos.append((texto[pos:], base))
+    return tramos
+
+
+def parsear_linea(linea: str, cerca: Optional[str], salto: str = '\n') -> Tuple[Linea, Optional[str]]:
+    """Parsea una línea sabiendo si se está dentro de un bloque de código.
+
+    `cerca` es el delimitador del bloque abierto (p. ej. '```') o None. Devuelve la línea
+    lista para insertar (terminada en `salto`) y el delimitador vigente después de ella.
+    """
+    m = _CERCA.match(linea)
+    if cerca is not None:
+        if m and m.group(1)[0] == cerca[0] and len(m.group(1)) >= len(cerca) and not m.group(2):
+            return Linea([], 'codigo', 'codigo_bloque'), None
+        base = ('codigo_bloque',)
+        return Linea([(linea.expandtabs(4) + salto, base)], 'codigo', 'codigo_bloque'), cerca
+    if m:
+        lenguaje = m.group(2)
+        tramos = [(lenguaje + salto, ('codigo_lenguaje',))] if lenguaje else []
+        return Linea(tramos, 'codigo', 'codigo_bloque'), m.group(1)
+    m = _TITULO.match(linea)
+    if m:
+        tag = 'h%d' % min(len(m.group(1)), 3)
+        return Linea(en_linea(m.group(2), (tag,)) + [(salto, (tag,))], tag, tag), None
+    if _REGLA.match(linea):
+        return Linea([('─' * 24 + salto, ('regla',))], 'normal', 'regla'), None
+    m = _VINETA.match(linea)
+    if m:
+        nivel = min(len(m.group(1).expandtabs(4)) // 2, 2)
+        tag = 'lista%d' % (nivel + 1)
+        vineta = '•◦▪'[nivel] + ' '
+        return Linea([(vineta, (tag,))] + en_linea(m.group(2), (tag,)) + [(salto, (tag,))], 'normal', tag), None
+    m = _NUMERADA.match(linea)
+    if m:
+        nivel = min(len(m.group(1).expandtabs(4)) // 3, 2)
+        tag = 'lista%d' % (nivel + 1)
+        return Linea([(m.group(2) + ' ', (tag,))] + en_linea(m.group(3), (tag,)) + [(salto, (tag,))],
+                     'normal', tag), None
+    m = _CITA.match(linea)
+    if m:
+        return Linea(en_linea(m.group(1), ('cita',)) + [(salto, ('cita',))], 'normal', 'cita'), None
+    return Linea(en_linea(linea) + [(salto, ())], 'normal', ''), None
+
+
+class ParserIncremental:
+    """Convierte el texto acumulado de una respuesta en líneas nuevas + cola.
+
+    Recibe siempre el texto completo (como lo manda el streaming) y sólo parsea lo que
+    está después de la última línea terminada.
+    """
+
+    def __init__(self):
+        self._confirmado = ''              # prefijo ya parseado (hasta el último '\n')
+        self._cerca: Optional[str] = None  # bloque de código abierto al final del prefijo
+
+    def alimentar(self, texto: str) -> Actualizacion:
+        # startswith compara memoria contigua: no es parsear, y detecta un texto distinto
+        # (p. ej. el '...' de espera reemplazado por el primer token)
+        reiniciar = not texto.startswith(self._confirmado)
+        if reiniciar:
+            self._confirmado = ''
+            self._cerca = None
+        partes = texto[len(self._confirmado):].split('\n')
+        resto = partes.pop()
+        nuevas = []
+        for linea in partes:
+            parseada, self._cerca = parsear_linea(linea, self._cerca)
+            nuevas.append(parseada)
+        if partes:
+            self._confirmado = texto[:len(texto) - len(resto)]
+        cola = parsear_linea(resto, self._cerca, salto='')[0] if resto else None
+        return Actualizacion(reiniciar, nuevas, cola)
+
+
+def crear_fuentes(root, familia: str, tamano: int, familia_codigo: str = 'Consolas') -> Dict[str, object]:
+    """Fuentes de los tags, por nombre de tag o de clase (ver Linea.clase)."""
+    from tkinter import font as tkfont
+    return {
+        'normal': tkfont.Font(root=root, family=familia, size=tamano),
+        'negrita': tkfont.Font(root=root, family=familia, size=tamano, weight='bold'),
+        'cursiva': tkfont.Font(root=root, family=familia, size=tamano, slant='italic'),
+        'codigo': tkfont.Font(root=root, family=familia_codigo, size=max(tamano - 1, 8)),
+        'h1': tkfont.Font(root=root, family=familia, size=tamano + 6, weight='bold'),
+        'h2': tkfont.Font(root=root, family=familia, size=tamano + 4, weight='bold'),
+        'h3': tkfont.Font(root=root, family=familia, size=tamano + 2, weight='bold'),
+    }
+
+
+def configurar_tags(widget, fuentes: Dict[str, object], fondo_codigo: str, color_secundario: str,
+                    color_enlace: str = '#9cc9ff') -> None:
+    """Estilos de los tags en un tk.Text. Los últimos configurados tienen prioridad en Tk."""
+    widget.tag_configure('negrita', font=fuentes['negrita'])
+    widget.tag_configure('cursiva', font=fuentes['cursiva'])
+    widget.tag_configure('enlace', foreground=color_enlace, underline=True)
+    widget.tag_configure('codigo', font=fuentes['codigo'], background=fondo_codigo)
+    for tag in ('h3', 'h2', 'h1'):
+        widget.tag_configure(tag, font=fuentes[tag])
+    widget.tag_configure('regla', foreground=color_secundario)
+    widget.tag_configure('codigo_lenguaje', font=fuentes['codigo'], foreground=color_secundario)
+    for tag, (m1, m2) in SANGRIAS.items():
+        widget.tag_configure(tag, lmargin1=m1, lmargin2=m2)
+    widget.tag_configure('cita', foreground=color_secundario, font=fuentes['cursiva'])
+    # El fondo del '\n' se extiende hasta el borde: el bloque se ve como una caja
+    widget.tag_configure('codigo_bloque', font=fuentes['codigo'], background=fondo_codigo, wrap='char')
+
+
+class BurbujaMarkdown:
+    """Pinta una respuesta en un tk.Text y lo dimensiona sin pasadas de geometría.
+
+    `widget` es el tk.Text (con wrap='word'); `metricas` tiene un MetricasFuente por clase
+    ('normal', 'codigo', 'h1', 'h2', 'h3'). Expone configure(width=px) y winfo_exists()
+    para registrarse en layout_chat.MotorLayout como cualquier burbuja.
+    """
+
+    def __init__(self, widget, metricas: Dict[str, MetricasFuente], corte: int, padx: int = 12):
+        self.widget = widget
+        self.metricas = metricas
+        self.padx = padx
+        self.parser = ParserIncremental()
+        self._corte = corte
+        self._lineas: List[Linea] = []
+        self._altos: List[int] = []   # píxeles de cada línea confirmada al ancho de corte
+        self._alto_confirmado = 0
+        self._natural_confirmado = 0
+        self._cola: Optional[Linea] = None
+        self._tamano: Optional[Tuple[int, int]] = None
+        self.insertados = 0           # caracteres insertados en el widget (para medir el costo)
+        widget.mark_set(MARCA_COLA, 'end-1c')
+        widget.mark_gravity(MARCA_COLA, 'left')
+
+    # --- Interfaz de MotorLayout ---
+    def winfo_exists(self):
+        return self.widget.winfo_exists()
+
+    def configure(self, width: int) -> None:
+        """Nuevo ancho de corte en píxeles: recalcula el alto de todas las líneas (sólo al redimensionar)."""
+        self._corte = width
+        ancho = self._ancho_envoltura()
+        self._altos = [self._alto(linea, ancho) for linea in self._lineas]
+        self._alto_confirmado = sum(self._altos)
+        self._ajustar()
+
+    def ancho_natural(self) -> int:
+        natural = self._natural_confirmado
+        if self._cola is not None:
+            natural = max(natural, self._natural(self._cola))
+        return natural
+
+    # --- Pintado ---
+    def mostrar(self, texto: str) -> None:
+        """Pinta `texto` (el acumulado completo) reemplazando sólo lo que cambió."""
+        act = self.parser.alimentar(texto)
+        w = self.widget
+        w.configure(state='normal')
+        if act.reiniciar:
+            w.delete('1.0', 'end')
+            self._lineas, self._altos = [], []
+            self._alto_confirmado = self._natural_confirmado = 0
+        else:
+            w.delete(MARCA_COLA, 'end')
+        ancho = self._ancho_envoltura()
+        for linea in act.nuevas:
+            self._insertar(linea)
+            alto = self._alto(linea, ancho)
+            self._lineas.append(linea)
+            self._altos.append(alto)
+            self._alto_confirmado += alto
+            self._natural_confirmado = max(self._natural_confirmado, self._natural(linea))
+        w.mark_set(MARCA_COLA, 'end-1c')
+        w.mark_gravity(MARCA_COLA, 'left')
+        self._cola = act.cola
+        if act.cola is not None:
+            self._insertar(act.cola)
+        w.configure(state='disabled')
+        self._ajustar()
+
+    def _insertar(self, linea: Linea) -> None:
+        # La cola termina en salto '' (tramo vacío): no se inserta
+        args = [x for tramo in linea.tramos if tramo[0] for x in tramo]
+        if args:
+            self.widget.insert('end', *args)
+            self.insertados += sum(len(t) for t in args[::2])
+
+    # --- Medidas (métricas cacheadas, sin consultar a Tk) ---
+    def _ancho_envoltura(self) -> int:
+        """Ancho de texto en píxeles cuando la burbuja ocupa todo el corte."""
+        cero = self.metricas['normal'].ancho('0')
+        return max(1, (self._corte - 2 * self.padx) // cero) * cero
+
+    def _natural(self, linea: Linea) -> int:
+        texto = ''.join(t for t, _tags in linea.tramos).rstrip('\n')
+        return SANGRIAS.get(linea.bloque, (0, 0))[0] + self.metricas[linea.clase].ancho(texto)
+
+    def _alto(self, linea: Linea, ancho: int) -> int:
+        if not linea.tramos:
+            return 0
+        texto = ''.join(t for t, _tags in linea.tramos).rstrip('\n')
+        metricas = self.metricas[linea.clase]
+        margen = max(SANGRIAS.get(linea.bloque, (0, 0)))
+        return metricas.lineas(texto, ancho - margen) * metricas.alto_linea()
+
+    def _ajustar(self) -> None:
+        """width en caracteres ('0' de la fuente base) y height en líneas de la fuente base."""
+        base = self.metricas['normal']
+        cero = base.ancho('0')
+        ancho = min(self._ancho_envoltura(), self.ancho_natural() + 2)
+        alto = self._alto_confirmado
+        if self._cola is not None:
+            alto += self._alto(self._cola, self._ancho_envoltura())
+        tamano = (max(1, math.ceil(ancho / cero)), max(1, math.ceil(alto / base.alto_linea())))
+        if tamano != self._tamano:
+            self._tamano = tamano
+            self.widget.configure(width=tamano[0], height=tamano[1])
@@ -0,0 +1,501 @@
+"""Generación concurrente con batching continuo sobre la API de batch de llama.cpp.
+
+Con un único contexto de llama-cpp cada conversación espera su turno (_gen_lock). En
+CPU la decodificación de un token está limitada por leer los pesos de memoria, así que
+decodificar N secuencias en la misma pasada cuesta poco más que decodificar una: el
+rendimiento agregado (tokens/s) crece casi lineal con las secuencias activas.
+
+MotorBatchContinuo mantiene hasta `max_secuencias` secuencias en un mismo contexto
+(una por seq_id del KV cache) y en cada pasada arma un lote con:
+  - un token por cada secuencia que ya está generando, y
+  - trozos de los prompts pendientes hasta completar `n_batch` tokens (prefill por
+    partes: un prompt largo no congela a las demás conversaciones).
+Las secuencias entran y salen entre pasadas (al terminar, cancelarse o cerrar el
+generador), sin esperar a que termine el resto del lote. Una secuencia cuyo consumidor
+tiene `max_pendientes` deltas sin leer queda fuera de las pasadas hasta que lea: no
+acumula texto sin límite ni frena a las demás.
+
+Uso (mismo contrato que llama_local_helper.generar_deltas):
+  motor = MotorBatchContinuo(BackendLlamaCpp('modelo.gguf'), max_secuencias=4)
+  for delta in motor.generar(mensajes, max_tokens=256, cancel_event=ev, uso=uso):
+      ...
+  motor.estadisticas()   # tokens/s agregado, tokens por pasada, activas, en espera
+
+En la app se activa con AGENTE_BATCH=1 (ver llama_local_helper).
+"""
+
+import codecs
+import ctypes
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import motores_llm
+import telemetria
+
+# (seq_id, tokens, posición del primer token, pedir logits del último)
+Entrada = Tuple[int, Sequence[int], int, bool]
+
+_FIN = object()
+
+
+class BackendBatch:
+    """Interfaz de un backend capaz de decodificar varias secuencias en una pasada."""
+
+    n_ctx_secuencia = 2048
+
+    def tokenizar(self, mensajes: List[Dict[str, str]]) -> List[int]:
+        """Prompt completo (plantilla de chat incluida) como lista de tokens."""
+        raise NotImplementedError
+
+    def decodificar(self, entradas: List[Entrada]) -> Dict[int, object]:
+        """Evalúa el lote en una sola pasada; devuelve los logits de cada seq_id que los pidió."""
+        raise NotImplementedError
+
+    def muestrear(self, seq_id: int, logits) -> int:
+        raise NotImplementedError
+
+    def es_fin(self, token: int) -> bool:
+        raise NotImplementedError
+
+    def pieza(self, token: int) -> bytes:
+        """Bytes del token (un carácter UTF-8 puede quedar repartido entre tokens)."""
+        raise NotImplementedError
+
+    def liberar(self, seq_id: int) -> None:
+        """Olvida la secuencia (borra su parte del KV cache) para reutilizar el seq_id."""
+
+    def cerrar(self) -> None:
+        pass
+
+
+def _api(modulo, *nombres):
+    """Primera función disponible entre varios nombres (la API de llama.cpp cambia seguido)."""
+    for nombre in nombres:
+        fn = getattr(modulo, nombre, None)
+        if fn is not None:
+            return fn
+    raise RuntimeError(f'llama_cpp no expone ninguna de: {", ".join(nombres)}')
+
+
+class BackendLlamaCpp(BackendBatch):
+    """Backend sobre la API de bajo nivel de llama-cpp-python (llama_batch / llama_decode).
+
+    Crea un contexto propio con n_seq_max = max_secuencias. Con los valores por defecto
+    (4 x 1024) el KV cache ocupa lo mismo que el contexto único de 4096 de la app.
+    """
+
+    def __init__(self, ruta_modelo: str, max_secuencias: int = 4, n_ctx_secuencia: int = 1024,
+                 n_batch: int = 512, n_threads: Optional[int] = None, temperatura: float = 0.8,
+                 top_k: int = 40, top_p: float = 0.95, semilla: Optional[int] = None):
+        import llama_cpp as lc  # type: ignore
+        import numpy as np
+        self._lc = lc
+        self._np = np
+        self.n_ctx_secuencia = n_ctx_secuencia
+        self.n_batch = n_batch
+        self.temperatura = temperatura
+        self.top_k = top_k
+        self.top_p = top_p
+        self._rng = np.random.default_rng(semilla)
+
+        lc.llama_backend_init()
+        self._modelo = _api(lc, 'llama_model_load_from_file', 'llama_load_model_from_file')(
+            ruta_modelo.encode('utf-8'), lc.llama_model_default_params())
+        if not self._modelo:
+            raise RuntimeError(f'No se pudo cargar {ruta_modelo}')
+        params = lc.llama_context_default_params()
+        params.n_ctx = n_ctx_secuencia * max_secuencias
+        params.n_batch = n_batch
+        params.n_seq_max = max_secuencias
+        params.n_threads = params.n_threads_batch = n_threads or os.cpu_count() or 4
+        self._ctx = _api(lc, 'llama_init_from_model', 'llama_new_context_with_model')(self._modelo, params)
+        if not self._ctx:
+            raise RuntimeError('No se pudo crear el contexto de llama.cpp')
+        # Desde 2025 el vocabulario es un objeto aparte; antes las funciones recibían el modelo
+        vocab_de = getattr(lc, 'llama_model_get_vocab', None)
+        self._vocab = vocab_de(self._modelo) if vocab_de is not None else self._modelo
+        self._n_vocab = _api(lc, 'llama_vocab_n_tokens', 'llama_n_vocab')(self._vocab)
+        self._es_eog = _api(lc, 'llama_vocab_is_eog', 'llama_token_is_eog')
+        self._seq_rm = self._funcion_seq_rm()
+        self._batch = lc.llama_batch_init(n_batch, 0, max_secuencias)
+
+    def _funcion_seq_rm(self):
+        lc = self._lc
+        if hasattr(lc, 'llama_memory_seq_rm'):
+            memoria = lc.llama_get_memory(self._ctx)
+            return lambda seq_id: lc.llama_memory_seq_rm(memoria, seq_id, -1, -1)
+        seq_rm = _api(lc, 'llama_kv_self_seq_rm', 'llama_kv_cache_seq_rm')
+        return lambda seq_id: seq_rm(self._ctx, seq_id, -1, -1)
+
+    def tokenizar(self, mensajes: List[Dict[str, str]]) -> List[int]:
+        texto = motores_llm.prompt_llama2(mensajes).encode('utf-8')
+        maximo = len(texto) + 8
+        buf = (self._lc.llama_token * maximo)()
+        # add_special=False: la plantilla ya trae los <s>; parse_special=True para reconocerlos
+        n = self._lc.llama_tokenize(self._vocab, texto, len(texto), buf, maximo, False, True)
+        if n < 0:
+            raise RuntimeError('Prompt demasiado largo para tokenizar')
+        return list(buf[:n])
+
+    def decodificar(self, entradas: List[Entrada]) -> Dict[int, object]:
+        b = self._batch
+        filas: Dict[int, int] = {}
+        i = 0
+        for seq_id, tokens, pos, pedir in entradas:
+            for j, tok in enumerate(tokens):
+                b.token[i] = tok
+                b.pos[i] = pos + j
+                b.n_seq_id[i] = 1
+                b.seq_id[i][0] = seq_id
+                b.logits[i] = 0
+                i += 1
+            if pedir:
+                b.logits[i - 1] = 1
+                filas[seq_id] = i - 1
+        b.n_tokens = i
+        ret = self._lc.llama_decode(self._ctx, b)
+        if ret != 0:
+            raise RuntimeError(f'llama_decode devolvió {ret} (¿KV cache lleno?)')
+        np = self._np
+        return {seq_id: np.ctypeslib.as_array(self._lc.llama_get_logits_ith(self._ctx, fila),
+                                             shape=(self._n_vocab,))
+                for seq_id, fila in filas.items()}
+
+    def muestrear(self, seq_id: int, logits) -> int:
+        np = self._np
+        if self.temperatura <= 0:
+            return int(np.argmax(logits))
+        k = min(self.top_k, len(logits))
+        candidatos = np.argpartition(logits, -k)[-k:]
+        valores = logits[candidatos].astype(np.float64) / self.temperatura
+        probs = np.exp(valores - valores.max())
+        orden = np.argsort(-probs)
+        candidatos, probs = candidatos[orden], probs[orden] / probs.sum()
+        corte = int(np.searchsorted(np.cumsum(probs), self.top_p)) + 1
+        candidatos, probs = candidatos[:corte], probs[:corte]
+        return int(self._rng.choice(candidatos, p=probs / probs.sum()))
+
+    def es_fin(self, token: int) -> bool:
+        return bool(self._es_eog(self._vocab, token))
+
+    def pieza(self, token: int) -> bytes:
+        buf = ctypes.create_string_buffer(64)
+        n = self._lc.llama_token_to_piece(self._vocab, token, buf, len(buf), 0, False)
+        if n < 0:
+            buf = ctypes.create_string_buffer(-n)
+            n = self._lc.llama_token_to_piece(self._vocab, token, buf, len(buf), 0, False)
+        return buf.raw[:n]
+
+    def liberar(self, seq_id: int) -> None:
+        self._seq_rm(seq_id)
+
+    def cerrar(self) -> None:
+        lc = self._lc
+        if self._batch is not None:
+            lc.llama_batch_free(self._batch)
+            self._batch = None
+        if self._ctx:
+            lc.llama_free(self._ctx)
+            self._ctx = None
+        if self._modelo:
+            _api(lc, 'llama_model_free', 'llama_free_model')(self._modelo)
+            self._modelo = None
+
+
+class BackendFalso(BackendBatch):
+    """Backend determinista para pruebas y benchmarks, sin modelo.
+
+    Cada pasada cuesta `costo_pasada` + `costo_token` por token del lote, imitando la
+    decodificación en CPU (dominada por leer los pesos una vez por pasada). La respuesta
+    repite la última palabra del prompt `tokens_respuesta` veces.
+    """
+
+    FIN = 0
+
+    def __init__(self, tokens_respuesta: int = 16, costo_pasada: float = 0.0, costo_token: float = 0.0,
+                 n_ctx_secuencia: int = 2048):
+        self.tokens_respuesta = tokens_respuesta
+        self.costo_pasada = costo_pasada
+        self.costo_token = costo_token
+        self.n_ctx_secuencia = n_ctx_secuencia
+        self._vocab: Dict[str, int] = {}
+        self._palabras: List[str] = ['</s>']
+        self._lock = threading.Lock()
+        self._ultimo: Dict[int, int] = {}
+        self._generados: Dict[int, int] = {}
+        self.lotes: List[List[Entrada]] = []  # registro de cada pasada (para los tests)
+
+    def tokenizar(self, mensajes: List[Dict[str, str]]) -> List[int]:
+        ids = []
+        with self._lock:
+            for m in mensajes:
+                for palabra in (m.get('content') or '').split():
+                    if palabra not in self._vocab:
+                        self._vocab[palabra] = len(self._palabras)
+                        self._palabras.append(palabra)
+                    ids.append(self._vocab[palabra])
+        return ids
+
+    def decodificar(self, entradas: List[Entrada]) -> Dict[int, object]:
+        self.lotes.append([(s, list(t), p, pedir) for s, t, p, pedir in entradas])
+        n = sum(len(t) for _s, t, _p, _pedir in entradas)
+        if self.costo_pasada or self.costo_token:
+            time.sleep(self.costo_pasada + self.costo_token * n)
+        salida = {}
+        for seq_id, tokens, _pos, pedir in entradas:
+            if tokens:
+                self._ultimo[seq_id] = tokens[-1]
+            if pedir:
+                generados = self._generados.get(seq_id, 0)
+                self._generados[seq_id] = generados + 1
+                salida[seq_id] = self.FIN if generados >= self.tokens_respuesta else self._ultimo[seq_id]
+        return salida
+
+    def muestrear(self, seq_id: int, logits) -> int:
+        return int(logits)
+
+    def es_fin(self, token: int) -> bool:
+        return token == self.FIN
+
+    def pieza(self, token: int) -> bytes:
+        return (self._palabras[token] + ' ').encode('utf-8')
+
+    def liberar(self, seq_id: int) -> None:
+        self._ultimo.pop(seq_id, None)
+        self._generados.pop(seq_id, None)
+
+
+class _Secuencia:
+    __slots__ = ('prompt', 'evaluados', 'pendiente', 'generados', 'max_tokens', 'cancel_event',
+                 'abandonada', 'frenada', 'salida', 'max_pendientes', 'texto', 'uso', 't0', 'seq_id')
+
+    def __init__(self, prompt: List[int], max_tokens: int, cancel_event: Optional[threading.Event], uso,
+                 max_pendientes: int):
+        self.prompt = prompt
+        self.evaluados = 0              # tokens del prompt ya cargados en el KV cache
+        self.pendiente: Optional[int] = None  # último token muestreado, a evaluar en la próxima pasada
+        self.generados = 0
+        self.max_tokens = max_tokens
+        self.cancel_event = cancel_event
+        self.abandonada = False         # el consumidor cerró el generador
+        self.frenada = False            # fuera de la última pasada por tener la salida llena
+        # +2: el resto del decodificador y el _FIN (o el error) entran siempre sin bloquear
+        self.salida: "queue.Queue" = queue.Queue(maxsize=max_pendientes + 2)
+        self.max_pendientes = max_pendientes
+        self.texto = codecs.getincrementaldecoder('utf-8')('replace')
+        self.uso = uso
+        self.t0 = time.perf_counter()
+        self.seq_id = -1
+
+    def cancelada(self) -> bool:
+        return self.abandonada or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def salida_llena(self) -> bool:
+        return self.salida.qsize() >= self.max_pendientes
+
+
+class MotorBatchContinuo:
+    """Planificador de batching continuo: un hilo decodifica todas las secuencias activas juntas."""
+
+    def __init__(self, backend: BackendBatch, max_secuencias: int = 4, n_batch: int = 512,
+                 max_pendientes: int = 16):
+        self.backend = backend
+        self.max_secuencias = max(1, max_secuencias)
+        self.n_batch = max(self.max_secuencias, n_batch)
+        self.max_pendientes = max(1, max_pendientes)
+        self._cond = threading.Condition()
+        self._espera: Deque[_Secuencia] = deque()
+        self._activas: List[_Secuencia] = []
+        self._libres = list(range(self.max_secuencias))
+        self._cerrado = False
+        self._pasadas = 0
+        self._tokens_generados = 0
+        self._tokens_prompt = 0
+        self._t_ocupado = 0.0
+        self._hilo = threading.Thread(target=self._bucle, name='motor-batch', daemon=True)
+        self._hilo.start()
+
+    # --- API para consumidores ---
+    def generar(self, mensajes: List[Dict[str, str]], max_tokens: int = 512,
+                cancel_event: Optional[threading.Event] = None, uso=None) -> Iterator[str]:
+        """Deltas de la respuesta; mismo contrato que generar_deltas (cancelar o cerrar corta).
+
+        `uso` es opcional (un UsoGeneracion o similar): queda con tokens, tiempos y finish_reason.
+        Si no se lee, la secuencia deja de generar con `max_pendientes` deltas en espera.
+        """
+        prompt = self.backend.tokenizar(mensajes)
+        max_tokens = max(1, min(max_tokens, self.backend.n_ctx_secuencia // 2))
+        limite = self.backend.n_ctx_secuencia - max_tokens
+        if len(prompt) > limite:
+            prompt = prompt[-limite:]  # lo más viejo de la conversación queda afuera
+        seq = _Secuencia(prompt, max_tokens, cancel_event, uso, self.max_pendientes)
+        if uso is not None:
+            uso.prompt_tokens = len(prompt)
+        with self._cond:
+            if self._cerrado:
+                raise RuntimeError('El motor de batching está cerrado')
+            self._espera.append(seq)
+            self._cond.notify()
+        try:
+            while True:
+                item = seq.salida.get()
+                if seq.frenada:
+                    with self._cond:
+                        self._cond.notify()  # ya hay lugar: que vuelva a entrar en las pasadas
+                if item is _FIN:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            seq.abandonada = True
+            if seq.frenada:
+                with self._cond:
+                    self._cond.notify()
+            if uso is not None:
+                if uso.finish_reason is None:
+                    uso.finish_reason = 'cancelado'
+                uso.t_total = time.perf_counter() - seq.t0
+
+    def estadisticas(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                'activas': len(self._activas),
+                'en_espera': len(self._espera),
+                'pasadas': self._pasadas,
+                'tokens_prompt': self._tokens_prompt,
+                'tokens_generados': self._tokens_generados,
+                'tokens_por_pasada': round(self._tokens_generados / self._pasadas, 2) if self._pasadas else 0.0,
+                'tokens_por_segundo': round(self._tokens_generados / self._t_ocupado, 2) if self._t_ocupado else 0.0,
+            }
+
+    def cerrar(self, timeout: Optional[float] = 10.0) -> None:
+        """Corta las generaciones en curso y libera el backend."""
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify()
+        self._hilo.join(timeout)
+        if not self._hilo.is_alive():
+            self.backend.cerrar()
+
+    # --- Hilo del planificador ---
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while not (self._cerrado or self._espera or self._activas):
+                    self._cond.wait()
+                if self._cerrado:
+                    pendientes = list(self._espera) + self._activas
+                    self._espera.clear()
+                    break
+                while self._espera and self._libres:
+                    seq = self._espera.popleft()
+                    seq.seq_id = self._libres.pop()
+                    if seq.uso is not None:
+                        seq.uso.t_espera = time.perf_counter() - seq.t0
+                    self._activas.append(seq)
+            for seq in [s for s in self._activas if s.cancelada()]:
+                self._retirar(seq, 'cancelado')
+            lote = self._armar_lote()
+            if lote:
+                self._pasada(lote)
+            else:
+                # Todas frenadas por consumidores lentos: esperar a que alguno lea (o cancele)
+                with self._cond:
+                    if not (self._cerrado or self._espera):
+                        self._cond.wait(0.05)
+        for seq in pendientes:
+            self._retirar(seq, 'cancelado')
+
+    def _armar_lote(self) -> List[Tuple[_Secuencia, Entrada]]:
+        lote = []
+        cupo = self.n_batch
+        # Primero un token por cada secuencia que ya genera: la latencia entre tokens no
+        # depende de los prompts que estén entrando
+        for seq in self._activas:
+            if seq.pendiente is not None:
+                seq.frenada = seq.salida_llena()
+                if seq.frenada:
+                    continue  # el token espera en `pendiente` hasta que el consumidor lea
+                lote.append((seq, (seq.seq_id, [seq.pendiente], len(seq.prompt) + seq.generados - 1, True)))
+                cupo -= 1
+        # El resto del cupo, para los prompts en orden de llegada
+        for seq in self._activas:
+            if cupo <= 0:
+                break
+            if seq.pendiente is None and seq.evaluados < len(seq.prompt):
+                trozo = seq.prompt[seq.evaluados:seq.evaluados + cupo]
+                ultimo = seq.evaluados + len(trozo) == len(seq.prompt)
+                lote.append((seq, (seq.seq_id, trozo, seq.evaluados, ultimo)))
+                cupo -= len(trozo)
+        return lote
+
+    def _pasada(self, lote: List[Tuple[_Secuencia, Entrada]]):
+        t0 = time.perf_counter()
+        try:
+            logits = self.backend.decodificar([entrada for _seq, entrada in lote])
+        except Exception as e:
+            for seq, _entrada in lote:
+                self._retirar(seq, 'error', e)
+            return
+        dt = time.perf_counter() - t0
+        generados = 0
+        prompt = 0
+        for seq, (_seq_id, tokens, _pos, pedir) in lote:
+            if seq.pendiente is None:
+                seq.evaluados += len(tokens)
+                prompt += len(tokens)
+            if not pedir:
+                continue
+            try:
+                token = self.backend.muestrear(seq.seq_id, logits[seq.seq_id])
+            except Exception as e:
+                self._retirar(seq, 'error', e)
+                continue
+            if self._emitir(seq, token):
+                generados += 1
+        with self._cond:
+            self._pasadas += 1
+            self._tokens_generados += generados
+            self._tokens_prompt += prompt
+            self._t_ocupado += dt
+        telemetria.observar('motor_pasada', dt)
+        telemetria.observar('motor_secuencias_por_pasada', len(lote))
+
+    def _emitir(self, seq: _Secuencia, token: int) -> bool:
+        """Entrega el token al consumidor; False si era el de fin de secuencia."""
+        if self.backend.es_fin(token):
+            self._retirar(seq, 'stop')
+            return False
+        seq.generados += 1
+        seq.pendiente = token
+        uso = seq.uso
+        if uso is not None:
+            uso.completion_tokens = seq.generados
+            if uso.t_primer_token is None:
+                uso.t_primer_token = time.perf_counter() - seq.t0
+        delta = seq.texto.decode(self.backend.pieza(token))
+        if delta:
+            seq.salida.put_nowait(delta)
+        if seq.generados >= seq.max_tokens:
+            self._retirar(seq, 'length')
+        return True
+
+    def _retirar(self, seq: _Secuencia, motivo: str, error: Optional[BaseException] = None):
+        if seq in self._activas:
+            self._activas.remove(seq)
+            try:
+                self.backend.liberar(seq.seq_id)
+            finally:
+                with self._cond:
+                    self._libres.append(seq.seq_id)
+        resto = seq.texto.decode(b'', final=True)
+        if resto and error is None and motivo != 'cancelado':
+            seq.salida.put_nowait(resto)
+        if seq.uso is not None and seq.uso.finish_reason is None:
+            seq.uso.finish_reason = motivo
+        seq.salida.put_nowait(error if error is not None else _FIN)
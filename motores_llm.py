@@ -0,0 +1,381 @@
+"""Motores de inferencia local intercambiables para el chat (CPU, sin conexión).
+
+Todos reciben la lista de mensajes ya armada (con el prompt de sistema) y devuelven la
+respuesta de a fragmentos (deltas), con el mismo contrato que generar_deltas en
+llama_local_helper. Según el procesador, otro runtime puede decodificar un modelo chico
+bastante más rápido que llama.cpp.
+
+Instalación sugerida (CPU):
+  pip install llama-cpp-python              # GGUF (el de siempre)
+  pip install onnxruntime-genai             # + modelo exportado con el model builder de ORT GenAI
+  pip install ctranslate2 tokenizers        # + modelo convertido con ct2-transformers-converter
+
+Variables de entorno:
+  AGENTE_LLM          motor: 'llama_cpp', 'onnx' o 'ctranslate2' (pisa la elección del benchmark)
+  AGENTE_ONNX_MODELO  carpeta del modelo ONNX Runtime GenAI (default: ./modelo-onnx, con genai_config.json)
+  AGENTE_CT2_MODELO   carpeta del modelo CTranslate2 (default: ./modelo-ct2, con tokenizer.json)
+
+Para que cada máquina use el motor más rápido que tenga instalado:
+  python bench_motores_llm.py --guardar
+deja la elección en motor_llm.json, que sólo vale para la máquina donde se midió y
+mientras los modelos medidos sean los mismos archivos.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import threading
+from typing import Dict, Iterator, List, Optional, Type
+
+_DIR = os.path.dirname(__file__)
+ARCHIVO_PREFERENCIA = os.path.join(_DIR, 'motor_llm.json')
+
+# Muestreo: los mismos valores por defecto que create_chat_completion de llama-cpp
+TEMPERATURA = 0.8
+TOP_K = 40
+TOP_P = 0.95
+
+
+def prompt_llama2(mensajes: List[Dict[str, str]]) -> str:
+    """Plantilla de chat de Llama 2 (la misma que usa create_chat_completion para este modelo)."""
+    sistema = ''
+    if mensajes and mensajes[0].get('role') == 'system':
+        sistema, mensajes = mensajes[0].get('content', ''), mensajes[1:]
+    prefijo = f'<<SYS>>\n{sistema}\n<</SYS>>\n\n' if sistema else ''
+    texto = ''
+    for m in mensajes:
+        contenido = (m.get('content') or '').strip()
+        if m.get('role') == 'assistant':
+            texto += f' {contenido} </s>'
+        else:
+            texto += f'<s>[INST] {prefijo}{contenido} [/INST]'
+            prefijo = ''
+    return texto
+
+
+class MotorLLM:
+    """Interfaz base de un motor de generación local."""
+
+    nombre = 'base'
+    ruta_modelo: Optional[str] = None
+
+    def disponible(self) -> bool:
+        """True si las dependencias y el modelo están presentes."""
+        return False
+
+    def modelo(self) -> Optional[str]:
+        """Archivo o carpeta del modelo que usa el motor."""
+        return self.ruta_modelo
+
+    def cargar(self) -> None:
+        """Carga el modelo en memoria (una vez)."""
+
+    def generar(self, mensajes: List[Dict[str, str]], max_tokens: int,
+                cancel_event: Optional[threading.Event], uso) -> Iterator[str]:
+        """Deltas de la respuesta. Completa uso.prompt_tokens, completion_tokens y finish_reason."""
+        raise NotImplementedError
+
+    def cerrar(self) -> None:
+        pass
+
+
+class MotorLlamaCpp(MotorLLM):
+    """llama-cpp-python sobre el GGUF de la app (create_chat_completion en modo stream)."""
+
+    nombre = 'llama_cpp'
+
+    def __init__(self, ruta_modelo: Optional[str] = None, llm=None):
+        self.ruta_modelo = ruta_modelo
+        self._llm = llm
+
+    def _ruta(self) -> str:
+        if self.ruta_modelo is None:
+            from llama_local_helper import _MODEL_PATH
+            self.ruta_modelo = _MODEL_PATH
+        return self.ruta_modelo
+
+    def modelo(self) -> Optional[str]:
+        return self._ruta()
+
+    def disponible(self) -> bool:
+        try:
+            import llama_cpp  # type: ignore  # noqa: F401
+        except Exception:
+            return False
+        return os.path.exists(self._ruta())
+
+    def cargar(self) -> None:
+        if self._llm is None:
+            from llama_cpp import Llama  # type: ignore
+            self._llm = Llama(model_path=self._ruta(), n_ctx=4096, n_threads=os.cpu_count() or 4, verbose=False)
+
+    def generar(self, mensajes, max_tokens, cancel_event, uso):
+        llm = self._llm
+        stream = llm.create_chat_completion(messages=mensajes, stream=True, max_tokens=max_tokens)
+        # Los tokens se cuentan con n_tokens (tokens en el contexto) y no por chunks: un token
+        # con medio carácter UTF-8 no trae texto y el detokenizador puede juntar varios en un chunk.
+        # Con el primer chunk el prompt ya está evaluado y el token recién muestreado todavía no.
+        base = None
+        try:
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    uso.finish_reason = 'cancelado'
+                    return
+                n_tokens = int(getattr(llm, 'n_tokens', 0) or 0)
+                if base is None:
+                    base = n_tokens
+                uso.completion_tokens = max(uso.completion_tokens, n_tokens - base)
+                choice = chunk['choices'][0]
+                try:
+                    delta = choice['delta'].get('content', '')
+                except Exception:
+                    # Compatibilidad con versiones que usan 'text' durante el stream
+                    delta = choice.get('text', '')
+                if choice.get('finish_reason'):
+                    uso.finish_reason = choice['finish_reason']
+                if not delta:
+                    continue
+                yield delta
+        finally:
+            # Cerrar el stream de llama-cpp libera el contexto aunque el consumidor corte antes
+            cerrar = getattr(stream, 'close', None)
+            if cerrar is not None:
+                cerrar()
+            if base is not None:
+                generados = int(getattr(llm, 'n_tokens', 0) or 0) - base
+                # Al cortar por largo el último token muestreado no llega a evaluarse
+                generados += uso.finish_reason == 'length'
+                uso.prompt_tokens = base
+                uso.completion_tokens = max(uso.completion_tokens, generados)
+
+
+class _Decodificador:
+    """Convierte ids generados en deltas de texto sin cortar un carácter UTF-8 a la mitad."""
+
+    def __init__(self, decode):
+        self._decode = decode
+        self.ids: List[int] = []
+        self._emitido = ''
+
+    def agregar(self, token_id: int) -> str:
+        self.ids.append(token_id)
+        texto = self._decode(self.ids)
+        if texto.endswith('\ufffd'):
+            return ''  # faltan bytes del carácter: se emite con el próximo token
+        delta = texto[len(self._emitido):]
+        self._emitido = texto
+        return delta
+
+
+class MotorOnnxGenAI(MotorLLM):
+    """ONNX Runtime GenAI (onnxruntime-genai) sobre una carpeta exportada con su model builder."""
+
+    nombre = 'onnx'
+
+    def __init__(self, ruta_modelo: Optional[str] = None):
+        self.ruta_modelo = ruta_modelo or os.environ.get('AGENTE_ONNX_MODELO', os.path.join(_DIR, 'modelo-onnx'))
+        self._og = None
+        self._modelo = None
+        self._tokenizer = None
+
+    def disponible(self) -> bool:
+        try:
+            import onnxruntime_genai  # type: ignore  # noqa: F401
+        except Exception:
+            return False
+        return os.path.isfile(os.path.join(self.ruta_modelo, 'genai_config.json'))
+
+    def cargar(self) -> None:
+        import onnxruntime_genai as og  # type: ignore
+        self._og = og
+        self._modelo = og.Model(self.ruta_modelo)
+        self._tokenizer = og.Tokenizer(self._modelo)
+
+    def _prompt(self, mensajes: List[Dict[str, str]]) -> str:
+        aplicar = getattr(self._tokenizer, 'apply_chat_template', None)
+        if aplicar is not None:
+            # Plantilla propia del modelo exportado (desde onnxruntime-genai 0.6)
+            try:
+                return aplicar(json.dumps(mensajes, ensure_ascii=False), add_generation_prompt=True)
+            except Exception:
+                pass
+        return prompt_llama2(mensajes)
+
+    def generar(self, mensajes, max_tokens, cancel_event, uso):
+        og = self._og
+        tokens = self._tokenizer.encode(self._prompt(mensajes))
+        uso.prompt_tokens = len(tokens)
+        params = og.GeneratorParams(self._modelo)
+        # max_length cuenta el prompt
+        params.set_search_options(max_length=len(tokens) + max_tokens, do_sample=True,
+                                  temperature=TEMPERATURA, top_k=TOP_K, top_p=TOP_P)
+        if not hasattr(og.Generator, 'append_tokens'):
+            params.input_ids = tokens  # API anterior a 0.6
+        generador = og.Generator(self._modelo, params)
+        if hasattr(generador, 'append_tokens'):
+            generador.append_tokens(tokens)
+        stream = self._tokenizer.create_stream()
+        try:
+            while not generador.is_done():
+                if cancel_event is not None and cancel_event.is_set():
+                    uso.finish_reason = 'cancelado'
+                    return
+                if hasattr(generador, 'compute_logits'):
+                    generador.compute_logits()  # API anterior a 0.6
+                generador.generate_next_token()
+                uso.completion_tokens += 1
+                delta = stream.decode(generador.get_next_tokens()[0])
+                if delta:
+                    yield delta
+            uso.finish_reason = 'length' if uso.completion_tokens >= max_tokens else 'stop'
+        finally:
+            del generador
+
+
+class MotorCTranslate2(MotorLLM):
+    """CTranslate2 (int8 en CPU) sobre un modelo convertido con ct2-transformers-converter.
+
+    El tokenizador se lee del tokenizer.json copiado junto al modelo (--copy_files
+    tokenizer.json), sin transformers ni conexión.
+    """
+
+    nombre = 'ctranslate2'
+
+    def __init__(self, ruta_modelo: Optional[str] = None, compute_type: str = 'int8'):
+        self.ruta_modelo = ruta_modelo or os.environ.get('AGENTE_CT2_MODELO', os.path.join(_DIR, 'modelo-ct2'))
+        self.compute_type = compute_type
+        self._generador = None
+        self._tokenizer = None
+
+    def disponible(self) -> bool:
+        try:
+            import ctranslate2  # type: ignore  # noqa: F401
+            import tokenizers  # type: ignore  # noqa: F401
+        except Exception:
+            return False
+        return (os.path.isfile(os.path.join(self.ruta_modelo, 'model.bin'))
+                and os.path.isfile(os.path.join(self.ruta_modelo, 'tokenizer.json')))
+
+    def cargar(self) -> None:
+        import ctranslate2  # type: ignore
+        from tokenizers import Tokenizer  # type: ignore
+        self._generador = ctranslate2.Generator(self.ruta_modelo, device='cpu', compute_type=self.compute_type,
+                                                intra_threads=os.cpu_count() or 4)
+        self._tokenizer = Tokenizer.from_file(os.path.join(self.ruta_modelo, 'tokenizer.json'))
+
+    def generar(self, mensajes, max_tokens, cancel_event, uso):
+        # La plantilla ya trae los <s>: no agregar tokens especiales otra vez
+        prompt = self._tokenizer.encode(prompt_llama2(mensajes), add_special_tokens=False).tokens
+        uso.prompt_tokens = len(prompt)
+        decodificador = _Decodificador(self._tokenizer.decode)
+        pasos = self._generador.generate_tokens(prompt, max_length=max_tokens, sampling_temperature=TEMPERATURA,
+                                                sampling_topk=TOP_K, sampling_topp=TOP_P)
+        try:
+            for paso in pasos:
+                if cancel_event is not None and cancel_event.is_set():
+                    uso.finish_reason = 'cancelado'
+                    return
+                uso.completion_tokens += 1
+                delta = decodificador.agregar(paso.token_id)
+                if delta:
+                    yield delta
+            uso.finish_reason = 'length' if uso.completion_tokens >= max_tokens else 'stop'
+        finally:
+            # Cerrar el iterador detiene la generación en CTranslate2
+            cerrar = getattr(pasos, 'close', None)
+            if cerrar is not None:
+                cerrar()
+
+    def cerrar(self) -> None:
+        self._generador = None
+
+
+# Orden de preferencia cuando no hay elección: llama-cpp sigue siendo el de siempre
+MOTORES: Dict[str, Type[MotorLLM]] = {
+    MotorLlamaCpp.nombre: MotorLlamaCpp,
+    MotorOnnxGenAI.nombre: MotorOnnxGenAI,
+    MotorCTranslate2.nombre: MotorCTranslate2,
+}
+
+
+def motores_disponibles() -> List[str]:
+    return [nombre for nombre, cls in MOTORES.items() if cls().disponible()]
+
+
+def huella_maquina() -> str:
+    """Identifica la máquina donde se midió: la elección no vale si se copia a otra."""
+    return '|'.join([platform.node(), platform.machine(), platform.processor(), str(os.cpu_count())])
+
+
+def huella_modelo(ruta: Optional[str]) -> Optional[str]:
+    """Identifica los archivos de un modelo (nombres, tamaños y fechas), sin leerlos."""
+    if not ruta or not os.path.exists(ruta):
+        return None
+    if os.path.isdir(ruta):
+        archivos = sorted(os.path.join(ruta, n) for n in os.listdir(ruta))
+    else:
+        archivos = [ruta]
+    h = hashlib.sha1(os.path.abspath(ruta).encode())
+    for archivo in archivos:
+        st = os.stat(archivo)
+        h.update(f'|{os.path.basename(archivo)}|{st.st_size}|{st.st_mtime_ns}'.encode())
+    return h.hexdigest()
+
+
+def _modelos_actuales(nombres) -> Dict[str, Dict[str, Optional[str]]]:
+    modelos = {}
+    for nombre in nombres:
+        cls = MOTORES.get(nombre)
+        ruta = cls().modelo() if cls is not None else None
+        modelos[nombre] = {'ruta': ruta, 'huella': huella_modelo(ruta)}
+    return modelos
+
+
+def guardar_preferencia(nombre: str, mediciones: Optional[dict] = None, ruta: Optional[str] = None,
+                        medidos: Optional[List[str]] = None) -> None:
+    """Guarda la elección junto con los modelos con que se midió cada motor de `medidos`."""
+    with open(ruta or ARCHIVO_PREFERENCIA, 'w', encoding='utf-8') as f:
+        json.dump({'motor': nombre, 'maquina': huella_maquina(),
+                   'modelos': _modelos_actuales(medidos if medidos is not None else [nombre]),
+                   'mediciones': mediciones or {}},
+                  f, indent=2, ensure_ascii=False)
+
+
+def leer_preferencia(ruta: Optional[str] = None) -> Optional[str]:
+    """Motor elegido por el benchmark en esta máquina con los mismos modelos, o None."""
+    try:
+        with open(ruta or ARCHIVO_PREFERENCIA, encoding='utf-8') as f:
+            datos = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (datos.get('maquina') != huella_maquina() or datos.get('motor') not in MOTORES
+            or 'modelos' not in datos):
+        return None
+    # Con otro modelo en alguno de los motores comparados la medición ya no vale
+    medidos = datos.get('modelos') or {}
+    if _modelos_actuales(medidos) != medidos:
+        return None
+    return datos['motor']
+
+
+def motor_preferido() -> Optional[str]:
+    """AGENTE_LLM si está definido; si no, lo que eligió el benchmark en esta máquina."""
+    elegido = os.environ.get('AGENTE_LLM')
+    if elegido in MOTORES:
+        return elegido
+    return leer_preferencia()
+
+
+def crear_motor(preferido: Optional[str] = None) -> Optional[MotorLLM]:
+    """Devuelve el motor preferido si está disponible o el primero disponible (sin cargar)."""
+    preferido = preferido or motor_preferido()
+    if preferido and preferido in MOTORES:
+        motor = MOTORES[preferido]()
+        if motor.disponible():
+            return motor
+    for cls in MOTORES.values():
+        motor = cls()
+        if motor.disponible():
+            return motor
+    return None
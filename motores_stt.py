@@ -0,0 +1,276 @@
+"""Motores de transcripción de voz (speech-to-text) intercambiables.
+
+Todos reciben PCM int16 mono y devuelven texto. Los motores locales (faster-whisper,
+Vosk) funcionan sin conexión; Google queda como último recurso si no hay ninguno.
+Un motor local cuenta como disponible sólo si su modelo ya está en disco: whisper no
+descarga nada al cargar.
+
+Instalación sugerida (CPU):
+  pip install faster-whisper        # + una vez, con red:
+                                    #   python -c "from faster_whisper import download_model; download_model('small')"
+                                    # o bien
+  pip install vosk                  # + modelo, ej. vosk-model-small-es-0.42
+
+Variables de entorno:
+  AGENTE_STT            motor preferido: 'whisper', 'vosk' o 'google'
+  AGENTE_WHISPER_MODELO tamaño (ya descargado) o ruta del modelo whisper (default: 'small')
+  AGENTE_VOSK_MODELO    ruta del modelo Vosk (default: ./vosk-model-small-es-0.42)
+
+El modelo se carga una sola vez dentro de un hilo dedicado (TranscriptorWorker) y
+queda caliente para los dictados siguientes; la UI nunca espera la transcripción.
+Si la carga falla, el worker prueba con el siguiente motor disponible.
+"""
+
+import json
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Type
+
+_DIR = os.path.dirname(__file__)
+
+
+class MotorSTT:
+    """Interfaz base de un motor de transcripción."""
+
+    nombre = 'base'
+    offline = True
+
+    def disponible(self) -> bool:
+        """True si las dependencias (y el modelo, si aplica) están presentes."""
+        return False
+
+    def cargar(self) -> None:
+        """Carga el modelo en memoria. Se llama una vez, desde el hilo del worker."""
+
+    def transcribir(self, pcm: bytes, fs: int) -> str:
+        raise NotImplementedError
+
+
+class MotorFasterWhisper(MotorSTT):
+    nombre = 'whisper'
+
+    def __init__(self, modelo: Optional[str] = None, idioma: str = 'es'):
+        self.modelo = modelo or os.environ.get('AGENTE_WHISPER_MODELO', 'small')
+        self.idioma = idioma
+        self._model = None
+
+    def ruta_local(self) -> Optional[str]:
+        """Carpeta del modelo en disco (ruta dada o ya en la caché de Hugging Face), sin usar la red."""
+        if os.path.isdir(self.modelo):
+            return self.modelo
+        try:
+            from faster_whisper.utils import download_model  # type: ignore
+            return download_model(self.modelo, local_files_only=True)
+        except Exception:
+            return None
+
+    def disponible(self) -> bool:
+        try:
+            import faster_whisper  # type: ignore  # noqa: F401
+            import numpy  # noqa: F401
+        except Exception:
+            return False
+        return self.ruta_local() is not None
+
+    def cargar(self) -> None:
+        from faster_whisper import WhisperModel  # type: ignore
+        ruta = self.ruta_local()
+        if ruta is None:
+            raise FileNotFoundError(f'El modelo whisper {self.modelo!r} no está descargado')
+        self._model = WhisperModel(ruta, device='cpu', compute_type='int8',
+                                   cpu_threads=os.cpu_count() or 4, local_files_only=True)
+
+    def transcribir(self, pcm: bytes, fs: int) -> str:
+        import numpy as np
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        if fs != 16000:
+            # Remuestreo lineal simple: whisper espera 16 kHz
+            n = int(len(audio) * 16000 / fs)
+            audio = np.interp(np.linspace(0, len(audio), n, endpoint=False),
+                              np.arange(len(audio)), audio).astype(np.float32)
+        segmentos, _info = self._model.transcribe(audio, language=self.idioma, beam_size=1,
+                                                  condition_on_previous_text=False)
+        return ' '.join(s.text.strip() for s in segmentos).strip()
+
+
+class MotorVosk(MotorSTT):
+    nombre = 'vosk'
+
+    def __init__(self, ruta_modelo: Optional[str] = None):
+        self.ruta_modelo = ruta_modelo or os.environ.get(
+            'AGENTE_VOSK_MODELO', os.path.join(_DIR, 'vosk-model-small-es-0.42'))
+        self._model = None
+
+    def disponible(self) -> bool:
+        try:
+            import vosk  # type: ignore  # noqa: F401
+        except Exception:
+            return False
+        return os.path.isdir(self.ruta_modelo)
+
+    def cargar(self) -> None:
+        from vosk import Model, SetLogLevel  # type: ignore
+        SetLogLevel(-1)
+        self._model = Model(self.ruta_modelo)
+
+    def transcribir(self, pcm: bytes, fs: int) -> str:
+        from vosk import KaldiRecognizer  # type: ignore
+        rec = KaldiRecognizer(self._model, fs)
+        rec.AcceptWaveform(pcm)
+        return json.loads(rec.FinalResult()).get('text', '').strip()
+
+
+class MotorGoogle(MotorSTT):
+    """Transcripción online vía SpeechRecognition (requiere red)."""
+
+    nombre = 'google'
+    offline = False
+
+    def __init__(self, idioma: str = 'es-AR'):
+        self.idioma = idioma
+        self._sr = None
+        self._recognizer = None
+
+    def disponible(self) -> bool:
+        try:
+            import speech_recognition  # type: ignore  # noqa: F401
+        except Exception:
+            return False
+        return True
+
+    def cargar(self) -> None:
+        import speech_recognition as sr  # type: ignore
+        self._sr = sr
+        self._recognizer = sr.Recognizer()
+
+    def transcribir(self, pcm: bytes, fs: int) -> str:
+        sr = self._sr
+        try:
+            return self._recognizer.recognize_google(sr.AudioData(pcm, fs, sample_width=2), language=self.idioma)
+        except sr.UnknownValueError:
+            return ''
+
+
+# Orden de preferencia: primero los motores offline
+MOTORES: Dict[str, Type[MotorSTT]] = {
+    MotorFasterWhisper.nombre: MotorFasterWhisper,
+    MotorVosk.nombre: MotorVosk,
+    MotorGoogle.nombre: MotorGoogle,
+}
+
+
+def motores_disponibles() -> List[str]:
+    return [nombre for nombre, cls in MOTORES.items() if cls().disponible()]
+
+
+def crear_motores(preferido: Optional[str] = None) -> List[MotorSTT]:
+    """Los motores disponibles, primero el preferido y después en el orden de MOTORES."""
+    preferido = preferido or os.environ.get('AGENTE_STT')
+    nombres = list(MOTORES)
+    if preferido in MOTORES:
+        nombres.remove(preferido)
+        nombres.insert(0, preferido)
+    motores = (MOTORES[nombre]() for nombre in nombres)
+    return [motor for motor in motores if motor.disponible()]
+
+
+def crear_motor(preferido: Optional[str] = None) -> Optional[MotorSTT]:
+    """Devuelve el motor preferido si está disponible o el primero disponible."""
+    motores = crear_motores(preferido)
+    return motores[0] if motores else None
+
+
+class TranscriptorWorker:
+    """Hilo dedicado que carga el motor una vez y atiende pedidos en orden.
+
+    Si `motor` no carga se prueban las `alternativas` en orden; `motor` queda en el que cargó.
+    """
+
+    def __init__(self, motor: MotorSTT, alternativas: Sequence[MotorSTT] = ()):
+        self.motor = motor
+        self._alternativas = list(alternativas)
+        self._cola: 'queue.Queue[Optional[tuple]]' = queue.Queue()
+        self._listo = threading.Event()
+        self._error_carga: Optional[BaseException] = None
+        self._hilo = threading.Thread(target=self._loop, name=f'stt-{motor.nombre}', daemon=True)
+        self._hilo.start()
+
+    @property
+    def listo(self) -> bool:
+        return self._listo.is_set()
+
+    @property
+    def fallido(self) -> bool:
+        """True si ya terminó de cargar y ningún motor funcionó."""
+        return self.listo and self._error_carga is not None
+
+    def esperar_listo(self, timeout: Optional[float] = None) -> bool:
+        return self._listo.wait(timeout)
+
+    def transcribir_async(self, pcm: bytes, fs: int) -> Future:
+        fut: Future = Future()
+        self._cola.put((pcm, fs, fut))
+        return fut
+
+    def transcribir(self, pcm: bytes, fs: int, timeout: Optional[float] = 60.0) -> str:
+        """Bloquea al llamador (nunca llamar desde el hilo de Tk)."""
+        return self.transcribir_async(pcm, fs).result(timeout=timeout)
+
+    def cerrar(self):
+        self._cola.put(None)
+
+    def _loop(self):
+        errores = []
+        try:
+            for motor in [self.motor] + self._alternativas:
+                try:
+                    motor.cargar()
+                except Exception as e:
+                    errores.append(f'{motor.nombre}: {e}')
+                    continue
+                self.motor = motor
+                threading.current_thread().name = f'stt-{motor.nombre}'
+                break
+            else:
+                self._error_carga = RuntimeError('; '.join(errores))
+        finally:
+            self._listo.set()
+        while True:
+            item = self._cola.get()
+            if item is None:
+                return
+            pcm, fs, fut = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            if self._error_carga is not None:
+                fut.set_exception(RuntimeError(f'No se pudo cargar ningún motor de voz ({self._error_carga})'))
+                continue
+            try:
+                fut.set_result(self.motor.transcribir(pcm, fs))
+            except BaseException as e:
+                fut.set_exception(e)
+
+
+_transcriptor: Optional[TranscriptorWorker] = None
+_transcriptor_lock = threading.Lock()
+
+
+def obtener_transcriptor(preferido: Optional[str] = None) -> Optional[TranscriptorWorker]:
+    """Worker compartido del proceso (el modelo se carga una sola vez). None si no hay motor.
+
+    Un worker en el que no cargó ningún motor se descarta y se vuelve a intentar en el
+    siguiente pedido (por ejemplo, después de instalar o descargar un modelo).
+    """
+    global _transcriptor
+    with _transcriptor_lock:
+        if _transcriptor is not None and _transcriptor.fallido:
+            _transcriptor.cerrar()
+            _transcriptor = None
+        if _transcriptor is None:
+            motores = crear_motores(preferido)
+            if not motores:
+                return None
+            _transcriptor = TranscriptorWorker(motores[0], motores[1:])
+        return _transcriptor
@@ -0,0 +1,341 @@
+"""Perfil compacto de archivos tabulares (CSV / Excel) para pasarle al modelo.
+
+Volcar el DataFrame entero como texto (df.to_string) y cortarlo a 5000 caracteres
+gastaba memoria y CPU en formatear millones de filas, y el modelo veía sólo las primeras.
+En su lugar el archivo se lee por bloques y cada columna acumula, con operaciones
+vectorizadas de pandas/NumPy:
+
+  tipo, % de nulos, valores inválidos, distintos, min/max, media ± desvío, cuantiles
+  (sobre una muestra uniforme), categorías más frecuentes, y unas filas de ejemplo.
+
+El texto resultante ocupa unos cientos de tokens aunque el archivo tenga millones de
+filas; la memoria queda acotada por el tamaño de bloque y de la muestra.
+
+  perfil = perfilar('ventas.csv')
+  perfil.texto()      # lo que recibe el modelo
+
+Requiere pandas (y openpyxl para .xlsx).
+"""
+
+import os
+import re
+import time
+import warnings
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import numpy as np
+    import pandas as pd
+except Exception:  # librería opcional: sin pandas no hay perfil
+    np = None  # type: ignore
+    pd = None  # type: ignore
+
+FILAS_POR_BLOQUE = 200_000
+TAMANO_MUESTRA = 20_000     # valores por columna para los cuantiles
+MAX_CATEGORIAS = 50_000     # conteos exactos hasta acá; después se aproxima con los más frecuentes
+TOP_CATEGORIAS = 5
+FILAS_EJEMPLO = 3
+MAX_COLUMNAS = 30           # en el texto; el resto se nombra al final
+COLUMNAS_EJEMPLO = 8        # columnas que se muestran en las filas de ejemplo
+_LARGO_VALOR = 30
+
+_CUANTILES = (0.25, 0.5, 0.75)
+_SEPARADORES = (',', ';', '\t', '|')
+_DEC_COMA = re.compile(r'\d,\d')
+_DEC_PUNTO = re.compile(r'\d\.\d')
+
+NUMERICO = 'numérico'
+FECHA = 'fecha'
+TEXTO = 'texto'
+BOOLEANO = 'booleano'
+VACIA = 'vacía'
+
+
+def disponible() -> bool:
+    return pd is not None
+
+
+def _corto(valor, largo: int = _LARGO_VALOR) -> str:
+    texto = str(valor).replace('\n', ' ')
+    return texto if len(texto) <= largo else texto[:largo - 1] + '…'
+
+
+def _num(valor: float) -> str:
+    if valor is None or valor != valor:
+        return '-'
+    if abs(valor) >= 1e15 or (valor and abs(valor) < 1e-3):
+        return f'{valor:.3g}'
+    if float(valor).is_integer() or abs(valor) >= 1e4:
+        return f'{round(valor):,}'
+    return f'{valor:.4g}'
+
+
+class _Muestra:
+    """Muestra uniforme sin reemplazo de tamaño fijo sobre un flujo (claves aleatorias, se quedan las k menores)."""
+
+    def __init__(self, k: int, rng):
+        self.k = k
+        self._rng = rng
+        self._claves = np.empty(0)
+        self.valores = np.empty(0)
+
+    def agregar(self, valores) -> None:
+        if not len(valores):
+            return
+        claves = np.concatenate([self._claves, self._rng.random(len(valores))])
+        todos = np.concatenate([self.valores, valores])
+        if len(claves) > self.k:
+            elegidos = np.argpartition(claves, self.k)[:self.k]
+            claves, todos = claves[elegidos], todos[elegidos]
+        self._claves, self.valores = claves, todos
+
+
+class PerfilColumna:
+    """Acumulador de una columna; el tipo se fija con el primer bloque que trae valores."""
+
+    def __init__(self, nombre: str, rng, muestra: int = TAMANO_MUESTRA):
+        self.nombre = nombre
+        self.tipo = VACIA
+        self.entero = False
+        self.filas = 0
+        self.nulos = 0
+        self.invalidos = 0   # presentes pero no convertibles al tipo de la columna
+        self.minimo = None
+        self.maximo = None
+        self.media = 0.0
+        self._m2 = 0.0
+        self._n = 0
+        self.muestra = _Muestra(muestra, rng)
+        self.conteos = None  # pd.Series valor -> apariciones (texto y booleanos)
+        self.aproximado = False
+
+    # --- acumulación por bloque ---
+    def agregar(self, serie) -> None:
+        self.filas += len(serie)
+        presentes = serie.notna()
+        self.nulos += int(len(serie) - presentes.sum())
+        if self.tipo == VACIA:
+            if not presentes.any():
+                return
+            self.tipo = self._inferir(serie[presentes])
+        if self.tipo == NUMERICO:
+            self._agregar_numeros(serie, presentes)
+        elif self.tipo == FECHA:
+            self._agregar_fechas(serie, presentes)
+        else:
+            self._agregar_categorias(serie[presentes])
+
+    @staticmethod
+    def _inferir(valores) -> str:
+        if pd.api.types.is_bool_dtype(valores):
+            return BOOLEANO
+        if pd.api.types.is_numeric_dtype(valores):
+            return NUMERICO
+        if pd.api.types.is_datetime64_any_dtype(valores):
+            return FECHA
+        muestra = valores.iloc[:200]
+        if pd.to_numeric(muestra, errors='coerce').notna().mean() >= 0.9:
+            return NUMERICO
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # "no se pudo inferir el formato": se prueba igual
+            fechas = pd.to_datetime(muestra.astype(str), errors='coerce')
+        if fechas.notna().mean() >= 0.9 and muestra.astype(str).str.contains(r'\d[-/]\d', regex=True).mean() >= 0.9:
+            return FECHA
+        return TEXTO
+
+    def _agregar_numeros(self, serie, presentes) -> None:
+        if not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+            serie = pd.to_numeric(serie, errors='coerce')
+            self.invalidos += int((presentes & serie.isna()).sum())
+        valores = serie.to_numpy(dtype='float64', na_value=np.nan)
+        valores = valores[~np.isnan(valores)]
+        if not len(valores):
+            return
+        # Un entero con nulos llega como float: cuenta si todos los valores son enteros
+        entero = pd.api.types.is_integer_dtype(serie) or bool(np.all(np.mod(valores, 1) == 0))
+        self.entero = entero if self._n == 0 else self.entero and entero
+        minimo, maximo = float(valores.min()), float(valores.max())
+        self.minimo = minimo if self.minimo is None else min(self.minimo, minimo)
+        self.maximo = maximo if self.maximo is None else max(self.maximo, maximo)
+        # Media y varianza combinando bloques (Chan et al.): estable aunque haya millones
+        n_b = len(valores)
+        media_b = float(valores.mean())
+        m2_b = float(((valores - media_b) ** 2).sum())
+        n = self._n + n_b
+        delta = media_b - self.media
+        self.media += delta * n_b / n
+        self._m2 += m2_b + delta * delta * self._n * n_b / n
+        self._n = n
+        self.muestra.agregar(valores)
+
+    def _agregar_fechas(self, serie, presentes) -> None:
+        if not pd.api.types.is_datetime64_any_dtype(serie):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                serie = pd.to_datetime(serie.astype(str).where(presentes), errors='coerce')
+            self.invalidos += int((presentes & serie.isna()).sum())
+        validas = serie.dropna()
+        if validas.empty:
+            return
+        self._n += len(validas)
+        minimo, maximo = validas.min(), validas.max()
+        self.minimo = minimo if self.minimo is None else min(self.minimo, minimo)
+        self.maximo = maximo if self.maximo is None else max(self.maximo, maximo)
+
+    def _agregar_categorias(self, valores) -> None:
+        self._n += len(valores)
+        conteos = valores.value_counts(sort=False)
+        self.conteos = conteos if self.conteos is None else self.conteos.add(conteos, fill_value=0)
+        if len(self.conteos) > MAX_CATEGORIAS:
+            # Alta cardinalidad (ids, textos libres): quedan los más frecuentes, conteos aproximados
+            self.conteos = self.conteos.nlargest(MAX_CATEGORIAS // 2)
+            self.aproximado = True
+
+    # --- resultados ---
+    @property
+    def desvio(self) -> float:
+        return (self._m2 / (self._n - 1)) ** 0.5 if self._n > 1 else 0.0
+
+    def cuantiles(self) -> Dict[float, float]:
+        if not len(self.muestra.valores):
+            return {}
+        return dict(zip(_CUANTILES, np.quantile(self.muestra.valores, _CUANTILES).tolist()))
+
+    def distintos(self) -> Optional[int]:
+        """Cantidad de valores distintos (None si no se lleva la cuenta o se aproximó)."""
+        if self.conteos is None or self.aproximado:
+            return None
+        return int(len(self.conteos))
+
+    def top(self, n: int = TOP_CATEGORIAS) -> List[tuple]:
+        if self.conteos is None or not len(self.conteos):
+            return []
+        return [(valor, int(c)) for valor, c in self.conteos.nlargest(n).items()]
+
+    def resumen(self) -> str:
+        nulos = 100 * self.nulos / self.filas if self.filas else 0
+        partes = [f'{self.tipo}{", entero" if self.tipo == NUMERICO and self.entero else ""}',
+                  f'{nulos:.3g}% nulos']
+        if self.invalidos:
+            partes.append(f'{self.invalidos:,} valores no válidos')
+        distintos = self.distintos()
+        if distintos is not None:
+            partes.append(f'{distintos:,} distintos')
+        elif self.aproximado:
+            partes.append(f'más de {MAX_CATEGORIAS:,} distintos')
+        cabecera = f'- {_corto(self.nombre, 40)} ({", ".join(partes)})'
+        if self.tipo == NUMERICO and self.minimo is not None:
+            q = self.cuantiles()
+            detalle = (f'min {_num(self.minimo)} · p25 {_num(q.get(0.25))} · mediana {_num(q.get(0.5))} · '
+                       f'p75 {_num(q.get(0.75))} · max {_num(self.maximo)} · media {_num(self.media)} ± {_num(self.desvio)}')
+        elif self.tipo == FECHA and self.minimo is not None:
+            detalle = f'{self.minimo} → {self.maximo}'
+        elif self.tipo in (TEXTO, BOOLEANO) and self._n:
+            aprox = '~' if self.aproximado else ''
+            detalle = ' · '.join(f'{_corto(v)} {aprox}{100 * c / self._n:.3g}%' for v, c in self.top())
+        else:
+            detalle = ''
+        return f'{cabecera}: {detalle}' if detalle else cabecera
+
+
+class PerfilTabla:
+    def __init__(self, nombre: str, columnas: List[PerfilColumna], ejemplo, filas: int, segundos: float,
+                 nota: str = ''):
+        self.nombre = nombre
+        self.columnas = columnas
+        self.ejemplo = ejemplo
+        self.filas = filas
+        self.segundos = segundos
+        self.nota = nota
+
+    def texto(self, max_columnas: int = MAX_COLUMNAS) -> str:
+        """Perfil para el prompt: unos cientos de tokens sin importar el tamaño del archivo."""
+        lineas = [f'Tabla {self.nombre}{self.nota}: {self.filas:,} filas × {len(self.columnas)} columnas '
+                  f'(estadísticas sobre todas las filas; cuantiles sobre una muestra de hasta {TAMANO_MUESTRA:,} valores)']
+        lineas += [c.resumen() for c in self.columnas[:max_columnas]]
+        resto = self.columnas[max_columnas:]
+        if resto:
+            lineas.append(f'- … y {len(resto)} columnas más: ' + ', '.join(_corto(c.nombre, 20) for c in resto))
+        if self.ejemplo is not None and len(self.ejemplo):
+            k = min(max_columnas, COLUMNAS_EJEMPLO)
+            ejemplo = self.ejemplo.iloc[:, :k]
+            filas = ejemplo.astype(object).where(ejemplo.notna(), '')
+            lineas.append('Filas de ejemplo (al azar):')
+            lineas.append(' | '.join(_corto(c.nombre, 20) for c in self.columnas[:k]))
+            for fila in filas.itertuples(index=False):
+                lineas.append(' | '.join(_corto(v, 20) for v in fila))
+        return '\n'.join(lineas)
+
+
+def _opciones_csv(ruta: str) -> dict:
+    """Separador y separador decimal mirando el comienzo del archivo (el motor C no adivina)."""
+    with open(ruta, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+        inicio = f.read(64 * 1024)
+    # El encabezado casi nunca trae números con coma decimal, que confundirían el conteo
+    encabezado = inicio.split('\n', 1)[0]
+    conteos = {d: encabezado.count(d) for d in _SEPARADORES}
+    sep = max(conteos, key=conteos.get) if any(conteos.values()) else ','
+    opciones = {'sep': sep}
+    # Exportaciones de Excel en español: 'a;b;1,5'
+    if sep != ',' and len(_DEC_COMA.findall(inicio)) > len(_DEC_PUNTO.findall(inicio)):
+        opciones['decimal'] = ','
+    return opciones
+
+
+def _bloques_csv(ruta: str, filas_por_bloque: int) -> Iterator:
+    # on_bad_lines reemplaza a error_bad_lines (quitado en pandas 2.0): las filas mal formadas se saltean
+    return pd.read_csv(ruta, chunksize=filas_por_bloque, encoding='utf-8-sig', encoding_errors='replace',
+                       on_bad_lines='skip', **_opciones_csv(ruta))
+
+
+def _bloques_excel(libro, filas_por_bloque: int, hoja=0):
+    # read_excel no lee por partes: se carga la hoja (Excel tiene a lo sumo ~1M de filas) y se recorre en bloques
+    df = pd.read_excel(libro, sheet_name=hoja)
+    for inicio in range(0, max(len(df), 1), filas_por_bloque):
+        yield df.iloc[inicio:inicio + filas_por_bloque]
+
+
+def perfilar_bloques(bloques, nombre: str = 'tabla', muestra: int = TAMANO_MUESTRA,
+                     filas_ejemplo: int = FILAS_EJEMPLO, semilla: int = 0, nota: str = '') -> PerfilTabla:
+    """Perfil de una secuencia de DataFrames con las mismas columnas (bloques de un archivo)."""
+    if pd is None:
+        raise RuntimeError('Para perfilar tablas hace falta pandas (pip install pandas)')
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(semilla)
+    columnas: Dict[str, PerfilColumna] = {}
+    ejemplo = None
+    claves_ejemplo = np.empty(0)
+    filas = 0
+    for bloque in bloques:
+        for nombre_col in bloque.columns:
+            if nombre_col not in columnas:
+                columnas[nombre_col] = PerfilColumna(str(nombre_col), rng, muestra)
+            columnas[nombre_col].agregar(bloque[nombre_col])
+        filas += len(bloque)
+        if filas_ejemplo and len(bloque):
+            # Filas al azar de todo el archivo con el mismo muestreo por claves que los valores
+            claves = np.concatenate([claves_ejemplo, rng.random(len(bloque))])
+            candidatas = bloque if ejemplo is None else pd.concat([ejemplo, bloque], ignore_index=True)
+            if len(claves) > filas_ejemplo:
+                elegidas = np.sort(np.argpartition(claves, filas_ejemplo)[:filas_ejemplo])
+                claves, candidatas = claves[elegidas], candidatas.iloc[elegidas]
+            claves_ejemplo, ejemplo = claves, candidatas.reset_index(drop=True)
+    for columna in columnas.values():
+        # Columnas que faltaban en algún bloque cuentan esas filas como nulas
+        columna.nulos += filas - columna.filas
+        columna.filas = filas
+    return PerfilTabla(nombre, list(columnas.values()), ejemplo, filas, time.perf_counter() - t0, nota)
+
+
+def perfilar(ruta: str, filas_por_bloque: int = FILAS_POR_BLOQUE, **opciones) -> PerfilTabla:
+    """Perfil de un .csv o .xlsx leído por bloques (ver perfilar_bloques)."""
+    if pd is None:
+        raise RuntimeError('Para perfilar tablas hace falta pandas (pip install pandas)')
+    nombre = os.path.basename(ruta)
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext in ('.xlsx', '.xlsm', '.xls'):
+        with pd.ExcelFile(ruta) as libro:
+            hojas = libro.sheet_names
+            nota = f' (hoja "{hojas[0]}" de {len(hojas)})' if len(hojas) > 1 else ''
+            return perfilar_bloques(_bloques_excel(libro, filas_por_bloque), nombre, nota=nota, **opciones)
+    return perfilar_bloques(_bloques_csv(ruta, filas_por_bloque), nombre, **opciones)
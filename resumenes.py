@@ -0,0 +1,156 @@
+"""Resumen incremental de conversaciones largas.
+
+En vez de mandar todo el historial al modelo (que con n_ctx=4096 termina desbordando),
+el prompt queda como:
+
+  prompt de sistema + resumen de lo viejo + últimos turnos tal cual
+
+El resumen vive en la tabla `resumenes` junto con una marca de agua: el id del último
+mensaje que ya cubre. Cuando la cola sin resumir supera `umbral_tokens`, un hilo en
+segundo plano pliega los turnos más viejos de esa cola en el resumen (le pasa al modelo
+sólo el resumen anterior y ese tramo nuevo) y avanza la marca. Así cada actualización
+cuesta lo mismo sin importar cuán larga sea la conversación.
+
+Uso:
+  resumidor = Resumidor(agente)
+  historial = resumidor.historial(conversacion_id)   # para generar la respuesta
+  ...
+  resumidor.agendar(conversacion_id)                  # después de guardar la respuesta
+  resumidor.cerrar()                                  # antes de agente.cerrar()
+"""
+
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import telemetria
+
+# Firma de la función que resume: (resumen anterior o None, [(remitente, contenido)], cancel_event)
+# -> resumen nuevo, o None si no se pudo (sin modelo, cancelado).
+FuncionResumir = Callable[[Optional[str], List[Tuple[str, str]], threading.Event], Optional[str]]
+
+_INSTRUCCION = ('Actualizá el resumen de una conversación entre Facu y su asistente. Conservá datos, '
+                'decisiones, pedidos pendientes y nombres propios; descartá saludos y relleno. '
+                'Respondé sólo con el resumen, en español y en menos de 200 palabras.')
+
+
+def estimar_tokens(texto: str) -> int:
+    """Aproximación barata (≈4 caracteres por token en español) sin tocar el tokenizador."""
+    return (len(texto) + 3) // 4
+
+
+def resumir_con_modelo(resumen: Optional[str], mensajes: List[Tuple[str, str]],
+                       cancel_event: threading.Event, max_tokens: int = 320) -> Optional[str]:
+    """Resume con el modelo local. Sin modelo devuelve None (la respuesta demo no es un resumen)."""
+    import llama_local_helper as llh
+    if not llh.modelo_disponible():
+        return None
+    tramo = '\n'.join(f'{remitente}: {contenido}' for remitente, contenido in mensajes)
+    pedido = f'{_INSTRUCCION}\n\nResumen anterior:\n{resumen or "(vacío)"}\n\nMensajes nuevos:\n{tramo}'
+    uso = llh.UsoGeneracion()
+    texto = ''.join(llh.generar_deltas([{'role': 'user', 'content': pedido}], max_tokens=max_tokens,
+                                       cancel_event=cancel_event, uso=uso)).strip()
+    if uso.finish_reason in ('cancelado', 'error') or not texto:
+        return None
+    return texto
+
+
+class Resumidor:
+    """Mantiene el resumen de cada conversación y arma historiales acotados para el modelo.
+
+    - umbral_tokens: tamaño de la cola sin resumir a partir del cual se pliega.
+    - conservar_tokens: cuánto de lo más reciente queda siempre fuera del resumen
+      (al menos `conservar_mensajes` mensajes), para que el modelo vea los turnos textuales.
+    """
+
+    def __init__(self, agente, resumir: Optional[FuncionResumir] = None, umbral_tokens: int = 1500,
+                 conservar_tokens: int = 500, conservar_mensajes: int = 4):
+        self.agente = agente
+        self.resumir = resumir or resumir_con_modelo
+        self.umbral_tokens = umbral_tokens
+        self.conservar_tokens = conservar_tokens
+        self.conservar_mensajes = conservar_mensajes
+        self._lock = threading.Lock()
+        self._pendientes: Set[int] = set()
+        self._hay_trabajo = threading.Event()
+        self._cerrando = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    # --- Historial para el modelo ---
+    def historial(self, conversacion_id: int) -> List[Dict[str, str]]:
+        """Resumen (como mensaje de sistema) + mensajes posteriores a la marca de agua."""
+        resumen, hasta = self.agente.obtener_resumen(conversacion_id)
+        cola = self.agente.listar_mensajes_desde(conversacion_id, hasta)
+        historial = [{'role': 'user' if r == 'Usuario' else 'assistant', 'content': c} for _id, r, c in cola]
+        if resumen:
+            historial.insert(0, {'role': 'system', 'content': f'Resumen de la conversación hasta ahora:\n{resumen}'})
+        return historial
+
+    # --- Plegado ---
+    def _tramo_a_plegar(self, cola: List[Tuple[int, str, str]]) -> List[Tuple[int, str, str]]:
+        """Los mensajes más viejos de la cola, dejando afuera lo reciente (vacío si no hace falta)."""
+        tokens = [estimar_tokens(c) for _id, _r, c in cola]
+        if sum(tokens) <= self.umbral_tokens:
+            return []
+        recientes = 0
+        corte = len(cola)
+        while corte > 0 and (len(cola) - corte < self.conservar_mensajes
+                             or recientes + tokens[corte - 1] <= self.conservar_tokens):
+            corte -= 1
+            recientes += tokens[corte]
+        return cola[:corte]
+
+    def actualizar(self, conversacion_id: int) -> bool:
+        """Pliega la cola en el resumen si pasó el umbral. True si el resumen avanzó."""
+        resumen, hasta = self.agente.obtener_resumen(conversacion_id)
+        tramo = self._tramo_a_plegar(self.agente.listar_mensajes_desde(conversacion_id, hasta))
+        if not tramo:
+            return False
+        with telemetria.medir('resumen_plegar'):
+            nuevo = self.resumir(resumen, [(r, c) for _id, r, c in tramo], self._cerrando)
+        if not nuevo or self._cerrando.is_set():
+            return False
+        telemetria.contar('resumen_mensajes_plegados', len(tramo))
+        # Si otro hilo ya avanzó la marca, guardar_resumen no pisa el más nuevo
+        return self.agente.guardar_resumen(conversacion_id, nuevo, tramo[-1][0])
+
+    # --- Segundo plano ---
+    def agendar(self, conversacion_id: int) -> None:
+        """Revisa la conversación en el hilo del resumidor (no bloquea al llamador)."""
+        if self._cerrando.is_set():
+            return
+        with self._lock:
+            self._pendientes.add(conversacion_id)
+            self._hay_trabajo.set()
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._loop, name='resumidor', daemon=True)
+                self._hilo.start()
+
+    def _loop(self):
+        while not self._cerrando.is_set():
+            with self._lock:
+                if not self._pendientes:
+                    # Sin trabajo: el hilo termina y se recrea en el próximo agendar()
+                    self._hay_trabajo.clear()
+                    self._hilo = None
+                    return
+                conversacion_id = self._pendientes.pop()
+            try:
+                self.actualizar(conversacion_id)
+            except Exception:
+                # Conversación borrada o base cerrada: se reintenta en el próximo turno
+                pass
+
+    def esperar(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se procese lo agendado (útil en tests y scripts)."""
+        hilo = self._hilo
+        if hilo is not None:
+            hilo.join(timeout)
+            return not hilo.is_alive()
+        return True
+
+    def cerrar(self, timeout: float = 5.0) -> None:
+        """Corta el resumen en curso (la generación se cancela) y descarta lo pendiente."""
+        self._cerrando.set()
+        hilo = self._hilo
+        if hilo is not None and hilo is not threading.current_thread():
+            hilo.join(timeout)
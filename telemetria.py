@@ -0,0 +1,235 @@
+"""Telemetría liviana: contadores y tiempos de los caminos calientes (modelo, base, UI).
+
+Uso:
+  import telemetria
+  with telemetria.medir('db_listar_mensajes'):
+      ...
+  telemetria.observar('llm_ttft', segundos)
+  telemetria.contar('llm_tokens_generados', n)
+  telemetria.resumen()                 # dict con n, suma, p50, p95, max por métrica
+
+Cada observación cuesta un perf_counter y un append bajo lock. Las distribuciones
+guardan las últimas N muestras (percentiles) además de totales acumulados.
+
+Persistencia opcional (un hilo vuelca cada `intervalo` segundos, nunca en el camino caliente):
+  telemetria.iniciar_volcado(archivo='metricas.jsonl', prometheus='metricas.prom')
+  - archivo: JSON Lines rotativo (RotatingFileHandler) con las observaciones crudas
+  - prometheus: texto en formato de exposición de Prometheus (para node_exporter
+    textfile collector o para leerlo a mano)
+
+AGENTE_TELEMETRIA=0 desactiva todo (las funciones quedan como no-op).
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+_MUESTRAS = 2048          # muestras recientes por métrica para los percentiles
+_PENDIENTES_MAX = 50000   # observaciones sin volcar al archivo (las más viejas se descartan)
+
+activa = os.environ.get('AGENTE_TELEMETRIA', '1') != '0'
+
+
+class _Distribucion:
+    __slots__ = ('n', 'suma', 'maximo', 'muestras')
+
+    def __init__(self):
+        self.n = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self.muestras: Deque[float] = deque(maxlen=_MUESTRAS)
+
+    def agregar(self, valor: float):
+        self.n += 1
+        self.suma += valor
+        if valor > self.maximo:
+            self.maximo = valor
+        self.muestras.append(valor)
+
+    def percentil(self, q: float) -> float:
+        if not self.muestras:
+            return 0.0
+        orden = sorted(self.muestras)
+        return orden[min(len(orden) - 1, int(round(q * (len(orden) - 1))))]
+
+
+_lock = threading.Lock()
+_contadores: Dict[str, float] = {}
+_distribuciones: Dict[str, _Distribucion] = {}
+_pendientes: Deque[Tuple[float, str, float]] = deque(maxlen=_PENDIENTES_MAX)
+_volcador: Optional['_Volcador'] = None
+
+
+def contar(nombre: str, n: float = 1) -> None:
+    if not activa:
+        return
+    with _lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + n
+
+
+def observar(nombre: str, valor: float) -> None:
+    """Registra una observación (en segundos para los tiempos)."""
+    if not activa:
+        return
+    with _lock:
+        dist = _distribuciones.get(nombre)
+        if dist is None:
+            dist = _distribuciones[nombre] = _Distribucion()
+        dist.agregar(valor)
+        if _volcador is not None:
+            _pendientes.append((time.time(), nombre, valor))
+
+
+@contextmanager
+def medir(nombre: str):
+    """Cronometra el bloque y lo registra en `nombre` (también si termina con excepción)."""
+    if not activa:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nombre, time.perf_counter() - t0)
+
+
+def resumen() -> Dict[str, Dict[str, float]]:
+    """Estado actual: contadores como {'total': x}; distribuciones con n/suma/media/p50/p95/max."""
+    with _lock:
+        res: Dict[str, Dict[str, float]] = {nombre: {'total': v} for nombre, v in _contadores.items()}
+        for nombre, d in _distribuciones.items():
+            res[nombre] = {
+                'n': d.n,
+                'suma': d.suma,
+                'media': d.suma / d.n if d.n else 0.0,
+                'p50': d.percentil(0.5),
+                'p95': d.percentil(0.95),
+                'max': d.maximo,
+            }
+    return dict(sorted(res.items()))
+
+
+def percentiles(valores: Sequence[float]) -> Dict[str, float]:
+    """Resumen de una serie de duraciones en segundos (benchmarks): n, p50/p95/p99, máximo y media en ms."""
+    if not valores:
+        return {'n': 0}
+    orden = sorted(valores)
+
+    def p(q):
+        return orden[min(len(orden) - 1, int(round(q * (len(orden) - 1))))]
+
+    return {
+        'n': len(orden),
+        'p50_ms': round(statistics.median(orden) * 1000, 3),
+        'p95_ms': round(p(0.95) * 1000, 3),
+        'p99_ms': round(p(0.99) * 1000, 3),
+        'max_ms': round(orden[-1] * 1000, 3),
+        'media_ms': round(statistics.fmean(orden) * 1000, 3),
+    }
+
+
+def reiniciar() -> None:
+    with _lock:
+        _contadores.clear()
+        _distribuciones.clear()
+        _pendientes.clear()
+
+
+def _nombre_prometheus(nombre: str) -> str:
+    limpio = ''.join(c if c.isalnum() or c == '_' else '_' for c in nombre)
+    return 'agente_' + limpio
+
+
+def formato_prometheus() -> str:
+    """Métricas en formato de texto de Prometheus (contadores y summaries)."""
+    lineas: List[str] = []
+    for nombre, datos in resumen().items():
+        prom = _nombre_prometheus(nombre)
+        if 'total' in datos:
+            lineas.append(f'# TYPE {prom}_total counter')
+            lineas.append(f'{prom}_total {datos["total"]:g}')
+        else:
+            lineas.append(f'# TYPE {prom} summary')
+            lineas.append(f'{prom}{{quantile="0.5"}} {datos["p50"]:.6g}')
+            lineas.append(f'{prom}{{quantile="0.95"}} {datos["p95"]:.6g}')
+            lineas.append(f'{prom}_sum {datos["suma"]:.6g}')
+            lineas.append(f'{prom}_count {datos["n"]}')
+    return '\n'.join(lineas) + '\n'
+
+
+def exportar_prometheus(ruta: str) -> None:
+    """Escribe formato_prometheus() en `ruta` de forma atómica (nunca queda a medias)."""
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(formato_prometheus())
+    os.replace(tmp, ruta)
+
+
+class _Volcador(threading.Thread):
+    def __init__(self, archivo: Optional[str], prometheus: Optional[str], intervalo: float,
+                 max_bytes: int, respaldos: int):
+        super().__init__(name='telemetria', daemon=True)
+        self.prometheus = prometheus
+        self.intervalo = intervalo
+        self.detener = threading.Event()
+        self.log: Optional[logging.Logger] = None
+        if archivo:
+            handler = logging.handlers.RotatingFileHandler(archivo, maxBytes=max_bytes, backupCount=respaldos,
+                                                           encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.log = logging.getLogger(f'telemetria.{id(self)}')
+            self.log.propagate = False
+            self.log.setLevel(logging.INFO)
+            self.log.addHandler(handler)
+
+    def volcar(self):
+        with _lock:
+            lote = list(_pendientes)
+            _pendientes.clear()
+        if self.log is not None and lote:
+            for ts, nombre, valor in lote:
+                self.log.info(json.dumps({'ts': round(ts, 3), 'metrica': nombre, 'valor': valor}))
+        if self.prometheus:
+            exportar_prometheus(self.prometheus)
+
+    def run(self):
+        while not self.detener.wait(self.intervalo):
+            try:
+                self.volcar()
+            except Exception:
+                pass  # disco lleno o sin permisos: la app sigue igual
+        self.volcar()
+        if self.log is not None:
+            for h in list(self.log.handlers):
+                h.close()
+                self.log.removeHandler(h)
+
+
+def iniciar_volcado(archivo: Optional[str] = None, prometheus: Optional[str] = None, intervalo: float = 10.0,
+                    max_bytes: int = 5 * 1024 * 1024, respaldos: int = 3) -> None:
+    """Arranca (o reemplaza) el hilo que persiste las métricas cada `intervalo` segundos."""
+    global _volcador
+    detener_volcado()
+    if not activa or not (archivo or prometheus):
+        return
+    volcador = _Volcador(archivo, prometheus, intervalo, max_bytes, respaldos)
+    with _lock:
+        _volcador = volcador
+    volcador.start()
+
+
+def detener_volcado(timeout: float = 5.0) -> None:
+    """Detiene el volcado periódico haciendo un último volcado."""
+    global _volcador
+    with _lock:
+        volcador, _volcador = _volcador, None
+    if volcador is not None:
+        volcador.detener.set()
+        volcador.join(timeout)
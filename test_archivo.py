@@ -0,0 +1,117 @@
+# test_archivo.py
+# Archivo de conversaciones inactivas en bases adjuntas a demanda
+
+import os
+import sys
+
+import pytest
+
+from agente_personal import AgentePersonal
+
+
+def _envejecer(ag, cid, fecha):
+    ag.conn.execute('UPDATE mensajes SET fecha = ? WHERE conversacion_id = ?', (fecha, cid))
+    ag.conn.commit()
+
+
+def _chat(ag, pid, nombre, n, fecha=None):
+    cid = ag.crear_conversacion(nombre, pid)
+    for i in range(n):
+        ag.agregar_mensaje(cid, 'Usuario' if i % 2 == 0 else 'Agente', f'{nombre} mensaje {i}')
+    if fecha:
+        _envejecer(ag, cid, fecha)
+    return cid
+
+
+def test_archivar_por_anio_y_leer_transparente(ag, tmp_path):
+    pid = ag.crear_proyecto('P')
+    viejo = _chat(ag, pid, 'viejo', 5, '2020-03-01 10:00:00')
+    otro = _chat(ag, None, 'otro', 3, '2021-07-01 10:00:00')
+    nuevo = _chat(ag, pid, 'nuevo', 4)
+    esperado = ag.listar_mensajes(viejo)
+
+    informe = ag.archivar_inactivas(dias=30, pausa=0)
+    assert informe == {'conversaciones': 2, 'mensajes': 8}
+    assert ag.conversacion_archivada(viejo) == 'anio_2020.db'
+    assert ag.conversacion_archivada(otro) == 'anio_2021.db'
+    assert ag.conversacion_archivada(nuevo) is None
+    assert sorted(os.listdir(ag.dir_archivo)) == ['anio_2020.db', 'anio_2021.db']
+    # La base principal sólo conserva el historial vivo
+    assert ag.conn.execute('SELECT COUNT(*) FROM main.mensajes').fetchone()[0] == 4
+    # Las lecturas caen al archivo sin que el llamador se entere
+    assert ag.listar_mensajes(viejo) == esperado
+    assert ag.contar_mensajes(otro) == 3
+    assert [c for c, _ in ag.listar_conversaciones(pid)] == [viejo, nuevo]
+    assert {r[1] for r in ag.buscar_mensajes('mensaje 2')} == {viejo, otro, nuevo}
+    assert ag.buscar_mensajes('mensaje 2', incluir_archivo=False)[0][1] == nuevo
+    # Idempotente
+    assert ag.archivar_inactivas(dias=30, pausa=0)['conversaciones'] == 0
+
+
+def test_sobrevive_reapertura_y_reactivacion(tmp_path):
+    ruta = str(tmp_path / 'b.db')
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False)
+    pid = ag.crear_proyecto('P')
+    cid = _chat(ag, pid, 'c', 3, '2019-01-01 00:00:00')
+    ag.archivar_inactivas(dias=1, por='proyecto', pausa=0)
+    assert ag.conversacion_archivada(cid) == f'proyecto_{pid}.db'
+    ag.cerrar()
+
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False)
+    assert ag.conversacion_archivada(cid) == f'proyecto_{pid}.db'
+    assert len(ag.listar_mensajes(cid)) == 3
+    # Escribir en una conversación archivada la devuelve a la base principal
+    ag.agregar_mensaje(cid, 'Usuario', 'volví')
+    assert ag.conversacion_archivada(cid) is None
+    assert [c for _, c in ag.listar_mensajes(cid)][-1] == 'volví'
+    assert ag.conn.execute('SELECT COUNT(*) FROM main.mensajes WHERE conversacion_id = ?', (cid,)).fetchone()[0] == 4
+    ag.cerrar()
+
+
+def test_purga_borra_del_archivo(ag):
+    pid = ag.crear_proyecto('P')
+    cid = _chat(ag, pid, 'c', 6, '2018-05-05 00:00:00')
+    cid2 = _chat(ag, None, 'libre', 2, '2018-06-06 00:00:00')
+    ag.archivar_inactivas(dias=1, pausa=0)
+    ag.eliminar_proyecto(pid)
+    ag.eliminar_chat(cid2)
+    assert ag.purgar_eliminados(lote=2, pausa=0) >= 8
+    assert not ag.purga_pendiente()
+    esquema = ag._adjuntar('anio_2018.db')
+    assert ag.conn.execute(f'SELECT COUNT(*) FROM {esquema}.mensajes').fetchone()[0] == 0
+    assert ag.conversacion_archivada(cid) is None
+
+
+def test_busqueda_y_compresion_en_el_archivo(ag):
+    cid = ag.crear_conversacion('vieja', None)
+    largo = 'Informe anual: ' + ' '.join(f'renglón {i} con ventas en Córdoba' for i in range(300))
+    # Filas de antes de la compresión, en texto plano
+    ag.conn.executemany("INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) VALUES (?, 'Agente', 'texto', ?)",
+                        [(cid, f'{largo} #{i}') for i in range(3)])
+    ag.conn.commit()
+    _envejecer(ag, cid, '2019-02-02 00:00:00')
+    ag.archivar_inactivas(dias=1, pausa=0)
+    informe = ag.comprimir_mensajes_existentes(lote=2, pausa=0)
+    assert informe['comprimidas'] == 3
+    esquema = ag._adjuntar('anio_2019.db')
+    assert ag.conn.execute(f"SELECT COUNT(*) FROM {esquema}.mensajes WHERE typeof(contenido) = 'blob'").fetchone()[0] == 3
+    assert [c for _, c in ag.listar_mensajes(cid)] == [f'{largo} #{i}' for i in range(3)]
+    # El archivo tiene su propio índice: comprimir no cambió el texto, no hay nada que reindexar
+    ag.indexar_busqueda_pendiente(pausa=0)
+    assert ag.conn.execute(f'SELECT COUNT(*) FROM {esquema}.busqueda_cola').fetchone()[0] == 0
+    assert ag.conn.execute(f"SELECT COUNT(*) FROM {esquema}.mensajes_busqueda "
+                           "WHERE mensajes_busqueda MATCH '\"CÓRDOBA\"'").fetchone()[0] == 3
+    assert [r[3][-2:] for r in ag.buscar_mensajes('VENTAS EN CÓRDOBA')] == ['#2', '#1', '#0']
+
+
+def test_lru_de_adjuntos(ag):
+    cids = [_chat(ag, None, f'c{i}', 1, f'{2010 + i}-01-01 00:00:00') for i in range(7)]
+    ag.archivar_inactivas(dias=1, pausa=0)
+    for cid in cids:
+        assert ag.listar_mensajes(cid) == [('Usuario', f'c{cids.index(cid)} mensaje 0')]
+    adjuntas = [r[1] for r in ag.conn.execute('PRAGMA database_list').fetchall()]
+    assert len(adjuntas) <= 1 + 4 + 1  # main, archivos (LRU) y temp
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,33 @@
+# test_bench_chat_e2e.py
+# Prueba de humo del benchmark punta a punta (requiere DISPLAY; en CI usar xvfb-run)
+
+import os
+import sys
+
+import pytest
+
+import bench_chat_e2e as bench
+
+
+def test_modelo_falso_determinista():
+    a = bench.ModeloFalso(tokens_por_segundo=0, n_tokens=10, latencia_primer_token=0, semilla=3)
+    b = bench.ModeloFalso(tokens_por_segundo=0, n_tokens=10, latencia_primer_token=0, semilla=3)
+    parciales = []
+    final = a.stream([], parciales.append)
+    assert final == ''.join(b.tokens())
+    assert len(parciales) == len(a.emisiones) == 10
+    assert parciales[-1] == final
+
+
+@pytest.mark.skipif(not os.environ.get('DISPLAY') and sys.platform.startswith('linux'),
+                    reason='sin DISPLAY (correr con xvfb-run)')
+def test_corrida_completa():
+    modelo = bench.ModeloFalso(tokens_por_segundo=200, n_tokens=20, latencia_primer_token=0.01)
+    res = bench.correr(2, modelo, historial_previo=10)
+    assert res['incompletos'] == 0
+    assert res['ttft']['n'] == 2
+    assert res['latencia_token_ui']['n'] == 40
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
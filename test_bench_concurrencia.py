@@ -0,0 +1,81 @@
+# test_bench_concurrencia.py
+# Prueba de humo del estrés de concurrencia (base mínima, pocas operaciones por hilo)
+
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+import bench_concurrencia as estres
+import bench_persistencia
+
+
+def _retener(candado, segundos):
+    with candado:
+        time.sleep(segundos)
+
+
+def test_candado_mide_espera_y_retencion_por_sitio():
+    candado = estres.CandadoInstrumentado()
+    otro = threading.Thread(target=_retener, args=(candado, 0.05))
+    otro.start()
+    time.sleep(0.01)
+    with candado:  # espera a que `otro` suelte
+        pass
+    otro.join()
+    assert candado.acquire(timeout=1)
+    candado.release()
+    sitios = candado.muestras()
+    retener = next(s for s in sitios if s.startswith('_retener '))
+    assert sitios[retener]['retencion'][0] >= 0.04
+    propio = [s for s in sitios if s.startswith('test_candado_mide_espera_y_retencion_por_sitio ')]
+    assert len(propio) == 2  # `with` y acquire() en líneas distintas
+    assert max(sitios[s]['espera'][0] for s in propio) >= 0.02
+    assert not candado.locked()
+
+
+def test_mezcla():
+    assert estres.parsear_mezcla('lectura=3,escritura=1') == {
+        'lectura': 3.0, 'escritura': 1.0, 'cascada': 0.0, 'migracion': 0.0}
+    with pytest.raises(ValueError):
+        estres.parsear_mezcla('borrar_todo=1')
+    with pytest.raises(ValueError):
+        estres.parsear_mezcla('lectura=0')
+
+
+def test_hilos_sin_huerfanos(tmp_path):
+    ruta = str(tmp_path / 'estres.db')
+    bench_persistencia.generar_db(ruta, 1000)
+    mezcla = estres.parsear_mezcla('lectura=40,escritura=40,cascada=15,migracion=5')
+    res = estres.correr(ruta, hilos=4, duracion=30, operaciones=40, mezcla=mezcla, mensajes_base=1000)
+    assert res['operaciones'] == 160
+    assert sum(m['n'] for m in res['latencias'].values()) == 160
+    # 'migracion' abre otra conexión: un `database is locked` ocasional es legítimo
+    assert res['huerfanos'] == 0
+    sitios = {s['sitio'].split(' ')[0] for s in res['candado']}
+    assert {'agregar_mensaje', 'listar_mensajes', 'eliminar_proyecto'} <= sitios
+    assert all(s['n'] == s['espera']['n'] == s['retencion']['n'] for s in res['candado'])
+
+
+def test_varios_procesos(tmp_path):
+    ruta = str(tmp_path / 'estres.db')
+    bench_persistencia.generar_db(ruta, 1000)
+    res = estres.correr(ruta, hilos=2, procesos=2, duracion=30, operaciones=25, mensajes_base=1000)
+    assert res['operaciones'] == 100
+    assert res['huerfanos'] == 0
+
+
+def test_main_barre_y_escribe_json(tmp_path):
+    salida = tmp_path / 'res.json'
+    assert estres.main(['--hilos', '1,2', '--operaciones', '20', '--mensajes', '1000',
+                        '--dir', str(tmp_path), '--salida', str(salida)]) == 0
+    resultados = json.loads(salida.read_text(encoding='utf-8'))['resultados']
+    assert [(r['hilos'], r['procesos']) for r in resultados] == [(1, 1), (2, 1)]
+    assert resultados[0]['aceleracion'] == resultados[0]['eficiencia'] == 1.0
+    assert resultados[1]['operaciones'] == 40
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,47 @@
+# test_bench_persistencia.py
+# Prueba de humo del benchmark de persistencia (escala mínima, base temporal)
+
+import json
+import sqlite3
+import sys
+
+import pytest
+
+import bench_persistencia as bench
+
+
+def test_generacion_determinista(tmp_path):
+    a, b = tmp_path / 'a.db', tmp_path / 'b.db'
+    dims = bench.generar_db(str(a), 1000, semilla=7)
+    bench.generar_db(str(b), 1000, semilla=7)
+    filas = []
+    for ruta in (a, b):
+        conn = sqlite3.connect(ruta)
+        filas.append(conn.execute('SELECT conversacion_id, remitente, contenido FROM mensajes ORDER BY id').fetchall())
+        conn.close()
+    assert len(filas[0]) == dims['mensajes'] == 1000
+    assert filas[0] == filas[1]
+
+
+def test_medir_escala_y_comparar(tmp_path):
+    res = bench.medir_escala(1000, str(tmp_path), repeticiones=3)
+    for op in ('listar_mensajes', 'listar_tareas', 'agregar_mensaje', 'eliminar_chat',
+               'eliminar_proyecto', 'purga', 'migracion'):
+        assert res[op]['n'] >= 1 and res[op]['p50_ms'] >= 0
+    actual = {'resultados': {'1000': res}}
+    base = json.loads(json.dumps(actual))
+    assert bench.comparar(actual, base, 0.25) == []
+    base['resultados']['1000']['listar_mensajes']['p50_ms'] = res['listar_mensajes']['p50_ms'] / 10 or 1e-6
+    assert bench.comparar(actual, base, 0.25)
+
+
+def test_main_escribe_json(tmp_path):
+    salida = tmp_path / 'res.json'
+    assert bench.main(['--escalas', '1e3', '--repeticiones', '2', '--dir', str(tmp_path),
+                       '--salida', str(salida)]) == 0
+    informe = json.loads(salida.read_text(encoding='utf-8'))
+    assert informe['resultados']['1000']['listar_mensajes']['n'] == 2
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
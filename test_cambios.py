@@ -0,0 +1,122 @@
+# test_cambios.py
+# Varias instancias sobre la misma base: cada una se entera sólo de lo que cambió otra
+
+import sqlite3
+import threading
+
+import pytest
+
+from agente_personal import Cambio
+
+
+@pytest.fixture
+def dos(abrir_agente):
+    """Dos instancias sobre la misma base, como dos ventanas de la app."""
+    return abrir_agente('compartida.db'), abrir_agente('compartida.db')
+
+
+def test_sin_escrituras_ajenas_no_hay_nada(dos):
+    a, _b = dos
+    assert a.revisar_cambios() == []
+    # Lo propio no cuenta como cambio externo (data_version no se mueve)
+    pid = a.crear_proyecto('Mío')
+    a.agregar_tarea('Mío', 'x')
+    a.crear_conversacion('c', pid)
+    assert a.revisar_cambios() == []
+
+
+def test_proyectos_y_chats_de_otra_instancia_invalidan_la_cache(dos):
+    a, b = dos
+    pid = a.crear_proyecto('Viaje')
+    assert a.listar_conversaciones(pid) == []  # queda en caché
+    cid = b.crear_conversacion('Pasajes', pid)
+    assert a.listar_conversaciones(pid) == []  # todavía no se enteró
+    cambios = a.revisar_cambios()
+    assert Cambio('conversaciones', cid, pid, cambios[-1].version) in cambios
+    assert a.listar_conversaciones(pid) == [(cid, 'Pasajes')]
+    b.renombrar_proyecto(pid, 'Viaje 2026')
+    assert 'proyectos' in {c.tabla for c in a.revisar_cambios()}
+    assert a.listar_proyectos() == ['Viaje 2026']
+
+
+def test_mil_mensajes_son_un_solo_cambio(dos):
+    a, b = dos
+    cid = a.crear_conversacion('c')
+    assert a.contar_mensajes(cid) == 0
+    ids = [b.agregar_mensaje(cid, 'Usuario', f'm{i}') for i in range(1000)]
+    cambios = a.revisar_cambios()
+    # (también viene la creación del chat: lo propio se entrega junto con lo ajeno)
+    assert [c.clave for c in cambios if c.tabla == 'mensajes'] == [cid]
+    assert a.contar_mensajes(cid) == 1000
+    # Lo nuevo se pide desde el último id mostrado, no se recarga el chat
+    assert [m[0] for m in a.listar_mensajes_desde(cid, ids[-3])] == ids[-2:]
+    assert a.conn.execute('SELECT COUNT(*) FROM cambios').fetchone()[0] == 2
+
+
+def test_tareas_y_vaciar_chat(dos):
+    a, b = dos
+    pid = b.crear_proyecto('P')
+    cid = b.crear_conversacion('c', pid)
+    b.agregar_mensaje(cid, 'Usuario', 'hola')
+    a.revisar_cambios()
+    b.agregar_tarea('P', 'Hacer algo')
+    b.vaciar_conversacion(cid)
+    claves = {(c.tabla, c.clave) for c in a.revisar_cambios()}
+    assert ('tareas', pid) in claves and ('mensajes', cid) in claves
+
+
+def test_la_purga_no_llena_el_registro(dos):
+    a, b = dos
+    pid = b.crear_proyecto('Grande')
+    cid = b.crear_conversacion('c', pid)
+    with b.lock:
+        b.conn.executemany('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) VALUES (?, ?, ?, ?)',
+                           [(cid, 'Usuario', 'texto', f'm{i}') for i in range(500)])
+        b.conn.executemany('INSERT INTO tareas (proyecto_id, descripcion) VALUES (?, ?)',
+                           [(pid, f't{i}') for i in range(500)])
+        b.conn.commit()
+    a.revisar_cambios()
+    version = a._version_vista
+    b.eliminar_proyecto(pid)
+    b.purgar_eliminados(lote=50, pausa=0)
+    cambios = a.revisar_cambios()
+    # Un aviso por proyecto/chat, no uno por cada fila purgada
+    assert {(c.tabla, c.clave) for c in cambios} == {('proyectos', pid), ('conversaciones', cid)}
+    assert all(c.version > version for c in cambios)
+    assert a.listar_proyectos() == []
+
+
+def test_escritura_de_un_script_con_sqlite3(tmp_path, abrir_agente):
+    a = abrir_agente('script.db')
+    conn = sqlite3.connect(tmp_path / 'script.db')
+    conn.execute("INSERT INTO proyectos (nombre) VALUES ('desde script')")
+    conn.commit()
+    conn.close()
+    assert [c.tabla for c in a.revisar_cambios()] == ['proyectos']
+    assert a.listar_proyectos() == ['desde script']
+
+
+def test_base_reemplazada_pide_recargar_todo(dos):
+    a, b = dos
+    b.crear_proyecto('P')
+    a.revisar_cambios()
+    with b.lock:
+        b.conn.execute('DELETE FROM cambios')
+        b.conn.commit()
+    assert a.revisar_cambios()[0].tabla == '*'
+
+
+def test_vigilante_avisa_desde_su_hilo(dos):
+    a, b = dos
+    recibidos = []
+    llego = threading.Event()
+
+    def al_cambiar(cambios):
+        recibidos.extend(cambios)
+        llego.set()
+    a.vigilar_cambios(al_cambiar, intervalo=0.02)
+    b.crear_proyecto('Nuevo')
+    assert llego.wait(5)
+    assert recibidos[0].tabla == 'proyectos'
+    a.cerrar()
+    assert not a._vigilante.is_alive()
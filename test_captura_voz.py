@@ -0,0 +1,93 @@
+# test_captura_voz.py
+# Pruebas del buffer circular, el VAD y el pipeline de dictado incremental (sin micrófono)
+
+import sys
+import threading
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from captura_voz import BufferCircular, SegmentadorVAD, CapturaVozIncremental
+
+FS = 16000
+
+
+def _tono(segundos, amplitud=3000):
+    t = np.arange(int(FS * segundos)) / FS
+    return (amplitud * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+def _silencio(segundos):
+    return np.zeros(int(FS * segundos), dtype=np.int16)
+
+
+def test_buffer_circular_da_la_vuelta():
+    buf = BufferCircular(10)
+    buf.escribir(np.arange(7, dtype=np.int16))
+    buf.escribir(np.arange(7, 14, dtype=np.int16))
+    assert buf.escritas == 14
+    assert list(buf.leer(4, 14)) == list(range(4, 14))
+    # Lo sobrescrito se recorta a lo disponible
+    assert list(buf.leer(0, 6)) == [4, 5]
+
+
+def test_buffer_circular_bloque_mayor_a_capacidad():
+    buf = BufferCircular(4)
+    buf.escribir(np.arange(10, dtype=np.int16))
+    assert buf.escritas == 10
+    assert list(buf.leer(0, 10)) == [6, 7, 8, 9]
+
+
+def test_vad_detecta_dos_tramos():
+    vad = SegmentadorVAD(fs=FS)
+    audio = np.concatenate([_silencio(0.5), _tono(1.0), _silencio(1.0), _tono(0.8), _silencio(1.0)])
+    segmentos = []
+    for pos in range(0, len(audio) - vad.trama + 1, vad.trama):
+        seg = vad.procesar(audio[pos:pos + vad.trama], pos)
+        if seg:
+            segmentos.append(seg)
+    assert len(segmentos) == 2
+    (i1, f1), (i2, f2) = segmentos
+    assert i1 < int(0.5 * FS) < f1 < i2 < f2
+
+
+def test_vad_corta_tramos_largos():
+    vad = SegmentadorVAD(fs=FS, max_segmento_s=1.0)
+    audio = _tono(3.5)
+    cortes = []
+    for pos in range(0, len(audio) - vad.trama + 1, vad.trama):
+        seg = vad.procesar(audio[pos:pos + vad.trama], pos)
+        if seg:
+            cortes.append(seg)
+    assert len(cortes) >= 3
+    assert vad.en_voz
+
+
+def test_pipeline_transcribe_mientras_graba():
+    llamadas = []
+    parciales = []
+    primer_tramo = threading.Event()
+
+    def transcribir(pcm, fs):
+        llamadas.append(len(pcm) // 2)
+        primer_tramo.set()
+        return f'frase{len(llamadas)}'
+
+    captura = CapturaVozIncremental(transcribir, fs=FS, on_parcial=parciales.append, intervalo_s=0.01)
+    captura.iniciar()
+    bloque = 512
+    audio = np.concatenate([_tono(1.0), _silencio(1.0)])
+    for pos in range(0, len(audio), bloque):
+        captura.callback(audio[pos:pos + bloque].reshape(-1, 1), bloque, None, None)
+    # El primer tramo se transcribe antes de detener la grabación
+    assert primer_tramo.wait(timeout=5.0)
+    for pos in range(0, int(FS * 0.6), bloque):
+        captura.callback(_tono(bloque / FS).reshape(-1, 1), bloque, None, None)
+    texto = captura.detener()
+    assert texto == 'frase1 frase2'
+    assert parciales == ['frase1', 'frase1 frase2']
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
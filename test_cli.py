@@ -0,0 +1,154 @@
+# test_cli.py
+# CLI sin Tk: CRUD, chat con stream a stdout, modo lote con el planificador del modelo
+
+import io
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+import cli
+import llama_local_helper as llh
+from agente_personal import AgentePersonal
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # Sin modelo: respuesta demo del fallback (determinista)
+    monkeypatch.setattr(llh, '_get_llm', lambda: None)
+    return str(tmp_path / 'cli.db')
+
+
+def _correr(db, *argv):
+    return cli.main(['--db', db, *argv])
+
+
+def test_crud_proyectos_y_tareas(db, capsys):
+    assert _correr(db, 'proyecto', 'crear', 'Viaje', '--contexto', 'vacaciones') == 0
+    assert _correr(db, 'tarea', 'agregar', 'Viaje', 'Sacar pasajes') == 0
+    assert _correr(db, 'tarea', 'estado', '1', 'hecha') == 0
+    capsys.readouterr()
+    _correr(db, 'tareas', 'Viaje')
+    salida = capsys.readouterr().out.splitlines()
+    assert salida[0].split() == ['id', 'descripción', 'estado']
+    assert salida[1].split() == ['1', 'Sacar', 'pasajes', 'hecha']
+    assert _correr(db, 'proyecto', 'renombrar', 'Viaje', 'Viaje 2026') == 0
+    capsys.readouterr()
+    _correr(db, 'proyectos')
+    assert capsys.readouterr().out == 'Viaje 2026\n'
+    assert _correr(db, 'tareas', 'Inexistente') == 1
+    assert 'no existe' in capsys.readouterr().err
+    assert _correr(db, 'proyecto', 'eliminar', 'Viaje 2026') == 0
+    capsys.readouterr()
+    _correr(db, 'proyectos')
+    assert capsys.readouterr().out == ''
+
+
+def test_tareas_filtro_y_cambio_masivo(db, capsys):
+    _correr(db, 'proyecto', 'crear', 'Casa')
+    for d in ('Pintar', 'Regar', 'Barrer'):
+        _correr(db, 'tarea', 'agregar', 'Casa', d)
+    assert _correr(db, 'tarea', 'estado', '1', '3', 'hecha') == 0
+    capsys.readouterr()
+    _correr(db, 'tareas', 'Casa', '--estado', 'hecha')
+    assert [l.split()[1] for l in capsys.readouterr().out.splitlines()[1:]] == ['Pintar', 'Barrer']
+
+
+def test_chat_stream_y_persistencia(db, capsys, monkeypatch):
+    _correr(db, 'proyecto', 'crear', 'P')
+    capsys.readouterr()
+    assert _correr(db, 'chat', '--proyecto', 'P', 'hola', 'che') == 0
+    out = capsys.readouterr().out
+    assert out.startswith('⏳ Pensando… OK, ahora te respondo:\n') and "'hola che'" in out
+    ag = AgentePersonal(db_path=db, purga_automatica=False)
+    (cid, _nombre), = ag.listar_conversaciones(ag.id_proyecto('P'))
+    assert [r for r, _ in ag.listar_mensajes(cid)] == ['Usuario', 'Agente']
+    ag.cerrar()
+    # Interactivo sobre la misma conversación
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('segunda\n\n/salir\nno llega\n'))
+    assert _correr(db, 'chat', '--conversacion', str(cid)) == 0
+    capsys.readouterr()
+    _correr(db, 'historial', str(cid))
+    lineas = [l for l in capsys.readouterr().out.splitlines() if l.startswith('[')]
+    assert lineas[0] == '[Usuario] hola che' and lineas[2] == '[Usuario] segunda'
+    assert len([l for l in lineas if l.startswith('[Usuario]')]) == 2
+
+
+def test_lote_en_orden_con_errores(db, tmp_path):
+    entrada = tmp_path / 'pedidos.jsonl'
+    pedidos = [{'id': f'p{i}', 'prompt': f'texto {i}'} for i in range(9)]
+    pedidos.insert(4, {'id': 'malo'})
+    pedidos.append({'id': 'conv', 'mensajes': [{'role': 'user', 'content': 'a'}, {'role': 'assistant', 'content': 'b'},
+                                               {'role': 'user', 'content': 'c'}]})
+    entrada.write_text('\n'.join(json.dumps(p) for p in pedidos) + '\n', encoding='utf-8')
+    salida = tmp_path / 'res.jsonl'
+    _correr(db, 'proyecto', 'crear', 'Lote')
+    rc = _correr(db, 'lote', str(entrada), '--salida', str(salida), '--concurrencia', '3', '--proyecto', 'Lote')
+    assert rc == 1  # hubo un pedido inválido
+    res = [json.loads(l) for l in salida.read_text(encoding='utf-8').splitlines()]
+    assert [r['id'] for r in res] == [p['id'] for p in pedidos]
+    assert 'falta el campo' in res[4]['error']
+    assert "'texto 7'" in res[8]['respuesta'] and res[8]['uso']['finish_reason'] == 'stop'
+    assert "'c'" in res[-1]['respuesta']
+    ag = AgentePersonal(db_path=db, purga_automatica=False)
+    assert len(ag.listar_conversaciones(ag.id_proyecto('Lote'))) == 10
+    ag.cerrar()
+
+
+def test_lote_con_lineas_rotas_sin_base(db, tmp_path):
+    entrada = tmp_path / 'pedidos.jsonl'
+    entrada.write_text('{"id": "a", "prompt": "uno"}\n{"id": "b", "prompt": \n[1, 2]\n'
+                       '{"id": "c", "prompt": "tres"}\n', encoding='utf-8')
+    salida = tmp_path / 'res.jsonl'
+    assert _correr(db, 'lote', str(entrada), '--salida', str(salida)) == 1
+    res = [json.loads(l) for l in salida.read_text(encoding='utf-8').splitlines()]
+    assert [r['id'] for r in res] == ['a', 2, 3, 'c']
+    assert 'JSON inválido en la línea 2' in res[1]['error'] and 'no es un objeto' in res[2]['error']
+    assert "'uno'" in res[0]['respuesta'] and "'tres'" in res[3]['respuesta']
+
+
+def test_lote_sin_base_informa_errores(db, tmp_path, capsys):
+    entrada = tmp_path / 'latin1.jsonl'
+    entrada.write_bytes('{"prompt": "año"}\n'.encode('latin-1'))
+    assert _correr(db, 'lote', str(entrada), '--salida', str(tmp_path / 'r.jsonl')) == 1
+    assert 'Error:' in capsys.readouterr().err
+
+
+def test_planificador_concurrencia_y_errores():
+    activos, maximo = [0], [0]
+    lock = threading.Lock()
+
+    def generar(historial, max_tokens, cancel_event, uso):
+        with lock:
+            activos[0] += 1
+            maximo[0] = max(maximo[0], activos[0])
+        try:
+            contenido = historial[-1]['content']
+            if contenido == 'falla':
+                raise RuntimeError('modelo caído')
+            time.sleep(0.02)
+            for palabra in contenido.split():
+                uso.completion_tokens += 1
+                yield palabra + ' '
+        finally:
+            with lock:
+                activos[0] -= 1
+
+    plan = llh.PlanificadorModelo(concurrencia=3, generar=generar, max_en_cola=2)
+    deltas = []
+    futuros = [plan.enviar([{'role': 'user', 'content': f'uno dos {i}'}], on_delta=deltas.append) for i in range(6)]
+    malo = plan.enviar([{'role': 'user', 'content': 'falla'}])
+    textos = [f.result(timeout=5) for f in futuros]
+    assert [t for t, _ in textos] == [f'uno dos {i} ' for i in range(6)]
+    assert all(u.completion_tokens == 3 for _, u in textos)
+    assert len(deltas) == 18
+    assert maximo[0] == 3
+    with pytest.raises(RuntimeError, match='caído'):
+        malo.result(timeout=5)
+    plan.cerrar()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,172 @@
+# test_compresion.py
+# Compresión transparente de mensajes grandes: ida y vuelta, migración, reporte y búsqueda
+
+import sqlite3
+import sys
+
+import pytest
+
+import compresion
+from agente_personal import AgentePersonal
+
+TEXTO_LARGO = 'Resumen del archivo: ' + ' '.join(f'fila {i} ventas {i * 7} región norte' for i in range(400))
+
+
+def _conversacion(ag):
+    return ag.crear_conversacion('c', ag.crear_proyecto('P'))
+
+
+def test_codec_ida_y_vuelta_zlib(monkeypatch):
+    monkeypatch.setattr(compresion, 'zstandard', None)
+    assert compresion.comprimir('corto') == 'corto'
+    blob = compresion.comprimir(TEXTO_LARGO)
+    assert isinstance(blob, bytes) and compresion.es_comprimido(blob)
+    assert blob[2:3] == compresion.ZLIB
+    assert len(blob) < len(TEXTO_LARGO) // 3
+    assert compresion.descomprimir(blob) == TEXTO_LARGO
+    assert compresion.largo_original(blob) == len(TEXTO_LARGO.encode('utf-8'))
+
+
+def test_agregar_y_listar_transparente(ag):
+    cid = _conversacion(ag)
+    ag.agregar_mensaje(cid, 'Usuario', 'hola')
+    ag.agregar_mensaje(cid, 'Agente', TEXTO_LARGO)
+    assert ag.listar_mensajes(cid) == [('Usuario', 'hola'), ('Agente', TEXTO_LARGO)]
+    tipos = [r[0] for r in ag.conn.execute('SELECT typeof(contenido) FROM mensajes ORDER BY id')]
+    assert tipos == ['text', 'blob']
+
+
+def test_busqueda_sobre_comprimidos(ag):
+    cid = _conversacion(ag)
+    ag.agregar_mensaje(cid, 'Agente', TEXTO_LARGO)
+    ag.agregar_mensaje(cid, 'Usuario', 'otra cosa')
+    res = ag.buscar_mensajes('FILA 399 VENTAS')
+    assert len(res) == 1 and res[0][3] == TEXTO_LARGO
+    assert ag.buscar_mensajes('otra', conversacion_id=cid)[0][2] == 'Usuario'
+    assert ag.buscar_mensajes('inexistente') == []
+
+
+def test_busqueda_con_indice_unicode_y_sin_descomprimir_todo(ag, monkeypatch):
+    cid = _conversacion(ag)
+    for i in range(30):
+        ag.agregar_mensaje(cid, 'Agente', f'{TEXTO_LARGO} bloque {i}')
+    ag.agregar_mensaje(cid, 'Usuario', 'Canción del ÁRBOL viejo')
+    assert [r[3] for r in ag.buscar_mensajes('árbol')] == ['Canción del ÁRBOL viejo']
+    assert ag.buscar_mensajes('CANCIÓN DEL')[0][2] == 'Usuario'
+    assert [r[3] for r in ag.buscar_mensajes('ol')] == ['Canción del ÁRBOL viejo']  # corto: sin índice
+    llamadas = []
+    original = compresion.descomprimir
+    monkeypatch.setattr(compresion, 'descomprimir', lambda v, d=None: llamadas.append(v) or original(v, d))
+    res = ag.buscar_mensajes('bloque 17')
+    assert [r[3] for r in res] == [f'{TEXTO_LARGO} bloque 17']
+    assert len(llamadas) == 1  # sólo el resultado, no los 30 cuerpos comprimidos
+
+
+def test_indice_de_busqueda_con_otras_conexiones_y_base_previa(tmp_path):
+    ruta = str(tmp_path / 'b.db')
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False)
+    cid = _conversacion(ag)
+    viejos = [ag.agregar_mensaje(cid, 'Agente', f'{TEXTO_LARGO} viejo {i}') for i in range(5)]
+    # Una base de antes del índice: al reabrir, lo que ya estaba queda pendiente de indexar
+    for objeto in ('TABLE mensajes_busqueda', 'TABLE busqueda_pendiente', 'TABLE busqueda_cola',
+                   'TRIGGER trg_busqueda_mensajes_insert', 'TRIGGER trg_busqueda_mensajes_delete',
+                   'TRIGGER trg_busqueda_mensajes_update'):
+        ag.conn.execute(f'DROP {objeto}')
+    ag.conn.commit()
+    ag.cerrar()
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False)
+    try:
+        assert ag.conn.execute('SELECT desde, hasta FROM busqueda_pendiente').fetchone() == (0, viejos[-1])
+        assert [r[0] for r in ag.buscar_mensajes('VIEJO 3')] == [viejos[3]]
+        # Otra conexión, sin las funciones SQL de la app, escribe y borra mensajes
+        otra = sqlite3.connect(ruta)
+        otra.execute('DELETE FROM mensajes WHERE id = ?', (viejos[1],))
+        otra.execute("INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) VALUES (?, 'Usuario', 'texto', ?)",
+                     (cid, 'escrito desde otra conexión'))
+        otra.commit()
+        otra.close()
+        assert ag.buscar_mensajes('DESDE OTRA')[0][3] == 'escrito desde otra conexión'
+        assert ag.indexar_busqueda_pendiente(lote=2, pausa=0) == 4
+        assert ag.conn.execute('SELECT COUNT(*) FROM busqueda_pendiente').fetchone()[0] == 0
+        assert ag.conn.execute('SELECT COUNT(*) FROM busqueda_cola').fetchone()[0] == 0
+        assert ag.buscar_mensajes('desde otra')[0][3] == 'escrito desde otra conexión'
+        assert [r[0] for r in ag.buscar_mensajes(' viejo ')] == [viejos[4], viejos[3], viejos[2], viejos[0]]
+        ag.vaciar_conversacion(cid)
+        assert ag.buscar_mensajes(' viejo ') == []
+        # La búsqueda ya pasó las bajas al índice
+        assert ag.conn.execute('SELECT COUNT(*) FROM busqueda_cola').fetchone()[0] == 0
+        assert ag.conn.execute("SELECT COUNT(*) FROM mensajes_busqueda WHERE mensajes_busqueda MATCH '\"viejo\"'"
+                               ).fetchone()[0] == 0
+    finally:
+        ag.cerrar()
+
+
+def test_migracion_y_reporte(ag):
+    cid = _conversacion(ag)
+    # Filas viejas guardadas en texto plano (como antes de la compresión)
+    ag.conn.executemany('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) VALUES (?, ?, ?, ?)',
+                        [(cid, 'Agente', 'texto', TEXTO_LARGO + str(i)) for i in range(5)]
+                        + [(cid, 'Usuario', 'texto', 'chico')])
+    ag.conn.commit()
+    antes = ag.reporte_compresion()
+    assert antes['comprimidos'] == 0 and antes['bytes_ahorrados'] == 0
+    informe = ag.comprimir_mensajes_existentes(lote=2, pausa=0)
+    assert informe['revisadas'] == informe['comprimidas'] == 5
+    assert informe['bytes_despues'] < informe['bytes_antes']
+    despues = ag.reporte_compresion()
+    assert despues['comprimidos'] == 5
+    assert despues['bytes_originales'] == antes['bytes_originales']
+    assert despues['bytes_ahorrados'] == informe['bytes_antes'] - informe['bytes_despues']
+    assert [c for _, c in ag.listar_mensajes(cid)] == [TEXTO_LARGO + str(i) for i in range(5)] + ['chico']
+    # Idempotente
+    assert ag.comprimir_mensajes_existentes()['comprimidas'] == 0
+
+
+def test_diccionario_zstd(tmp_path):
+    pytest.importorskip('zstandard')
+    ruta = str(tmp_path / 'd.db')
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False, umbral_compresion=64)
+    cid = _conversacion(ag)
+    for i in range(300):
+        ag.agregar_mensaje(cid, 'Agente', f'Hola Facu, acá tenés el resumen número {i} del proyecto con sus tareas.')
+    dict_id = ag.entrenar_diccionario_compresion(tamaño=4096)
+    ag.agregar_mensaje(cid, 'Agente', 'Hola Facu, acá tenés el resumen número 999 del proyecto con sus tareas.')
+    ultimo = ag.conn.execute('SELECT contenido FROM mensajes ORDER BY id DESC LIMIT 1').fetchone()[0]
+    assert compresion.es_comprimido(ultimo) and ultimo[2:3] == compresion.ZSTD
+    ag.cerrar()
+    # Al reabrir se recuperan los diccionarios para poder leer
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False, umbral_compresion=64)
+    assert ag._diccionario_activo == dict_id
+    assert ag.listar_mensajes(cid)[-1][1].endswith('999 del proyecto con sus tareas.')
+    ag.cerrar()
+
+
+def test_diccionario_entrenado_por_otra_instancia(tmp_path):
+    pytest.importorskip('zstandard')
+    ruta = str(tmp_path / 'd.db')
+    a = AgentePersonal(db_path=ruta, purga_automatica=False, umbral_compresion=64)
+    b = AgentePersonal(db_path=ruta, purga_automatica=False, umbral_compresion=64)
+    try:
+        cid = _conversacion(a)
+        for i in range(300):
+            a.agregar_mensaje(cid, 'Agente', f'Hola Facu, acá tenés el resumen número {i} del proyecto con sus tareas.')
+        dict_id = a.entrenar_diccionario_compresion(tamaño=4096)
+        nuevo = 'Hola Facu, acá tenés el resumen número 999 del proyecto con sus tareas.'
+        a.agregar_mensaje(cid, 'Agente', nuevo)
+        assert b._diccionarios == {}
+        # B se abrió antes del entrenamiento: recarga los diccionarios al encontrar uno que no conoce
+        assert b.listar_mensajes(cid)[-1][1] == nuevo
+        assert b._diccionario_activo == dict_id
+        b._diccionarios = {}
+        assert b.buscar_mensajes('número 999')[0][3] == nuevo
+        b.agregar_mensaje(cid, 'Usuario', nuevo.replace('999', '1000'))
+        ultimo = b.conn.execute('SELECT contenido FROM mensajes ORDER BY id DESC LIMIT 1').fetchone()[0]
+        assert compresion.diccionario_usado(ultimo) == dict_id
+        assert a.listar_mensajes(cid)[-1][1].endswith('1000 del proyecto con sus tareas.')
+    finally:
+        b.cerrar()
+        a.cerrar()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
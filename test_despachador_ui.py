@@ -0,0 +1,124 @@
+# test_despachador_ui.py
+# Despachador de operaciones de UI: orden, coalescencia, tandas acotadas y publicación desde hilos
+
+import threading
+import time
+
+from despachador_ui import DespachadorUI
+
+
+class RootFalso:
+    """Imita after/after_cancel de Tk: guarda lo agendado para correrlo a mano."""
+
+    def __init__(self):
+        self.agendados = []
+        self.cancelados = []
+
+    def after(self, ms, func, *args):
+        self.agendados.append((ms, func, args))
+        return f'after#{len(self.agendados)}'
+
+    def after_cancel(self, ident):
+        self.cancelados.append(ident)
+
+    def correr_siguiente(self):
+        ms, func, args = self.agendados.pop(0)
+        func(*args)
+        return ms
+
+
+def test_ejecuta_en_orden_de_llegada():
+    d = DespachadorUI(RootFalso())
+    hechas = []
+    for i in range(5):
+        d.publicar(hechas.append, i)
+    assert hechas == []  # nada corre fuera del hilo de Tk
+    assert d.drenar() == 5
+    assert hechas == [0, 1, 2, 3, 4]
+
+
+def test_coalesce_por_clave_gana_la_ultima_en_su_posicion():
+    d = DespachadorUI(RootFalso())
+    hechas = []
+    d.publicar_unico('burbuja', hechas.append, 'h')
+    d.publicar(hechas.append, 'guardar')
+    d.publicar_unico('burbuja', hechas.append, 'hol')
+    d.publicar_unico('otra', hechas.append, 'x')
+    d.publicar_unico('burbuja', hechas.append, 'hola')
+    d.drenar()
+    assert hechas == ['guardar', 'x', 'hola']
+    assert d.coalescidas == 2
+    # Ya ejecutada, la clave vuelve a estar libre
+    d.publicar_unico('burbuja', hechas.append, 'hola!')
+    d.drenar()
+    assert hechas[-1] == 'hola!'
+
+
+def test_tandas_acotadas_y_reagenda_enseguida():
+    root = RootFalso()
+    d = DespachadorUI(root, intervalo_ms=16, max_por_tick=10)
+    d.iniciar()
+    hechas = []
+    for i in range(25):
+        d.publicar(hechas.append, i)
+    assert root.correr_siguiente() == 16
+    assert len(hechas) == 10
+    # Quedó trabajo: la próxima tanda va con demora mínima (Tk procesa eventos en el medio)
+    assert root.agendados[-1][0] == 1
+    root.correr_siguiente()
+    root.correr_siguiente()
+    assert hechas == list(range(25))
+    assert root.agendados[-1][0] == 16
+
+
+def test_presupuesto_de_tiempo_por_tanda():
+    d = DespachadorUI(RootFalso(), max_por_tick=1000, presupuesto_ms=5)
+    for _ in range(50):
+        d.publicar(time.sleep, 0.001)
+    assert 1 <= d.drenar() < 50
+    assert d.pendientes() > 0
+
+
+def test_un_error_no_corta_la_tanda(capsys):
+    d = DespachadorUI(RootFalso())
+    hechas = []
+    d.publicar(hechas.append, 1)
+    d.publicar(lambda: 1 / 0)
+    d.publicar(hechas.append, 2)
+    assert d.drenar() == 3
+    assert hechas == [1, 2]
+    assert 'ZeroDivisionError' in capsys.readouterr().err
+
+
+def test_publicar_desde_muchos_hilos():
+    d = DespachadorUI(RootFalso(), max_por_tick=100_000, presupuesto_ms=10_000)
+    contador = []
+    ultimo = {}
+
+    def productor(n):
+        for i in range(500):
+            d.publicar(contador.append, 1)
+            d.publicar_unico(('estado', n), ultimo.__setitem__, n, i)
+    hilos = [threading.Thread(target=productor, args=(n,)) for n in range(8)]
+    for h in hilos:
+        h.start()
+    while any(h.is_alive() for h in hilos):
+        d.drenar()
+    for h in hilos:
+        h.join()
+    d.drenar()
+    assert len(contador) == 8 * 500
+    assert ultimo == {n: 499 for n in range(8)}
+
+
+def test_detener_cancela_y_descarta():
+    root = RootFalso()
+    d = DespachadorUI(root)
+    d.iniciar()
+    hechas = []
+    d.publicar(hechas.append, 1)
+    d.detener()
+    assert root.cancelados == ['after#1']
+    assert d.pendientes() == 0
+    root.correr_siguiente()  # un tick que ya estaba en vuelo no hace nada
+    assert hechas == [] and not root.agendados
@@ -0,0 +1,70 @@
+# test_directorio_cache.py
+# Caché de proyectos/conversaciones: la navegación no hace consultas y las mutaciones la mantienen al día
+
+import sys
+
+import pytest
+
+
+def _contar_sql(ag):
+    sentencias = []
+    ag.conn.set_trace_callback(sentencias.append)
+    return sentencias
+
+
+def test_navegacion_sin_consultas(ag):
+    pid_b = ag.crear_proyecto('B')
+    pid_a = ag.crear_proyecto('A', contexto='ctx A')
+    ag.crear_conversacion('c1', pid_a)
+    ag.listar_proyectos()
+    ag.listar_conversaciones(pid_a)
+    sentencias = _contar_sql(ag)
+    for _ in range(50):
+        assert ag.listar_proyectos() == ['A', 'B']
+        assert ag.id_proyecto('B') == pid_b
+        assert [n for _, n in ag.listar_conversaciones(pid_a)] == ['c1']
+        assert ag.cargar_contexto('A') == 'ctx A'
+    assert sentencias == []
+
+
+def test_mutaciones_actualizan_la_cache(ag):
+    pid = ag.crear_proyecto('Uno')
+    assert ag.listar_proyectos() == ['Uno']
+    ag.crear_proyecto('Cero')
+    ag.renombrar_proyecto(pid, 'Zeta')
+    assert ag.listar_proyectos() == ['Cero', 'Zeta']
+    assert ag.id_proyecto('Uno') is None and ag.id_proyecto('Zeta') == pid
+
+    assert ag.listar_conversaciones(pid) == []
+    c1 = ag.crear_conversacion('primera', pid)
+    c2 = ag.crear_conversacion('segunda', pid)
+    ag.renombrar_chat(c1, 'renombrada')
+    assert ag.listar_conversaciones(pid) == [(c1, 'renombrada'), (c2, 'segunda')]
+
+    ag.agregar_mensaje(c2, 'Usuario', 'hola')
+    ag.agregar_mensaje(c2, 'Agente', 'qué tal')
+    assert ag.contar_mensajes(c2) == 2
+    ag.vaciar_conversacion(c2)
+    assert ag.contar_mensajes(c2) == 0
+
+    ag.eliminar_chat(c1)
+    assert ag.listar_conversaciones(pid) == [(c2, 'segunda')]
+    ag.eliminar_proyecto(pid)
+    assert ag.listar_proyectos() == ['Cero']
+    with pytest.raises(ValueError):
+        ag.listar_tareas('Zeta')
+
+
+def test_cache_coincide_con_la_base(ag):
+    for nombre in ('b', 'a', 'c'):
+        pid = ag.crear_proyecto(nombre)
+        ag.crear_conversacion(f'chat {nombre}', pid)
+    ag.eliminar_proyecto(ag.id_proyecto('c'))
+    en_cache = (ag.listar_proyectos(), [ag.listar_conversaciones(ag.id_proyecto(n)) for n in ('a', 'b')])
+    ag.invalidar_cache()
+    en_base = (ag.listar_proyectos(), [ag.listar_conversaciones(ag.id_proyecto(n)) for n in ('a', 'b')])
+    assert en_cache == en_base
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
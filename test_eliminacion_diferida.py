@@ -0,0 +1,86 @@
+# test_eliminacion_diferida.py
+# Eliminación con lápida + purga en lotes: lo borrado desaparece al instante y se purga en segundo plano
+
+import sys
+import threading
+
+import pytest
+
+import agente_personal
+
+def _poblar(ag, nombre, conversaciones=3, mensajes=50):
+    ag.crear_proyecto(nombre)
+    pid = ag.conn.execute('SELECT id FROM proyectos WHERE nombre=?', (nombre,)).fetchone()[0]
+    ag.agregar_tarea(nombre, 'tarea')
+    cids = []
+    for c in range(conversaciones):
+        cid = ag.crear_conversacion(f'chat {c}', pid)
+        ag.conn.executemany('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) VALUES (?, ?, ?, ?)',
+                            [(cid, 'Usuario', 'texto', f'm{i}') for i in range(mensajes)])
+        cids.append(cid)
+    ag.conn.commit()
+    return pid, cids
+
+
+def _contar(ag, tabla):
+    return ag.conn.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+
+
+def test_eliminar_proyecto_oculta_y_purga(ag):
+    pid, cids = _poblar(ag, 'Grande')
+    _poblar(ag, 'Otro')
+    ag.eliminar_proyecto(pid)
+    visibles = [r[0] for r in ag.conn.execute('SELECT nombre FROM proyectos WHERE eliminado = 0')]
+    assert visibles == ['Otro']
+    assert ag.conn.execute('SELECT COUNT(*) FROM conversaciones WHERE proyecto_id=? AND eliminado = 0',
+                           (pid,)).fetchone()[0] == 0
+    # El nombre queda libre enseguida aunque la purga no haya corrido
+    ag.crear_proyecto('Grande')
+    assert ag.purga_pendiente()
+    borradas = ag.purgar_eliminados(lote=7, pausa=0)
+    assert borradas == 3 * 50 + 3 + 1 + 1
+    assert not ag.purga_pendiente()
+    assert _contar(ag, 'mensajes') == 150
+    assert ag.conn.execute('PRAGMA foreign_key_check').fetchall() == []
+
+
+def test_purga_en_segundo_plano_no_bloquea_escrituras(abrir_agente):
+    ag = abrir_agente(purga_automatica=True)
+    pid, _ = _poblar(ag, 'Viejo', conversaciones=4, mensajes=3000)
+    _, (cid_vivo, *_) = _poblar(ag, 'Vivo', conversaciones=1, mensajes=0)
+    ag.eliminar_proyecto(pid)
+    escritos = []
+
+    def escritor():
+        for i in range(200):
+            escritos.append(ag.agregar_mensaje(cid_vivo, 'Usuario', f'durante purga {i}'))
+
+    t = threading.Thread(target=escritor)
+    t.start()
+    t.join(timeout=30)
+    assert ag.esperar_purga(timeout=30)
+    assert len(escritos) == 200
+    assert not ag.purga_pendiente()
+    assert _contar(ag, 'mensajes') == 200
+
+
+def test_eliminar_chat_y_vacuum_incremental(ag, monkeypatch):
+    assert ag.conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    _, cids = _poblar(ag, 'P', conversaciones=2, mensajes=2000)
+    ag.eliminar_chat(cids[0])
+    visibles = [r[0] for r in ag.conn.execute('SELECT id FROM conversaciones WHERE eliminado = 0')]
+    assert visibles == [cids[1]]
+    ag.purgar_eliminados(lote=500, pausa=0, vacuum_paginas=0)
+    libres = ag.conn.execute('PRAGMA freelist_count').fetchone()[0]
+    assert libres > 20
+    pasos = []
+    monkeypatch.setattr(agente_personal.time, 'sleep', pasos.append)
+    ag._vacuum_incremental(10, 0)
+    assert ag.conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+    assert len(pasos) <= -(-libres // 10)  # cada paso libera hasta 10 páginas, no una
+    assert ag.listar_mensajes(cids[0]) == []
+    assert len(ag.listar_mensajes(cids[1])) == 2000
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,110 @@
+# test_exportacion.py
+# Exportación/importación de proyectos en JSON Lines comprimido (streaming)
+
+import gzip
+import json
+import sys
+
+import pytest
+
+TEXTO_LARGO = 'informe ' * 500
+
+
+def _poblar(ag):
+    pid = ag.crear_proyecto('Viaje', 'Contexto del viaje')
+    ag.agregar_tarea('Viaje', 'Sacar pasajes')
+    ag.agregar_tarea('Viaje', 'Reservar hotel')
+    ag.actualizar_estado_tarea(ag.listar_tareas('Viaje')[0][0], 'hecha')
+    c1 = ag.crear_conversacion('Vuelos', pid)
+    for i in range(7):
+        ag.agregar_mensaje(c1, 'Usuario' if i % 2 == 0 else 'Agente', f'vuelo {i}')
+    c2 = ag.crear_conversacion('Hoteles', pid)
+    ag.agregar_mensaje(c2, 'Agente', TEXTO_LARGO)
+    # Otro proyecto que no debe colarse en la exportación
+    otro = ag.crear_proyecto('Otro')
+    ag.agregar_mensaje(ag.crear_conversacion('x', otro), 'Usuario', 'no exportar')
+    return pid, c1, c2
+
+
+@pytest.mark.parametrize('extension', ['.jsonl.gz', '.jsonl'])
+def test_ida_y_vuelta(tmp_path, abrir_agente, extension):
+    origen = abrir_agente('origen.db')
+    pid, c1, c2 = _poblar(origen)
+    ruta = str(tmp_path / ('viaje' + extension))
+    assert origen.exportar_proyecto(pid, ruta, lote=3) == {
+        'proyectos': 1, 'tareas': 2, 'conversaciones': 2, 'mensajes': 8}
+
+    destino = abrir_agente('destino.db')
+    sentencias = []
+    destino.conn.set_trace_callback(sentencias.append)
+    nuevo = destino.importar_proyecto(ruta, lote=3)
+    destino.conn.set_trace_callback(None)
+    assert destino.listar_proyectos() == ['Viaje']
+    assert destino.cargar_contexto('Viaje') == 'Contexto del viaje'
+    assert [(d, e) for _, d, e in destino.listar_tareas('Viaje')] == [(d, e) for _, d, e in origen.listar_tareas('Viaje')]
+    assert [n for _, n in destino.listar_conversaciones(nuevo)] == ['Vuelos', 'Hoteles']
+    for (cid_o, _), (cid_d, _) in zip(origen.listar_conversaciones(pid), destino.listar_conversaciones(nuevo)):
+        assert destino.listar_mensajes(cid_d) == origen.listar_mensajes(cid_o)
+    # El cuerpo grande se vuelve a comprimir al importar
+    assert destino.reporte_compresion()['comprimidos'] == 1
+    # Aun con la base vacía los índices no se tocan: otras instancias la siguen leyendo
+    assert not [s for s in sentencias if 'INDEX' in s.upper()]
+    assert destino.verificar_indices() == []
+
+
+def test_formato_y_archivadas(ag, tmp_path):
+    pid, c1, _c2 = _poblar(ag)
+    ag.conn.execute("UPDATE mensajes SET fecha = '2020-01-01 00:00:00' WHERE conversacion_id = ?", (c1,))
+    ag.conn.commit()
+    ag.archivar_inactivas(dias=1, pausa=0)
+    ruta = str(tmp_path / 'p.jsonl.gz')
+    ag.exportar_proyecto(pid, ruta)
+    with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+        registros = [json.loads(linea) for linea in f]
+    assert registros[0]['formato'] == 'agente_personal' and registros[0]['mensajes'] == 8
+    assert [r['t'] for r in registros[1:5]] == ['proyecto', 'tarea', 'tarea', 'conversacion']
+    mensajes = [r for r in registros if r.get('t') == 'mensaje']
+    assert [m['contenido'] for m in mensajes[:7]] == [f'vuelo {i}' for i in range(7)]
+    assert mensajes[0]['fecha'] == '2020-01-01 00:00:00'
+    assert mensajes[-1]['contenido'] == TEXTO_LARGO
+
+
+def test_conflicto_de_nombre_y_archivo_invalido(ag, tmp_path):
+    pid, _c1, _c2 = _poblar(ag)
+    ruta = str(tmp_path / 'p.jsonl')
+    ag.exportar_proyecto(pid, ruta)
+    with pytest.raises(ValueError, match='ya existe'):
+        ag.importar_proyecto(ruta)
+    copia = ag.importar_proyecto(ruta, nombre='Viaje (copia)')
+    assert len(ag.listar_conversaciones(copia)) == 2
+    assert ag.verificar_indices() == []
+    malo = tmp_path / 'malo.jsonl'
+    malo.write_text('{"hola": 1}\n', encoding='utf-8')
+    with pytest.raises(ValueError):
+        ag.importar_proyecto(str(malo))
+
+
+def test_importacion_fallida_no_deja_restos(ag, tmp_path):
+    ruta = tmp_path / 'roto.jsonl'
+    ruta.write_text('\n'.join(json.dumps(r) for r in [
+        {'formato': 'agente_personal', 'version': 1, 'mensajes': 1},
+        {'t': 'proyecto', 'nombre': 'Roto', 'contexto': None},
+        {'t': 'mensaje', 'c': 99, 'remitente': 'Usuario', 'tipo': 'texto', 'contenido': 'x', 'fecha': None},
+    ]) + '\n', encoding='utf-8')
+    with pytest.raises(ValueError, match='desconocida'):
+        ag.importar_proyecto(str(ruta))
+    assert ag.listar_proyectos() == []
+    assert ag.verificar_indices() == []
+
+
+def test_zstd(ag, tmp_path):
+    pytest.importorskip('zstandard')
+    pid, _c1, _c2 = _poblar(ag)
+    ruta = str(tmp_path / 'p.jsonl.zst')
+    ag.exportar_proyecto(pid, ruta)
+    nuevo = ag.importar_proyecto(ruta, nombre='Copia')
+    assert sum(ag.contar_mensajes(c) for c, _ in ag.listar_conversaciones(nuevo)) == 8
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
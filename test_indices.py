@@ -0,0 +1,49 @@
+# test_indices.py
+# Verifica que los índices de claves foráneas existan y que las consultas calientes no hagan SCAN
+
+import sqlite3
+import sys
+
+import pytest
+
+def test_indices_creados(ag):
+    assert ag.verificar_indices() == []
+
+
+def test_consultas_criticas_sin_scan(ag):
+    assert ag.consultas_con_scan() == {}
+
+
+def test_detecta_scan_si_falta_un_indice(abrir_agente):
+    ag = abrir_agente('idx.db')
+    ag.conn.execute('DROP INDEX idx_mensajes_conversacion_fecha')
+    assert ag.verificar_indices() == ['idx_mensajes_conversacion_fecha']
+    malas = ag.consultas_con_scan()
+    assert 'listar_mensajes' in malas and 'cascada_mensajes' in malas
+    # Reabrir la base repara el índice faltante
+    ag.cerrar()
+    assert abrir_agente('idx.db').verificar_indices() == []
+
+
+def test_migracion_recrea_indices(tmp_path, abrir_agente):
+    ruta = tmp_path / 'viejo.db'
+    conn = sqlite3.connect(ruta)
+    conn.executescript('''
+        CREATE TABLE proyectos (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT UNIQUE NOT NULL, contexto TEXT);
+        CREATE TABLE tareas (id INTEGER PRIMARY KEY AUTOINCREMENT, proyecto_id INTEGER NOT NULL,
+            descripcion TEXT NOT NULL, estado TEXT DEFAULT 'pendiente', FOREIGN KEY(proyecto_id) REFERENCES proyectos(id));
+        CREATE TABLE conversaciones (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT, proyecto_id INTEGER,
+            fecha_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(proyecto_id) REFERENCES proyectos(id));
+        CREATE TABLE mensajes (id INTEGER PRIMARY KEY AUTOINCREMENT, conversacion_id INTEGER NOT NULL,
+            remitente TEXT NOT NULL, tipo TEXT NOT NULL, contenido TEXT NOT NULL,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(conversacion_id) REFERENCES conversaciones(id));
+    ''')
+    conn.close()
+    ag = abrir_agente('viejo.db', perform_migration=True)
+    assert ag._tiene_cascada('mensajes')
+    assert ag.verificar_indices() == []
+    assert ag.consultas_con_scan() == {}
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
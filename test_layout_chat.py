@@ -0,0 +1,159 @@
+# test_layout_chat.py
+# Layout de burbujas: métricas cacheadas, debounce del reflow y reconfiguración selectiva
+
+from types import SimpleNamespace
+
+from layout_chat import MetricasFuente, MotorLayout, ancho_de_corte
+
+
+class FuenteFalsa:
+    """Cada carácter mide 7 px (la 'W' 12); cuenta las llamadas a measure."""
+
+    def __init__(self):
+        self.mediciones = 0
+
+    def measure(self, texto):
+        self.mediciones += 1
+        return sum(12 if c == 'W' else 7 for c in texto)
+
+
+class Reloj:
+    """Imita root.after/after_cancel sin Tk."""
+
+    def __init__(self):
+        self.agendados = {}
+        self._n = 0
+
+    def after(self, ms, func):
+        self._n += 1
+        self.agendados[self._n] = func
+        return self._n
+
+    def after_cancel(self, ident):
+        self.agendados.pop(ident, None)
+
+    def correr_todo(self):
+        while self.agendados:
+            ident = min(self.agendados)
+            self.agendados.pop(ident)()
+
+
+class BurbujaFalsa:
+    def __init__(self):
+        self.anchos = []
+        self.viva = True
+
+    def winfo_exists(self):
+        return self.viva
+
+    def configure(self, width):
+        self.anchos.append(width)
+
+
+def _motor(reloj, **kw):
+    return MotorLayout(MetricasFuente(FuenteFalsa()), reloj.after, reloj.after_cancel, **kw)
+
+
+def test_metricas_cachean_por_caracter():
+    fuente = FuenteFalsa()
+    m = MetricasFuente(fuente)
+    assert m.ancho('hola') == 28
+    assert m.ancho('WW') == 24
+    antes = fuente.mediciones
+    for _ in range(100):
+        m.ancho('hola WW hola')
+    assert fuente.mediciones == antes + 1  # sólo el espacio era nuevo
+    assert m.ancho_natural('ab\nabcd\nabc') == 28
+    assert m.ancho_natural('') == 0
+
+
+def test_corte_sale_del_configure_sin_consultar_tk():
+    reloj = Reloj()
+    motor = _motor(reloj)
+    assert motor.corte() == ancho_de_corte(300) == 200
+    motor.on_configure(SimpleNamespace(width=800))
+    assert motor.corte() == 700
+    assert motor.registrar(BurbujaFalsa(), 'x') == 700
+
+
+def test_cargar_500_burbujas_no_reconfigura_nada():
+    reloj = Reloj()
+    motor = _motor(reloj)
+    motor.on_configure(SimpleNamespace(width=600))
+    reloj.correr_todo()
+    burbujas = [BurbujaFalsa() for _ in range(500)]
+    for i, b in enumerate(burbujas):
+        motor.registrar(b, f'mensaje {i} ' * (i % 30))
+    assert not reloj.agendados
+    assert all(b.anchos == [] for b in burbujas)
+
+
+def test_redimensionar_con_debounce_y_solo_las_que_cambian():
+    reloj = Reloj()
+    motor = _motor(reloj)
+    motor.on_configure(SimpleNamespace(width=600))  # corte 500
+    reloj.correr_todo()
+    corta = BurbujaFalsa()      # 70 px: una línea con cualquier ancho
+    media = BurbujaFalsa()      # 420 px: cambia si el corte baja de 420
+    larga = BurbujaFalsa()      # 1400 px: siempre ocupa todo el ancho
+    motor.registrar(corta, 'x' * 10)
+    motor.registrar(media, 'x' * 60)
+    motor.registrar(larga, 'x' * 200)
+    # Arrastrar el borde: muchos <Configure> seguidos, un solo reflow
+    for ancho in range(600, 399, -20):
+        motor.on_configure(SimpleNamespace(width=ancho))
+    assert len(reloj.agendados) == 1
+    reloj.correr_todo()
+    assert corta.anchos == []
+    assert media.anchos == [300] and larga.anchos == [300]
+    # Agrandar hasta 1000: la media vuelve a entrar en una línea, la larga sigue cortada
+    motor.on_configure(SimpleNamespace(width=1000))
+    reloj.correr_todo()
+    assert media.anchos == [300, 900] and larga.anchos == [300, 900]
+    # Mismo ancho: no agenda nada
+    motor.on_configure(SimpleNamespace(width=1000))
+    assert not reloj.agendados
+
+
+def test_reflow_por_tandas_empezando_por_lo_visible():
+    reloj = Reloj()
+    motor = _motor(reloj, por_tanda=10, vista=lambda: (0.5, 0.6))
+    motor.on_configure(SimpleNamespace(width=600))
+    reloj.correr_todo()
+    burbujas = [BurbujaFalsa() for _ in range(100)]
+    for b in burbujas:
+        motor.registrar(b, 'x' * 200)
+    motor.on_configure(SimpleNamespace(width=500))
+    reloj.agendados.pop(min(reloj.agendados))()  # el reflow hace la primera tanda
+    hechas = [i for i, b in enumerate(burbujas) if b.anchos]
+    assert len(hechas) == 10 and all(50 <= i <= 60 for i in hechas)
+    reloj.correr_todo()
+    assert all(b.anchos == [400] for b in burbujas)
+
+
+def test_texto_en_streaming_y_burbujas_destruidas():
+    reloj = Reloj()
+    motor = _motor(reloj)
+    motor.on_configure(SimpleNamespace(width=600))
+    reloj.correr_todo()
+    b = BurbujaFalsa()
+    muerta = BurbujaFalsa()
+    motor.registrar(b, '...')
+    motor.registrar(muerta, 'x' * 200)
+    motor.actualizar_texto(b, 'x' * 200)
+    muerta.viva = False
+    motor.on_configure(SimpleNamespace(width=400))
+    reloj.correr_todo()
+    assert b.anchos == [300] and muerta.anchos == []
+    motor.limpiar()
+    motor.on_configure(SimpleNamespace(width=900))
+    reloj.correr_todo()
+    assert b.anchos == [300]
+
+
+def test_lineas_con_corte_por_palabra():
+    m = MetricasFuente(FuenteFalsa())
+    assert m.lineas('', 100) == 1
+    assert m.lineas('hola mundo', 100) == 1             # 70 px
+    assert m.lineas('hola mundo hola mundo', 100) == 2  # corta entre palabras
+    assert m.lineas('x' * 30, 100) == 3                 # 210 px de una sola palabra
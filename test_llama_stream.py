@@ -0,0 +1,139 @@
+# test_llama_stream.py
+# API de streaming por deltas (sync y async) con un modelo falso en lugar de llama-cpp
+
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+
+import llama_local_helper as llh
+
+
+class LlamaFalso:
+    """Imita create_chat_completion(stream=True) de llama-cpp: un chunk por token."""
+
+    def __init__(self, tokens, pausa=0.0, prompt_tokens=17):
+        self.tokens = tokens
+        self.pausa = pausa
+        self.prompt_tokens = prompt_tokens
+        self.producidos = 0
+        self.cerrados = 0
+        self.n_tokens = 0
+
+    def create_chat_completion(self, messages, stream=False, max_tokens=512):
+        assert stream and messages[0]['role'] == 'system'
+        self.n_tokens = self.prompt_tokens
+
+        def chunks():
+            try:
+                yield {'choices': [{'delta': {'role': 'assistant'}, 'finish_reason': None}]}
+                for tok in self.tokens[:max_tokens]:
+                    time.sleep(self.pausa)
+                    self.producidos += 1
+                    self.n_tokens += 1
+                    yield {'choices': [{'delta': {'content': tok}, 'finish_reason': None}]}
+                yield {'choices': [{'delta': {}, 'finish_reason': 'stop'}]}
+            finally:
+                self.cerrados += 1
+        return chunks()
+
+
+TOKENS = [f'palabra{i} ' for i in range(40)]
+HISTORIAL = [{'role': 'user', 'content': 'hola'}]
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    falso = LlamaFalso(TOKENS)
+    monkeypatch.setattr(llh, '_get_llm', lambda: falso)
+    return falso
+
+
+def test_deltas_y_uso(llm):
+    uso = llh.UsoGeneracion()
+    assert list(llh.generar_deltas(HISTORIAL, uso=uso)) == TOKENS
+    assert uso.completion_tokens == 40 and uso.prompt_tokens == 17
+    assert uso.finish_reason == 'stop'
+    assert uso.t_primer_token is not None and uso.t_total >= uso.t_primer_token
+    assert llm.cerrados == 1 and not llh._gen_lock.locked()
+
+
+def test_backpressure_y_cierre(llm):
+    uso = llh.UsoGeneracion()
+    gen = llh.generar_deltas(HISTORIAL, uso=uso)
+    assert [next(gen) for _ in range(3)] == TOKENS[:3]
+    time.sleep(0.02)
+    # Por demanda: el modelo no avanzó más allá de lo pedido
+    assert llm.producidos == 3
+    gen.close()
+    assert uso.finish_reason == 'cancelado'
+    assert llm.cerrados == 1 and not llh._gen_lock.locked()
+
+
+def test_cancel_event(llm):
+    ev = threading.Event()
+    recibidos = []
+    for delta in llh.generar_deltas(HISTORIAL, cancel_event=ev):
+        recibidos.append(delta)
+        if len(recibidos) == 5:
+            ev.set()
+    assert recibidos == TOKENS[:5]
+    assert llm.producidos == 6 and llm.cerrados == 1
+
+
+def test_async_con_backpressure(monkeypatch):
+    falso = LlamaFalso(TOKENS)
+    monkeypatch.setattr(llh, '_get_llm', lambda: falso)
+
+    async def consumir():
+        uso = llh.UsoGeneracion()
+        vistos = []
+        async for delta in llh.generar_deltas_async(HISTORIAL, uso=uso, max_pendientes=2):
+            vistos.append(delta)
+            await asyncio.sleep(0.002)
+            # El productor no se adelanta más que la cola acotada (+1 en mano, +1 esperando lugar)
+            assert falso.producidos - len(vistos) <= 2 + 2
+        return vistos, uso
+
+    vistos, uso = asyncio.run(consumir())
+    assert vistos == TOKENS and uso.finish_reason == 'stop'
+
+
+def test_async_cancelacion(monkeypatch):
+    falso = LlamaFalso(TOKENS, pausa=0.001)
+    monkeypatch.setattr(llh, '_get_llm', lambda: falso)
+
+    async def consumir():
+        gen = llh.generar_deltas_async(HISTORIAL, max_pendientes=1)
+        vistos = [await gen.__anext__() for _ in range(2)]
+        await gen.aclose()
+        return vistos
+
+    assert asyncio.run(consumir()) == TOKENS[:2]
+    assert falso.cerrados == 1 and falso.producidos < len(TOKENS)
+    assert not llh._gen_lock.locked()
+
+
+def test_stream_con_callback_y_fallback(llm, monkeypatch):
+    parciales = []
+    ev = threading.Event()
+
+    def cb(texto):
+        parciales.append(texto)
+        if len(parciales) == 4:
+            ev.set()
+
+    final = llh.obtener_respuesta_llama_stream(HISTORIAL, cb, cancel_event=ev)
+    assert final == ''.join(TOKENS[:4]) and parciales[-1] == final
+
+    monkeypatch.setattr(llh, '_get_llm', lambda: None)
+    parciales.clear()
+    final = llh.obtener_respuesta_llama_stream(HISTORIAL, parciales.append)
+    assert final.startswith('⏳ Pensando… OK, ahora te respondo:\n') and "'hola'" in final
+    assert parciales[-1] == final and len(parciales) == 6
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
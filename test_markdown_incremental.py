@@ -0,0 +1,185 @@
+# test_markdown_incremental.py
+# Markdown en streaming: sólo se re-parsea la línea sin terminar y el resultado es el mismo que pintar todo junto
+
+import markdown_incremental as mdi
+from layout_chat import MetricasFuente
+from markdown_incremental import BurbujaMarkdown, ParserIncremental, en_linea, parsear_linea
+
+RESPUESTA = """# Instalación
+
+Primero **creá** el entorno con `python -m venv .venv` y activalo.
+
+1. Instalá las dependencias
+2. Corré los *tests*
+   - con `pytest -q`
+   - o con [tox](https://tox.wiki)
+
+```python
+def hola(nombre):
+\treturn f"hola {nombre}"
+```
+
+> Ojo: en Windows el script es `activate.bat`.
+
+---
+Listo.
+"""
+
+
+class FuenteFalsa:
+    def __init__(self, ancho=7, alto=16):
+        self._ancho, self._alto = ancho, alto
+
+    def measure(self, texto):
+        return self._ancho * len(texto)
+
+    def metrics(self, opcion):
+        assert opcion == 'linespace'
+        return self._alto
+
+
+def _metricas():
+    return {
+        'normal': MetricasFuente(FuenteFalsa()),
+        'codigo': MetricasFuente(FuenteFalsa(8, 15)),
+        'h1': MetricasFuente(FuenteFalsa(12, 28)),
+        'h2': MetricasFuente(FuenteFalsa(10, 24)),
+        'h3': MetricasFuente(FuenteFalsa(9, 20)),
+    }
+
+
+class TextoFalso:
+    """Lo que BurbujaMarkdown usa de un tk.Text: insertar al final y borrar desde una marca."""
+
+    def __init__(self):
+        self.segmentos = []
+        self.marcas = {}
+        self.opciones = {}
+
+    def contenido(self):
+        return ''.join(t for t, _tags in self.segmentos)
+
+    def por_caracter(self):
+        return [(c, tags) for t, tags in self.segmentos for c in t]
+
+    def insert(self, indice, *args):
+        assert indice == 'end'
+        self.segmentos.extend(zip(args[::2], args[1::2]))
+
+    def delete(self, desde, hasta):
+        assert hasta == 'end'
+        resto = 0 if desde == '1.0' else self.marcas[desde]
+        conservados = []
+        for texto, tags in self.segmentos:
+            if resto <= 0:
+                break
+            conservados.append((texto[:resto], tags))
+            resto -= len(texto)
+        self.segmentos = conservados
+
+    def mark_set(self, nombre, indice):
+        assert indice == 'end-1c'
+        self.marcas[nombre] = len(self.contenido())
+
+    def mark_gravity(self, nombre, lado):
+        assert lado == 'left'
+
+    def configure(self, **opciones):
+        self.opciones.update(opciones)
+
+    def winfo_exists(self):
+        return True
+
+
+def test_bloques_y_formato_en_linea():
+    lineas = []
+    cerca = None
+    for linea in RESPUESTA.split('\n')[:-1]:
+        parseada, cerca = parsear_linea(linea, cerca)
+        lineas.append(parseada)
+    assert lineas[0].tramos == [('Instalación', ('h1',)), ('\n', ('h1',))]
+    assert ('creá', ('negrita',)) in lineas[2].tramos
+    assert ('python -m venv .venv', ('codigo',)) in lineas[2].tramos
+    assert lineas[4].tramos[0] == ('1. ', ('lista1',))
+    assert ('tests', ('lista1', 'cursiva')) in lineas[5].tramos
+    assert lineas[6].bloque == 'lista2' and lineas[6].tramos[0] == ('◦ ', ('lista2',))
+    assert ('tox', ('lista2', 'enlace')) in lineas[7].tramos
+    assert lineas[9].tramos == [('python\n', ('codigo_lenguaje',))]
+    assert lineas[11].tramos == [('    return f"hola {nombre}"\n', ('codigo_bloque',))]
+    assert lineas[12].tramos == [] and cerca is None
+    assert lineas[14].bloque == 'cita'
+    assert lineas[16].tramos[0][1] == ('regla',)
+
+
+def test_marcadores_sin_cerrar_se_ven_tal_cual():
+    assert en_linea('esto es **impor') == [('esto es **impor', ())]
+    assert en_linea('snake_case_name') == [('snake_case_name', ())]
+    assert en_linea('2 * 3 * 4') == [('2 * 3 * 4', ())]
+
+
+def test_streaming_token_a_token_igual_a_pintar_todo():
+    de_una = TextoFalso()
+    BurbujaMarkdown(de_una, _metricas(), corte=400).mostrar(RESPUESTA)
+    en_vivo = TextoFalso()
+    burbuja = BurbujaMarkdown(en_vivo, _metricas(), corte=400)
+    burbuja.mostrar('...')  # la burbuja de espera se reemplaza por el primer token
+    for i in range(1, len(RESPUESTA) + 1):
+        burbuja.mostrar(RESPUESTA[:i])
+    assert en_vivo.por_caracter() == de_una.por_caracter()
+    assert en_vivo.opciones['state'] == 'disabled'
+
+
+def test_el_costo_por_token_no_crece_con_la_respuesta():
+    linea = 'Una línea de respuesta con **algo** de `código` y texto común.\n'
+    texto = linea * 400
+    burbuja = BurbujaMarkdown(TextoFalso(), _metricas(), corte=400)
+    parseadas = []
+    original = mdi.parsear_linea
+
+    def contar(*args, **kw):
+        parseadas.append(args[0])
+        return original(*args, **kw)
+    mdi.parsear_linea = contar
+    try:
+        maximo = 0
+        for i in range(1, len(texto) + 1, 3):
+            antes = burbuja.insertados
+            del parseadas[:]
+            burbuja.mostrar(texto[:i])
+            maximo = max(maximo, burbuja.insertados - antes)
+            # A lo sumo la línea que terminó + la cola, nunca el texto acumulado
+            assert len(parseadas) <= 2 and all(len(p) < len(linea) for p in parseadas)
+    finally:
+        mdi.parsear_linea = original
+    assert maximo <= 2 * len(linea)
+
+
+def test_bloque_de_codigo_se_ve_antes_de_cerrarse():
+    w = TextoFalso()
+    burbuja = BurbujaMarkdown(w, _metricas(), corte=400)
+    burbuja.mostrar('Mirá:\n```python\nprint(1)\npri')
+    assert w.segmentos[-2:] == [('print(1)\n', ('codigo_bloque',)), ('pri', ('codigo_bloque',))]
+    burbuja.mostrar('Mirá:\n```python\nprint(1)\nprint(2)\n```\nFin')
+    assert w.segmentos[-1] == ('Fin', ())
+
+
+def test_texto_distinto_reinicia():
+    p = ParserIncremental()
+    p.alimentar('hola\nmundo')
+    act = p.alimentar('chau\n')
+    assert act.reiniciar and act.nuevas[0].tramos == [('chau', ()), ('\n', ())] and act.cola is None
+
+
+def test_tamano_sin_consultar_la_geometria():
+    w = TextoFalso()
+    burbuja = BurbujaMarkdown(w, _metricas(), corte=424, padx=12)  # 400 px de texto
+    burbuja.mostrar('Hola')
+    assert (w.opciones['width'], w.opciones['height']) == (5, 1)  # se achica al contenido
+    burbuja.mostrar('Hola\n' + 'palabra ' * 100)  # 800 px: se corta en varias líneas
+    assert w.opciones['width'] == 400 // 7
+    alto_angosto = w.opciones['height']
+    assert alto_angosto > 10
+    burbuja.configure(width=1624)  # la ventana se agrandó
+    assert w.opciones['height'] < alto_angosto
+    burbuja.mostrar('# Título')
+    assert w.opciones['height'] == 2  # 28 px de h1 en líneas de 16 px
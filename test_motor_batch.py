@@ -0,0 +1,186 @@
+# test_motor_batch.py
+# Batching continuo con un backend falso: varias conversaciones por pasada, altas y bajas al vuelo
+
+import threading
+import time
+
+import pytest
+
+import llama_local_helper as llh
+from motor_batch import BackendFalso, MotorBatchContinuo
+from motores_llm import prompt_llama2
+
+
+def _mensajes(palabra, n=3):
+    return [{'role': 'system', 'content': 'sistema'}, {'role': 'user', 'content': ' '.join([palabra] * n)}]
+
+
+@pytest.fixture
+def motor_factory():
+    motores = []
+
+    def crear(backend, **kw):
+        motor = MotorBatchContinuo(backend, **kw)
+        motores.append(motor)
+        return motor
+    yield crear
+    for motor in motores:
+        motor.cerrar()
+
+
+def _generar_en_hilos(motor, palabras, max_tokens=512):
+    resultados = {}
+
+    def uno(palabra):
+        uso = llh.UsoGeneracion()
+        texto = ''.join(motor.generar(_mensajes(palabra), max_tokens=max_tokens, uso=uso))
+        resultados[palabra] = (texto, uso)
+    hilos = [threading.Thread(target=uno, args=(p,)) for p in palabras]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join(10)
+    return resultados
+
+
+def test_respuestas_sin_mezclarse(motor_factory):
+    motor = motor_factory(BackendFalso(tokens_respuesta=8), max_secuencias=3)
+    res = _generar_en_hilos(motor, ['alfa', 'beta', 'gamma', 'delta', 'epsilon'])
+    assert set(res) == {'alfa', 'beta', 'gamma', 'delta', 'epsilon'}
+    for palabra, (texto, uso) in res.items():
+        assert texto.split() == [palabra] * 8
+        assert uso.completion_tokens == 8
+        assert uso.prompt_tokens == 4
+        assert uso.finish_reason == 'stop'
+        assert uso.t_primer_token is not None and uso.t_total >= uso.t_primer_token
+
+
+def test_varias_secuencias_por_pasada_y_limite(motor_factory):
+    backend = BackendFalso(tokens_respuesta=10, costo_pasada=0.002)
+    motor = motor_factory(backend, max_secuencias=3)
+    _generar_en_hilos(motor, ['a', 'b', 'c', 'd', 'e', 'f'])
+    por_pasada = [len({seq for seq, *_ in lote}) for lote in backend.lotes]
+    assert max(por_pasada) == 3
+    # seq_id reutilizados: nunca más de max_secuencias distintos
+    assert {seq for lote in backend.lotes for seq, *_ in lote} <= {0, 1, 2}
+    assert motor.estadisticas()['tokens_generados'] == 60
+
+
+def test_prefill_por_partes_no_frena_la_decodificacion(motor_factory):
+    backend = BackendFalso(tokens_respuesta=40, costo_pasada=0.001)
+    motor = motor_factory(backend, max_secuencias=2, n_batch=8)
+    corta = motor.generar(_mensajes('corta', 1))
+    primer = next(corta)
+    largo = [{'role': 'user', 'content': ' '.join(f'p{i}' for i in range(50))}]
+    hilo = threading.Thread(target=lambda: ''.join(motor.generar(largo, max_tokens=2)))
+    hilo.start()
+    resto = ''.join(corta)
+    hilo.join(5)
+    assert (primer + resto).split() == ['corta'] * 40
+    assert all(sum(len(t) for _s, t, _p, _l in lote) <= 8 for lote in backend.lotes)
+    # Mientras el prompt largo entraba por partes, la conversación corta siguió decodificando
+    mixtas = [lote for lote in backend.lotes if len(lote) == 2 and len(lote[1][1]) > 1]
+    assert len(mixtas) >= 6
+
+
+def test_cerrar_generador_libera_el_lugar(motor_factory):
+    backend = BackendFalso(tokens_respuesta=1000, costo_pasada=0.001)
+    motor = motor_factory(backend, max_secuencias=1)
+    uso = llh.UsoGeneracion()
+    gen = motor.generar(_mensajes('larga'), uso=uso)
+    next(gen)
+    gen.close()
+    assert uso.finish_reason == 'cancelado'
+    # Con una sola secuencia, la siguiente sólo puede entrar si la anterior salió
+    t0 = time.perf_counter()
+    assert ''.join(motor.generar(_mensajes('otra'), max_tokens=3)).split() == ['otra'] * 3
+    assert time.perf_counter() - t0 < 2
+
+
+
+def test_consumidor_lento_no_acumula_ni_frena_a_las_demas(motor_factory):
+    backend = BackendFalso(tokens_respuesta=200, costo_pasada=0.001)
+    motor = motor_factory(backend, max_secuencias=2, max_pendientes=4)
+    lenta = motor.generar(_mensajes('lenta'), max_tokens=100)
+    assert next(lenta) == 'lenta '
+    # Mientras la lenta no lee, la otra termina y la lenta no pasa de 4 deltas en espera
+    assert ''.join(motor.generar(_mensajes('rapida'), max_tokens=50)).split() == ['rapida'] * 50
+    time.sleep(0.1)
+    seq = next(s for s in motor._activas if s.max_tokens == 100)
+    assert seq.frenada and seq.salida.qsize() == 4 and seq.generados == 5
+    pasadas = motor.estadisticas()['pasadas']
+    time.sleep(0.1)
+    assert motor.estadisticas()['pasadas'] == pasadas  # sin secuencias que avanzar, no hay pasadas
+    assert ''.join(lenta).split() == ['lenta'] * 99
+
+def test_cancel_event_y_max_tokens(motor_factory):
+    motor = motor_factory(BackendFalso(tokens_respuesta=1000, costo_pasada=0.001), max_secuencias=2)
+    ev = threading.Event()
+    uso = llh.UsoGeneracion()
+    partes = []
+    for delta in motor.generar(_mensajes('x'), cancel_event=ev, uso=uso):
+        partes.append(delta)
+        if len(partes) == 5:
+            ev.set()
+    assert 5 <= len(partes) <= 7
+    assert uso.finish_reason == 'cancelado'
+    uso = llh.UsoGeneracion()
+    assert len(''.join(motor.generar(_mensajes('y'), max_tokens=4, uso=uso)).split()) == 4
+    assert uso.finish_reason == 'length'
+
+
+def test_error_del_backend_llega_al_consumidor(motor_factory):
+    class Roto(BackendFalso):
+        def decodificar(self, entradas):
+            raise RuntimeError('sin memoria')
+    motor = motor_factory(Roto(), max_secuencias=2)
+    uso = llh.UsoGeneracion()
+    with pytest.raises(RuntimeError, match='sin memoria'):
+        list(motor.generar(_mensajes('z'), uso=uso))
+    assert uso.finish_reason == 'error'
+    assert motor.estadisticas()['activas'] == 0
+
+
+def test_rendimiento_agregado_supera_al_de_una_secuencia(motor_factory):
+    # Cada pasada cuesta 10 ms casi sin importar cuántas secuencias lleve (como en CPU)
+    def tps(max_secuencias, conversaciones):
+        motor = motor_factory(BackendFalso(tokens_respuesta=20, costo_pasada=0.01, costo_token=0.0001),
+                              max_secuencias=max_secuencias)
+        t0 = time.perf_counter()
+        res = _generar_en_hilos(motor, [f'c{i}' for i in range(conversaciones)])
+        return sum(uso.completion_tokens for _t, uso in res.values()) / (time.perf_counter() - t0)
+    una = tps(1, 4)
+    cuatro = tps(4, 4)
+    assert cuatro > 2.5 * una
+
+
+def test_motor_cerrado_corta_las_pendientes():
+    motor = MotorBatchContinuo(BackendFalso(tokens_respuesta=10000, costo_pasada=0.001), max_secuencias=1)
+    gen = motor.generar(_mensajes('a'))
+    next(gen)
+    motor.cerrar()
+    list(gen)  # termina sin colgarse
+    with pytest.raises(RuntimeError):
+        next(motor.generar(_mensajes('b')))
+
+
+def test_plantilla_llama2():
+    texto = prompt_llama2([{'role': 'system', 'content': 'S'}, {'role': 'user', 'content': 'hola'},
+                           {'role': 'assistant', 'content': 'buenas'}, {'role': 'user', 'content': 'chau'}])
+    assert texto == '<s>[INST] <<SYS>>\nS\n<</SYS>>\n\nhola [/INST] buenas </s><s>[INST] chau [/INST]'
+
+
+def test_generar_deltas_usa_el_motor_si_esta_activo(monkeypatch, motor_factory):
+    motor = motor_factory(BackendFalso(tokens_respuesta=3), max_secuencias=2)
+    monkeypatch.setattr(llh, '_motor', motor)
+    uso = llh.UsoGeneracion()
+    texto = ''.join(llh.generar_deltas([{'role': 'user', 'content': 'eco'}], uso=uso))
+    assert texto.split() == ['eco'] * 3
+    assert uso.finish_reason == 'stop'
+    # El planificador con varios hilos comparte el mismo lote
+    planificador = llh.PlanificadorModelo(concurrencia=2)
+    try:
+        futuros = [planificador.enviar([{'role': 'user', 'content': p}]) for p in ('uno', 'dos')]
+        assert [f.result(5)[0].split() for f in futuros] == [['uno'] * 3, ['dos'] * 3]
+    finally:
+        planificador.cerrar()
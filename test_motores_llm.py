@@ -0,0 +1,204 @@
+# test_motores_llm.py
+# Motores de inferencia intercambiables: contrato de streaming, elección por máquina y benchmark
+
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+import bench_motores_llm as bench
+import llama_local_helper as llh
+import motores_llm
+from motores_llm import MotorLLM, _Decodificador
+
+HISTORIAL = [{'role': 'user', 'content': 'hola'}]
+
+
+class MotorFalso(MotorLLM):
+    """Genera `n` tokens con `pausa` segundos entre cada uno."""
+
+    nombre = 'falso'
+
+    def __init__(self, n=10, pausa=0.0, falla_carga=False, pieza=None):
+        self.n = n
+        self.pausa = pausa
+        self.pieza = pieza
+        self.falla_carga = falla_carga
+        self.cargas = 0
+        self.cerrados = 0
+        self.mensajes = None
+
+    def disponible(self):
+        return True
+
+    def cargar(self):
+        if self.falla_carga:
+            raise OSError('modelo corrupto')
+        self.cargas += 1
+
+    def generar(self, mensajes, max_tokens, cancel_event, uso):
+        self.mensajes = mensajes
+        uso.prompt_tokens = 5
+        try:
+            for i in range(min(self.n, max_tokens)):
+                if cancel_event is not None and cancel_event.is_set():
+                    uso.finish_reason = 'cancelado'
+                    return
+                time.sleep(self.pausa)
+                uso.completion_tokens += 1
+                yield self.pieza or f't{i} '
+            uso.finish_reason = 'length' if self.n >= max_tokens else 'stop'
+        finally:
+            self.cerrados += 1
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    motor = MotorFalso()
+    monkeypatch.setattr(llh, '_get_motor', lambda: None)
+    monkeypatch.setattr(llh, '_get_backend', lambda: motor)
+    return motor
+
+
+def test_el_helper_genera_con_el_motor_elegido(backend):
+    uso = llh.UsoGeneracion()
+    assert ''.join(llh.generar_deltas(HISTORIAL, uso=uso)) == ''.join(f't{i} ' for i in range(10))
+    assert backend.mensajes[0]['role'] == 'system'  # el prompt de sistema de la app
+    assert (uso.prompt_tokens, uso.completion_tokens, uso.finish_reason) == (5, 10, 'stop')
+    assert uso.t_total >= uso.t_primer_token >= uso.t_espera
+    assert llh.obtener_respuesta_llama(HISTORIAL) == ' '.join(f't{i}' for i in range(10))
+    assert llh.modelo_disponible()
+
+
+def test_cortar_o_cancelar_libera_el_turno(backend):
+    uso = llh.UsoGeneracion()
+    deltas = llh.generar_deltas(HISTORIAL, max_tokens=4, uso=uso)
+    assert next(deltas) == 't0 '
+    deltas.close()
+    assert uso.finish_reason == 'cancelado' and backend.cerrados == 1
+    assert not llh._gen_lock.locked()
+    cancelar = threading.Event()
+    uso = llh.UsoGeneracion()
+    for i, _delta in enumerate(llh.generar_deltas(HISTORIAL, cancel_event=cancelar, uso=uso)):
+        if i == 2:
+            cancelar.set()
+    assert uso.completion_tokens == 3 and uso.finish_reason == 'cancelado'
+
+
+def test_backend_elegido_se_carga_una_vez_y_si_falla_sigue_llama(monkeypatch):
+    motor = MotorFalso()
+    monkeypatch.setitem(motores_llm.MOTORES, 'falso', lambda: motor)
+    monkeypatch.setenv('AGENTE_LLM', 'falso')
+    monkeypatch.setattr(llh, '_backend', None)
+    monkeypatch.setattr(llh, '_backend_resuelto', False)
+    assert llh._get_backend() is motor and llh._get_backend() is motor
+    assert motor.cargas == 1
+    monkeypatch.setitem(motores_llm.MOTORES, 'falso', lambda: MotorFalso(falla_carga=True))
+    monkeypatch.setattr(llh, '_backend', None)
+    monkeypatch.setattr(llh, '_backend_resuelto', False)
+    assert llh._get_backend() is None
+    assert 'corrupto' in llh._backend_error
+    # llama_cpp es el camino de siempre, no un backend alternativo
+    monkeypatch.setenv('AGENTE_LLM', 'llama_cpp')
+    monkeypatch.setattr(llh, '_backend_resuelto', False)
+    assert llh._get_backend() is None
+
+
+def test_preferencia_vale_solo_en_la_maquina_donde_se_midio(tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'motor_llm.json')
+    monkeypatch.delenv('AGENTE_LLM', raising=False)
+    monkeypatch.setenv('AGENTE_CT2_MODELO', str(tmp_path / 'ct2'))
+    assert motores_llm.leer_preferencia(ruta) is None
+    motores_llm.guardar_preferencia('ctranslate2', {'ctranslate2': {'decode_cps_p50': 120}}, ruta)
+    assert motores_llm.leer_preferencia(ruta) == 'ctranslate2'
+    monkeypatch.setattr(motores_llm, 'ARCHIVO_PREFERENCIA', ruta)
+    assert motores_llm.motor_preferido() == 'ctranslate2'
+    monkeypatch.setenv('AGENTE_LLM', 'onnx')
+    assert motores_llm.motor_preferido() == 'onnx'
+    monkeypatch.setattr(motores_llm, 'huella_maquina', lambda: 'otra|x86_64||2')
+    assert motores_llm.leer_preferencia(ruta) is None
+
+
+def test_preferencia_se_descarta_si_cambia_un_modelo_medido(tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'motor_llm.json')
+    ct2 = tmp_path / 'ct2'
+    ct2.mkdir()
+    (ct2 / 'model.bin').write_bytes(b'x' * 10)
+    gguf = tmp_path / 'modelo.gguf'
+    gguf.write_bytes(b'y' * 10)
+    monkeypatch.setenv('AGENTE_CT2_MODELO', str(ct2))
+    monkeypatch.setattr(llh, '_MODEL_PATH', str(gguf))
+    motores_llm.guardar_preferencia('ctranslate2', {}, ruta, medidos=['ctranslate2', 'llama_cpp'])
+    guardado = json.loads(open(ruta, encoding='utf-8').read())
+    assert guardado['modelos']['llama_cpp']['ruta'] == str(gguf)
+    assert motores_llm.leer_preferencia(ruta) == 'ctranslate2'
+    # Otro GGUF en el motor que perdió también invalida la comparación
+    gguf.write_bytes(b'y' * 20)
+    assert motores_llm.leer_preferencia(ruta) is None
+    motores_llm.guardar_preferencia('ctranslate2', {}, ruta, medidos=['ctranslate2'])
+    monkeypatch.setenv('AGENTE_CT2_MODELO', str(tmp_path / 'otro-ct2'))
+    assert motores_llm.leer_preferencia(ruta) is None
+    # Un archivo sin los modelos (de antes de registrarlos) no vale
+    del guardado['modelos']
+    open(ruta, 'w', encoding='utf-8').write(json.dumps(guardado))
+    assert motores_llm.leer_preferencia(ruta) is None
+
+
+class LlamaFalso:
+    """Como llama-cpp: n_tokens cuenta el contexto evaluado; los tokens con medio carácter no traen texto."""
+
+    def __init__(self, piezas, prompt_tokens=7):
+        self.piezas = piezas
+        self.prompt_tokens = prompt_tokens
+        self.n_tokens = 0
+
+    def create_chat_completion(self, messages, stream=False, max_tokens=512):
+        def chunks():
+            self.n_tokens = self.prompt_tokens
+            yield {'choices': [{'delta': {'role': 'assistant'}, 'finish_reason': None}]}
+            for pieza in self.piezas:
+                yield {'choices': [{'delta': {'content': pieza}, 'finish_reason': None}]}
+                self.n_tokens += 1  # el token se evalúa cuando se pide el siguiente
+            yield {'choices': [{'delta': {}, 'finish_reason': 'stop'}]}
+        return chunks()
+
+
+def test_llama_cpp_cuenta_tokens_del_contexto_y_no_chunks():
+    # 'ñ' llega en dos tokens: el primero sin texto
+    motor = motores_llm.MotorLlamaCpp(llm=LlamaFalso(['Ma', '', 'ña', 'na']))
+    uso = llh.UsoGeneracion()
+    assert ''.join(motor.generar(HISTORIAL, 64, None, uso)) == 'Mañana'
+    assert (uso.prompt_tokens, uso.completion_tokens, uso.finish_reason) == (7, 4, 'stop')
+
+
+def test_decodificador_no_corta_caracteres():
+    piezas = {1: 'Ma'.encode(), 2: b'\xc3', 3: b'\xb1', 4: 'ana'.encode()}  # 'ñ' en dos tokens
+
+    def decode(ids):
+        return b''.join(piezas[i] for i in ids).decode('utf-8', errors='replace')
+    d = _Decodificador(decode)
+    assert [d.agregar(i) for i in (1, 2, 3, 4)] == ['Ma', '', 'ñ', 'ana']
+
+
+def test_benchmark_elige_el_mas_rapido(tmp_path, monkeypatch):
+    monkeypatch.setitem(motores_llm.MOTORES, 'rapido', lambda: MotorFalso(n=6, pausa=0.001, pieza='palabra '))
+    monkeypatch.setitem(motores_llm.MOTORES, 'lento', lambda: MotorFalso(n=6, pausa=0.02))
+    # Más tokens/s pero de a una letra: un tokenizador más fino no lo hace más rápido
+    monkeypatch.setitem(motores_llm.MOTORES, 'letras', lambda: MotorFalso(n=6, pausa=0.0005, pieza='a'))
+    preferencia = tmp_path / 'motor_llm.json'
+    salida = tmp_path / 'bench.json'
+    assert bench.main(['--motores', 'lento,rapido,letras,no_existe', '--repeticiones', '2', '--tokens', '6',
+                       '--guardar', '--preferencia', str(preferencia), '--salida', str(salida)]) == 0
+    informe = json.loads(salida.read_text(encoding='utf-8'))
+    assert informe['ganador'] == 'rapido'
+    assert informe['resultados']['rapido']['tokens'] == 12
+    assert informe['resultados']['letras']['decode_tps_p50'] > informe['resultados']['rapido']['decode_tps_p50']
+    assert 'error' in informe['resultados']['no_existe']
+    assert motores_llm.leer_preferencia(str(preferencia)) == 'rapido'
+    assert bench.elegir({'a': {'error': 'x'}}) is None
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,113 @@
+# test_motores_stt.py
+# Pruebas del worker de transcripción con un motor falso (sin modelos ni red)
+
+import sys
+import threading
+
+import pytest
+
+import motores_stt
+from motores_stt import MotorSTT, TranscriptorWorker
+
+
+class MotorFalso(MotorSTT):
+    nombre = 'falso'
+
+    def __init__(self, falla_carga=False):
+        self.cargas = 0
+        self.hilos = set()
+        self.falla_carga = falla_carga
+
+    def disponible(self):
+        return True
+
+    def cargar(self):
+        if self.falla_carga:
+            raise OSError('modelo corrupto')
+        self.cargas += 1
+
+    def transcribir(self, pcm, fs):
+        self.hilos.add(threading.current_thread().name)
+        if not pcm:
+            raise ValueError('audio vacío')
+        return f'{len(pcm) // 2} muestras a {fs} Hz'
+
+
+def test_worker_carga_una_vez_y_transcribe_fuera_del_llamador():
+    motor = MotorFalso()
+    worker = TranscriptorWorker(motor)
+    assert worker.esperar_listo(timeout=5)
+    assert worker.transcribir(b'\x00\x00' * 10, 16000) == '10 muestras a 16000 Hz'
+    futuros = [worker.transcribir_async(b'\x00\x00' * n, 8000) for n in range(1, 4)]
+    assert [f.result(timeout=5) for f in futuros] == [f'{n} muestras a 8000 Hz' for n in range(1, 4)]
+    assert motor.cargas == 1
+    assert motor.hilos == {'stt-falso'}
+    worker.cerrar()
+
+
+def test_worker_propaga_errores():
+    worker = TranscriptorWorker(MotorFalso())
+    with pytest.raises(ValueError):
+        worker.transcribir(b'', 16000)
+    worker.cerrar()
+    worker_roto = TranscriptorWorker(MotorFalso(falla_carga=True))
+    with pytest.raises(RuntimeError, match='modelo corrupto'):
+        worker_roto.transcribir(b'\x00\x00', 16000)
+    worker_roto.cerrar()
+
+
+def test_crear_motor_prefiere_offline(monkeypatch):
+    class Online(MotorFalso):
+        nombre = 'online'
+        offline = False
+
+    monkeypatch.setattr(motores_stt, 'MOTORES', {'falso': MotorFalso, 'online': Online})
+    monkeypatch.delenv('AGENTE_STT', raising=False)
+    assert motores_stt.crear_motor().nombre == 'falso'
+    assert motores_stt.crear_motor('online').nombre == 'online'
+    assert motores_stt.motores_disponibles() == ['falso', 'online']
+
+
+class MotorRoto(MotorFalso):
+    nombre = 'roto'
+
+    def __init__(self):
+        super().__init__(falla_carga=True)
+
+
+def test_si_el_motor_no_carga_se_usa_el_siguiente(monkeypatch):
+    monkeypatch.setattr(motores_stt, 'MOTORES', {'roto': MotorRoto, 'falso': MotorFalso})
+    monkeypatch.setattr(motores_stt, '_transcriptor', None)
+    monkeypatch.delenv('AGENTE_STT', raising=False)
+    worker = motores_stt.obtener_transcriptor()
+    assert worker.transcribir(b'\x00\x00' * 3, 16000) == '3 muestras a 16000 Hz'
+    assert worker.motor.nombre == 'falso' and worker.motor.hilos == {'stt-falso'}
+    assert motores_stt.obtener_transcriptor() is worker
+    worker.cerrar()
+    # Si no carga ninguno, el pedido falla y el worker roto no se reutiliza
+    monkeypatch.setattr(motores_stt, 'MOTORES', {'roto': MotorRoto})
+    monkeypatch.setattr(motores_stt, '_transcriptor', None)
+    roto = motores_stt.obtener_transcriptor()
+    with pytest.raises(RuntimeError, match='roto: modelo corrupto'):
+        roto.transcribir(b'\x00\x00', 16000)
+    assert roto.fallido
+    monkeypatch.setattr(motores_stt, 'MOTORES', {'falso': MotorFalso})
+    nuevo = motores_stt.obtener_transcriptor()
+    assert nuevo is not roto and nuevo.transcribir(b'\x00\x00', 8000) == '1 muestras a 8000 Hz'
+    nuevo.cerrar()
+
+
+def test_whisper_disponible_solo_con_el_modelo_en_disco(tmp_path, monkeypatch):
+    pytest.importorskip('faster_whisper')
+    hub = pytest.importorskip('huggingface_hub.constants')
+    monkeypatch.setattr(hub, 'HF_HUB_CACHE', str(tmp_path / 'cache_vacia'))
+    # Sin el modelo descargado no se elige whisper (cargarlo lo bajaría de internet)
+    sin_modelo = motores_stt.MotorFasterWhisper('small')
+    assert sin_modelo.ruta_local() is None and not sin_modelo.disponible()
+    with pytest.raises(FileNotFoundError):
+        sin_modelo.cargar()
+    assert motores_stt.MotorFasterWhisper(str(tmp_path)).disponible()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
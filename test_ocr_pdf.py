@@ -0,0 +1,98 @@
+# test_ocr_pdf.py
+# OCR de PDFs escaneados: páginas en paralelo, progreso, caché por página y páginas con texto intactas
+
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+import ocr_pdf
+from ocr_pdf import CacheOCR, TextoPDF, clave_pagina, paginas_sin_texto, reconocer_paginas
+
+PAUSA = 0.4
+
+
+def _ocr_falso(ruta, indice, dpi, idioma, dir_cache):
+    """Trabajador de prueba (a nivel de módulo para que llegue a los procesos)."""
+    inicio = time.time()
+    time.sleep(PAUSA)
+    if indice == 5:
+        raise ValueError('página ilegible')
+    return (f'p{indice} pid={os.getpid()} omp={os.environ.get("OMP_THREAD_LIMIT")} {inicio} {time.time()}',
+            indice % 2 == 0)
+
+
+class _Imagen:
+    def __init__(self, pixeles, mode='L', size=(2, 2)):
+        self.pixeles, self.mode, self.size = pixeles, mode, size
+
+    def tobytes(self):
+        return self.pixeles
+
+
+def test_solo_las_paginas_sin_texto_van_a_ocr():
+    textos = ['Cláusula primera: el locador entrega...', '', '  \n ', 'p. 4', 'Firma y aclaración del contratante']
+    assert paginas_sin_texto(textos) == [1, 2, 3]
+    assert paginas_sin_texto(textos, min_caracteres=1) == [1, 2]
+
+
+def test_paginas_en_paralelo_con_progreso_y_errores_por_pagina():
+    paginas = ['con texto'] + [''] * 8
+    resultado = TextoPDF(paginas)
+    avisos = []
+    reconocer_paginas('escaneo.pdf', list(range(1, 9)), resultado, progreso=lambda h, t: avisos.append((h, t)),
+                      procesos=4, idioma='spa', trabajador=_ocr_falso)
+    assert resultado.paginas[0] == 'con texto'
+    assert list(resultado.errores) == [5] and 'ilegible' in resultado.errores[5]
+    assert resultado.ocr == [1, 2, 3, 4, 6, 7, 8]
+    assert resultado.desde_cache == 4  # 2, 4, 6, 8
+    reconocidas = [p.split() for p in resultado.paginas[1:] if p]
+    assert len({r[1] for r in reconocidas}) > 1 and all(r[2] == 'omp=1' for r in reconocidas)
+    # Páginas reconocidas a la vez en procesos distintos (el arranque de los procesos no cuenta)
+    intervalos = sorted((float(r[3]), float(r[4])) for r in reconocidas)
+    assert any(b[0] < a[1] for a, b in zip(intervalos, intervalos[1:]))
+    assert [h for h, _ in avisos] == list(range(2, 9)) and {t for _, t in avisos} == {9}
+    assert 'p8 ' in resultado.texto and 'con texto' in resultado.texto
+
+
+def test_cache_por_hash_de_la_pagina(tmp_path):
+    cache = CacheOCR(str(tmp_path))
+    a = clave_pagina(_Imagen(b'\x00\xff\x00\xff'), 'spa', 300)
+    assert a == clave_pagina(_Imagen(b'\x00\xff\x00\xff'), 'spa', 300)
+    assert len({a, clave_pagina(_Imagen(b'\x00\xff\xff\xff'), 'spa', 300),
+                clave_pagina(_Imagen(b'\x00\xff\x00\xff'), 'eng', 300),
+                clave_pagina(_Imagen(b'\x00\xff\x00\xff'), 'spa', 150)}) == 4
+    assert cache.leer(a) is None
+    cache.guardar(a, 'CONTRATO DE LOCACIÓN')
+    assert CacheOCR(str(tmp_path)).leer(a) == 'CONTRATO DE LOCACIÓN'
+    assert not [n for n in os.listdir(tmp_path / a[:2]) if n.endswith('.tmp')]
+
+
+def test_pdf_escaneado_de_punta_a_punta(tmp_path):
+    pytest.importorskip('pypdfium2')
+    pytest.importorskip('pytesseract')
+    Image = pytest.importorskip('PIL.Image')
+    ImageDraw = pytest.importorskip('PIL.ImageDraw')
+    ImageFont = pytest.importorskip('PIL.ImageFont')
+    if not ocr_pdf.disponible() or shutil.which('tesseract') is None:
+        pytest.skip('sin Tesseract')
+    hojas = []
+    for n in range(3):
+        hoja = Image.new('L', (1240, 1754), 255)
+        ImageDraw.Draw(hoja).text((120, 200), f'CONTRATO NUMERO {n + 1}', fill=0,
+                                  font=ImageFont.load_default(size=64))
+        hojas.append(hoja)
+    ruta = tmp_path / 'escaneo.pdf'
+    hojas[0].save(ruta, save_all=True, append_images=hojas[1:], resolution=150)
+    cache = str(tmp_path / 'cache')
+    leido = ocr_pdf.extraer_texto(str(ruta), procesos=2, idioma='eng', dir_cache=cache)
+    assert leido.con_capa == 0 and leido.ocr == [0, 1, 2] and not leido.errores
+    assert 'CONTRATO' in leido.texto.upper()
+    otra_vez = ocr_pdf.extraer_texto(str(ruta), procesos=2, idioma='eng', dir_cache=cache)
+    assert otra_vez.desde_cache == 3 and otra_vez.texto == leido.texto
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
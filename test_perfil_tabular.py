@@ -0,0 +1,99 @@
+# test_perfil_tabular.py
+# Perfil de tablas por bloques: mismas estadísticas que sobre el DataFrame entero y texto acotado
+
+import sys
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+np = pytest.importorskip('numpy')
+
+import perfil_tabular  # noqa: E402
+from perfil_tabular import perfilar, perfilar_bloques  # noqa: E402
+
+
+def _tabla(n=10_000, semilla=3):
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame({
+        'monto': np.round(rng.normal(100, 15, n), 2),
+        'cantidad': rng.integers(1, 50, n),
+        'region': rng.choice(['Norte', 'Sur', 'Este'], n, p=[0.5, 0.3, 0.2]),
+        'fecha': pd.date_range('2024-01-01', periods=n, freq='h').strftime('%Y-%m-%d %H:%M'),
+    })
+    df.loc[rng.random(n) < 0.05, 'monto'] = np.nan
+    return df
+
+
+def test_por_bloques_igual_que_todo_junto(tmp_path):
+    df = _tabla()
+    ruta = tmp_path / 'ventas.csv'
+    df.to_csv(ruta, index=False)
+    perfil = perfilar(str(ruta), filas_por_bloque=700)
+    assert perfil.filas == len(df)
+    cols = {c.nombre: c for c in perfil.columnas}
+    monto, cantidad, region, fecha = cols['monto'], cols['cantidad'], cols['region'], cols['fecha']
+    assert monto.tipo == 'numérico' and not monto.entero
+    assert monto.nulos == df['monto'].isna().sum()
+    assert (monto.minimo, monto.maximo) == (df['monto'].min(), df['monto'].max())
+    assert monto.media == pytest.approx(df['monto'].mean())
+    assert monto.desvio == pytest.approx(df['monto'].std())
+    assert monto.cuantiles()[0.5] == pytest.approx(df['monto'].median(), rel=0.02)
+    assert cantidad.entero
+    assert region.tipo == 'texto' and region.distintos() == 3
+    assert region.top(2) == list(df['region'].value_counts().head(2).items())
+    assert fecha.tipo == 'fecha'
+    assert str(fecha.minimo).startswith('2024-01-01') and fecha.maximo == pd.Timestamp(df['fecha'].iloc[-1])
+    # Las filas de ejemplo son filas reales del archivo
+    assert len(perfil.ejemplo) == 3
+    for fila in perfil.ejemplo.itertuples(index=False):
+        assert fila.fecha in set(df['fecha'])
+
+
+def test_tipos_que_cambian_entre_bloques():
+    bloques = [
+        pd.DataFrame({'x': [1, 2, 3], 'y': [None, None, None]}),
+        pd.DataFrame({'x': ['4', 'no sé', None], 'y': ['a', 'b', 'a']}),
+    ]
+    perfil = perfilar_bloques(bloques)
+    x, y = perfil.columnas
+    assert x.tipo == 'numérico' and x.invalidos == 1 and x.nulos == 1 and x.maximo == 4
+    assert y.tipo == 'texto' and y.nulos == 3 and y.top() == [('a', 2), ('b', 1)]
+
+
+def test_csv_con_punto_y_coma_coma_decimal_y_filas_rotas(tmp_path):
+    ruta = tmp_path / 'excel_es.csv'
+    ruta.write_text('producto;precio\nyerba;1234,5\nmate;10,25\nroto;1;2;3\nbombilla;7,75\n', encoding='utf-8')
+    perfil = perfilar(str(ruta))
+    precio = perfil.columnas[1]
+    assert perfil.filas == 3  # la fila mal formada se saltea en vez de fallar
+    assert precio.tipo == 'numérico' and precio.maximo == 1234.5
+
+
+def test_texto_acotado_con_muchas_columnas_y_alta_cardinalidad(monkeypatch):
+    monkeypatch.setattr(perfil_tabular, 'MAX_CATEGORIAS', 100)
+    n = 5000
+    df = pd.DataFrame({f'col{i}': np.arange(n) * i for i in range(60)})
+    df['id'] = [f'cliente-{i}' for i in range(n)]
+    bloques = [df.iloc[i:i + 1000] for i in range(0, n, 1000)]
+    perfil = perfilar_bloques(bloques, nombre='ancha')
+    ids = perfil.columnas[-1]
+    assert ids.aproximado and ids.distintos() is None
+    texto = perfil.texto()
+    assert 'y 31 columnas más' in texto and 'más de 100 distintos' not in texto  # 'id' quedó fuera de las 30
+    assert len(texto) < 4500
+    assert 'más de 100 distintos' in ids.resumen()
+
+
+def test_excel_con_varias_hojas(tmp_path):
+    pytest.importorskip('openpyxl')
+    ruta = tmp_path / 'libro.xlsx'
+    with pd.ExcelWriter(ruta) as escritor:
+        _tabla(200).to_excel(escritor, sheet_name='Ventas', index=False)
+        pd.DataFrame({'a': [1]}).to_excel(escritor, sheet_name='Otra', index=False)
+    perfil = perfilar(str(ruta), filas_por_bloque=64)
+    assert perfil.filas == 200
+    assert perfil.texto().startswith('Tabla libro.xlsx (hoja "Ventas" de 2): 200 filas × 4 columnas')
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,93 @@
+# test_respaldos.py
+# Respaldos en caliente: copia por pasos sin frenar a los demás hilos, rotación y VACUUM INTO
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+from agente_personal import AgentePersonal
+
+
+@pytest.fixture
+def ag(ag):
+    # La base de conftest con 5000 mensajes precargados
+    cid = ag.crear_conversacion('c', ag.crear_proyecto('P'))
+    ag.conn.executemany('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) VALUES (?, ?, ?, ?)',
+                        [(cid, 'Usuario', 'texto', f'mensaje {i} ' + 'x' * 200) for i in range(5000)])
+    ag.conn.commit()
+    ag.cid = cid
+    return ag
+
+
+def _contar(ruta):
+    conn = sqlite3.connect(ruta)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM mensajes').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_respaldo_incluye_escrituras_concurrentes(ag):
+    escritos = []
+    listo = threading.Event()
+
+    def escritor():
+        while not listo.is_set():
+            escritos.append(ag.agregar_mensaje(ag.cid, 'Agente', 'durante el respaldo'))
+
+    hilo = threading.Thread(target=escritor)
+    hilo.start()
+    try:
+        fut = ag.respaldar_en_segundo_plano(paginas=8, pausa=0.001)
+        assert ag.respaldar_en_segundo_plano() is fut  # uno a la vez
+        ruta = fut.result(timeout=60)
+    finally:
+        listo.set()
+        hilo.join()
+    # El escritor no quedó bloqueado durante toda la copia
+    assert escritos
+    copia = os.path.join(ruta, 'agente.db')
+    n = _contar(copia)
+    # Foto consistente: tiene todo lo previo y lo escrito por la misma conexión hasta el final
+    assert 5000 < n <= 5000 + len(escritos)
+    assert ag.listar_respaldos() == [ruta]
+
+
+def test_rotacion_y_archivo(ag):
+    ag.conn.execute("UPDATE mensajes SET fecha = '2020-01-01 00:00:00'")
+    ag.conn.commit()
+    ag.archivar_inactivas(dias=1, pausa=0)
+    rutas = [ag.respaldar(conservar=2, pausa=0) for _ in range(3)]
+    assert ag.listar_respaldos() == [rutas[2], rutas[1]]
+    assert not os.path.exists(rutas[0])
+    archivo = os.path.join(rutas[2], 'agente_archivo', 'anio_2020.db')
+    assert _contar(archivo) == 5000
+    assert not [n for n in os.listdir(ag.dir_respaldos) if n.endswith('.parcial')]
+
+
+def test_vacuum_into(ag):
+    ruta = ag.respaldar(metodo='vacuum', incluir_archivo=False)
+    assert _contar(os.path.join(ruta, 'agente.db')) == 5000
+    assert ag.respaldar_si_vencido(horas=1) is None
+
+
+def test_cerrar_cancela_respaldo(tmp_path):
+    ag = AgentePersonal(db_path=str(tmp_path / 'c.db'), purga_automatica=False)
+    cid = ag.crear_conversacion('c')
+    ag.conn.executemany('INSERT INTO mensajes (conversacion_id, remitente, tipo, contenido) VALUES (?, ?, ?, ?)',
+                        [(cid, 'Usuario', 'texto', 'y' * 500) for _ in range(3000)])
+    ag.conn.commit()
+    fut = ag.respaldar_en_segundo_plano(paginas=1, pausa=0.01)
+    time.sleep(0.05)
+    ag.cerrar()
+    with pytest.raises(InterruptedError):
+        fut.result(timeout=5)
+    assert not os.listdir(ag.dir_respaldos)
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,142 @@
+# test_resumenes.py
+# Resumen incremental: marca de agua, plegado sólo del tramo nuevo y historial acotado
+
+import threading
+
+import llama_local_helper as llh
+from resumenes import Resumidor, estimar_tokens
+
+
+class ResumirFalso:
+    def __init__(self):
+        self.llamadas = []
+
+    def __call__(self, resumen, mensajes, cancel_event):
+        self.llamadas.append((resumen, list(mensajes)))
+        n = len(self.llamadas)
+        return f'resumen {n} ({len(mensajes)} mensajes)'
+
+
+def _charla(ag, cid, n, desde=0):
+    ids = []
+    for i in range(desde, desde + n):
+        ids.append(ag.agregar_mensaje(cid, 'Usuario' if i % 2 == 0 else 'Agente', f'm{i} ' + 'x' * 96))
+    return ids
+
+
+def test_sin_resumen_el_historial_es_completo(ag):
+    cid = ag.crear_conversacion('c')
+    _charla(ag, cid, 3)
+    r = Resumidor(ag, resumir=ResumirFalso(), umbral_tokens=10_000)
+    assert [m['role'] for m in r.historial(cid)] == ['user', 'assistant', 'user']
+    assert r.actualizar(cid) is False
+    assert ag.obtener_resumen(cid) == (None, 0)
+
+
+def test_pliega_lo_viejo_y_avanza_la_marca(ag):
+    cid = ag.crear_conversacion('c')
+    ids = _charla(ag, cid, 20)  # ~25 tokens cada uno
+    resumir = ResumirFalso()
+    r = Resumidor(ag, resumir=resumir, umbral_tokens=300, conservar_tokens=100, conservar_mensajes=2)
+    assert r.actualizar(cid) is True
+    resumen, hasta = ag.obtener_resumen(cid)
+    assert resumen == 'resumen 1 (16 mensajes)'
+    assert hasta == ids[15]
+    historial = r.historial(cid)
+    assert historial[0]['role'] == 'system' and 'resumen 1' in historial[0]['content']
+    assert [m['content'].split()[0] for m in historial[1:]] == ['m16', 'm17', 'm18', 'm19']
+    # Debajo del umbral no se vuelve a llamar al modelo
+    assert r.actualizar(cid) is False
+    assert len(resumir.llamadas) == 1
+
+
+def test_solo_se_resume_el_tramo_nuevo(ag):
+    cid = ag.crear_conversacion('c')
+    _charla(ag, cid, 20)
+    resumir = ResumirFalso()
+    r = Resumidor(ag, resumir=resumir, umbral_tokens=300, conservar_tokens=100, conservar_mensajes=2)
+    r.actualizar(cid)
+    _charla(ag, cid, 10, desde=20)
+    assert r.actualizar(cid) is True
+    previo, mensajes = resumir.llamadas[1]
+    assert previo == 'resumen 1 (16 mensajes)'
+    # Sólo lo que quedó después de la marca (m16..m29), menos los recientes
+    assert [c.split()[0] for _r, c in mensajes] == [f'm{i}' for i in range(16, 26)]
+    # El costo del plegado no depende del largo total de la conversación
+    assert sum(estimar_tokens(c) for _r, c in mensajes) <= 300 + 100
+
+
+def test_conserva_siempre_los_ultimos_mensajes(ag):
+    cid = ag.crear_conversacion('c')
+    for i in range(6):
+        ag.agregar_mensaje(cid, 'Usuario', 'y' * 2000)  # cada uno supera conservar_tokens
+    r = Resumidor(ag, resumir=ResumirFalso(), umbral_tokens=100, conservar_tokens=50, conservar_mensajes=4)
+    r.actualizar(cid)
+    assert len(r.historial(cid)) == 1 + 4
+
+
+def test_la_marca_no_retrocede(ag):
+    cid = ag.crear_conversacion('c')
+    ids = _charla(ag, cid, 4)
+    assert ag.guardar_resumen(cid, 'nuevo', ids[2]) is True
+    assert ag.guardar_resumen(cid, 'viejo', ids[1]) is False
+    assert ag.obtener_resumen(cid) == ('nuevo', ids[2])
+
+
+def test_vaciar_y_eliminar_borran_el_resumen(ag):
+    cid = ag.crear_conversacion('c')
+    ids = _charla(ag, cid, 4)
+    ag.guardar_resumen(cid, 'algo', ids[1])
+    ag.vaciar_conversacion(cid)
+    assert ag.obtener_resumen(cid) == (None, 0)
+    ag.guardar_resumen(cid, 'algo', 1)
+    ag.eliminar_chat(cid)
+    ag.purgar_eliminados()
+    assert ag.conn.execute('SELECT COUNT(*) FROM resumenes').fetchone()[0] == 0
+
+
+def test_resumen_de_conversacion_archivada(ag):
+    cid = ag.crear_conversacion('c')
+    ids = _charla(ag, cid, 20)
+    ag.conn.execute("UPDATE mensajes SET fecha = datetime('now', '-400 days')")
+    ag.conn.commit()
+    ag.archivar_inactivas(dias=180)
+    assert ag.conversacion_archivada(cid)
+    assert [i for i, _r, _c in ag.listar_mensajes_desde(cid, ids[17])] == ids[18:]
+
+
+def test_agendar_en_segundo_plano_y_cerrar(ag):
+    cid = ag.crear_conversacion('c')
+    _charla(ag, cid, 20)
+    r = Resumidor(ag, resumir=ResumirFalso(), umbral_tokens=300, conservar_tokens=100)
+    r.agendar(cid)
+    assert r.esperar(5)
+    assert ag.obtener_resumen(cid)[0] is not None
+
+    empezado = threading.Event()
+
+    def lento(resumen, mensajes, cancel_event):
+        empezado.set()
+        cancel_event.wait(5)
+        return 'no debería guardarse'
+    _charla(ag, cid, 20, desde=20)
+    r2 = Resumidor(ag, resumir=lento, umbral_tokens=300, conservar_tokens=100)
+    r2.agendar(cid)
+    assert empezado.wait(5)
+    r2.cerrar()
+    assert ag.obtener_resumen(cid)[0] == 'resumen 1 (16 mensajes)'
+
+
+def test_el_resumen_entra_en_el_prompt_de_sistema():
+    msgs = llh._mensajes([{'role': 'system', 'content': 'Resumen: A'}, {'role': 'user', 'content': 'hola'}])
+    assert [m['role'] for m in msgs] == ['system', 'user']
+    assert msgs[0]['content'].startswith(llh._SYSTEM_PROMPT['content']) and msgs[0]['content'].endswith('Resumen: A')
+
+
+def test_sin_modelo_no_se_guarda_la_respuesta_demo(ag, monkeypatch):
+    monkeypatch.setattr(llh, 'modelo_disponible', lambda: False)
+    cid = ag.crear_conversacion('c')
+    _charla(ag, cid, 20)
+    r = Resumidor(ag, umbral_tokens=300, conservar_tokens=100)
+    assert r.actualizar(cid) is False
+    assert ag.obtener_resumen(cid) == (None, 0)
@@ -0,0 +1,116 @@
+# test_tareas.py
+# Tablero de tareas: filtro por estado con índice, totales por triggers, páginas por clave y cambios masivos
+
+import sqlite3
+
+import pytest
+
+from agente_personal import AgentePersonal
+
+
+def _cargar(ag, proyecto, n, estados=('pendiente', 'en curso', 'hecha')):
+    pid = ag.crear_proyecto(proyecto)
+    with ag.lock:
+        ag.conn.executemany('INSERT INTO tareas (proyecto_id, descripcion, estado) VALUES (?, ?, ?)',
+                            [(pid, f'tarea {i}', estados[i % len(estados)]) for i in range(n)])
+        ag.conn.commit()
+    return pid
+
+
+def _recontar(ag, pid):
+    return dict(ag.conn.execute("SELECT COALESCE(estado, 'pendiente'), COUNT(*) FROM tareas "
+                                'WHERE proyecto_id = ? GROUP BY 1', (pid,)).fetchall())
+
+
+def test_totales_al_dia_con_cada_cambio(ag):
+    pid = _cargar(ag, 'P', 30)
+    assert ag.contar_tareas('P') == {'pendiente': 10, 'en curso': 10, 'hecha': 10}
+    ag.agregar_tarea('P', 'una más')
+    primera = ag.listar_tareas('P', limite=1)[0][0]
+    ag.actualizar_estado_tarea(primera, 'bloqueada')
+    with ag.lock:
+        ag.conn.execute('DELETE FROM tareas WHERE id IN (SELECT id FROM tareas WHERE estado = ? LIMIT 4)', ('hecha',))
+        ag.conn.commit()
+    assert ag.contar_tareas('P') == _recontar(ag, pid) == {
+        'pendiente': 10, 'en curso': 10, 'hecha': 6, 'bloqueada': 1}
+    # Un estado que se queda sin tareas desaparece de los totales
+    ag.actualizar_estado_tarea(primera, 'pendiente')
+    assert 'bloqueada' not in ag.contar_tareas('P')
+
+
+def test_purga_del_proyecto_limpia_los_totales(ag):
+    pid = _cargar(ag, 'P', 50)
+    _cargar(ag, 'Q', 5)
+    ag.eliminar_proyecto(pid)
+    ag.purgar_eliminados(lote=7, pausa=0)
+    assert ag.conn.execute('SELECT COUNT(*) FROM tareas_conteo WHERE proyecto_id = ?', (pid,)).fetchone()[0] == 0
+    assert sum(ag.contar_tareas('Q').values()) == 5
+
+
+def test_filtro_y_paginas_por_clave(ag):
+    _cargar(ag, 'P', 1000)
+    todas = ag.listar_tareas('P')
+    assert len(todas) == 1000
+    vistas, ultimo = [], 0
+    while True:
+        pagina = ag.listar_tareas('P', estado='en curso', despues_de=ultimo, limite=64)
+        vistas += pagina
+        if len(pagina) < 64:
+            break
+        ultimo = pagina[-1][0]
+    assert vistas == [t for t in todas if t[2] == 'en curso']
+    assert [t[0] for t in ag.listar_tareas('P', despues_de=todas[9][0], limite=3)] == [t[0] for t in todas[10:13]]
+
+
+def test_consultas_del_tablero_por_indice(ag):
+    _cargar(ag, 'P', 100)
+    assert ag.consultas_con_scan() == {}
+    plan = ag.plan_consulta('SELECT id, descripcion, estado FROM tareas WHERE proyecto_id = ? AND estado = ? '
+                            'AND id > ? ORDER BY id LIMIT ?', (1, 'hecha', 0, 50))
+    assert any('idx_tareas_proyecto_estado' in paso for paso in plan)
+    assert not any('TEMP B-TREE' in paso for paso in plan)
+
+
+def test_cambio_masivo_en_una_transaccion(ag):
+    pid = _cargar(ag, 'P', 1200)
+    ids = [t[0] for t in ag.listar_tareas('P', estado='pendiente')]
+    assert ag.actualizar_estado_tareas(ids, 'hecha') == 400
+    assert ag.actualizar_estado_tareas(ids[:10], 'hecha') == 0  # ya estaban
+    assert ag.contar_tareas('P') == {'en curso': 400, 'hecha': 800}
+    assert ag.transicionar_tareas('P', 'en curso', 'hecha') == 400
+    assert ag.contar_tareas('P') == _recontar(ag, pid) == {'hecha': 1200}
+
+
+def test_cambio_masivo_fallido_no_deja_nada_a_medias(ag):
+    _cargar(ag, 'P', 1200)
+    ids = [t[0] for t in ag.listar_tareas('P')]
+    with ag.lock:
+        ag.conn.execute("CREATE TRIGGER falla BEFORE UPDATE ON tareas WHEN NEW.id = ? "
+                        "BEGIN SELECT RAISE(ABORT, 'no'); END".replace('?', str(ids[-1])))
+        ag.conn.commit()
+    with pytest.raises(sqlite3.IntegrityError):
+        ag.actualizar_estado_tareas(ids, 'archivada')
+    assert 'archivada' not in ag.contar_tareas('P')
+    assert ag.listar_tareas('P', estado='archivada') == []
+
+
+def test_base_sin_triggers_recalcula_los_totales(tmp_path):
+    ruta = str(tmp_path / 'vieja.db')
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False)
+    pid = _cargar(ag, 'P', 30)
+    with ag.lock:
+        ag.conn.executescript('DROP TRIGGER trg_tareas_conteo_alta; DELETE FROM tareas_conteo;')
+        ag.conn.execute('INSERT INTO tareas (proyecto_id, descripcion) VALUES (?, ?)', (pid, 'sin contar'))
+        ag.conn.commit()
+    ag.cerrar()
+    ag = AgentePersonal(db_path=ruta, purga_automatica=False)
+    assert ag.contar_tareas('P') == {'pendiente': 11, 'en curso': 10, 'hecha': 10}
+    ag.cerrar()
+
+
+def test_importar_proyecto_cuenta_las_tareas(ag, tmp_path):
+    _cargar(ag, 'P', 9)
+    ruta = str(tmp_path / 'p.jsonl')
+    ag.exportar_proyecto(ag.id_proyecto('P'), ruta)
+    ag.importar_proyecto(ruta, nombre='P2')
+    assert ag.contar_tareas('P2') == ag.contar_tareas('P')
@@ -0,0 +1,89 @@
+# test_telemetria.py
+# Contadores/tiempos, formato Prometheus, volcado rotativo e instrumentación de los caminos calientes
+
+import json
+import os
+import sys
+
+import pytest
+
+import llama_local_helper as llh
+import telemetria
+from agente_personal import AgentePersonal
+
+
+@pytest.fixture(autouse=True)
+def limpio(monkeypatch):
+    monkeypatch.setattr(telemetria, 'activa', True)
+    telemetria.reiniciar()
+    yield
+    telemetria.detener_volcado()
+    telemetria.reiniciar()
+
+
+def test_contadores_y_distribuciones():
+    telemetria.contar('pedidos')
+    telemetria.contar('pedidos', 2)
+    for v in (0.1, 0.2, 0.3, 0.4):
+        telemetria.observar('latencia', v)
+    with pytest.raises(ZeroDivisionError):
+        with telemetria.medir('bloque'):
+            1 / 0
+    r = telemetria.resumen()
+    assert r['pedidos'] == {'total': 3}
+    assert r['latencia']['n'] == 4 and r['latencia']['max'] == 0.4
+    assert r['latencia']['p50'] in (0.2, 0.3) and r['latencia']['media'] == pytest.approx(0.25)
+    assert r['bloque']['n'] == 1  # se mide aunque falle
+
+
+def test_formato_prometheus(tmp_path):
+    telemetria.contar('llm_tokens_generados', 42)
+    telemetria.observar('db_listar_mensajes', 0.002)
+    texto = telemetria.formato_prometheus()
+    assert '# TYPE agente_llm_tokens_generados_total counter\nagente_llm_tokens_generados_total 42' in texto
+    assert 'agente_db_listar_mensajes{quantile="0.95"} 0.002' in texto
+    assert 'agente_db_listar_mensajes_count 1' in texto
+    ruta = str(tmp_path / 'm.prom')
+    telemetria.exportar_prometheus(ruta)
+    assert open(ruta, encoding='utf-8').read() == texto
+
+
+def test_volcado_rotativo(tmp_path):
+    archivo = str(tmp_path / 'metricas.jsonl')
+    prom = str(tmp_path / 'metricas.prom')
+    telemetria.iniciar_volcado(archivo=archivo, prometheus=prom, intervalo=60, max_bytes=2000, respaldos=2)
+    for i in range(100):
+        telemetria.observar('x', i / 1000)
+    telemetria.detener_volcado()  # hace el último volcado
+    assert os.path.exists(prom)
+    rotados = sorted(n for n in os.listdir(tmp_path) if n.startswith('metricas.jsonl'))
+    assert rotados == ['metricas.jsonl', 'metricas.jsonl.1', 'metricas.jsonl.2']
+    primera = json.loads(open(archivo, encoding='utf-8').readline())
+    assert primera['metrica'] == 'x' and 'ts' in primera
+
+
+def test_desactivada(monkeypatch):
+    monkeypatch.setattr(telemetria, 'activa', False)
+    telemetria.contar('a')
+    with telemetria.medir('b'):
+        pass
+    assert telemetria.resumen() == {}
+
+
+def test_instrumentacion_db_y_modelo(tmp_path, monkeypatch):
+    ag = AgentePersonal(db_path=str(tmp_path / 't.db'), purga_automatica=False)
+    cid = ag.crear_conversacion('c')
+    ag.agregar_mensaje(cid, 'Usuario', 'hola')
+    ag.listar_mensajes(cid)
+    ag.cerrar()
+    monkeypatch.setattr(llh, '_get_llm', lambda: None)
+    list(llh.generar_deltas([{'role': 'user', 'content': 'hola che'}]))
+    r = telemetria.resumen()
+    assert r['db_agregar_mensaje']['n'] == 1 and r['db_listar_mensajes']['n'] == 1
+    assert r['db_espera_lock']['n'] == 2
+    assert r['llm_tokens_generados']['total'] == 6 and r['llm_fin_stop']['total'] == 1
+    assert r['llm_ttft']['n'] == 1 and r['llm_total']['n'] == 1
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))